@@ -261,6 +261,7 @@ class AQL(ApiGroup):
         stream: Optional[bool] = None,
         skip_inaccessible_cols: Optional[bool] = None,
         max_runtime: Optional[Number] = None,
+        stream_batches: bool = False,
     ) -> Result[Cursor]:
         """Execute the query and return the result cursor.
 
@@ -343,6 +344,12 @@ class AQL(ApiGroup):
             it is killed. The value is specified in seconds. Default value
             is 0.0 (no timeout).
         :type max_runtime: int | float
+        :param stream_batches: If set to True, batches after the first batch
+            are parsed as they are received from the server, so documents are
+            available before the entire batch has been received and the raw
+            batch is never held in memory in its entirety. The first batch is
+            always received in full, as it contains the cursor ID and count.
+        :type stream_batches: bool
         :return: Result cursor.
         :rtype: aioarango.cursor.Cursor
         :raise aioarango.exceptions.AQLQueryExecuteError: If execute fails.
@@ -396,7 +403,12 @@ class AQL(ApiGroup):
         def response_handler(resp: Response) -> Cursor:
             if not resp.is_success:
                 raise AQLQueryExecuteError(resp, request)
-            return Cursor(self._conn, resp.body)
+            return Cursor(
+                self._conn,
+                resp.body,
+                init_size=len(resp.raw_body or ""),
+                stream_batches=stream_batches,
+            )
 
         return await self._execute(request, response_handler)
 
@@ -1012,6 +1012,41 @@ class Collection(ApiGroup):
 
         return await self._execute(request, response_handler)
 
+    async def get_many_by_key(self, keys: Sequence[str]) -> Result[List[Optional[Json]]]:
+        """Return multiple documents by key in a single request via the document API.
+
+        Unlike :func:`get_many`, the documents are returned in the same order as the keys.
+
+        :param keys: Document keys.
+        :type keys: [str]
+        :return: Documents, with None in place of any missing documents.
+        :rtype: [dict | None]
+        :raise aioarango.exceptions.DocumentGetError: If retrieval fails.
+        """
+        request = Request(
+            method="put",
+            endpoint=f"/_api/document/{self.name}",
+            params={"onlyget": "true"},
+            data=list(keys),
+            read=self.name,
+        )
+
+        def response_handler(resp: Response) -> List[Optional[Json]]:
+            if not resp.is_success:
+                raise DocumentGetError(resp, request)
+            docs: List[Optional[Json]] = []
+            for body in resp.body:
+                if body.get("error"):
+                    if body.get("errorNum") == 1202:
+                        docs.append(None)
+                        continue
+                    raise DocumentGetError(
+                        self._conn.prep_bulk_err_response(resp, body), request)
+                docs.append(body)
+            return docs
+
+        return await self._execute(request, response_handler)
+
     async def random(self) -> Result[Json]:
         """Return a random document from the collection.
 
@@ -1,5 +1,6 @@
 from abc import abstractmethod
-from typing import Any, Callable, Optional, Sequence, Union
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Optional, Sequence, Union
 
 import httpx
 from requests_toolbelt import MultipartEncoder
@@ -8,7 +9,7 @@ from aioarango.exceptions import ServerConnectionError
 from aioarango.http import HTTPClient
 from aioarango.request import Request
 from aioarango.resolver import HostResolver
-from aioarango.response import Response
+from aioarango.response import Response, StreamedResponse
 from aioarango.typings import Fields, Json
 
 Connection = Union['BaseConnection']
@@ -164,6 +165,18 @@ class BaseConnection(object):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def stream_request(self, request: Request):  # pragma: no cover
+        """Send an HTTP request to ArangoDB server and receive the response body
+        incrementally.
+
+        :param request: HTTP request.
+        :type request: aioarango.request.Request
+        :return: Async context manager yielding the HTTP response.
+        :rtype: aioarango.response.StreamedResponse
+        """
+        raise NotImplementedError
+
 
 class BasicConnection(BaseConnection):
     """Connection to specific ArangoDB database using basic authentication.
@@ -227,3 +240,30 @@ class BasicConnection(BaseConnection):
             auth=self._auth,
         )
         return self.prep_response(resp, request.deserialize)
+
+    @asynccontextmanager
+    async def stream_request(self, request: Request) -> AsyncIterator[StreamedResponse]:
+        """Send an HTTP request to ArangoDB server and receive the response body
+        incrementally.
+
+        The response is not deserialized. Read the response with
+        :func:`aioarango.response.StreamedResponse.read` and pass it to
+        :func:`aioarango.connection.BaseConnection.prep_response` to process it
+        as a non-streamed response.
+
+        :param request: HTTP request.
+        :type request: aioarango.request.Request
+        :return: Async context manager yielding the HTTP response.
+        :rtype: aioarango.response.StreamedResponse
+        """
+        host_index = self._host_resolver.get_host_index()
+        async with self._http.stream_request(
+            session=self._sessions[host_index],
+            method=request.method,
+            url=self._url_prefixes[host_index] + request.endpoint,
+            params=request.params,
+            data=self.normalize_data(request.data),
+            headers=request.headers,
+            auth=self._auth,
+        ) as resp:
+            yield resp
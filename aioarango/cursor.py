@@ -1,5 +1,5 @@
 from collections import deque
-from typing import Any, Deque, Optional, Sequence
+from typing import Any, AsyncGenerator, Callable, Deque, Optional, Sequence
 
 from aioarango.connection import BaseConnection
 from aioarango.exceptions import (
@@ -10,6 +10,8 @@ from aioarango.exceptions import (
     CursorStateError,
 )
 from aioarango.request import Request
+from aioarango.response import Response
+from aioarango.streaming import CursorBodyParser
 from aioarango.typings import Json
 
 
@@ -25,6 +27,15 @@ class Cursor:
     :type init_data: dict
     :param cursor_type: Cursor type ("cursor" or "export").
     :type cursor_type: str
+    :param init_size: Size of the raw response body containing the
+        initialization data.
+    :type init_size: int
+    :param stream_batches: If set to True, batches after the initial batch
+        are parsed as they are received, and each document is returned by
+        :func:`aioarango.cursor.Cursor.next` as soon as it has been parsed
+        rather than after the entire batch has been received and
+        deserialized.
+    :type stream_batches: bool
     """
 
     __slots__ = [
@@ -38,6 +49,12 @@ class Cursor:
         "_warnings",
         "_has_more",
         "_batch",
+        "_fetches",
+        "_received",
+        "_received_bytes",
+        "_close_callback",
+        "_stream_batches",
+        "_stream",
     ]
 
     def __init__(
@@ -45,6 +62,8 @@ class Cursor:
         connection: BaseConnection,
         init_data: Json,
         cursor_type: str = "cursor",
+        init_size: int = 0,
+        stream_batches: bool = False,
     ) -> None:
         self._conn = connection
         self._type = cursor_type
@@ -55,6 +74,12 @@ class Cursor:
         self._stats = None
         self._profile = None
         self._warnings = None
+        self._fetches = 1  # the initial batch is included in the init data
+        self._received = 0
+        self._received_bytes = init_size
+        self._close_callback: Optional[Callable[["Cursor"], None]] = None
+        self._stream_batches = stream_batches
+        self._stream: Optional[AsyncGenerator[Any, None]] = None
         self._update(init_data)
 
     def __aiter__(self):
@@ -101,6 +126,7 @@ class Cursor:
         result["has_more"] = data["hasMore"]
 
         self._batch.extend(data["result"])
+        self._received += len(data["result"])
         result["batch"] = data["result"]
 
         if "extra" in data:
@@ -208,9 +234,48 @@ class Cursor:
         """
         return self._warnings
 
+    def fetch_count(self) -> int:
+        """Return the number of batches fetched from the server, including the
+        initial batch.
+
+        :return: Number of batches fetched.
+        :rtype: int
+        """
+        return self._fetches
+
+    def received_count(self) -> int:
+        """Return the number of documents received from the server so far.
+
+        :return: Number of documents received.
+        :rtype: int
+        """
+        return self._received
+
+    def received_bytes(self) -> int:
+        """Return the total size of the raw response bodies received from the
+        server so far. Bodies are counted in characters if they were decoded.
+
+        :return: Size of the response bodies received.
+        :rtype: int
+        """
+        return self._received_bytes
+
+    def set_close_callback(self, callback: Callable[["Cursor"], None]) -> None:
+        """Set a function to be called with this cursor the first time the cursor is
+        closed.
+
+        :param callback: The function to call.
+        :type callback: callable
+        """
+        self._close_callback = callback
+
     def empty(self) -> bool:
         """Check if the current batch is empty.
 
+        Documents in a batch that is being streamed are not included until
+        they are returned by :func:`aioarango.cursor.Cursor.next` or the
+        batch is completed by :func:`aioarango.cursor.Cursor.fetch`.
+
         :return: True if current batch is empty, False otherwise.
         :rtype: bool
         """
@@ -227,10 +292,19 @@ class Cursor:
         :raise aioarango.exceptions.CursorNextError: If batch retrieval fails.
         :raise aioarango.exceptions.CursorStateError: If cursor ID is not set.
         """
-        if self.empty():
+        while self.empty():
+            if self._stream is not None:
+                try:
+                    return await self._stream.__anext__()
+                except StopAsyncIteration:
+                    self._stream = None
+                    continue
             if not self.has_more():
                 raise StopAsyncIteration
-            await self.fetch()
+            if self._stream_batches:
+                self._stream = self._stream_batch()
+            else:
+                await self.fetch()
 
         return self.pop()
 
@@ -256,6 +330,12 @@ class Cursor:
         :raise aioarango.exceptions.CursorNextError: If batch retrieval fails.
         :raise aioarango.exceptions.CursorStateError: If cursor ID is not set.
         """
+        if self._stream is not None:
+            # complete the batch that is being streamed
+            stream, self._stream = self._stream, None
+            docs = [doc async for doc in stream]
+            self._batch.extend(docs)
+            return {"id": self._id, "has_more": self._has_more, "batch": docs}
         if self._id is None:
             raise CursorStateError("cursor ID not set")
         request = Request(method="put", endpoint=f"/_api/{self._type}/{self._id}")
@@ -264,8 +344,46 @@ class Cursor:
         if not resp.is_success:
             raise CursorNextError(resp, request)
 
+        self._fetches += 1
+        self._received_bytes += len(resp.raw_body or "")
         return self._update(resp.body)
 
+    async def _stream_batch(self) -> AsyncGenerator[Any, None]:
+        """Fetch the next batch from server, yielding each document as it is
+        parsed, and update the cursor when the batch is complete.
+
+        :raise aioarango.exceptions.CursorNextError: If batch retrieval fails.
+        :raise aioarango.exceptions.CursorStateError: If cursor ID is not set.
+        """
+        if self._id is None:
+            raise CursorStateError("cursor ID not set")
+        request = Request(method="put", endpoint=f"/_api/{self._type}/{self._id}")
+        async with self._conn.stream_request(request) as stream:
+            if not 200 <= stream.status_code < 300:
+                resp = self._conn.prep_response(await stream.read())
+                raise CursorNextError(resp, request)
+            parser = CursorBodyParser()
+            try:
+                async for chunk in stream.aiter_bytes():
+                    self._received_bytes += len(chunk)
+                    for doc in parser.feed(chunk):
+                        self._received += 1
+                        yield doc
+                data = parser.close()
+            except ValueError as e:
+                resp = Response(
+                    method=stream.method,
+                    url=stream.url,
+                    headers=stream.headers,
+                    status_code=stream.status_code,
+                    status_text=stream.status_text,
+                    raw_body="",
+                )
+                resp = self._conn.prep_response(resp, deserialize=False)
+                raise CursorNextError(resp, request, str(e)) from e
+        self._fetches += 1
+        self._update(data | {"result": []})
+
     async def close(self, ignore_missing: bool = False) -> Optional[bool]:
         """Close the cursor and free any server resources tied to it.
 
@@ -279,6 +397,12 @@ class Cursor:
         :raise aioarango.exceptions.CursorCloseError: If operation fails.
         :raise aioarango.exceptions.CursorStateError: If cursor ID is not set.
         """
+        if self._stream is not None:
+            stream, self._stream = self._stream, None
+            await stream.aclose()
+        if self._close_callback:
+            callback, self._close_callback = self._close_callback, None
+            callback(self)
         if self._id is None:
             return None
         request = Request(method="delete", endpoint=f"/_api/{self._type}/{self._id}")
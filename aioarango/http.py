@@ -1,9 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import MutableMapping, Optional, Tuple
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, MutableMapping, Optional, Tuple
 
 import httpx
 
-from aioarango.response import Response
+from aioarango.response import Response, StreamedResponse
 from aioarango.typings import Headers
 
 
@@ -57,6 +58,57 @@ class HTTPClient(ABC):  # pragma: no cover
         """
         raise NotImplementedError
 
+    @asynccontextmanager
+    async def stream_request(
+        self,
+        session: httpx.AsyncClient,
+        method: str,
+        url: str,
+        headers: Optional[Headers] = None,
+        params: Optional[MutableMapping[str, str]] = None,
+        data: Optional[str] = None,
+        auth: Optional[Tuple[str, str]] = None,
+    ) -> AsyncIterator[StreamedResponse]:
+        """Send an HTTP request and receive the response body incrementally.
+
+        The default implementation sends the request with
+        :func:`aioarango.http.HTTPClient.send_request` and provides the
+        response body as a single chunk. Override this method to stream the
+        body as it arrives.
+
+        :param session: httpx session object.
+        :type session: httpx.AsyncClient
+        :param method: HTTP method in lowercase (e.g. "post").
+        :type method: str
+        :param url: Request URL.
+        :type url: str
+        :param headers: Request headers.
+        :type headers: dict
+        :param params: URL (query) parameters.
+        :type params: dict
+        :param data: Request payload.
+        :type data: str | None
+        :param auth: Username and password.
+        :type auth: tuple
+        :returns: Async context manager yielding the HTTP response.
+        :rtype: aioarango.response.StreamedResponse
+        """
+        resp = await self.send_request(
+            session, method, url, headers=headers, params=params, data=data, auth=auth
+        )
+
+        async def chunks() -> AsyncIterator[bytes]:
+            yield (resp.raw_body or "").encode("utf-8")
+
+        yield StreamedResponse(
+            method=resp.method,
+            url=resp.url,
+            headers=resp.headers,
+            status_code=resp.status_code,
+            status_text=resp.status_text,
+            chunks=chunks(),
+        )
+
 
 class DefaultHTTPClient(HTTPClient):
     """Default HTTP client implementation."""
@@ -121,3 +173,51 @@ class DefaultHTTPClient(HTTPClient):
             status_text=response.reason_phrase,
             raw_body=response.text,
         )
+
+    @asynccontextmanager
+    async def stream_request(
+        self,
+        session: httpx.AsyncClient,
+        method: str,
+        url: str,
+        headers: Optional[Headers] = None,
+        params: Optional[MutableMapping[str, str]] = None,
+        data: Optional[str] = None,
+        auth: Optional[Tuple[str, str]] = None,
+    ) -> AsyncIterator[StreamedResponse]:
+        """Send an HTTP request and receive the response body as it arrives.
+
+        :param session: httpx client object.
+        :type session: httpx.AsyncClient
+        :param method: HTTP method in lowercase (e.g. "post").
+        :type method: str
+        :param url: Request URL.
+        :type url: str
+        :param headers: Request headers.
+        :type headers: dict
+        :param params: URL (query) parameters.
+        :type params: dict
+        :param data: Request payload.
+        :type data: str | None
+        :param auth: Username and password.
+        :type auth: tuple
+        :returns: Async context manager yielding the HTTP response.
+        :rtype: aioarango.response.StreamedResponse
+        """
+        async with session.stream(
+            method=method,
+            url=url,
+            params=params,
+            data=data,
+            headers=headers,
+            auth=auth,
+            timeout=self.REQUEST_TIMEOUT,
+        ) as response:
+            yield StreamedResponse(
+                method=method,
+                url=str(response.url),
+                headers=response.headers,
+                status_code=response.status_code,
+                status_text=response.reason_phrase,
+                chunks=response.aiter_bytes(),
+            )
@@ -1,4 +1,4 @@
-from typing import Any, MutableMapping, Optional
+from typing import Any, AsyncIterator, MutableMapping, Optional
 
 
 class Response:
@@ -73,3 +73,81 @@ class Response:
         self.error_code: Optional[int] = None
         self.error_message: Optional[str] = None
         self.is_success: Optional[bool] = None
+
+
+class StreamedResponse:
+    """HTTP response with a body that is received incrementally.
+
+    :param method: HTTP method in lowercase (e.g. "post").
+    :type method: str
+    :param url: API URL.
+    :type url: str
+    :param headers: Response headers.
+    :type headers: MutableMapping
+    :param status_code: Response status code.
+    :type status_code: int
+    :param status_text: Response status text.
+    :type status_text: str
+    :param chunks: The chunks of the raw response body.
+    :type chunks: AsyncIterator[bytes]
+
+    :ivar method: HTTP method in lowercase (e.g. "post").
+    :vartype method: str
+    :ivar url: API URL.
+    :vartype url: str
+    :ivar headers: Response headers.
+    :vartype headers: MutableMapping
+    :ivar status_code: Response status code.
+    :vartype status_code: int
+    :ivar status_text: Response status text.
+    :vartype status_text: str
+    """
+
+    __slots__ = (
+        "method",
+        "url",
+        "headers",
+        "status_code",
+        "status_text",
+        "_chunks",
+    )
+
+    def __init__(
+        self,
+        method: str,
+        url: str,
+        headers: MutableMapping[str, str],
+        status_code: int,
+        status_text: str,
+        chunks: AsyncIterator[bytes],
+    ) -> None:
+        self.method = method.lower()
+        self.url = url
+        self.headers = headers
+        self.status_code = status_code
+        self.status_text = status_text
+        self._chunks = chunks
+
+    def aiter_bytes(self) -> AsyncIterator[bytes]:
+        """Iterate over the chunks of the raw response body.
+
+        :return: The chunks.
+        :rtype: AsyncIterator[bytes]
+        """
+        return self._chunks
+
+    async def read(self) -> Response:
+        """Read the remainder of the response body.
+
+        :return: HTTP response.
+        :rtype: aioarango.response.Response
+        """
+        body = b"".join([chunk async for chunk in self._chunks])
+        return Response(
+            method=self.method,
+            url=self.url,
+            headers=self.headers,
+            status_code=self.status_code,
+            status_text=self.status_text,
+            raw_body=body.decode("utf-8"),
+        )
@@ -0,0 +1,169 @@
+import codecs
+import json
+import re
+from typing import Any, List
+
+from aioarango.typings import Json
+
+_WS = re.compile(r"[ \t\n\r]*")
+
+# the characters that may follow a complete JSON value in an object or array
+_DELIMITERS = ",]}"
+
+_START = 0
+_KEY_OR_END = 1
+_KEY = 2
+_COLON = 3
+_VALUE = 4
+_AFTER_VALUE = 5
+_ELEMENT_OR_END = 6
+_ELEMENT = 7
+_AFTER_ELEMENT = 8
+_DONE = 9
+
+
+class CursorBodyParser:
+    """Incremental parser for ArangoDB cursor response bodies.
+
+    A cursor response body is a JSON object where one member, usually
+    "result", is an array of documents. The parser is fed the body in chunks
+    as it arrives and returns each document of the array as soon as it is
+    complete, so the documents can be consumed before the body has been
+    received and the body never has to be held in memory in its entirety.
+    The other members of the object are returned by
+    :func:`aioarango.streaming.CursorBodyParser.close`.
+
+    Values are decoded with the standard library json decoder's
+    ``raw_decode``. A value that is split across chunks is retried when the
+    unparsed data has doubled in size, so large documents are not rescanned
+    for every chunk.
+
+    :param array_key: The key of the array to stream.
+    :type array_key: str
+    """
+
+    def __init__(self, array_key: str = "result") -> None:
+        self._array_key = array_key
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._state = _START
+        self._key: Any = None
+        self._fields: Json = {}
+        self._retry_len = 0
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """Parse the next chunk of the body.
+
+        :param chunk: The chunk.
+        :type chunk: bytes
+        :return: The documents completed by the chunk.
+        :rtype: list
+        :raise ValueError: If the body is not a JSON object.
+        """
+        self._buf += self._utf8.decode(chunk)
+        docs: List[Any] = []
+        if len(self._buf) >= self._retry_len:
+            self._parse(docs)
+        return docs
+
+    def close(self) -> Json:
+        """Finish parsing the body.
+
+        :return: The members of the body other than the streamed array.
+        :rtype: dict
+        :raise ValueError: If the body is incomplete or invalid.
+        """
+        self._buf += self._utf8.decode(b"", final=True)
+        if self._state != _DONE:
+            # the data may have been held back waiting for more to arrive
+            self._retry_len = 0
+            docs: List[Any] = []
+            self._parse(docs)
+            if self._state != _DONE or docs:
+                raise ValueError("The cursor response body is truncated or invalid")
+        return self._fields
+
+    def _decode(self, pos: int):
+        # Returns the value and the position after it, or None if the value is incomplete.
+        # A value is only accepted when it is followed by a delimiter, since a number may be
+        # truncated at the end of the buffer.
+        buf = self._buf
+        try:
+            value, end = self._decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            self._retry_len = pos + 2 * (len(buf) - pos)
+            return None
+        nxt = _WS.match(buf, end).end()
+        if nxt >= len(buf) or buf[nxt] not in _DELIMITERS:
+            self._retry_len = pos + 2 * (len(buf) - pos)
+            return None
+        self._retry_len = 0
+        return value, end
+
+    def _parse(self, docs: List[Any]) -> None:
+        buf = self._buf
+        pos = 0
+        while self._state != _DONE:
+            pos = _WS.match(buf, pos).end()
+            if pos >= len(buf):
+                break
+            c = buf[pos]
+            state = self._state
+            if state == _START:
+                if c != "{":
+                    raise ValueError("The cursor response body is not a JSON object")
+                pos += 1
+                self._state = _KEY_OR_END
+            elif state in (_KEY_OR_END, _KEY):
+                if c == "}" and state == _KEY_OR_END:
+                    pos += 1
+                    self._state = _DONE
+                    continue
+                if c != '"':
+                    raise ValueError("Expected a key in the cursor response body")
+                try:
+                    self._key, pos = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break  # incomplete
+                self._state = _COLON
+            elif state == _COLON:
+                if c != ":":
+                    raise ValueError("Expected ':' in the cursor response body")
+                pos += 1
+                self._state = _VALUE
+            elif state == _VALUE:
+                if c == "[" and self._key == self._array_key:
+                    pos += 1
+                    self._state = _ELEMENT_OR_END
+                    continue
+                res = self._decode(pos)
+                if res is None:
+                    break
+                self._fields[self._key], pos = res
+                self._state = _AFTER_VALUE
+            elif state == _AFTER_VALUE:
+                if c not in ",}":
+                    raise ValueError("Expected ',' or '}' in the cursor response body")
+                pos += 1
+                self._state = _KEY if c == "," else _DONE
+            elif state in (_ELEMENT_OR_END, _ELEMENT):
+                if c == "]" and state == _ELEMENT_OR_END:
+                    pos += 1
+                    self._state = _AFTER_VALUE
+                    continue
+                res = self._decode(pos)
+                if res is None:
+                    break
+                doc, pos = res
+                docs.append(doc)
+                self._state = _AFTER_ELEMENT
+            elif state == _AFTER_ELEMENT:
+                if c not in ",]":
+                    raise ValueError("Expected ',' or ']' in the cursor response body")
+                pos += 1
+                self._state = _ELEMENT if c == "," else _AFTER_VALUE
+        # drop the parsed data
+        self._buf = buf[pos:]
+        if self._retry_len:
+            self._retry_len -= pos
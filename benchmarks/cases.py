@@ -0,0 +1,865 @@
+"""
+Benchmark cases for the service hot paths.
+
+Each case is a function that takes the benchmark data set and returns a Benchmark, which
+holds a callable to be timed and the number of operations performed per call. Setup work
+done in the case function is not timed.
+"""
+
+import asyncio
+import atexit
+import base64
+import heapq
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, NamedTuple
+
+import numpy as np
+from pyroaring import BitMap
+
+from aioarango.streaming import CursorBodyParser
+import src.common.storage.collection_and_field_names as names
+from src.common.gtdb_lineage import GTDBLineage, GTDBTaxaCount, clear_lineage_cache
+from src.common.heatmap_matrix import HeatMapMatrix, write_heatmap_matrix
+from src.common.product_models.columnar_attribs_common_models import ColumnType, FilterStrategy
+from src.loaders.genome_collection.compute_genome_taxa_count import _parse_files
+from src.service import compression
+from src.service.data_products.columnar_snapshots import ColumnarSnapshot
+from src.service.data_products.common_functions import query_simple_collection_list, query_table
+from src.service.data_products.data_product_processing import MATCH_ID_PREFIX
+from src.service.data_products.heatmap import HeatMapController
+from src.service.data_products.table_models import TableAttributes
+from src.service.filtering.filters import FilterSet
+from src.service.filtering.result_cache import ResultCache
+from src.service.metrics import MetricsMiddleware
+from src.service.processing import SubsetSpecification
+from src.service.responses import to_json
+from src.service.storage_arango import ArangoStorage
+
+from benchmarks import synthetic_data
+from benchmarks.fake_storage import FakeDatabase, FakeStorage, keep_resolver
+
+
+# the number of FilterSet.to_aql calls per timed iteration, since a single call is too fast
+# to time accurately
+_AQL_CALLS = 10_000
+
+# the number of requests or queries per timed iteration for the instrumentation benchmarks
+_INSTRUMENTATION_CALLS = 2_000
+
+# heatmap rows are much larger than genome attribute rows, so the heatmap data set is
+# scaled down relative to the requested row count
+HEATMAP_ROW_DIVISOR = 10
+HEATMAP_COLUMNS = 50
+# the number of rows in a heatmap page
+HEATMAP_PAGE = 1000
+# the columns returned for the narrow projection benchmarks
+_TABLE_NARROW_FIELDS = [names.FLD_KBASE_ID, "checkm_completeness", "checkm_contamination"]
+_HEATMAP_NARROW_COLUMNS = [str(c) for c in range(5)]
+# the subset sizes for the subset membership benchmarks
+_SUBSET_SIZES = (10_000, 100_000, 300_000)
+_SUBSET_ID = "m_bench_subset"
+# the page size for the sorted view page benchmarks
+_VIEW_PAGE = 1000
+# the number of heatmap rows in a cursor batch and the size of the chunks the batch is received in
+# for the cursor batch decoding benchmarks
+_CURSOR_BATCH_ROWS = 5000
+_CURSOR_CHUNK = 64 * 1024
+
+
+class Benchmark(NamedTuple):
+    """ A benchmark ready to be timed. """
+
+    func: Callable[[], Any]
+    """ The function to time. """
+
+    ops: int
+    """ The number of operations (rows, calls, etc.) the function performs per call. """
+
+    info: dict[str, Any] = None
+    """ Any additional information about the benchmark to include in the results. """
+
+
+class DataSet:
+    """
+    Lazily generated synthetic data shared between benchmark cases.
+    """
+
+    def __init__(self, rows: int, seed: int = 42):
+        """
+        rows - the number of rows to generate for the genome attributes and lineage data.
+            The heatmap data is scaled down by HEATMAP_ROW_DIVISOR.
+        seed - the seed for the random number generator.
+        """
+        self.rows = rows
+        self._seed = seed
+        self._genome_attribs = None
+        self._heatmap = None
+        self._heatmap_matrix_dir = None
+        self._lineages = None
+        self._taxonomy_file = None
+
+    @property
+    def genome_attribs(self) -> list[dict[str, Any]]:
+        if self._genome_attribs is None:
+            self._genome_attribs = synthetic_data.genome_attribs_docs(self.rows, self._seed)
+        return self._genome_attribs
+
+    @property
+    def heatmap(self) -> list[dict[str, Any]]:
+        if self._heatmap is None:
+            self._heatmap = synthetic_data.heatmap_docs(
+                max(1, self.rows // HEATMAP_ROW_DIVISOR), HEATMAP_COLUMNS, self._seed)
+        return self._heatmap
+
+    @property
+    def heatmap_matrix_dir(self) -> Path:
+        """ The path to a directory containing the heatmap data as heatmap matrix files. """
+        if self._heatmap_matrix_dir is None:
+            path = Path(tempfile.mkdtemp(prefix="bench_heatmap_matrix_"))
+            atexit.register(shutil.rmtree, path, ignore_errors=True)
+            write_heatmap_matrix(
+                path / "matrix",
+                synthetic_data.heatmap_meta(len(self.heatmap), HEATMAP_COLUMNS),
+                self.heatmap,
+                [],
+            )
+            self._heatmap_matrix_dir = path / "matrix"
+        return self._heatmap_matrix_dir
+
+    @property
+    def lineages(self) -> list[str]:
+        if self._lineages is None:
+            self._lineages = [
+                d[names.FLD_GENOME_ATTRIBS_GTDB_LINEAGE] for d in self.genome_attribs]
+        return self._lineages
+
+    @property
+    def taxonomy_file(self) -> str:
+        """ The path to a GTDB style taxonomy TSV file containing the lineages. """
+        if self._taxonomy_file is None:
+            fd, path = tempfile.mkstemp(prefix="bench_taxonomy_", suffix=".tsv")
+            atexit.register(os.remove, path)
+            with os.fdopen(fd, "w") as f:
+                for i, lin in enumerate(self.lineages):
+                    f.write(f"GB_GCA_{i:09}.1\t{lin}\n")
+            self._taxonomy_file = path
+        return self._taxonomy_file
+
+
+def _run(coro_func: Callable[[], Any]) -> Callable[[], Any]:
+    return lambda: asyncio.run(coro_func())
+
+
+def _filterset(**kwargs) -> FilterSet:
+    return FilterSet(
+        synthetic_data.COLLECTION_ID,
+        synthetic_data.LOAD_VER,
+        view="bench_view",
+        collection=names.COLL_GENOME_ATTRIBS,
+        **kwargs,
+    )
+
+
+def _match_spec(mark_only: bool = True) -> SubsetSpecification:
+    return SubsetSpecification(
+        internal_subset_id=synthetic_data.MATCH_ID, mark_only=mark_only, prefix=MATCH_ID_PREFIX)
+
+
+def filterset_to_aql_standard(data: DataSet) -> Benchmark:
+    """ AQL generation for an unfiltered, sorted, paged table query. """
+    fs = _filterset(sort_on=names.FLD_KBASE_ID, match_spec=_match_spec(False), limit=1000)
+
+    def run():
+        for _ in range(_AQL_CALLS):
+            fs.to_aql()
+    return Benchmark(run, _AQL_CALLS)
+
+
+def filterset_to_aql_search(data: DataSet) -> Benchmark:
+    """ AQL generation for an ArangoSearch query with one filter of each type. """
+    fs = _filterset(sort_on=names.FLD_KBASE_ID, match_spec=_match_spec(False), limit=1000)
+    fs.append("checkm_completeness", ColumnType.FLOAT, "[90, 100]")
+    fs.append("contig_count", ColumnType.INT, "(0, 200]")
+    fs.append("release_date", ColumnType.DATE, "[2020-01-01,]")
+    fs.append("gtdb_representative", ColumnType.BOOL, "true")
+    fs.append(names.FLD_GENOME_ATTRIBS_GTDB_LINEAGE, ColumnType.STRING, "d__d_bench_0;p__",
+              strategy=FilterStrategy.PREFIX)
+
+    def run():
+        for _ in range(_AQL_CALLS):
+            fs.to_aql()
+    return Benchmark(run, _AQL_CALLS)
+
+
+def heatmap_query(data: DataSet) -> Benchmark:
+    """
+    A full heatmap table query, including document key removal, cell reconstruction,
+    min / max calculation and JSON serialization.
+    """
+    ctrl = HeatMapController("bench_heatmap", "bench", "meta", "data", "cells")
+    store = FakeStorage(keep_resolver(data.heatmap))
+    fs = _filterset(match_spec=_match_spec(), limit=0)
+    return Benchmark(_run(lambda: ctrl._query(store, fs, None, None)), len(data.heatmap))
+
+
+def _heatmap_page(data: DataSet, col_ids: list[str] | None) -> Benchmark:
+    ctrl = HeatMapController("bench_heatmap", "bench", "meta", "data", "cells")
+    store = FakeStorage(keep_resolver(data.heatmap[:HEATMAP_PAGE]))
+    fs = _filterset(
+        match_spec=_match_spec(), limit=HEATMAP_PAGE, keep=ctrl._projection(col_ids))
+    page = lambda: ctrl._query(store, fs, None, None)
+    return Benchmark(_run(page), HEATMAP_PAGE, {"bytes": len(asyncio.run(page()).body)})
+
+
+def heatmap_page(data: DataSet) -> Benchmark:
+    """
+    A page of a heatmap with a marked match, with the page returned from the database.
+    The response size is included in the results.
+    """
+    return _heatmap_page(data, None)
+
+
+def heatmap_page_narrow(data: DataSet) -> Benchmark:
+    """
+    A page of a heatmap with a marked match and a subset of the columns projected in the
+    database. The response size is included in the results.
+    """
+    return _heatmap_page(data, _HEATMAP_NARROW_COLUMNS)
+
+
+def _heatmap_page_matrix(data: DataSet, col_ids: list[str] | None) -> Benchmark:
+    ctrl = HeatMapController("bench_heatmap", "bench", "meta", "data", "cells")
+    matrix = HeatMapMatrix(data.heatmap_matrix_dir)
+    # the database only returns the kbase IDs of the rows in the match
+    match = synthetic_data.MATCH_ID_PREFIX + synthetic_data.MATCH_ID
+    store = FakeStorage(keep_resolver(
+        [d for d in data.heatmap if match in d[names.FLD_MATCHES_SELECTIONS]]))
+    # start in the middle of the heatmap
+    start = matrix.count // 2
+    start_after = matrix.get_rows([start])[0][0][names.FLD_KB_DISPLAY_NAME]
+    fs = _filterset(
+        match_spec=_match_spec(),
+        start_after=start_after,
+        sort_on=names.FLD_KB_DISPLAY_NAME,
+        limit=HEATMAP_PAGE,
+    )
+    page = lambda: ctrl._query_matrix(store, matrix, fs, None, None, col_ids=col_ids)
+    return Benchmark(
+        _run(page),
+        max(1, min(HEATMAP_PAGE, matrix.count - start - 1)),
+        {"bytes": len(asyncio.run(page()).body)},
+    )
+
+
+def heatmap_page_matrix(data: DataSet) -> Benchmark:
+    """
+    A page of a heatmap with a marked match, served from a memory mapped heatmap matrix with
+    the match membership returned from the database. The response size is included in the
+    results.
+    """
+    return _heatmap_page_matrix(data, None)
+
+
+def heatmap_page_matrix_narrow(data: DataSet) -> Benchmark:
+    """
+    A page of a heatmap with a marked match and a subset of the columns, served from a memory
+    mapped heatmap matrix. The response size is included in the results.
+    """
+    return _heatmap_page_matrix(data, _HEATMAP_NARROW_COLUMNS)
+
+
+def genome_attribs_histogram(data: DataSet) -> Benchmark:
+    """ The /hist code path - retrieving a single column and binning it with numpy. """
+    store = FakeStorage(keep_resolver(data.genome_attribs))
+    column = "checkm_completeness"
+    fs = _filterset(keep=[column], keep_filter_nulls=True, limit=0)
+
+    async def run():
+        vals = []
+        await query_simple_collection_list(store, fs, lambda d: vals.append(d[column]))
+        return np.histogram(vals)
+    return Benchmark(_run(run), data.rows)
+
+
+def _genome_attribs_snapshot(data: DataSet) -> ColumnarSnapshot:
+    types = {c.key: c.type for c in synthetic_data.GENOME_ATTRIBS_COLUMNS}
+    return ColumnarSnapshot.from_columns(
+        synthetic_data.COLLECTION_ID,
+        synthetic_data.LOAD_VER,
+        types,
+        {k: [d.get(k) for d in data.genome_attribs] for k in types},
+    )
+
+
+def genome_attribs_histogram_snapshot(data: DataSet) -> Benchmark:
+    """ The /hist code path when answered from a columnar snapshot. """
+    snap = _genome_attribs_snapshot(data)
+    column = "checkm_completeness"
+    fs = _filterset(keep=[column], keep_filter_nulls=True, limit=0)
+    return Benchmark(lambda: np.histogram(snap.get_values(fs, column)[0]), data.rows)
+
+
+def genome_attribs_filtered_count_snapshot(data: DataSet) -> Benchmark:
+    """ A count with one filter of each non-string type, answered from a columnar snapshot. """
+    snap = _genome_attribs_snapshot(data)
+    fs = _filterset(count=True)
+    fs.append("checkm_completeness", ColumnType.FLOAT, "[90, 100]")
+    fs.append("contig_count", ColumnType.INT, "(0, 200]")
+    fs.append("release_date", ColumnType.DATE, "[2020-01-01,]")
+    fs.append("gtdb_representative", ColumnType.BOOL, "true")
+    return Benchmark(lambda: snap.count(fs), data.rows)
+
+
+def _query_table(data: DataSet, output_table: bool) -> Benchmark:
+    store = FakeStorage(keep_resolver(data.genome_attribs))
+    fs = _filterset(sort_on=names.FLD_KBASE_ID, match_spec=_match_spec(), limit=0)
+    return Benchmark(
+        _run(lambda: query_table(
+            store, synthetic_data.GENOME_ATTRIBS_COLUMNS, fs, output_table=output_table)),
+        data.rows,
+    )
+
+
+def query_table_rows(data: DataSet) -> Benchmark:
+    """ The query_table acceptor when outputting a table of lists. """
+    return _query_table(data, True)
+
+
+def query_table_dicts(data: DataSet) -> Benchmark:
+    """ The query_table acceptor when outputting a list of dicts. """
+    return _query_table(data, False)
+
+
+def _query_table_page(data: DataSet, result_cache: ResultCache = None) -> Benchmark:
+    store = FakeStorage(keep_resolver(data.genome_attribs[:1000]))
+    fs = _filterset(sort_on=names.FLD_KBASE_ID, match_spec=_match_spec(), limit=1000)
+
+    async def run():
+        # don't return the result, as asyncio.run spends a surprising amount of time calling
+        # repr on large results, which would swamp the cached case
+        await query_table(
+            store,
+            synthetic_data.GENOME_ATTRIBS_COLUMNS,
+            fs,
+            output_table=False,
+            result_cache=result_cache,
+        )
+    return Benchmark(_run(run), 1)
+
+
+def query_table_page(data: DataSet) -> Benchmark:
+    """ A 1000 row genome attributes page without a result cache. """
+    return _query_table_page(data)
+
+
+def query_table_page_cached(data: DataSet) -> Benchmark:
+    """ A 1000 row genome attributes page served from the result cache. """
+    return _query_table_page(data, ResultCache())
+
+
+def _table_page_projection(data: DataSet, keep: list[str] | None) -> Benchmark:
+    store = FakeStorage(keep_resolver(data.genome_attribs[:1000]))
+    fs = _filterset(sort_on=names.FLD_KBASE_ID, match_spec=_match_spec(), limit=1000, keep=keep)
+
+    async def page() -> bytes:
+        res = await query_table(store, synthetic_data.GENOME_ATTRIBS_COLUMNS, fs)
+        return to_json(TableAttributes.model_construct(**res._asdict()))
+
+    async def run():
+        await page()
+    return Benchmark(_run(run), 1, {"bytes": len(asyncio.run(page()))})
+
+
+def table_page_full(data: DataSet) -> Benchmark:
+    """
+    A serialized 1000 row genome attributes page with all the columns. The response size is
+    included in the results.
+    """
+    return _table_page_projection(data, None)
+
+
+def table_page_narrow(data: DataSet) -> Benchmark:
+    """
+    A serialized 1000 row genome attributes page with three columns projected in the database.
+    The response size is included in the results.
+    """
+    return _table_page_projection(data, _TABLE_NARROW_FIELDS)
+
+
+def _table_page(data: DataSet) -> dict[str, Any]:
+    store = FakeStorage(keep_resolver(data.genome_attribs[:1000]))
+    fs = _filterset(sort_on=names.FLD_KBASE_ID, match_spec=_match_spec(), limit=0)
+    res = asyncio.run(query_table(
+        store, synthetic_data.GENOME_ATTRIBS_COLUMNS, fs, output_table=False))
+    return res._asdict()
+
+
+def serialize_table_validated(data: DataSet) -> Benchmark:
+    """
+    Serializing a genome attributes page as FastAPI does for a response model, e.g. validating
+    and then dumping the model.
+    """
+    page = _table_page(data)
+
+    def run():
+        json.dumps(TableAttributes.model_validate(page).model_dump(mode="json"),
+                   ensure_ascii=False).encode()
+    return Benchmark(run, len(page["data"]))
+
+
+def serialize_table_fast(data: DataSet) -> Benchmark:
+    """ Serializing a genome attributes page as the data product endpoints do. """
+    page = _table_page(data)
+    return Benchmark(
+        lambda: to_json(TableAttributes.model_construct(**page)), len(page["data"]))
+
+
+def gtdb_lineage_parse(data: DataSet) -> Benchmark:
+    """ Parsing GTDB lineage strings. After the warmup run all the strings are cached. """
+    lineages = data.lineages
+
+    def run():
+        for lin in lineages:
+            GTDBLineage(lin)
+    return Benchmark(run, len(lineages))
+
+
+def gtdb_lineage_parse_uncached(data: DataSet) -> Benchmark:
+    """ Parsing GTDB lineage strings starting with an empty lineage cache. """
+    lineages = data.lineages
+
+    def run():
+        clear_lineage_cache()
+        for lin in lineages:
+            GTDBLineage(lin)
+    return Benchmark(run, len(lineages))
+
+
+def gtdb_lineage_parse_many(data: DataSet) -> Benchmark:
+    """ Parsing GTDB lineage strings in bulk starting with an empty lineage cache. """
+    lineages = data.lineages
+
+    def run():
+        clear_lineage_cache()
+        return GTDBLineage.parse_many(lineages)
+    return Benchmark(run, len(lineages))
+
+
+def gtdb_taxonomy_file(data: DataSet) -> Benchmark:
+    """
+    Counting taxa from a GTDB taxonomy file as done by the taxa count loader, starting with an
+    empty lineage cache.
+    """
+    path = data.taxonomy_file
+
+    def run():
+        clear_lineage_cache()
+        with open(path) as f:
+            return _parse_files([f], "GTDB")
+    return Benchmark(run, len(data.lineages))
+
+
+def gtdb_taxa_count(data: DataSet) -> Benchmark:
+    """ Counting taxa from GTDB lineage strings, as done by the taxa count loader. """
+    lineages = data.lineages
+
+    def run():
+        tc = GTDBTaxaCount()
+        for lin in lineages:
+            tc.add(lin)
+        return tc
+    return Benchmark(run, len(lineages))
+
+
+async def _asgi_requests(app, count: int):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/things/foo",
+        "raw_path": b"/things/foo",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "server": ("bench", 80),
+        "client": ("bench", 1234),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(_):
+        pass
+
+    for _ in range(count):
+        await app(dict(scope), receive, send)
+
+
+def _asgi_app(with_metrics: bool):
+    from fastapi import FastAPI
+    app = FastAPI()
+
+    @app.get("/things/{thing_id}")
+    async def get_thing(thing_id: str):
+        return {"id": thing_id}
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+def asgi_request_plain(data: DataSet) -> Benchmark:
+    """ Requests to a trivial FastAPI route without metrics, as a baseline. """
+    app = _asgi_app(False)
+    return Benchmark(
+        _run(lambda: _asgi_requests(app, _INSTRUMENTATION_CALLS)), _INSTRUMENTATION_CALLS)
+
+
+def asgi_request_metrics(data: DataSet) -> Benchmark:
+    """
+    Requests to a trivial FastAPI route with the metrics middleware. Compare to
+    asgi_request_plain for the per request overhead of the middleware.
+    """
+    app = _asgi_app(True)
+    return Benchmark(
+        _run(lambda: _asgi_requests(app, _INSTRUMENTATION_CALLS)), _INSTRUMENTATION_CALLS)
+
+
+async def _execute_queries(store, count: int):
+    bind_vars = {"@coll": names.COLL_GENOME_ATTRIBS, "key": "foo"}
+    for _ in range(count):
+        cur = await store.execute_aql("FOR d IN @@coll RETURN d", bind_vars=bind_vars)
+        try:
+            async for _ in cur:
+                pass
+        finally:
+            await cur.close(ignore_missing=True)
+
+
+def execute_aql_plain(data: DataSet) -> Benchmark:
+    """ Small queries against the storage fake without metrics, as a baseline. """
+    store = FakeStorage(keep_resolver(data.genome_attribs[:10]))
+    return Benchmark(
+        _run(lambda: _execute_queries(store, _INSTRUMENTATION_CALLS)), _INSTRUMENTATION_CALLS)
+
+
+def execute_aql_metrics(data: DataSet) -> Benchmark:
+    """
+    Small queries via the ArangoStorage.execute_aql metrics instrumentation. Compare to
+    execute_aql_plain for the per query overhead of the instrumentation.
+    """
+    store = ArangoStorage(FakeDatabase(keep_resolver(data.genome_attribs[:10])))
+    return Benchmark(
+        _run(lambda: _execute_queries(store, _INSTRUMENTATION_CALLS)), _INSTRUMENTATION_CALLS)
+
+
+def _compression_payloads(data: DataSet) -> dict[str, bytes]:
+    # JSON bodies as returned by the service for a heatmap page and for a page and a large
+    # chunk of the genome attributes table
+    ctrl = HeatMapController("bench_heatmap", "bench", "meta", "data", "cells")
+    store = FakeStorage(keep_resolver(data.heatmap[:HEATMAP_PAGE]))
+    fs = _filterset(match_spec=_match_spec(), limit=HEATMAP_PAGE)
+    payloads = {"heatmap_page": asyncio.run(ctrl._query(store, fs, None, None)).body}
+    for name, rows in [("genome_attribs_page", 1000), ("genome_attribs_table", 20_000)]:
+        store = FakeStorage(keep_resolver(data.genome_attribs[:rows]))
+        fs = _filterset(sort_on=names.FLD_KBASE_ID, match_spec=_match_spec(), limit=0)
+        res = asyncio.run(query_table(
+            store, synthetic_data.GENOME_ATTRIBS_COLUMNS, fs, output_table=True))
+        payloads[name] = json.dumps(res._asdict()).encode()
+    return payloads
+
+
+def _compress(data: DataSet, encoding: str, level: int) -> Benchmark:
+    payloads = _compression_payloads(data)
+    ratios = {name: len(p) / len(compression.compress(encoding, level, p))
+              for name, p in payloads.items()}
+    info = {"level": level, "bytes": {n: len(p) for n, p in payloads.items()}, "ratio": ratios}
+
+    def run():
+        for p in payloads.values():
+            compression.compress(encoding, level, p)
+    return Benchmark(run, sum(len(p) for p in payloads.values()), info)
+
+
+def compress_gzip_9(data: DataSet) -> Benchmark:
+    """ gzip at the level previously used for all responses. """
+    return _compress(data, compression.GZIP, 9)
+
+
+def compress_gzip(data: DataSet) -> Benchmark:
+    """ gzip at the default level. """
+    return _compress(data, compression.GZIP, compression.CompressionLevels().gzip)
+
+
+def compress_zstd(data: DataSet) -> Benchmark:
+    """ zstd at the default level. """
+    return _compress(data, compression.ZSTD, compression.CompressionLevels().zstd)
+
+
+def compress_br(data: DataSet) -> Benchmark:
+    """ brotli at the default level. """
+    return _compress(data, compression.BROTLI, compression.CompressionLevels().br)
+
+
+def _view_page_filter(doc: dict[str, Any]) -> bool:
+    # a range filter on two numeric columns matching ~10% of the documents
+    return doc["checkm_completeness"] >= 90 and doc["contig_count"] <= 5000
+
+
+def _view_page_info(data: DataSet, examined: int) -> dict[str, Any]:
+    return {"docs": len(data.genome_attribs), "docs_examined": examined, "page": _VIEW_PAGE}
+
+
+def view_sorted_page_full_sort(data: DataSet) -> Benchmark:
+    """
+    A Python analog of a filtered page sorted on kbase_id from a view without a primary sort.
+    Every document matching the search is found, in index order, and a bounded heap selects
+    the page, as the database does for a SORT with a LIMIT.
+    """
+    docs = list(data.genome_attribs)
+    random.Random(42).shuffle(docs)  # the index order isn't the sort order
+
+    def run():
+        return heapq.nsmallest(
+            _VIEW_PAGE, filter(_view_page_filter, docs), key=lambda d: d[names.FLD_KBASE_ID])
+    return Benchmark(run, _VIEW_PAGE, _view_page_info(data, len(docs)))
+
+
+def view_sorted_page_primary_sort(data: DataSet) -> Benchmark:
+    """
+    A Python analog of a filtered page sorted on kbase_id from a view with a primary sort on
+    kbase_id. The documents are visited in sort order and the search stops when the page is
+    full.
+    """
+    docs = sorted(data.genome_attribs, key=lambda d: d[names.FLD_KBASE_ID])
+
+    def run():
+        return list(itertools.islice(filter(_view_page_filter, docs), _VIEW_PAGE))
+    page = run()
+    examined = docs.index(page[-1]) + 1 if len(page) == _VIEW_PAGE else len(docs)
+    return Benchmark(run, _VIEW_PAGE, _view_page_info(data, examined))
+
+
+def _cursor_batch_chunks(data: DataSet) -> list[bytes]:
+    # a cursor batch of heatmap rows as received from the database
+    body = json.dumps({
+        "id": "12345",
+        "result": data.heatmap[:_CURSOR_BATCH_ROWS],
+        "hasMore": True,
+        "extra": {"stats": {"executionTime": 0.5}},
+    }).encode()
+    return [body[i:i + _CURSOR_CHUNK] for i in range(0, len(body), _CURSOR_CHUNK)]
+
+
+def _decode_batch_full(chunks: list[bytes], on_doc: Callable[[Any], None]):
+    for doc in json.loads(b"".join(chunks).decode())["result"]:
+        on_doc(doc)
+
+
+def _decode_batch_streamed(chunks: list[bytes], on_doc: Callable[[Any], None]):
+    parser = CursorBodyParser()
+    for chunk in chunks:
+        for doc in parser.feed(chunk):
+            on_doc(doc)
+    parser.close()
+
+
+def _cursor_batch(data: DataSet, decode: Callable[[list[bytes], Callable], None]) -> Benchmark:
+    chunks = _cursor_batch_chunks(data)
+    # measure the time to the first row and the peak memory while decoding, excluding the
+    # received chunks, once, as the tracing slows the decoding
+    start = time.perf_counter()
+    first = []
+
+    def on_doc(_):
+        # the documents are discarded as they are processed, as when they're streamed out
+        if not first:
+            first.append(time.perf_counter() - start)
+
+    decode(chunks, on_doc)
+    tracemalloc.start()
+    try:
+        decode(chunks, lambda _: None)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    info = {"rows": len(data.heatmap[:_CURSOR_BATCH_ROWS]),
+            "bytes": sum(len(c) for c in chunks),
+            "time_to_first_row_sec": first[0] if first else None,
+            "peak_decode_bytes": peak}
+    return Benchmark(
+        lambda: decode(chunks, lambda _: None), len(data.heatmap[:_CURSOR_BATCH_ROWS]), info)
+
+
+def cursor_batch_full(data: DataSet) -> Benchmark:
+    """ Decoding a cursor batch of heatmap rows after the entire batch is received. """
+    return _cursor_batch(data, _decode_batch_full)
+
+
+def cursor_batch_streamed(data: DataSet) -> Benchmark:
+    """ Decoding a cursor batch of heatmap rows incrementally as the batch is received. """
+    return _cursor_batch(data, _decode_batch_streamed)
+
+
+def _subset_members(data: DataSet, size: int) -> np.ndarray:
+    # the ordinals of a random subset of the genome attributes documents, where a document's
+    # ordinal is its index
+    rng = np.random.default_rng(size)
+    docs = len(data.genome_attribs)
+    return np.sort(rng.choice(docs, min(size, docs), replace=False))
+
+
+def _subset_info(data: DataSet, members: np.ndarray, bytes_: int) -> dict[str, Any]:
+    return {"members": len(members), "load_version_docs": len(data.genome_attribs),
+            "bytes": bytes_}
+
+
+def _subset_mark(data: DataSet, size: int) -> Benchmark:
+    members = _subset_members(data, size)
+    docs = [data.genome_attribs[i] for i in members.tolist()]
+
+    def run():
+        # the database rewrites each member document, approximated here by re-encoding it
+        written = 0
+        for d in docs:
+            written += len(to_json(d | {names.FLD_MATCHES_SELECTIONS:
+                                        d[names.FLD_MATCHES_SELECTIONS] + [_SUBSET_ID]}))
+        return written
+    return Benchmark(run, len(members), _subset_info(data, members, run()))
+
+
+def _subset_delete(data: DataSet, size: int) -> Benchmark:
+    members = _subset_members(data, size)
+    docs = [data.genome_attribs[i] | {names.FLD_MATCHES_SELECTIONS:
+                                      data.genome_attribs[i][names.FLD_MATCHES_SELECTIONS]
+                                      + [_SUBSET_ID]}
+            for i in members.tolist()]
+
+    def run():
+        # REMOVE_VALUE rewrites each member document
+        written = 0
+        for d in docs:
+            written += len(to_json(d | {names.FLD_MATCHES_SELECTIONS: [
+                m for m in d[names.FLD_MATCHES_SELECTIONS] if m != _SUBSET_ID]}))
+        return written
+    return Benchmark(run, len(members), _subset_info(data, members, run()))
+
+
+def _subset_query_ids(data: DataSet, size: int) -> Benchmark:
+    members = _subset_members(data, size)
+    all_ids = np.array([d[names.FLD_KBASE_ID].encode() for d in data.genome_attribs])
+    # the kbase IDs of the members, as returned from the database
+    body = to_json([{names.FLD_KBASE_ID: data.genome_attribs[i][names.FLD_KBASE_ID]}
+                    for i in members.tolist()])
+
+    def run():
+        ids = json.loads(body)
+        return np.isin(all_ids, np.array([d[names.FLD_KBASE_ID].encode() for d in ids]))
+    return Benchmark(run, len(members), _subset_info(data, members, len(body)))
+
+
+def _subset_query_ordinals(data: DataSet, size: int) -> Benchmark:
+    members = _subset_members(data, size)
+    all_ordinals = np.arange(len(data.genome_attribs))
+    # the ordinals of the members, as returned from the database
+    body = to_json([{names.FLD_ORDINAL: o} for o in members.tolist()])
+
+    def run():
+        ords = json.loads(body)
+        return np.isin(all_ordinals, np.fromiter(
+            (d[names.FLD_ORDINAL] for d in ords), dtype=np.int64, count=len(ords)))
+    return Benchmark(run, len(members), _subset_info(data, members, len(body)))
+
+
+def _subset_save_bitmap(data: DataSet, size: int) -> Benchmark:
+    members = _subset_members(data, size)
+    ordinals = members.tolist()  # as returned from the database when marking
+
+    def run():
+        return base64.b64encode(BitMap(ordinals).serialize())
+    return Benchmark(run, len(members), _subset_info(data, members, len(run())))
+
+
+def _subset_query_bitmap(data: DataSet, size: int) -> Benchmark:
+    members = _subset_members(data, size)
+    all_ordinals = np.arange(len(data.genome_attribs))
+    # the stored bitmap document
+    body = to_json({names.FLD_SUBSET_BITMAP: base64.b64encode(
+        BitMap(members.tolist()).serialize()).decode("ascii")})
+
+    def run():
+        bitmap = BitMap.deserialize(base64.b64decode(json.loads(body)[names.FLD_SUBSET_BITMAP]))
+        return np.isin(all_ordinals, np.frombuffer(bitmap.to_array(), dtype=np.uint32))
+    return Benchmark(run, len(members), _subset_info(data, members, len(body)))
+
+
+def _subset_cases() -> dict[str, Callable[[DataSet], Benchmark]]:
+    # mark and delete costs for subset membership stored as _mtchsel arrays, the one time cost
+    # of saving the subset bitmap when marking, and the cost of building an in memory row mask
+    # from member kbase IDs vs. ordinals vs. the stored bitmap, for each subset size
+    cases = {}
+    for name, func in [
+        ("mark", _subset_mark),
+        ("save_bitmap", _subset_save_bitmap),
+        ("delete", _subset_delete),
+        ("query_ids", _subset_query_ids),
+        ("query_ordinals", _subset_query_ordinals),
+        ("query_bitmap", _subset_query_bitmap),
+    ]:
+        for size in _SUBSET_SIZES:
+            cases[f"subset_{name}_{size // 1000}k"] = (
+                lambda data, func=func, size=size: func(data, size))
+    return cases
+
+
+CASES = {
+    f.__name__: f for f in [
+        filterset_to_aql_standard,
+        filterset_to_aql_search,
+        heatmap_query,
+        heatmap_page,
+        heatmap_page_narrow,
+        heatmap_page_matrix,
+        heatmap_page_matrix_narrow,
+        genome_attribs_histogram,
+        genome_attribs_histogram_snapshot,
+        genome_attribs_filtered_count_snapshot,
+        query_table_rows,
+        query_table_dicts,
+        query_table_page,
+        query_table_page_cached,
+        table_page_full,
+        table_page_narrow,
+        serialize_table_validated,
+        serialize_table_fast,
+        gtdb_lineage_parse,
+        gtdb_lineage_parse_uncached,
+        gtdb_lineage_parse_many,
+        gtdb_taxonomy_file,
+        gtdb_taxa_count,
+        asgi_request_plain,
+        asgi_request_metrics,
+        execute_aql_plain,
+        execute_aql_metrics,
+        cursor_batch_full,
+        cursor_batch_streamed,
+        view_sorted_page_full_sort,
+        view_sorted_page_primary_sort,
+        compress_gzip_9,
+        compress_gzip,
+    ] + [
+        # zstd and brotli are optional
+        {compression.ZSTD: compress_zstd, compression.BROTLI: compress_br}[enc]
+        for enc in compression.available_encodings() if enc != compression.GZIP
+    ]
+} | _subset_cases()
@@ -0,0 +1,216 @@
+"""
+An in-memory stand in for the parts of the ArangoStorage class used by the query code paths.
+
+The fake does not interpret AQL. Instead each query is answered by a resolver function that
+is given the AQL and bind variables and returns the documents to be returned by the cursor.
+This allows benchmarking the Python side of the query code paths - AQL generation, cursor
+iteration, document mutation and serialization - without a database.
+"""
+
+from collections import deque
+from typing import Any, Callable, Iterable
+
+from aioarango.exceptions import CursorEmptyError
+
+
+# AQL, bind vars -> documents
+Resolver = Callable[[str, dict[str, Any]], Iterable[dict[str, Any]]]
+
+
+class FakeCursor:
+    """
+    An in-memory implementation of the subset of the aioarango.cursor.Cursor interface used by
+    the service.
+
+    Documents are shallow copied as they're returned, since the service code mutates returned
+    documents in place and the same documents are returned on every benchmark iteration.
+    """
+
+    def __init__(self, docs: Iterable[dict[str, Any]], count: bool = False, batch_size: int = 1000):
+        """
+        Create the cursor.
+
+        docs - the documents the cursor will return.
+        count - True to enable the count() method.
+        batch_size - the number of documents per simulated server round trip.
+        """
+        self._docs = iter(docs)
+        self._batch = deque()
+        self._batch_size = batch_size
+        self._has_more = True
+        self._count = None
+        if count:
+            docs = list(self._docs)
+            self._count = len(docs)
+            self._docs = iter(docs)
+        self.fetches = 0
+        self.received = 0
+        self.closed = False
+        self._close_callback = None
+        self._fetch()
+
+    def _fetch(self):
+        self.fetches += 1
+        for _ in range(self._batch_size):
+            try:
+                d = next(self._docs)
+            except StopIteration:
+                self._has_more = False
+                return
+            self._batch.append(dict(d) if isinstance(d, dict) else d)
+            self.received += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.next()
+
+    async def next(self) -> Any:
+        if not self._batch:
+            if not self._has_more:
+                raise StopAsyncIteration
+            self._fetch()
+            if not self._batch:
+                raise StopAsyncIteration
+        return self._batch.popleft()
+
+    def pop(self) -> Any:
+        if not self._batch:
+            raise CursorEmptyError("current batch is empty")
+        return self._batch.popleft()
+
+    def batch(self) -> deque:
+        return self._batch
+
+    def has_more(self) -> bool:
+        return self._has_more
+
+    def empty(self) -> bool:
+        return not self._batch
+
+    def count(self) -> int | None:
+        return self._count
+
+    def fetch_count(self) -> int:
+        return self.fetches
+
+    def received_count(self) -> int:
+        return self.received
+
+    def received_bytes(self) -> int:
+        # there's no serialized form, so response sizes aren't tracked
+        return 0
+
+    def set_close_callback(self, callback: Callable[["FakeCursor"], None]):
+        self._close_callback = callback
+
+    async def close(self, ignore_missing: bool = False) -> bool | None:
+        if self._close_callback:
+            callback, self._close_callback = self._close_callback, None
+            callback(self)
+        self.closed = True
+        return True
+
+
+class FakeStorage:
+    """
+    A fake ArangoStorage supporting the execute_aql method.
+
+    Instance variables:
+    queries - a list of the (AQL, bind vars) tuples that have been executed.
+    """
+
+    def __init__(self, resolver: Resolver, batch_size: int = 1000):
+        """
+        Create the storage fake.
+
+        resolver - a function that takes AQL and bind variables and returns the documents
+            the query would return.
+        batch_size - the number of documents per simulated server round trip.
+        """
+        self._resolver = resolver
+        self._batch_size = batch_size
+        self.queries = []
+
+    async def execute_aql(
+        self,
+        aql_str: str,
+        bind_vars: dict[str, Any] = None,
+        count: bool = False,
+        batch_size: int = None,
+        query_shape: Any = None,
+        op: str = None,
+    ) -> FakeCursor:
+        """
+        Execute an AQL query against the fake.
+
+        aql_str - the query.
+        bind_vars - the query's bind variables.
+        count - enable the cursor count() method.
+        batch_size - the number of documents per simulated server round trip. Defaults to the
+            batch size provided in the constructor.
+        query_shape - ignored.
+        op - ignored.
+        """
+        bind_vars = bind_vars or {}
+        self.queries.append((aql_str, bind_vars))
+        return FakeCursor(
+            self._resolver(aql_str, bind_vars), count, batch_size or self._batch_size)
+
+
+class _FakeAQL:
+
+    def __init__(self, storage: FakeStorage):
+        self._storage = storage
+
+    async def execute(
+        self,
+        query: str,
+        bind_vars: dict[str, Any] = None,
+        count: bool = False,
+        batch_size: int = None,
+        stream_batches: bool = False,  # batches are always in memory
+    ):
+        return await self._storage.execute_aql(query, bind_vars, count, batch_size)
+
+
+class FakeDatabase:
+    """
+    A fake of the aioarango StandardDatabase AQL interface, allowing the real ArangoStorage
+    execute_aql method to be benchmarked.
+    """
+
+    def __init__(self, resolver: Resolver, batch_size: int = 1000):
+        """
+        Create the database fake.
+
+        resolver - a function that takes AQL and bind variables and returns the documents
+            the query would return.
+        batch_size - the number of documents per simulated server round trip.
+        """
+        self.aql = _FakeAQL(FakeStorage(resolver, batch_size))
+
+
+def keep_resolver(docs: list[dict[str, Any]]) -> Resolver:
+    """
+    Create a resolver that returns all the documents, or the count of the documents if the
+    query is a count query. Applies the `keep` bind variable if present, as the database would,
+    but ignores any other filtering.
+
+    docs - the documents to return.
+    """
+    def resolver(aql: str, bind_vars: dict[str, Any]) -> Iterable[Any]:
+        if "COLLECT WITH COUNT" in aql or "RETURN COUNT(" in aql:
+            return [len(docs)]
+        limit = bind_vars.get("limit")
+        limit = limit if limit and limit < len(docs) else None
+        skip = bind_vars.get("skip", 0)
+        # slicing is a copy, so use an iterator for the common no skip or limit case
+        selected = docs[skip:skip + limit if limit else None] if skip or limit else iter(docs)
+        keep = bind_vars.get("keep")
+        if keep:
+            # KEEP() omits missing fields
+            return ({k: d[k] for k in keep if k in d} for d in selected)
+        return selected
+    return resolver
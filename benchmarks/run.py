@@ -0,0 +1,186 @@
+"""
+Run the service microbenchmarks and emit the results as JSON.
+
+usage: PYTHONPATH=. python -m benchmarks.run [-h] [--scale {small,medium,large} | --rows ROWS]
+                                            [--repeat REPEAT] [--warmup WARMUP] [--seed SEED]
+                                            [--bench BENCH [BENCH ...]] [--output OUTPUT]
+                                            [--compare COMPARE]
+
+e.g.
+PYTHONPATH=. python -m benchmarks.run --scale small --output bench_main.json
+PYTHONPATH=. python -m benchmarks.run --scale small --output bench_branch.json --compare bench_main.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+from benchmarks import synthetic_data
+from benchmarks.cases import CASES, DataSet
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _rss_bytes() -> int | None:
+    # the current, rather than peak, resident set size, which includes any memory mapped file
+    # pages that have been read. Linux only.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def run_benchmarks(
+    rows: int,
+    bench_names: list[str] = None,
+    repeat: int = 5,
+    warmup: int = 1,
+    seed: int = 42,
+) -> dict[str, Any]:
+    """
+    Run the benchmarks and return the results as a JSON compatible dict.
+
+    rows - the number of rows of synthetic data to generate.
+    bench_names - the names of the benchmarks to run, or None to run all benchmarks.
+    repeat - the number of timed runs per benchmark.
+    warmup - the number of untimed runs per benchmark prior to the timed runs.
+    seed - the seed for the synthetic data random number generator.
+    """
+    bench_names = bench_names or list(CASES)
+    unknown = set(bench_names) - set(CASES)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {sorted(unknown)}")
+    data = DataSet(rows, seed)
+    results = []
+    for name in bench_names:
+        bench = CASES[name](data)
+        gc.collect()
+        rss_start = _rss_bytes()
+        for _ in range(warmup):
+            bench.func()
+        times = []
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            bench.func()
+            times.append(time.perf_counter() - start)
+        rss = _rss_bytes()
+        results.append({
+            "name": name,
+            "ops": bench.ops,
+            "runs_sec": times,
+            "min_sec": min(times),
+            "median_sec": statistics.median(times),
+            "mean_sec": statistics.mean(times),
+            "stdev_sec": statistics.stdev(times) if len(times) > 1 else 0.0,
+            "min_usec_per_op": min(times) / bench.ops * 1_000_000,
+            "rss_bytes": rss,
+            "rss_delta_bytes": rss - rss_start if rss is not None else None,
+        } | ({"info": bench.info} if bench.info else {}))
+        print(f"{name}: min {min(times):.4f}s over {repeat} runs, {bench.ops} ops",
+              file=sys.stderr)
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "rows": rows,
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(old: dict[str, Any], new: dict[str, Any]) -> list[str]:
+    """
+    Compare two sets of benchmark results and return a table of the minimum run times as a list
+    of lines.
+
+    old - the baseline results.
+    new - the results to compare against the baseline.
+    """
+    oldres = {r["name"]: r for r in old["results"]}
+    lines = [f"{'benchmark':<30} {'old (s)':>10} {'new (s)':>10} {'new/old':>8}"]
+    for r in new["results"]:
+        o = oldres.get(r["name"])
+        if not o:
+            lines.append(f"{r['name']:<30} {'-':>10} {r['min_sec']:>10.4f} {'-':>8}")
+        else:
+            lines.append(f"{r['name']:<30} {o['min_sec']:>10.4f} {r['min_sec']:>10.4f} "
+                         + f"{r['min_sec'] / o['min_sec']:>8.2f}")
+    if old["rows"] != new["rows"]:
+        lines.append(f"WARNING: row counts differ: {old['rows']} vs {new['rows']}")
+    return lines
+
+
+def _get_parser():
+    parser = argparse.ArgumentParser(
+        description="Run the service microbenchmarks and emit the results as JSON.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument(
+        "--scale",
+        choices=list(synthetic_data.SCALES),
+        default="small",
+        help="The size of the synthetic data set: "
+            + ", ".join(f"{k}={v}" for k, v in synthetic_data.SCALES.items()) + " rows",
+    )
+    size.add_argument(
+        "--rows", type=int, help="The number of rows of synthetic data. Overrides --scale.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the synthetic data")
+    parser.add_argument(
+        "--bench", nargs="+", choices=list(CASES), help="Benchmarks to run. Default is all.")
+    parser.add_argument(
+        "--output", type=str, help="File to write the JSON results to. Default is stdout.")
+    parser.add_argument(
+        "--compare",
+        type=str,
+        help="A JSON results file from a previous run to compare against. "
+            + "The comparison is printed to stderr.",
+    )
+    return parser
+
+
+def main():
+    parser = _get_parser()
+    args = parser.parse_args()
+    rows = args.rows if args.rows else synthetic_data.SCALES[args.scale]
+    if rows < 1:
+        parser.error("rows must be > 0")
+    if args.repeat < 1:
+        parser.error("repeat must be > 0")
+    if args.warmup < 0:
+        parser.error("warmup must be >= 0")
+    res = run_benchmarks(rows, args.bench, args.repeat, args.warmup, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(res, f, indent=4)
+    else:
+        print(json.dumps(res, indent=4))
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print("\n".join(compare(old, res)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
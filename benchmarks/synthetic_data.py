@@ -0,0 +1,188 @@
+"""
+Generators for synthetic data resembling the documents stored in the service's Arango
+collections.
+
+The data is generated deterministically from a seed so that benchmark results are comparable
+across commits.
+"""
+
+import random
+from typing import Any
+
+import src.common.storage.collection_and_field_names as names
+from src.common.gtdb_lineage import GTDBRank
+from src.common.product_models import columnar_attribs_common_models as col_models
+from src.common.product_models import heatmap_common_models as heatmap_models
+from src.service.data_products.data_product_processing import (
+    MATCH_ID_PREFIX,
+    SELECTION_ID_PREFIX,
+)
+
+
+COLLECTION_ID = "BENCH"
+LOAD_VER = "bench.1"
+MATCH_ID = "benchmatch"
+SELECTION_ID = "benchsel"
+
+# Rows counts for the standard benchmark scales
+SCALES = {
+    "small": 300_000,
+    "medium": 1_000_000,
+    "large": 5_000_000,
+}
+
+# The number of distinct names to generate per GTDB rank. The small number of higher rank
+# names relative to the number of species mirrors the GTDB taxonomy.
+_NAMES_PER_RANK = {
+    GTDBRank.DOMAIN: 2,
+    GTDBRank.PHYLUM: 180,
+    GTDBRank.CLASS: 500,
+    GTDBRank.ORDER: 1800,
+    GTDBRank.FAMILY: 5000,
+    GTDBRank.GENUS: 25000,
+    GTDBRank.SPECIES: 85000,
+}
+
+# the fraction of rows in the match and selection
+_MATCH_FRACTION = 0.3
+_SELECTION_FRACTION = 0.1
+
+GENOME_ATTRIBS_COLUMNS = [
+    col_models.AttributesColumn(key=names.FLD_KBASE_ID, type=col_models.ColumnType.STRING,
+        filter_strategy=col_models.FilterStrategy.IDENTITY),
+    col_models.AttributesColumn(key=names.FLD_GENOME_ATTRIBS_GTDB_LINEAGE,
+        type=col_models.ColumnType.STRING, filter_strategy=col_models.FilterStrategy.PREFIX),
+    col_models.AttributesColumn(key="checkm_completeness", type=col_models.ColumnType.FLOAT,
+        min_value=0, max_value=100),
+    col_models.AttributesColumn(key="checkm_contamination", type=col_models.ColumnType.FLOAT,
+        min_value=0, max_value=100),
+    col_models.AttributesColumn(key="contig_count", type=col_models.ColumnType.INT,
+        min_value=1, max_value=10000),
+    col_models.AttributesColumn(key="gtdb_representative", type=col_models.ColumnType.BOOL),
+    col_models.AttributesColumn(key="release_date", type=col_models.ColumnType.DATE,
+        min_value="2000-01-01", max_value="2023-12-31"),
+]
+
+
+def _rank_name(rank: GTDBRank, i: int) -> str:
+    return f"{rank.abbrev}_bench_{i}"
+
+
+def lineage_strings(count: int, seed: int = 42) -> list[str]:
+    """
+    Generate GTDB lineage strings. About 5% of the strings are unresolved at the species level.
+
+    count - the number of lineage strings to generate.
+    seed - the seed for the random number generator.
+    """
+    rand = random.Random(seed)
+    ret = []
+    for _ in range(count):
+        # generate the species and derive the higher ranks from it so the lineages form a tree
+        species = rand.randrange(_NAMES_PER_RANK[GTDBRank.SPECIES])
+        parts = []
+        for rank in GTDBRank:
+            idx = species * _NAMES_PER_RANK[rank] // _NAMES_PER_RANK[GTDBRank.SPECIES]
+            parts.append(f"{rank.abbrev}__{_rank_name(rank, idx)}")
+        if rand.random() < 0.05:
+            parts[-1] = f"{GTDBRank.SPECIES.abbrev}__"
+        ret.append(";".join(parts))
+    return ret
+
+
+def _matchsel(rand: random.Random) -> list[str]:
+    ms = []
+    if rand.random() < _MATCH_FRACTION:
+        ms.append(MATCH_ID_PREFIX + MATCH_ID)
+    if rand.random() < _SELECTION_FRACTION:
+        ms.append(SELECTION_ID_PREFIX + SELECTION_ID)
+    return ms
+
+
+def genome_attribs_docs(count: int, seed: int = 42) -> list[dict[str, Any]]:
+    """
+    Generate genome attributes documents as they would be stored in the database.
+
+    count - the number of documents to generate.
+    seed - the seed for the random number generator.
+    """
+    rand = random.Random(seed)
+    lineages = lineage_strings(count, seed)
+    ret = []
+    for i in range(count):
+        kbase_id = f"GB_GCA_{i:09d}.1"
+        ret.append({
+            names.FLD_ARANGO_KEY: f"{COLLECTION_ID}_{LOAD_VER}_{i}",
+            names.FLD_COLLECTION_ID: COLLECTION_ID,
+            names.FLD_LOAD_VERSION: LOAD_VER,
+            names.FLD_KBASE_ID: kbase_id,
+            names.FLD_GENOME_ATTRIBS_GTDB_LINEAGE: lineages[i],
+            "checkm_completeness": round(rand.uniform(50, 100), 2),
+            "checkm_contamination": round(rand.expovariate(1 / 2), 2),
+            "contig_count": rand.randint(1, 10000),
+            "gtdb_representative": rand.random() < 0.1,
+            "release_date": f"{rand.randint(2000, 2023)}-{rand.randint(1, 12):02d}-"
+                + f"{rand.randint(1, 28):02d}",
+            names.FLD_MATCHES_SELECTIONS: _matchsel(rand),
+        })
+    return ret
+
+
+def heatmap_meta(count: int, columns: int = 50) -> dict[str, Any]:
+    """
+    Generate the heatmap metadata document matching the documents from `heatmap_docs`.
+
+    count - the number of heatmap rows.
+    columns - the number of heatmap columns per row.
+    """
+    return {
+        names.FLD_ARANGO_KEY: f"{COLLECTION_ID}_{LOAD_VER}",
+        names.FLD_COLLECTION_ID: COLLECTION_ID,
+        names.FLD_LOAD_VERSION: LOAD_VER,
+        heatmap_models.FIELD_HEATMAP_CATEGORIES: [{
+            heatmap_models.FIELD_HEATMAP_CATEGORY: "bench",
+            heatmap_models.FIELD_HEATMAP_COLUMNS: [{
+                heatmap_models.FIELD_HEATMAP_COL_ID: str(c),
+                heatmap_models.FIELD_HEATMAP_NAME: f"column {c}",
+                heatmap_models.FIELD_HEATMAP_DESCR: f"column {c}",
+                heatmap_models.FIELD_HEATMAP_TYPE: heatmap_models.ColumnType.BOOL.value
+                    if c % 2 else heatmap_models.ColumnType.COUNT.value,
+            } for c in range(columns)],
+        }],
+        heatmap_models.FIELD_HEATMAP_MIN_VALUE: 0,
+        heatmap_models.FIELD_HEATMAP_MAX_VALUE: 20,
+        heatmap_models.FIELD_HEATMAP_COUNT: count,
+    }
+
+
+def heatmap_docs(count: int, columns: int = 50, seed: int = 42) -> list[dict[str, Any]]:
+    """
+    Generate heatmap row documents in the transformed form they're stored in the database.
+
+    count - the number of documents to generate.
+    columns - the number of heatmap columns per row.
+    seed - the seed for the random number generator.
+    """
+    rand = random.Random(seed)
+    ret = []
+    for i in range(count):
+        doc = {
+            names.FLD_ARANGO_KEY: f"{COLLECTION_ID}_{LOAD_VER}_{i}",
+            names.FLD_COLLECTION_ID: COLLECTION_ID,
+            names.FLD_LOAD_VERSION: LOAD_VER,
+            names.FLD_KBASE_ID: f"69036_{i}_1",
+            names.FLD_KB_DISPLAY_NAME: f"genome {i}",
+            heatmap_models.FIELD_HEATMAP_ROW_CELLS: [
+                {
+                    heatmap_models.FIELD_HEATMAP_CELL_ID: f"{i * columns + c}",
+                    heatmap_models.FIELD_HEATMAP_COL_ID: str(c),
+                    # mix of bool and numeric columns like the microtrait heatmap
+                    heatmap_models.FIELD_HEATMAP_CELL_VALUE:
+                        rand.random() < 0.5 if c % 2 else rand.randint(0, 20),
+                } for c in range(columns)
+            ],
+            names.FLD_MATCHES_SELECTIONS: _matchsel(rand),
+        }
+        heatmap_models.transform_heatmap_row_cells(doc)
+        ret.append(doc)
+    return ret
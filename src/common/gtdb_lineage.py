@@ -3,10 +3,17 @@ Functions for processing GTDB style lineage information.
 """
 
 import enum
+import functools
+import heapq
 from collections import namedtuple, defaultdict
 from typing import Iterable, Self
 
 
+# The maximum number of distinct lineage strings and lineage nodes to cache. GTDB releases
+# contain a few hundred thousand distinct lineages.
+LINEAGE_CACHE_SIZE = 500_000
+
+
 class GTDBLineageError(Exception):
     """The general GTDB lineage error. """
 
@@ -86,12 +93,15 @@ class GTDBRank(str, enum.Enum):
 
 class GTDBLineageNode:
     """
-    A node in a GTDB lineage.
+    A node in a GTDB lineage. Nodes are immutable, and nodes created by parsing lineage strings
+    are shared between lineages.
 
     Instance variables:
     rank - the node's rank
     name - the node's scientific name.
     """
+    __slots__ = ("rank", "name")
+
     rank: GTDBRank
     name: str
 
@@ -102,8 +112,11 @@ class GTDBLineageNode:
         rank - the node's rank.
         name - the scientific name of the node.
         """
-        self.rank = rank
-        self.name = name
+        object.__setattr__(self, "rank", rank)
+        object.__setattr__(self, "name", name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
 
     def __str__(self):
         return f"{self.rank.abbrev}__{self.name}"
@@ -115,6 +128,60 @@ class GTDBLineageNode:
     def __eq__(self, other):
         return (self.rank, self.name) == (other.rank, other.name)
 
+    def __hash__(self):
+        return hash((self.rank, self.name))
+
+
+_RANKS = tuple(GTDBRank)
+
+
+@functools.lru_cache(maxsize=LINEAGE_CACHE_SIZE)
+def _intern_node(rank: GTDBRank, name: str) -> GTDBLineageNode:
+    return GTDBLineageNode(rank, name)
+
+
+@functools.lru_cache(maxsize=LINEAGE_CACHE_SIZE)
+def _parse_lineage(linstr: str) -> tuple[tuple[GTDBLineageNode, ...], bool]:
+    # Returns the lineage nodes and whether the ranks are in the correct order. Errors are not
+    # cached, so incorrect lineage strings are parsed every time.
+    # This may probably not handle incorrectly formatted lineage strings well - haven't thought
+    # through all possible cases. For now all our inputs are expected to be coming from GTDB
+    # or GTDB_tk so we'll worry about that later.
+    ret = []
+    resolved = True
+    linparts = linstr.strip().split(";")
+    linparts = linparts if linparts[-1].strip() else linparts[:-1]  # remove trailing ;
+    for lin in linparts:
+        taxa_abbrev, sep, taxa_name = lin.partition("__")
+        if not sep or "__" in taxa_name:
+            raise GTDBLineageParseError(f"Invalid lineage node '{lin}' in lineage '{linstr}'")
+        taxa_abbrev, taxa_name = taxa_abbrev.strip(), taxa_name.strip()
+        if not taxa_name:
+            resolved = False
+        elif not resolved:
+            raise GTDBLineageParseError(
+                f"Found resolved rank after unresolved rank in lineage string '{linstr}'")
+        else:
+            try:
+                ret.append(_intern_node(GTDBRank.from_abbreviation(taxa_abbrev), taxa_name))
+            except ValueError as e:  # maybe want a more specific error?
+                raise GTDBLineageParseError(
+                    f"Illegal rank in lineage string '{linstr}': {str(e)}")
+    if not ret:
+        raise GTDBLineageResolutionError(
+            f"No lineage information in lineage string '{linstr}'")
+    ranks_ok = all(n.rank is r for n, r in zip(ret, _RANKS))
+    return tuple(ret), ranks_ok
+
+
+def clear_lineage_cache():
+    """
+    Clear the lineage string and lineage node caches. Normally this should not be necessary, as
+    the caches are bounded.
+    """
+    _parse_lineage.cache_clear()
+    _intern_node.cache_clear()
+
 
 class GTDBLineage:
     """
@@ -129,46 +196,46 @@ class GTDBLineage:
 
     def __init__(self, linstr: str, force_complete=False):
         """
-        Create the lineage from a gdtb lineage string, omitting unresolved ranks.
+        Create the lineage from a gdtb lineage string, omitting unresolved ranks. Parsed lineage
+        strings are cached, and the lineage tuple is shared between lineages created from the
+        same string.
 
         linstr - the lineage string
         force_complete - throw a GTDBResolutionError if the lineage string is not fully resolved.
         """
-        # This may probably not handle incorrectly formatted lineage strings well - haven't thought
-        # through all possible cases. For now all our inputs are expected to be coming from GTDB
-        # or GTDB_tk so we'll worry about that later.
-        ret = []
-        resolved = True
-        linparts = linstr.strip().split(";")
-        linparts = linparts if linparts[-1].strip() else linparts[:-1]  # remove trailing ;
-        for lin in linparts:
-            node = lin.split("__")
-            if len(node) != 2:
-                raise GTDBLineageParseError(f"Invalid lineage node '{lin}' in lineage '{linstr}'")
-            taxa_abbrev, taxa_name = [n.strip() for n in node]
-            if not taxa_name:
-                resolved = False
-            elif not resolved:
-                raise GTDBLineageParseError(
-                    f"Found resolved rank after unresolved rank in lineage string '{linstr}'")
-            else:
-                try:
-                    ret.append(
-                        GTDBLineageNode(GTDBRank.from_abbreviation(taxa_abbrev), taxa_name))
-                except ValueError as e:  # maybe want a more specific error?
-                    raise GTDBLineageParseError(
-                        f"Illegal rank in lineage string '{linstr}': {str(e)}")
-        if not ret:
-            raise GTDBLineageResolutionError(
-                f"No lineage information in lineage string '{linstr}'")
-        if force_complete and ret[-1].rank != GTDBRank.SPECIES:
+        self.lineage = self._check(linstr, _parse_lineage(linstr), force_complete)
+
+    @staticmethod
+    def _check(
+        linstr: str, parsed: tuple[tuple[GTDBLineageNode, ...], bool], force_complete: bool
+    ) -> tuple[GTDBLineageNode, ...]:
+        lineage, ranks_ok = parsed
+        if force_complete and lineage[-1].rank != GTDBRank.SPECIES:
             raise GTDBLineageResolutionError(f"Lineage '{linstr}' does not end with species")
-        ranks = [r for r in GTDBRank][:len(ret)]
-        for n, r in zip(ret, ranks):
-            if n.rank != r:
-                raise GTDBLineageRankError(
-                    f"Bad rank order in lineage '{linstr}'")
-        self.lineage = tuple(ret)
+        if not ranks_ok:
+            raise GTDBLineageRankError(f"Bad rank order in lineage '{linstr}'")
+        return lineage
+
+    @classmethod
+    def parse_many(cls, linstrs: Iterable[str], force_complete=False) -> list[Self]:
+        """
+        Create many lineages from gtdb lineage strings. Each distinct string in the input is
+        split and checked once.
+
+        linstrs - the lineage strings.
+        force_complete - throw a GTDBResolutionError if a lineage string is not fully resolved.
+        """
+        parsed = {}
+        ret = []
+        for linstr in linstrs:
+            lineage = parsed.get(linstr)
+            if lineage is None:
+                lineage = cls._check(linstr, _parse_lineage(linstr), force_complete)
+                parsed[linstr] = lineage
+            lin = cls.__new__(cls)
+            lin.lineage = lineage
+            ret.append(lin)
+        return ret
 
     def __str__(self):
         return ";".join([str(n) for n in self.lineage])
@@ -194,6 +261,20 @@ class GTDBLineage:
 TaxaNodeCount = namedtuple("TaxaNodeCount", "rank name count")
 
 
+def top_k_taxa(counts: Iterable[TaxaNodeCount], k: int) -> list[TaxaNodeCount]:
+    """
+    Select the taxa with the highest counts in a single pass with a heap of size k. The results
+    are sorted by count, descending, and then by name, ascending, so ties are broken
+    deterministically.
+
+    counts - the taxa counts.
+    k - the maximum number of taxa to return.
+    """
+    if k < 1:
+        raise ValueError("k must be > 0")
+    return heapq.nsmallest(k, counts, key=lambda tc: (-tc.count, tc.name))
+
+
 class GTDBTaxaCount:
     """
     Counts GTDB taxa by rank and name. Implements the Iterable interface.
@@ -213,7 +294,32 @@ class GTDBTaxaCount:
         for lin in lineage.lineage:
             self._counts[lin.rank][lin.name] += 1
 
+    def add_many(self, gtdb_lineage_strings: Iterable[str]) -> None:
+        """
+        Process many GTDB lineage strings and add them to the taxa count information.
+        """
+        # count the distinct strings first so each lineage is parsed and counted once
+        strcounts = defaultdict(int)
+        for linstr in gtdb_lineage_strings:
+            strcounts[linstr] += 1
+        for linstr, count in strcounts.items():
+            for lin in GTDBLineage(linstr).lineage:
+                self._counts[lin.rank][lin.name] += count
+
     def __iter__(self) -> Iterable[TaxaNodeCount]:
         for rank in self._counts:
             for name in self._counts[rank]:
                 yield TaxaNodeCount(rank, name, self._counts[rank][name])
+
+    def top_k(self, k: int) -> dict[GTDBRank, list[TaxaNodeCount]]:
+        """
+        Get the k taxa with the highest counts for each rank. See top_k_taxa for the sort
+        order.
+
+        k - the maximum number of taxa to return per rank.
+        """
+        if k < 1:
+            raise ValueError("k must be > 0")
+        return {rank: top_k_taxa(
+                    (TaxaNodeCount(rank, name, count) for name, count in names.items()), k)
+                for rank, names in self._counts.items()}
@@ -0,0 +1,480 @@
+"""
+Dense, memory mapped storage for heatmap data products.
+
+A heatmap load version is written by the loaders into a directory of numpy files:
+
+* A structured array of the cell values with one row per heatmap row and one field per
+  heatmap column, where the dtype of each field is determined by the column type.
+* A 2D boolean array marking missing cells, a 2D array of the cell IDs, and the row
+  kbase IDs and display names as fixed width UTF-8 byte arrays.
+* The remainder of each row document (e.g. the row metadata) and the cell details as
+  JSON encoded documents concatenated into a single byte array with an offset index.
+
+The rows are written sorted by the bytes of the display name, but ArangoDB sorts strings with
+its ICU collation, which can't be reproduced here. The service therefore records the ArangoDB
+display name order of the rows when it opens a matrix, and pages are served by slicing that
+order. All the arrays are memory mapped when read, so only the pages of the files that are
+accessed are read from disk and the memory can be shared between processes.
+
+Match and selection marks change over time and are not part of the files; they remain in
+ArangoDB. If the rows have ordinals, the ordinals are stored so that stored subset bitmaps, or
+the member ordinals, can be applied to the rows rather than the longer kbase IDs.
+"""
+
+import json
+import os
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+from pyroaring import BitMap
+
+import src.common.storage.collection_and_field_names as names
+from src.common.product_models import heatmap_common_models as heatmap_models
+from src.common.product_models.heatmap_common_models import ColumnType
+
+
+_FORMAT_VERSION = 1
+
+_INDEX = "index.json"
+_VALUES = "values.npy"
+_MISSING = "missing.npy"
+_CELL_IDS = "cell_ids.npy"
+_KBASE_IDS = "kbase_ids.npy"
+_DISPLAY_NAMES = "display_names.npy"
+_ROW_DOCS = "row_docs.npy"
+_ROW_DOC_OFFSETS = "row_doc_offsets.npy"
+_DETAIL_IDS = "detail_ids.npy"
+_DETAIL_DOCS = "detail_docs.npy"
+_DETAIL_DOC_OFFSETS = "detail_doc_offsets.npy"
+_ORDINALS = "ordinals.npy"
+
+_IDX_COLLECTION_ID = "coll"
+_IDX_LOAD_VERSION = "load_ver"
+_IDX_COLUMNS = "columns"
+_IDX_COUNT = "count"
+_IDX_VERSION = "format_version"
+
+_DTYPES = {
+    ColumnType.FLOAT: np.float64,
+    ColumnType.INT: np.int64,
+    ColumnType.COUNT: np.int64,
+    ColumnType.BOOL: np.bool_,
+}
+
+# Fields in the row documents that are not returned to users or are stored elsewhere
+_ROW_DOC_SKIP_FIELDS = {
+    names.FLD_ARANGO_KEY,
+    names.FLD_ARANGO_ID,
+    "_rev",
+    names.FLD_COLLECTION_ID,
+    names.FLD_LOAD_VERSION,
+    names.FLD_MATCHES_SELECTIONS,
+    names.FLD_ORDINAL,
+}
+
+
+def _field(column_index: int) -> str:
+    # the column IDs are strings and could in theory be anything, so don't use them as
+    # structured array field names
+    return f"c{column_index}"
+
+
+def _check_value(col_id: str, type_: ColumnType, val: Any):
+    if type_ == ColumnType.BOOL:
+        ok = isinstance(val, bool)
+    elif type_ == ColumnType.FLOAT:
+        ok = isinstance(val, (int, float)) and not isinstance(val, bool)
+    else:
+        ok = isinstance(val, int) and not isinstance(val, bool)
+    if not ok:
+        raise ValueError(f"Illegal value for column {col_id} of type {type_.value}: {val}")
+
+
+def _encode_docs(docs: Iterable[dict[str, Any]]) -> tuple[np.ndarray, np.ndarray]:
+    encoded = [json.dumps(d).encode("utf-8") for d in docs]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded], dtype=np.int64)
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _utf8_array(strings: list[str]) -> np.ndarray:
+    # numpy can't create a zero width byte string array, so always use at least 1 byte
+    encoded = [s.encode("utf-8") for s in strings]
+    width = max([len(e) for e in encoded] + [1])
+    return np.array(encoded, dtype=f"S{width}")
+
+
+def write_heatmap_matrix(
+    directory: Path,
+    meta: dict[str, Any],
+    rows: list[dict[str, Any]],
+    cell_details: list[dict[str, Any]],
+):
+    """
+    Write a heatmap load version as a set of numpy files. Any existing files for the load
+    version are replaced.
+
+    directory - the directory in which to write the files. The files are written to a temporary
+        directory which is then moved into place.
+    meta - the heatmap metadata document, including the collection ID and load version.
+    rows - the heatmap row documents, with the cells transformed by
+        `heatmap_common_models.transform_heatmap_row_cells`.
+    cell_details - the heatmap cell detail documents.
+    """
+    directory = Path(directory)
+    columns = [(str(c[heatmap_models.FIELD_HEATMAP_COL_ID]),
+                ColumnType(c[heatmap_models.FIELD_HEATMAP_TYPE]))
+               for cat in meta[heatmap_models.FIELD_HEATMAP_CATEGORIES]
+               for c in cat[heatmap_models.FIELD_HEATMAP_COLUMNS]
+    ]
+    # nulls first, as in an ArangoDB sort, and then by bytes. This is only a stable default
+    # order; the service replaces it with the ArangoDB order via `HeatMapMatrix.set_row_order`.
+    rows = sorted(rows, key=lambda r: (
+        r.get(names.FLD_KB_DISPLAY_NAME) is not None,
+        (r.get(names.FLD_KB_DISPLAY_NAME) or "").encode("utf-8"),
+        r[names.FLD_KBASE_ID],
+    ))
+    count = len(rows)
+    values = np.zeros(count, dtype=[(_field(i), _DTYPES[t]) for i, (_, t) in enumerate(columns)])
+    missing = np.zeros((count, len(columns)), dtype=np.bool_)
+    cell_ids = [[""] * len(columns) for _ in range(count)]
+    cell_keys = set()
+    for i, (col_id, type_) in enumerate(columns):
+        val_key = heatmap_models.form_heatmap_cell_val_key(col_id)
+        id_key = heatmap_models.form_heatmap_cell_id_key(col_id)
+        cell_keys |= {val_key, id_key}
+        col = values[_field(i)]
+        for j, r in enumerate(rows):
+            if r.get(val_key) is None:
+                missing[j, i] = True
+            else:
+                _check_value(col_id, type_, r[val_key])
+                col[j] = r[val_key]
+                cell_ids[j][i] = r[id_key]
+    skip = _ROW_DOC_SKIP_FIELDS | cell_keys
+    row_docs = [{k: v for k, v in r.items() if k not in skip} for r in rows]
+    cell_details = sorted(
+        [{heatmap_models.FIELD_HEATMAP_CELL_ID: d[heatmap_models.FIELD_HEATMAP_CELL_ID],
+          heatmap_models.FIELD_HEATMAP_VALUES: d[heatmap_models.FIELD_HEATMAP_VALUES]}
+         for d in cell_details],
+        key=lambda d: d[heatmap_models.FIELD_HEATMAP_CELL_ID].encode("utf-8")
+    )
+    tmpdir = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    os.makedirs(tmpdir)
+    np.save(tmpdir / _VALUES, values)
+    np.save(tmpdir / _MISSING, missing)
+    np.save(tmpdir / _CELL_IDS, _utf8_array([c for r in cell_ids for c in r]).reshape(
+        (count, len(columns))))
+    np.save(tmpdir / _KBASE_IDS, _utf8_array([r[names.FLD_KBASE_ID] for r in rows]))
+    np.save(tmpdir / _DISPLAY_NAMES, _utf8_array(
+        [r.get(names.FLD_KB_DISPLAY_NAME) or "" for r in rows]))
+    docs, offsets = _encode_docs(row_docs)
+    np.save(tmpdir / _ROW_DOCS, docs)
+    np.save(tmpdir / _ROW_DOC_OFFSETS, offsets)
+    np.save(tmpdir / _DETAIL_IDS, _utf8_array(
+        [d[heatmap_models.FIELD_HEATMAP_CELL_ID] for d in cell_details]))
+    docs, offsets = _encode_docs(cell_details)
+    np.save(tmpdir / _DETAIL_DOCS, docs)
+    np.save(tmpdir / _DETAIL_DOC_OFFSETS, offsets)
+    if rows and all(names.FLD_ORDINAL in r for r in rows):
+        np.save(tmpdir / _ORDINALS, np.array([r[names.FLD_ORDINAL] for r in rows], dtype=np.int64))
+    with open(tmpdir / _INDEX, "w") as f:
+        json.dump({
+            _IDX_VERSION: _FORMAT_VERSION,
+            _IDX_COLLECTION_ID: meta[names.FLD_COLLECTION_ID],
+            _IDX_LOAD_VERSION: meta[names.FLD_LOAD_VERSION],
+            _IDX_COUNT: count,
+            _IDX_COLUMNS: [{heatmap_models.FIELD_HEATMAP_COL_ID: c,
+                            heatmap_models.FIELD_HEATMAP_TYPE: t.value} for c, t in columns],
+        }, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory.parent, exist_ok=True)
+    os.replace(tmpdir, directory)
+
+
+class HeatMapMatrix:
+    """
+    A read only, memory mapped heatmap load version written by `write_heatmap_matrix`.
+
+    Row indexes are positions in the files. `row_order` holds the row indexes in display name
+    sort order.
+
+    Instance variables:
+    collection_id - the ID of the collection containing the heatmap.
+    load_ver - the load version of the heatmap.
+    count - the number of rows in the heatmap.
+    column_ids - the IDs of the heatmap columns in render order.
+    """
+
+    def __init__(self, directory: Path):
+        """
+        Open the heatmap files.
+
+        directory - the directory containing the files.
+        """
+        directory = Path(directory)
+        with open(directory / _INDEX) as f:
+            index = json.load(f)
+        if index[_IDX_VERSION] != _FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported heatmap matrix format version {index[_IDX_VERSION]} in {directory}")
+        self.collection_id = index[_IDX_COLLECTION_ID]
+        self.load_ver = index[_IDX_LOAD_VERSION]
+        self.count = index[_IDX_COUNT]
+        self.column_ids = [c[heatmap_models.FIELD_HEATMAP_COL_ID] for c in index[_IDX_COLUMNS]]
+        self._col_index = {c: i for i, c in enumerate(self.column_ids)}
+        # np.asarray strips the memmap subclass, which has significant per index overhead,
+        # but the data is still backed by the mapped file
+        load = lambda f: np.asarray(np.load(directory / f, mmap_mode="r"))
+        self._values = load(_VALUES)
+        self._missing = load(_MISSING)
+        self._cell_ids = load(_CELL_IDS)
+        self._kbase_ids = load(_KBASE_IDS)
+        self._display_names = load(_DISPLAY_NAMES)
+        self._row_docs = load(_ROW_DOCS)
+        self._row_doc_offsets = load(_ROW_DOC_OFFSETS)
+        self._detail_ids = load(_DETAIL_IDS)
+        self._detail_docs = load(_DETAIL_DOCS)
+        self._detail_doc_offsets = load(_DETAIL_DOC_OFFSETS)
+        self._ordinals = load(_ORDINALS) if (directory / _ORDINALS).is_file() else None
+        self._row_order_recorded = False
+        self._set_row_order(np.arange(self.count, dtype=np.int64))
+
+    @property
+    def has_ordinals(self) -> bool:
+        """
+        True if the row ordinals are stored with the heatmap and `bitmap_mask` and `ordinal_mask`
+        can be used.
+        """
+        return self._ordinals is not None
+
+    @property
+    def has_row_order(self) -> bool:
+        """ True if the display name order of the rows has been set with `set_row_order`. """
+        return self._row_order_recorded
+
+    @property
+    def row_order(self) -> np.ndarray:
+        """
+        The row indexes in display name sort order. Until `set_row_order` is called, the rows are
+        sorted by the bytes of the display name.
+        """
+        return self._row_order
+
+    def _set_row_order(self, order: np.ndarray):
+        self._row_order = order
+        self._ordered_names = self._display_names[order]
+        # a stable sort means the last of a run of equal names is the last in display name order
+        self._name_index = np.argsort(self._ordered_names, kind="stable")
+
+    def set_row_order(self, row_ids: Iterable[int | str]):
+        """
+        Set the display name sort order of the rows, as returned from ArangoDB.
+
+        row_ids - the ordinals of the rows, if the matrix has ordinals, or the kbase IDs otherwise,
+            in display name sort order.
+        """
+        if self._ordinals is not None:
+            keys = self._ordinals
+            ids = np.fromiter(row_ids, dtype=np.int64)
+        else:
+            keys = self._kbase_ids
+            ids = [k.encode("utf-8") for k in row_ids]
+            ids = np.array(ids) if ids else np.zeros(0, dtype=keys.dtype)
+        err = ValueError("The row order does not contain each heatmap row exactly once")
+        if len(ids) != self.count:
+            raise err
+        sorter = np.argsort(keys)
+        order = sorter[np.searchsorted(keys, ids, sorter=sorter).clip(max=max(self.count - 1, 0))]
+        if (keys[order] != ids).any() or len(np.unique(order)) != self.count:
+            raise err
+        self._set_row_order(order.astype(np.int64))
+        self._row_order_recorded = True
+
+    def start_position(self, start_after: str | None) -> int | None:
+        """
+        Get the position in `row_order` of the first row with a display name after the given
+        name.
+
+        start_after - the display name. If None or empty, 0 is returned.
+
+        Returns None if no row has the display name, as where the name falls in the ArangoDB
+        collation order can't be determined.
+        """
+        if not start_after:
+            return 0
+        name = start_after.encode("utf-8")
+        i = int(np.searchsorted(self._ordered_names, name, side="right", sorter=self._name_index))
+        if not i or self._ordered_names[self._name_index[i - 1]] != name:
+            return None
+        return int(self._name_index[i - 1]) + 1
+
+    def row_mask(self, kbase_ids: Iterable[str]) -> np.ndarray:
+        """
+        Get a boolean array, one entry per row, that is True where the row's kbase ID is in the
+        given IDs.
+
+        kbase_ids - the IDs to find.
+        """
+        ids = [k.encode("utf-8") for k in kbase_ids]
+        if not ids:
+            return np.zeros(self.count, dtype=np.bool_)
+        return np.isin(self._kbase_ids, np.array(ids))
+
+    def ordinal_mask(self, ordinals: Iterable[int]) -> np.ndarray:
+        """
+        Get a boolean array, one entry per row, that is True where the row's ordinal is in the
+        given ordinals.
+
+        ordinals - the ordinals to find.
+        """
+        if self._ordinals is None:
+            raise ValueError("The heatmap rows have no ordinals")
+        ords = np.fromiter(ordinals, dtype=np.int64)
+        if not len(ords):
+            return np.zeros(self.count, dtype=np.bool_)
+        return np.isin(self._ordinals, ords)
+
+    def bitmap_mask(self, bitmap: BitMap) -> np.ndarray:
+        """
+        Get a boolean array, one entry per row, that is True where the row's ordinal is in the
+        given bitmap.
+
+        bitmap - the bitmap of row ordinals.
+        """
+        if self._ordinals is None:
+            raise ValueError("The heatmap rows have no ordinals")
+        return np.isin(self._ordinals, np.frombuffer(bitmap.to_array(), dtype=np.uint32))
+
+    def _docs(self, docs: np.ndarray, offsets: np.ndarray, indexes: np.ndarray
+    ) -> list[dict[str, Any]]:
+        return [json.loads(docs[start:end].tobytes())
+                for start, end in zip(offsets[indexes].tolist(), offsets[indexes + 1].tolist())]
+
+    def get_rows(
+        self, rows: np.ndarray, columns: list[str] = None,
+    ) -> tuple[list[dict[str, Any]], int | float | None, int | float | None]:
+        """
+        Get heatmap rows in the same structure as the rows returned from the heatmap
+        endpoints, minus any match or selection marks.
+
+        rows - the indexes of the rows to return, in the order they are to be returned.
+        columns - the IDs of the columns to include in the rows. Cells are always returned in
+            render order. All columns are included if not provided.
+
+        Returns a tuple of the rows and the minimum and maximum cell values in the rows, with
+        booleans converted to integers. The minimum and maximum are None if there are no cells.
+        """
+        if columns is None:
+            col_indexes = list(range(len(self.column_ids)))
+        else:
+            col_indexes = sorted(self._col_index[c] for c in columns)
+        column_ids = [self.column_ids[i] for i in col_indexes]
+        rows = np.asarray(rows, dtype=np.int64)
+        values = self._values[rows]
+        missing = np.asarray(self._missing[rows][:, col_indexes])
+        missing_cells = missing.tolist()
+        cell_ids = [[c.decode("utf-8") for c in r]
+                    for r in self._cell_ids[rows][:, col_indexes].tolist()]
+        cols = [values[_field(i)].tolist() for i in col_indexes]
+        minmax = []
+        for j, i in enumerate(col_indexes):
+            present = values[_field(i)][~missing[:, j]]
+            if len(present):
+                minmax += [int(v) if isinstance(v, bool) else v
+                           for v in (present.min().item(), present.max().item())]
+        ret = self._docs(self._row_docs, self._row_doc_offsets, rows)
+        for doc, row_vals, row_cell_ids, row_missing in zip(
+                ret, zip(*cols) if cols else [()] * len(ret), cell_ids, missing_cells):
+            doc[heatmap_models.FIELD_HEATMAP_ROW_CELLS] = [{
+                    heatmap_models.FIELD_HEATMAP_COL_ID: col_id,
+                    heatmap_models.FIELD_HEATMAP_CELL_ID: cell_id,
+                    heatmap_models.FIELD_HEATMAP_CELL_VALUE: val,
+                } for col_id, cell_id, val, miss in zip(
+                    column_ids, row_cell_ids, row_vals, row_missing)
+                if not miss
+            ]
+        return ret, min(minmax) if minmax else None, max(minmax) if minmax else None
+
+    def get_column(self, col_id: str) -> tuple[list[str], list[str | None], list[Any]] | None:
+        """
+        Get the cells in a column for all the rows in the heatmap, in `row_order`.
+
+        col_id - the ID of the column.
+
+        Returns None if the column does not exist, or a tuple of the row kbase IDs, the cell IDs,
+        and the cell values. Cell IDs and values are None for missing cells.
+        """
+        if col_id not in self._col_index:
+            return None
+        i = self._col_index[col_id]
+        order = self._row_order
+        missing = np.asarray(self._missing[order, i])
+        cell_ids = np.char.decode(self._cell_ids[order, i], "utf-8").astype(object)
+        vals = self._values[_field(i)][order].astype(object)
+        cell_ids[missing] = None
+        vals[missing] = None
+        return (np.char.decode(self._kbase_ids[order], "utf-8").tolist(),
+                cell_ids.tolist(),
+                vals.tolist())
+
+    def get_cell_detail(self, cell_id: str) -> dict[str, Any] | None:
+        """
+        Get the detail document for a cell, containing the cell ID and the detail values, or
+        None if the cell does not exist.
+
+        cell_id - the ID of the cell.
+        """
+        cid = cell_id.encode("utf-8")
+        i = int(np.searchsorted(self._detail_ids, cid))
+        if i >= len(self._detail_ids) or self._detail_ids[i] != cid:
+            return None
+        return self._docs(self._detail_docs, self._detail_doc_offsets, np.array([i]))[0]
+
+
+class HeatMapMatrixStore:
+    """
+    Opens and caches heatmap matrices stored in a directory with the structure
+    `<directory>/<data product ID>/<collection ID>/<load version>`.
+    """
+
+    def __init__(self, directory: Path, max_open: int = 16):
+        """
+        Create the store.
+
+        directory - the root directory of the heatmap matrices.
+        max_open - the maximum number of matrices to keep open.
+        """
+        self._dir = Path(directory)
+        self._max_open = max_open
+        self._open = OrderedDict()
+
+    def get_matrix(
+        self, data_product: str, collection_id: str, load_ver: str
+    ) -> HeatMapMatrix | None:
+        """
+        Get a heatmap matrix, or None if no matrix exists for the load version.
+
+        data_product - the ID of the heatmap data product.
+        collection_id - the ID of the collection.
+        load_ver - the load version of the heatmap.
+        """
+        key = (data_product, collection_id, load_ver)
+        if key in self._open:
+            self._open.move_to_end(key)
+            return self._open[key]
+        path = self._dir / data_product / collection_id / load_ver
+        if not (path / _INDEX).is_file():
+            return None
+        matrix = HeatMapMatrix(path)
+        if matrix.collection_id != collection_id or matrix.load_ver != load_ver:
+            raise ValueError(f"Heatmap matrix at {path} is for collection "
+                             + f"{matrix.collection_id} load version {matrix.load_ver}")
+        self._open[key] = matrix
+        while len(self._open) > self._max_open:
+            self._open.popitem(last=False)
+        return matrix
@@ -15,7 +15,11 @@ FIELD_HEATMAP_DATA = "data"
 FIELD_HEATMAP_MIN_VALUE = "min_value"
 FIELD_HEATMAP_MAX_VALUE = "max_value"
 FIELD_HEATMAP_COUNT = "count"
+FIELD_HEATMAP_COUNT_ESTIMATED = "count_estimated"
+FIELD_HEATMAP_COUNT_ERROR = "count_error"
 FIELD_HEATMAP_VALUES = 'values'
+FIELD_HEATMAP_KBASE_IDS = "kbase_ids"
+FIELD_HEATMAP_CELL_IDS = "cell_ids"
 FIELD_HEATMAP_ROW_CELLS = "cells"
 FIELD_HEATMAP_ROW_META = "meta"
 FIELD_HEATMAP_CELL_ID = 'cell_id'
@@ -216,6 +220,41 @@ class HeatMap(SubsetProcessStates):
         example=42,
         description="The total number of rows that match the query."
     )
+    count_estimated: bool | None = Field(
+        default=None,
+        example=False,
+        description="Whether the count is an estimate. Only estimated counts may be returned "
+                    + "when an approximate count is requested. Null if count is null."
+    )
+    count_error: int | None = Field(
+        default=None,
+        example=0,
+        description="The half width of the 95% confidence interval of the count, or 0 if the "
+                    + "count is exact. Null if count is null."
+    )
+
+
+class HeatMapColumn(BaseModel):
+    """
+    The cells in a column of a heatmap for every row in the heatmap, in the order of the rows.
+    """
+    col_id: str = Field(
+        example="8",
+        description="The ID of the column."
+    )
+    kbase_ids: list[str] = Field(
+        example=["GB_GCA_000006155.2"],
+        description="The kbase IDs of the heatmap rows."
+    )
+    cell_ids: list[str | None] = Field(
+        example=["4"],
+        description="The IDs of the cells in the column, or null if a row has no cell in the column."
+    )
+    values: list[float | int | bool | None] = Field(
+        example=[4.2],
+        description="The values of the cells in the column, or null if a row has no cell in "
+                    + "the column."
+    )
 
 
 class CellDetailEntry(BaseModel):
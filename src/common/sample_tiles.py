@@ -0,0 +1,242 @@
+"""
+Aggregation of sample locations into slippy map (web mercator XYZ) tiles.
+
+At zoom level z the map is divided into 2^z x 2^z tiles, numbered from the top left, and a
+sample is assigned to the tile containing its location. Latitudes are clamped to the web mercator
+limits of ~±85.05 degrees.
+
+The same tile assignment is used by the loaders to precompute the tiles for low zoom levels and
+by the service to aggregate tiles in ArangoDB for higher zoom levels, see `aql_tile_coordinates`.
+"""
+
+import math
+from typing import Any, Iterable, NamedTuple
+
+import src.common.storage.collection_and_field_names as names
+
+
+MAX_LATITUDE = 85.0511287798066
+""" The maximum absolute latitude representable in web mercator tiles. """
+
+MAX_ZOOM = 20
+""" The maximum supported zoom level. """
+
+# tile document fields
+FLD_TILE_X = "x"
+FLD_TILE_Y = "y"
+FLD_TILE_LAT = "lat"
+FLD_TILE_LON = "lon"
+FLD_TILE_COUNT = "count"
+FLD_TILE_SAMPLE_COUNT = "sample_count"
+FLD_TILE_IDS = "ids"
+
+
+class BoundingBox(NamedTuple):
+    """
+    A geographic bounding box in degrees. If `west` > `east` the box crosses the antimeridian.
+    """
+    west: float
+    south: float
+    east: float
+    north: float
+
+
+WORLD = BoundingBox(-180.0, -90.0, 180.0, 90.0)
+""" A bounding box containing the entire world. """
+
+
+class TileRange(NamedTuple):
+    """
+    A range of tiles at a zoom level, inclusive on both ends. If `x_min` > `x_max`, or the range
+    was created from a bounding box crossing the antimeridian, the range wraps around the
+    antimeridian.
+    """
+    zoom: int
+    x_min: int
+    x_max: int
+    y_min: int
+    y_max: int
+    wraps: bool = False
+
+    def tile_count(self) -> int:
+        """ Get the number of tiles in the range. """
+        n = 1 << self.zoom
+        xs = (self.x_max - self.x_min + 1) if not self.wraps else (n - self.x_min + self.x_max + 1)
+        return min(xs, n) * (self.y_max - self.y_min + 1)
+
+    def contains(self, x: int, y: int) -> bool:
+        """
+        Check whether the range contains a tile.
+
+        x - the x coordinate of the tile.
+        y - the y coordinate of the tile.
+        """
+        if not self.y_min <= y <= self.y_max:
+            return False
+        if self.wraps:
+            return x >= self.x_min or x <= self.x_max
+        return self.x_min <= x <= self.x_max
+
+
+def parse_bbox(bbox: str) -> BoundingBox:
+    """
+    Parse a bounding box string in the form `west,south,east,north`, in degrees.
+
+    bbox - the bounding box string.
+    """
+    parts = [p.strip() for p in bbox.split(",")]
+    if len(parts) != 4:
+        raise ValueError("A bounding box must have 4 comma separated values: "
+                         + "west,south,east,north")
+    try:
+        west, south, east, north = [float(p) for p in parts]
+    except ValueError:
+        raise ValueError(f"Illegal bounding box value in '{bbox}'")
+    if any(not math.isfinite(v) for v in (west, south, east, north)):
+        raise ValueError(f"Illegal bounding box value in '{bbox}'")
+    for lon in (west, east):
+        if not -180 <= lon <= 180:
+            raise ValueError(f"Bounding box longitudes must be between -180 and 180: {lon}")
+    for lat in (south, north):
+        if not -90 <= lat <= 90:
+            raise ValueError(f"Bounding box latitudes must be between -90 and 90: {lat}")
+    if south > north:
+        raise ValueError(
+            f"The bounding box south latitude {south} is greater than the north latitude {north}")
+    return BoundingBox(west, south, east, north)
+
+
+def _check_zoom(zoom: int):
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}: {zoom}")
+
+
+def tile_x(lon: float, zoom: int) -> int:
+    """
+    Get the x coordinate of the tile containing a longitude.
+
+    lon - the longitude in degrees.
+    zoom - the zoom level.
+    """
+    n = 1 << zoom
+    return min(n - 1, max(0, math.floor((lon + 180) / 360 * n)))
+
+
+def tile_y(lat: float, zoom: int) -> int:
+    """
+    Get the y coordinate of the tile containing a latitude.
+
+    lat - the latitude in degrees.
+    zoom - the zoom level.
+    """
+    n = 1 << zoom
+    rad = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    y = (1 - math.log(math.tan(rad) + 1 / math.cos(rad)) / math.pi) / 2 * n
+    return min(n - 1, max(0, math.floor(y)))
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> BoundingBox:
+    """
+    Get the bounding box of a tile.
+
+    zoom - the zoom level.
+    x - the x coordinate of the tile.
+    y - the y coordinate of the tile.
+    """
+    n = 1 << zoom
+
+    def lat(y_):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y_ / n))))
+
+    return BoundingBox(x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y))
+
+
+def tile_range(bbox: BoundingBox, zoom: int) -> TileRange:
+    """
+    Get the range of tiles intersecting a bounding box.
+
+    bbox - the bounding box.
+    zoom - the zoom level.
+    """
+    _check_zoom(zoom)
+    return TileRange(
+        zoom,
+        tile_x(bbox.west, zoom),
+        tile_x(bbox.east, zoom),
+        tile_y(bbox.north, zoom),
+        tile_y(bbox.south, zoom),
+        wraps=bbox.west > bbox.east,
+    )
+
+
+def aggregate_tiles(
+    samples: Iterable[dict[str, Any]],
+    zoom: int,
+    max_ids: int = names.SAMPLE_TILE_MAX_IDS,
+    tiles: TileRange = None,
+) -> list[dict[str, Any]]:
+    """
+    Aggregate sample documents into tiles. Returns a list of tile documents sorted by the tile
+    y and then x coordinate, each containing:
+
+    * the tile x and y coordinates.
+    * the mean latitude and longitude of the samples in the tile, which can be used to position
+      a marker for the tile.
+    * the sum of the genome counts and the number of samples in the tile.
+    * up to `max_ids` representative sample IDs - the lexically first IDs in the tile.
+
+    Samples without a location are ignored.
+
+    samples - the sample documents.
+    zoom - the zoom level.
+    max_ids - the maximum number of sample IDs to include per tile.
+    tiles - if provided, only include tiles in this range.
+    """
+    _check_zoom(zoom)
+    acc = {}
+    for s in samples:
+        lat, lon = s.get(names.FLD_SAMPLE_LATITUDE), s.get(names.FLD_SAMPLE_LONGITUDE)
+        if lat is None or lon is None:
+            continue
+        xy = (tile_y(lat, zoom), tile_x(lon, zoom))
+        if tiles and not tiles.contains(xy[1], xy[0]):
+            continue
+        if xy not in acc:
+            acc[xy] = [0.0, 0.0, 0, 0, []]
+        t = acc[xy]
+        t[0] += lat
+        t[1] += lon
+        t[2] += s.get(names.FLD_KB_GENOME_COUNT) or 0
+        t[3] += 1
+        t[4].append(s[names.FLD_KB_SAMPLE_ID])
+    return [
+        {
+            FLD_TILE_X: x,
+            FLD_TILE_Y: y,
+            FLD_TILE_LAT: lat / samps,
+            FLD_TILE_LON: lon / samps,
+            FLD_TILE_COUNT: count,
+            FLD_TILE_SAMPLE_COUNT: samps,
+            FLD_TILE_IDS: sorted(set(ids))[:max_ids],
+        }
+        for (y, x), (lat, lon, count, samps, ids) in sorted(acc.items())
+    ]
+
+
+def aql_tile_coordinates(doc_var: str = "d") -> str:
+    """
+    Get AQL `LET` statements that calculate the tile coordinates `x` and `y` of a sample
+    document, matching `tile_x` and `tile_y`. The query must bind the number of tiles per
+    side at the zoom level, e.g. 2^zoom, to `@tiles_per_side`.
+
+    doc_var - the AQL variable containing the sample document.
+    """
+    lat = f"{doc_var}.{names.FLD_SAMPLE_LATITUDE}"
+    lon = f"{doc_var}.{names.FLD_SAMPLE_LONGITUDE}"
+    return f"""
+        LET tile_rad = RADIANS(MAX([-{MAX_LATITUDE}, MIN([{MAX_LATITUDE}, {lat}])]))
+        LET x = MIN([@tiles_per_side - 1, MAX([0,
+            FLOOR(({lon} + 180) / 360 * @tiles_per_side)])])
+        LET y = MIN([@tiles_per_side - 1, MAX([0,
+            FLOOR((1 - LOG(TAN(tile_rad) + 1 / COS(tile_rad)) / PI()) / 2 * @tiles_per_side)])])
+    """
@@ -50,6 +50,25 @@ Used for marking matches and selections; contains a list of internal match or se
 Underscore to separate from "real" attribs
 """
 
+FLD_ORDINAL = "_ord"
+"""
+A dense integer ordinal for a document in a data product load version, assigned by the loaders.
+Used to store match and selection membership as compressed bitmaps and to map that membership
+onto in memory copies of the load version.
+"""
+
+FLD_SUBSET_BITMAP = "bitmap"
+"""
+The name of the key that has a base64 encoded, serialized roaring bitmap of document ordinals
+as its value.
+"""
+
+FLD_QUERY_SHAPE_BUCKET = "bucket"
+"""
+The name of the key that has the start, in epoch milliseconds, of the time window in which
+executions of a query shape were counted.
+"""
+
 FLD_MATCHED = "match"
 """
 Used for marking matches when returning data to the user and they request match marking vs.
@@ -195,6 +214,26 @@ COLL_SRV_SELECTIONS_DELETED: Annotated[
     }
 ] = COLL_SRV_SELECTIONS + "_deleted"
 
+COLL_SRV_SUBSET_BITMAPS: Annotated[
+    str,
+    COLL_ANNOTATION,
+    {
+        COLL_ANNOKEY_DESCRIPTION: "A collection holding the membership of matches and "
+            + "selections in data product load versions as compressed bitmaps.",
+        COLL_ANNOKEY_SUGGESTED_SHARDS: 3,
+    }
+] = _SRV_PREFIX + "subset_bitmaps"
+
+COLL_SRV_QUERY_SHAPES: Annotated[
+    str,
+    COLL_ANNOTATION,
+    {
+        COLL_ANNOKEY_DESCRIPTION: "A collection holding rolling counts of the normalized "
+            + "shapes of filtered data product queries, used to suggest indexes.",
+        COLL_ANNOKEY_SUGGESTED_SHARDS: 1,
+    }
+] = _SRV_PREFIX + "query_shapes"
+
 ## Non-data product specific collection shared between loaders and service
 
 COLL_EXPORT_TYPES: Annotated[
@@ -229,11 +268,25 @@ COLL_TAXA_COUNT: Annotated[
     }
 ] = COLLECTION_PREFIX + "taxa_count"
 
+COLL_TAXA_COUNT_TOP: Annotated[
+    str,
+    COLL_ANNOTATION,
+    {
+        COLL_ANNOKEY_DESCRIPTION: "A collection holding the precomputed highest taxa counts "
+            + "for each rank.",
+        COLL_ANNOKEY_SUGGESTED_SHARDS: 1,
+    }
+] = COLLECTION_PREFIX + "taxa_count_top"
+
 #### Taxa count document fields
 FLD_TAXA_COUNT_RANK = "rank"
 FLD_TAXA_COUNT_RANKS = "ranks"
 FLD_TAXA_COUNT_NAME = "name"
 FLD_TAXA_COUNT_COUNT = "count"
+FLD_TAXA_COUNT_TOP = "top"  # the list of highest taxa counts in a top counts document
+
+# The number of taxa counts stored per rank in a top counts document
+TAXA_COUNT_TOP_K = 1000
 
 ### Genome attributes
 
@@ -324,6 +377,16 @@ COLL_SAMPLES_META: Annotated[
     }
 ] = COLLECTION_PREFIX + SAMPLES_PRODUCT_ID + "_meta"
 
+COLL_SAMPLES_TILES: Annotated[
+    str,
+    COLL_ANNOTATION,
+    {
+        COLL_ANNOKEY_DESCRIPTION: "A collection holding sample locations aggregated into map "
+            + "tiles for low zoom levels.",
+        COLL_ANNOKEY_SUGGESTED_SHARDS: 1,
+    }
+] = COLLECTION_PREFIX + SAMPLES_PRODUCT_ID + "_tiles"
+
 FLD_SAMPLE_LATITUDE = "latitude"
 """ Key name for latitude data in degrees"""
 
@@ -342,6 +405,18 @@ FLD_KBASE_IDS = "kbase_ids"
 FLD_KB_GENOME_COUNT = "genome_count"
 """ Key name for genome count associated with a sample """
 
+FLD_SAMPLE_TILES_ZOOM = "zoom"
+""" Key name for the zoom level of a sample tiles document """
+
+FLD_SAMPLE_TILES = "tiles"
+""" Key name for the list of tiles in a sample tiles document """
+
+SAMPLE_TILES_PRECOMPUTED_MAX_ZOOM = 6
+""" The maximum zoom level for which sample tiles are precomputed at load time """
+
+SAMPLE_TILE_MAX_IDS = 10
+""" The maximum number of representative sample IDs stored per sample tile """
+
 ### biolog
 
 _BIOLOG_COLL_PREFIX = COLLECTION_PREFIX + "biolog_"
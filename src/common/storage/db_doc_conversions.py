@@ -3,6 +3,8 @@ Convert data structures to documents suitable for saving in a document-based dat
 MongoDB or ArangoDB.
 """
 
+from typing import Any
+
 from src.common.gtdb_lineage import TaxaNodeCount
 from src.common.hash import md5_string
 from src.common.storage import collection_and_field_names as names
@@ -37,6 +39,84 @@ def taxa_node_count_to_doc(
     }
 
 
+def taxa_count_top_key(
+    kbase_collection: str, load_version: str, rank: str, internal_id: str = None
+) -> str:
+    """
+    Calculate the database key for a top taxa counts document.
+
+    kbase_collection - the name of the KBase collection with which the data is associated
+    load_version - the load version of the data set
+    rank - the full name of the rank of the taxa counts
+    internal_id - the internal ID of a related match or selection, if any
+    """
+    id_str = f"{internal_id}_" if internal_id else ""
+    return md5_string(f"{kbase_collection}_{load_version}_{id_str}_{rank}")
+
+
+def taxa_count_top_to_doc(
+    kbase_collection: str,
+    load_version: str,
+    rank: str,
+    top: list[TaxaNodeCount],
+    internal_id: str = None
+) -> dict[str, Any]:
+    """
+    Convert the highest taxa counts for a rank, in order, to a document suitable for storage in
+    a document based database.
+
+    kbase_collection - the name of the KBase collection with which the data is associated
+    load_version - the load version of the data set
+    rank - the full name of the rank of the taxa counts
+    top - the taxa counts, sorted as they should be returned
+    internal_id - the internal ID of a related match or selection, if any
+    """
+    return {
+        names.FLD_ARANGO_KEY: taxa_count_top_key(
+            kbase_collection, load_version, rank, internal_id),
+        names.FLD_COLLECTION_ID: kbase_collection,
+        names.FLD_LOAD_VERSION: load_version,
+        names.FLD_TAXA_COUNT_RANK: rank,
+        names.FLD_INTERNAL_ID: internal_id,
+        names.FLD_TAXA_COUNT_TOP: [
+            {names.FLD_TAXA_COUNT_NAME: tc.name, names.FLD_TAXA_COUNT_COUNT: tc.count}
+            for tc in top
+        ],
+    }
+
+
+def sample_tiles_key(kbase_collection: str, load_version: str, zoom: int) -> str:
+    """
+    Calculate the database key for a sample tiles document.
+
+    kbase_collection - the name of the KBase collection with which the data is associated
+    load_version - the load version of the data set
+    zoom - the map zoom level of the tiles
+    """
+    return md5_string(f"{kbase_collection}_{load_version}_{zoom}")
+
+
+def sample_tiles_to_doc(
+    kbase_collection: str, load_version: str, zoom: int, tiles: list[dict[str, Any]]
+) -> dict[str, Any]:
+    """
+    Convert the sample tiles for a zoom level to a document suitable for storage in
+    a document based database.
+
+    kbase_collection - the name of the KBase collection with which the data is associated
+    load_version - the load version of the data set
+    zoom - the map zoom level of the tiles
+    tiles - the tiles, as returned from `src.common.sample_tiles.aggregate_tiles`
+    """
+    return {
+        names.FLD_ARANGO_KEY: sample_tiles_key(kbase_collection, load_version, zoom),
+        names.FLD_COLLECTION_ID: kbase_collection,
+        names.FLD_LOAD_VERSION: load_version,
+        names.FLD_SAMPLE_TILES_ZOOM: zoom,
+        names.FLD_SAMPLE_TILES: tiles,
+    }
+
+
 def data_product_export_types_to_doc(
     kbase_collection: str, data_product: str, load_version: str, types: list[str]
 ) -> dict[str, str | list[str]]:
@@ -0,0 +1,473 @@
+"""
+usage: arango_bulk_importer.py [-h] --file FILE --arango_url ARANGO_URL --database DATABASE
+                               --collection COLLECTION --arango_user ARANGO_USER
+                               [--chunk_size CHUNK_SIZE] [--concurrency CONCURRENCY]
+                               [--on_duplicate {error,update,replace,ignore}] [--max_retries MAX_RETRIES]
+                               [--restart]
+
+PROTOTYPE - Import a JSONL file created by the loaders (e.g. via loader_helper.create_import_files) into ArangoDB.
+
+The file is split into chunks that are posted concurrently to the ArangoDB bulk import API.
+Completed chunks are recorded in a sidecar checkpoint file next to the import file
+(<file>.import_checkpoint.json) so that a failed or interrupted import can be rerun and will resume where it
+stopped. The checkpoint file is deleted when the import completes.
+If the server responds with a 503 or the request times out, the number of concurrent requests is reduced and
+the chunk is retried after a backoff. The concurrency slowly recovers as chunks succeed.
+
+options:
+  -h, --help            show this help message and exit
+
+required named arguments:
+  --file FILE           The JSONL file to import
+  --arango_url ARANGO_URL
+                        The URL of the ArangoDB server (e.g. http://localhost:8529)
+  --database DATABASE   The ArangoDB database name
+  --collection COLLECTION
+                        The ArangoDB collection name
+  --arango_user ARANGO_USER
+                        The ArangoDB user name. The password must be provided in the `ARANGO_PW`
+                        environment variable.
+
+optional arguments:
+  --chunk_size CHUNK_SIZE
+                        Number of documents per import request (default: 10000)
+  --concurrency CONCURRENCY
+                        The maximum number of concurrent import requests (default: 4)
+  --on_duplicate {error,update,replace,ignore}
+                        Action to take on unique key constraint violations (default: error)
+  --max_retries MAX_RETRIES
+                        Number of times a chunk is retried after a 503 response or timeout (default: 5)
+  --restart             Ignore and overwrite any existing checkpoint file and import the entire file
+
+e.g.
+export ARANGO_PW=arango_password
+PYTHONPATH=. python src/loaders/common/arango_bulk_importer.py --file import_files/PROD/GTDB/r207.kbase.1/gtdb_genome_attribs.jsonl \
+    --arango_url http://localhost:8529 --database collections_dev --collection kbcoll_genome_attribs --arango_user collections_dev
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Generator, NamedTuple
+
+import httpx
+
+from src.loaders.common import loader_helper
+
+ARANGO_PW_ENV = "ARANGO_PW"
+
+ON_DUPLICATE_OPTIONS = ["error", "update", "replace", "ignore"]
+
+CHECKPOINT_SUFFIX = ".import_checkpoint.json"
+
+_DEFAULT_CHUNK_SIZE = 10000
+_DEFAULT_CONCURRENCY = 4
+_DEFAULT_MAX_RETRIES = 5
+_DEFAULT_BACKOFF_SEC = 1.0
+_MAX_BACKOFF_SEC = 60.0
+_REQUEST_TIMEOUT_SEC = 300
+
+# the number of successful chunks required before the concurrency limit is raised after being throttled
+_RECOVERY_SUCCESSES = 5
+
+# keys for the checkpoint file
+_CKPT_FILE_SIZE = "file_size"
+_CKPT_FILE_MTIME = "file_mtime"
+_CKPT_COLLECTION = "collection"
+_CKPT_CHUNK_SIZE = "chunk_size"
+_CKPT_ON_DUPLICATE = "on_duplicate"
+_CKPT_COMPLETED = "completed_chunks"
+
+# keys in the ArangoDB import API response
+_RESP_CREATED = "created"
+_RESP_ERRORS = "errors"
+_RESP_EMPTY = "empty"
+_RESP_UPDATED = "updated"
+_RESP_IGNORED = "ignored"
+_RESP_DETAILS = "details"
+
+
+class BulkImportError(Exception):
+    """ An error thrown when a chunk could not be imported into ArangoDB. """
+
+
+class CheckpointMismatchError(Exception):
+    """
+    An error thrown when an existing checkpoint file was written for a different file or
+    with different import parameters.
+    """
+
+
+class ImportResult(NamedTuple):
+    """ The summed results of importing a file. """
+
+    chunks_total: int
+    """ The total number of chunks in the file. """
+
+    chunks_skipped: int
+    """ The number of chunks skipped as they were completed in a previous run. """
+
+    created: int
+    """ The number of documents created. """
+
+    errors: int
+    """ The number of documents that failed to import. """
+
+    empty: int
+    """ The number of empty lines in the file. """
+
+    updated: int
+    """ The number of documents updated or replaced. """
+
+    ignored: int
+    """ The number of documents ignored. """
+
+    throttle_events: int
+    """ The number of times a 503 response or timeout was encountered. """
+
+
+class _AdaptiveLimiter:
+    """
+    Limits the number of concurrent requests. The limit is halved when the server is
+    overloaded and raised by one after a run of successful requests, up to the maximum.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self._in_flight = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def release(self, throttled: bool):
+        async with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self.limit < self.max_limit and self._successes >= _RECOVERY_SUCCESSES:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class _Checkpoint:
+    """
+    Records the indexes of completed chunks in a sidecar file next to the import file.
+    """
+
+    def __init__(self, path: Path, params: dict[str, Any], completed: set[int]):
+        self.path = path
+        self._params = params
+        self.completed = completed
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def load(cls, import_file: Path, params: dict[str, Any], restart: bool) -> "_Checkpoint":
+        path = checkpoint_path(import_file)
+        completed = set()
+        if path.exists() and not restart:
+            with open(path) as f:
+                ckpt = json.load(f)
+            for k, v in params.items():
+                if ckpt.get(k) != v:
+                    raise CheckpointMismatchError(
+                        f"Checkpoint file {path} does not match the current import: {k} is "
+                        + f"{ckpt.get(k)} in the checkpoint and {v} in the current import. "
+                        + "Rerun with the original parameters or restart the import.")
+            completed = set(ckpt[_CKPT_COMPLETED])
+        return cls(path, params, completed)
+
+    async def mark_complete(self, chunk_index: int):
+        async with self._lock:
+            self.completed.add(chunk_index)
+            # write and rename so an interrupted write can't corrupt the checkpoint
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w") as f:
+                json.dump(self._params | {_CKPT_COMPLETED: sorted(self.completed)}, f)
+            os.replace(tmp, self.path)
+
+    def delete(self):
+        self.path.unlink(missing_ok=True)
+
+
+def checkpoint_path(import_file: Path) -> Path:
+    """
+    Get the path of the checkpoint file for an import file.
+
+    import_file - the JSONL file to be imported.
+    """
+    return import_file.with_name(import_file.name + CHECKPOINT_SUFFIX)
+
+
+def _read_chunks(import_file: Path, chunk_size: int) -> Generator[tuple[int, str], None, None]:
+    # yields the chunk index and the chunk body without loading the entire file into memory
+    with open(import_file) as f:
+        index = 0
+        lines = []
+        for line in f:
+            lines.append(line)
+            if len(lines) == chunk_size:
+                yield index, "".join(lines)
+                index += 1
+                lines = []
+        if lines:
+            yield index, "".join(lines)
+
+
+async def import_file(
+        client: httpx.AsyncClient,
+        import_file: Path,
+        collection: str,
+        chunk_size: int = _DEFAULT_CHUNK_SIZE,
+        concurrency: int = _DEFAULT_CONCURRENCY,
+        on_duplicate: str = "error",
+        max_retries: int = _DEFAULT_MAX_RETRIES,
+        restart: bool = False,
+        backoff_sec: float = _DEFAULT_BACKOFF_SEC,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+) -> ImportResult:
+    """
+    Import a JSONL file into an ArangoDB collection with concurrent chunked requests.
+
+    client - an HTTP client with the base URL set to the ArangoDB database API root
+        (e.g. http://localhost:8529/_db/collections_dev) and any required authentication.
+    import_file - the JSONL file to import.
+    collection - the ArangoDB collection into which the documents will be imported.
+    chunk_size - the number of lines to send per import request.
+    concurrency - the maximum number of concurrent import requests.
+    on_duplicate - the action to take on unique key constraint violations. One of
+        "error", "update", "replace", or "ignore".
+    max_retries - the number of times a chunk is retried after a 503 response or timeout.
+    restart - ignore any existing checkpoint file and import the entire file.
+    backoff_sec - the initial time to wait before retrying a throttled chunk. The wait doubles
+        with each retry of the same chunk.
+    sleep - the function used to wait before retrying a chunk.
+
+    Returns the summed import results.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be > 0")
+    if concurrency < 1:
+        raise ValueError("concurrency must be > 0")
+    if max_retries < 0:
+        raise ValueError("max_retries must be >= 0")
+    if on_duplicate not in ON_DUPLICATE_OPTIONS:
+        raise ValueError(f"on_duplicate must be one of {ON_DUPLICATE_OPTIONS}")
+    import_file = Path(import_file)
+    stat = import_file.stat()
+    ckpt = _Checkpoint.load(
+        import_file,
+        {
+            _CKPT_FILE_SIZE: stat.st_size,
+            _CKPT_FILE_MTIME: stat.st_mtime_ns,
+            _CKPT_COLLECTION: collection,
+            _CKPT_CHUNK_SIZE: chunk_size,
+            _CKPT_ON_DUPLICATE: on_duplicate,
+        },
+        restart,
+    )
+    limiter = _AdaptiveLimiter(concurrency)
+    totals = {_RESP_CREATED: 0, _RESP_ERRORS: 0, _RESP_EMPTY: 0, _RESP_UPDATED: 0, _RESP_IGNORED: 0}
+    throttle_events = 0
+    params = {
+        "type": "documents",
+        "collection": collection,
+        "onDuplicate": on_duplicate,
+        "complete": "true",
+        "details": "true",
+    }
+
+    async def post_chunk(index: int, body: str):
+        nonlocal throttle_events
+        backoff = backoff_sec
+        for attempt in range(max_retries + 1):
+            await limiter.acquire()
+            throttled = False
+            try:
+                resp = await client.post(
+                    "/_api/import", params=params, content=body, timeout=_REQUEST_TIMEOUT_SEC)
+                throttled = resp.status_code == 503
+            except httpx.TimeoutException:
+                throttled = True
+            finally:
+                await limiter.release(throttled)
+            if not throttled:
+                break
+            throttle_events += 1
+            if attempt == max_retries:
+                raise BulkImportError(
+                    f"Chunk {index} could not be imported after {max_retries + 1} attempts "
+                    + "due to server overload or timeouts")
+            await sleep(backoff)
+            backoff = min(backoff * 2, _MAX_BACKOFF_SEC)
+        if resp.status_code >= 300:
+            raise BulkImportError(f"Chunk {index} failed to import with status {resp.status_code}: {resp.text}")
+        res = resp.json()
+        if res.get(_RESP_ERRORS):
+            raise BulkImportError(
+                f"Chunk {index} had {res[_RESP_ERRORS]} errors: {res.get(_RESP_DETAILS)}")
+        for k in totals:
+            totals[k] += res.get(k, 0)
+        await ckpt.mark_complete(index)
+
+    # only keep a bounded number of chunks in memory at once
+    pending = set()
+    chunks_total = 0
+    skipped = 0
+    try:
+        for index, body in _read_chunks(import_file, chunk_size):
+            chunks_total += 1
+            if index in ckpt.completed:
+                skipped += 1
+                continue
+            if len(pending) >= concurrency * 2:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    t.result()  # raise any errors
+            pending.add(asyncio.create_task(post_chunk(index, body)))
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            for t in done:
+                t.result()
+    except BaseException:
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        raise
+    ckpt.delete()
+    return ImportResult(
+        chunks_total=chunks_total,
+        chunks_skipped=skipped,
+        created=totals[_RESP_CREATED],
+        errors=totals[_RESP_ERRORS],
+        empty=totals[_RESP_EMPTY],
+        updated=totals[_RESP_UPDATED],
+        ignored=totals[_RESP_IGNORED],
+        throttle_events=throttle_events,
+    )
+
+
+def _get_parser():
+    parser = argparse.ArgumentParser(
+        description="PROTOTYPE - Import a JSONL file created by the loaders into ArangoDB.\n\n"
+        "The file is split into chunks that are posted concurrently to the ArangoDB bulk import API. "
+        "Completed chunks are recorded in a sidecar checkpoint file next to the import file so that a "
+        "failed or interrupted import can be rerun and will resume where it stopped. "
+        "If the server responds with a 503 or the request times out, the number of concurrent "
+        "requests is reduced and the chunk is retried after a backoff.",
+        formatter_class=loader_helper.ExplicitDefaultsHelpFormatter,
+    )
+
+    required = parser.add_argument_group("required named arguments")
+    optional = parser.add_argument_group("optional arguments")
+
+    # Required flag arguments
+    required.add_argument(
+        "--file", required=True, type=str, help="The JSONL file to import"
+    )
+    required.add_argument(
+        "--arango_url",
+        required=True,
+        type=str,
+        help="The URL of the ArangoDB server (e.g. http://localhost:8529)",
+    )
+    required.add_argument(
+        "--database", required=True, type=str, help="The ArangoDB database name"
+    )
+    required.add_argument(
+        "--collection", required=True, type=str, help="The ArangoDB collection name"
+    )
+    required.add_argument(
+        "--arango_user",
+        required=True,
+        type=str,
+        help="The ArangoDB user name. "
+        f"The password must be provided in the `{ARANGO_PW_ENV}` environment variable.",
+    )
+
+    # Optional arguments
+    optional.add_argument(
+        "--chunk_size",
+        type=int,
+        default=_DEFAULT_CHUNK_SIZE,
+        help="Number of documents per import request",
+    )
+    optional.add_argument(
+        "--concurrency",
+        type=int,
+        default=_DEFAULT_CONCURRENCY,
+        help="The maximum number of concurrent import requests",
+    )
+    optional.add_argument(
+        "--on_duplicate",
+        type=str,
+        choices=ON_DUPLICATE_OPTIONS,
+        default="error",
+        help="Action to take on unique key constraint violations",
+    )
+    optional.add_argument(
+        "--max_retries",
+        type=int,
+        default=_DEFAULT_MAX_RETRIES,
+        help="Number of times a chunk is retried after a 503 response or timeout",
+    )
+    optional.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore and overwrite any existing checkpoint file and import the entire file",
+    )
+    return parser
+
+
+async def _run(args: argparse.Namespace, password: str) -> ImportResult:
+    base_url = f"{args.arango_url.rstrip('/')}/_db/{args.database}"
+    async with httpx.AsyncClient(base_url=base_url, auth=(args.arango_user, password)) as client:
+        return await import_file(
+            client,
+            Path(args.file),
+            args.collection,
+            chunk_size=args.chunk_size,
+            concurrency=args.concurrency,
+            on_duplicate=args.on_duplicate,
+            max_retries=args.max_retries,
+            restart=args.restart,
+        )
+
+
+def main():
+    parser = _get_parser()
+    args = parser.parse_args()
+    if args.chunk_size <= 0:
+        parser.error("chunk_size needs to be > 0")
+    if args.concurrency <= 0:
+        parser.error("concurrency needs to be > 0")
+    if args.max_retries < 0:
+        parser.error("max_retries needs to be >= 0")
+    password = os.environ.get(ARANGO_PW_ENV)
+    if not password:
+        parser.error(f"The ArangoDB password must be provided in the {ARANGO_PW_ENV} environment variable")
+
+    start = time.time()
+    res = asyncio.run(_run(args, password))
+    print(
+        f"Imported {args.file} into {args.collection} in {time.time() - start:.2f} seconds: "
+        f"{res.chunks_total} chunks ({res.chunks_skipped} completed in a previous run), "
+        f"{res.created} created, {res.updated} updated, {res.ignored} ignored, "
+        f"{res.empty} empty lines, {res.throttle_events} throttle events"
+    )
+
+
+if __name__ == "__main__":
+    main()
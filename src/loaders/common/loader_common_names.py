@@ -53,6 +53,11 @@ COLLECTION_SOURCE_DIR = "collectionssource"  # subdirectory for source collectio
 # Default directory name for the parsed JSONL files for arango import
 IMPORT_DIR = 'import_files'
 
+# Subdirectory of the import directory for heatmap matrix files. The directory structure below
+# this directory is <env>/<data product ID>/<collection ID>/<load version>; the <env> directory
+# has the structure expected by the service's heatmap_matrix_dir configuration parameter.
+HEATMAP_MATRIX_DIR = 'heatmap_matrices'
+
 # metadata file generated in the tool result folder with tool generated genome identifier,
 # original genome id and source genome file info
 GENOME_METADATA_FILE = "genome_metadata.tsv"
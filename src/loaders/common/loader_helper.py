@@ -19,6 +19,7 @@ import jsonlines
 
 import src.common.storage.collection_and_field_names as names
 from src.common.collection_column_specs.load_specs import load_spec
+from src.common.heatmap_matrix import write_heatmap_matrix
 from src.common.product_models.columnar_attribs_common_models import (
     ColumnType,
 )
@@ -188,7 +189,13 @@ def create_import_files(
         docs: list[dict[str, Any]]):
     """
     Create and save the data documents as JSONLines file to the import directory.
+
+    If the documents can be matched and selected, e.g. they were created by init_row_doc,
+    ordinals are assigned to the documents in place with assign_ordinals.
     """
+    docs = list(docs)
+    if docs and all(names.FLD_MATCHES_SELECTIONS in d for d in docs):
+        assign_ordinals(docs)
     import_dir = create_import_dir(root_dir, env, kbase_collection, load_ver)
 
     file_path = os.path.join(import_dir, file_name)
@@ -197,6 +204,34 @@ def create_import_files(
         convert_to_json(docs, f)
 
 
+def assign_ordinals(docs: list[dict[str, Any]]):
+    """
+    Assign dense integer ordinals to the documents of a data product load version, in place,
+    in `_key` order. The ordinals are used to store match and selection membership as compressed
+    bitmaps, which are applied to in memory copies of the load version such as heatmap matrices.
+    """
+    for i, doc in enumerate(sorted(docs, key=lambda d: d[names.FLD_ARANGO_KEY])):
+        doc[names.FLD_ORDINAL] = i
+
+
+def create_heatmap_matrix_files(
+        root_dir: str,
+        env: str,
+        kbase_collection: str,
+        load_ver: str,
+        data_product: str,
+        meta: dict[str, Any],
+        rows: list[dict[str, Any]],
+        cell_details: list[dict[str, Any]]):
+    """
+    Create and save the heatmap data as memory mappable numpy matrix files to the import directory.
+    """
+    matrix_dir = Path(root_dir, loader_common_names.IMPORT_DIR, loader_common_names.HEATMAP_MATRIX_DIR,
+                      env, data_product, kbase_collection, load_ver)
+    print(f'Creating heatmap matrix files: {matrix_dir}')
+    write_heatmap_matrix(matrix_dir, meta, rows, cell_details)
+
+
 def parse_genome_id(gtdb_accession):
     """
     Extract the genome id from the GTDB accession field by removing the first 3 characters.
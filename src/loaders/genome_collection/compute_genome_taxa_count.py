@@ -9,12 +9,14 @@ from src.common.gtdb_lineage import (
 )
 from src.common.storage.db_doc_conversions import (
     collection_load_version_key,
+    taxa_count_top_to_doc,
     taxa_node_count_to_doc,
 )
 from src.loaders.common.loader_helper import create_import_files
 
 """
-PROTOTYPE - Prepare genome taxa count data and identical ranks in JSON format for arango import.
+PROTOTYPE - Prepare genome taxa count data, the highest taxa counts per rank, and identical ranks
+in JSON format for arango import.
 
 usage: compute_genome_taxa_count.py [-h] --kbase_collection KBASE_COLLECTION --load_ver LOAD_VER [--env {CI,NEXT,APPDEV,PROD,NONE}] [--root_dir ROOT_DIR]
                                     [--input_source {GTDB,genome_attributes}]
@@ -67,9 +69,7 @@ def _parse_lineage_from_line(line, source):
 def _parse_files(load_files, source):
     nodes = GTDBTaxaCount()
     for load_file in load_files:
-        for line in load_file:
-            lineage_str = _parse_lineage_from_line(line, source)
-            nodes.add(lineage_str)
+        nodes.add_many(_parse_lineage_from_line(line, source) for line in load_file)
     return nodes
 
 
@@ -84,6 +84,13 @@ def _create_count_docs(nodes, kbase_collection, load_version):
     return count_docs, identical_ranks
 
 
+def _create_top_docs(nodes, kbase_collection, load_version):
+    # one document per rank containing the highest counts, sorted, so the service can fetch the
+    # counts for a rank by key
+    return [taxa_count_top_to_doc(kbase_collection, load_version, rank.value, top)
+            for rank, top in nodes.top_k(names.TAXA_COUNT_TOP_K).items()]
+
+
 def _create_rank_docs(kbase_collection, load_version, identical_ranks):
     rank_candidates = [r.value for r in GTDBRank]
 
@@ -144,12 +151,17 @@ def main():
     nodes = _parse_files(load_files, source)
 
     count_docs, identical_ranks = _create_count_docs(nodes, kbase_collection, load_version)
+    top_docs = _create_top_docs(nodes, kbase_collection, load_version)
     rank_doc = _create_rank_docs(kbase_collection, load_version, identical_ranks)
 
     # Create taxa counts jsonl file
     count_jsonl = f'{kbase_collection}_{load_version}_{names.COLL_TAXA_COUNT}.jsonl'
     create_import_files(root_dir, env, kbase_collection, load_version, count_jsonl, count_docs)
 
+    # Create top taxa counts jsonl file
+    count_top_jsonl = f'{kbase_collection}_{load_version}_{names.COLL_TAXA_COUNT_TOP}.jsonl'
+    create_import_files(root_dir, env, kbase_collection, load_version, count_top_jsonl, top_docs)
+
     # Create identical ranks jsonl file
     count_ranks_jsonl = f'{kbase_collection}_{load_version}_{names.COLL_TAXA_COUNT_RANKS}.jsonl'
     create_import_files(root_dir, env, kbase_collection, load_version, count_ranks_jsonl, rank_doc)
@@ -38,6 +38,7 @@ from src.common.storage.field_names import FLD_KBASE_ID
 from src.loaders.common import loader_common_names
 from src.loaders.common.loader_helper import (
     init_row_doc,
+    create_heatmap_matrix_files,
     create_import_files,
 )
 from src.loaders.genome_collection.parse_tool_results import HEATMAP_FILE_ROOT
@@ -267,3 +268,5 @@ def generate_pmi_biolog_heatmap_data(
     create_import_files(root_dir, env, kbase_collection, load_ver, meta_output, [heatmap_meta_dict])
     create_import_files(root_dir, env, kbase_collection, load_ver, rows_output, heatmap_rows)
     create_import_files(root_dir, env, kbase_collection, load_ver, cell_details_output, heatmap_cell_details)
+    create_heatmap_matrix_files(root_dir, env, kbase_collection, load_ver, tool,
+                                heatmap_meta_dict, heatmap_rows, heatmap_cell_details)
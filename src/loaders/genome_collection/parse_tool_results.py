@@ -65,14 +65,17 @@ from src.common.product_models.heatmap_common_models import (
     FIELD_HEATMAP_COUNT,
     transform_heatmap_row_cells,
 )
+from src.common.sample_tiles import aggregate_tiles
 from src.common.storage.db_doc_conversions import (
     collection_load_version_key,
     collection_data_id_key,
     data_product_export_types_to_doc,
+    sample_tiles_to_doc,
 )
 from src.common.storage.field_names import FLD_KBASE_ID
 from src.loaders.common import loader_common_names
 from src.loaders.common.loader_helper import (
+    create_heatmap_matrix_files,
     create_import_files,
     create_global_fatal_dict_doc,
     init_row_doc,
@@ -307,6 +310,8 @@ def _process_heatmap_tools(heatmap_tools: set[str],
         create_import_files(root_dir, env, kbase_collection, load_ver, meta_output, [heatmap_meta_dict])
         create_import_files(root_dir, env, kbase_collection, load_ver, rows_output, heatmap_rows_list)
         create_import_files(root_dir, env, kbase_collection, load_ver, cell_details_output, heatmap_cell_details_list)
+        create_heatmap_matrix_files(root_dir, env, kbase_collection, load_ver, tool,
+                                    heatmap_meta_dict, heatmap_rows_list, heatmap_cell_details_list)
 
 
 def _process_fatal_error_tools(check_fatal_error_tools: set[str],
@@ -610,6 +615,14 @@ def _flat_samples_data(prepared_samples_data: list[dict]) -> list[dict]:
     return flatten_samples_data.values()
 
 
+def _create_sample_tiles_docs(samples_data, kbase_collection, load_ver):
+    # precompute the sample location map tiles for low zoom levels, where the tiles cover
+    # most or all of the collection, so the service doesn't need to aggregate every sample
+    samples_data = list(samples_data)
+    return [sample_tiles_to_doc(kbase_collection, load_ver, zoom, aggregate_tiles(samples_data, zoom))
+            for zoom in range(names.SAMPLE_TILES_PRECOMPUTED_MAX_ZOOM + 1)]
+
+
 def _retrieve_sample(root_dir, env, kbase_collection, source_ver, load_ver):
     print(f'Parsing sample data for {kbase_collection} collection, load version {load_ver}, '
           f'source version {source_ver}.')
@@ -664,6 +677,13 @@ def _retrieve_sample(root_dir, env, kbase_collection, source_ver, load_ver):
                         f'{kbase_collection}_{load_ver}_{names.COLL_SAMPLES_META}.jsonl',
                         [meta_doc])
 
+    create_import_files(root_dir,
+                        env,
+                        kbase_collection,
+                        load_ver,
+                        f'{kbase_collection}_{load_ver}_{names.COLL_SAMPLES_TILES}.jsonl',
+                        _create_sample_tiles_docs(flatten_samples_data, kbase_collection, load_ver))
+
     return data_id_sample_id_map
 
 
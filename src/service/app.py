@@ -9,16 +9,19 @@ import sys
 from fastapi import FastAPI, Request, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 from http.client import responses
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
+import src.common.storage.collection_and_field_names as names
 from src.common.git_commit import GIT_COMMIT
 from src.common.version import VERSION
 from src.service import app_state
+from src.service import compression
 from src.service import errors
+from src.service import etags
 from src.service import matcher_registry
+from src.service import metrics
 from src.service import models_errors
 from src.service.config import CollectionsServiceConfig
 from src.service import data_product_specs
@@ -40,6 +43,21 @@ _KB_DEPLOYMENT_CONFIG = "KB_DEPLOYMENT_CONFIG"
 
 SERVICE_DESCRIPTION = "A repository of data collections and and associated analyses"
 
+_DATA_PRODUCT_PREFIX = "/collections/{collection_id}/data_products"
+
+# Routes that can return multi megabyte JSON bodies, where faster compression levels save
+# significant CPU for a small loss in compression ratio
+_LARGE_BODY_ROUTES = [
+    f"{_DATA_PRODUCT_PREFIX}/{names.GENOME_ATTRIBS_PRODUCT_ID}/",
+    f"{_DATA_PRODUCT_PREFIX}/{names.SAMPLES_PRODUCT_ID}/",
+    f"{_DATA_PRODUCT_PREFIX}/{names.SAMPLES_PRODUCT_ID}/locations",
+    f"{_DATA_PRODUCT_PREFIX}/microtrait/",
+    f"{_DATA_PRODUCT_PREFIX}/microtrait/column/{{col_id}}",
+    f"{_DATA_PRODUCT_PREFIX}/biolog/",
+    f"{_DATA_PRODUCT_PREFIX}/biolog/column/{{col_id}}",
+]
+_LARGE_BODY_LEVELS = compression.CompressionLevels(zstd=1, br=2, gzip=4)
+
 # httpx is super chatty if the root logger is set to INFO
 logging.basicConfig(level=logging.WARNING)
 logging.getLogger("src").setLevel(logging.INFO)
@@ -77,14 +95,22 @@ def create_app(noop=False):
             "5XX": {"model": models_errors.ServerError}
         }
     )
-    app.add_middleware(GZipMiddleware)
+    etag_registry = etags.ETagRegistry()
+    # innermost, so the ETag is set before the body is compressed
+    app.add_middleware(
+        etags.ETagMiddleware, registry=etag_registry, version=f"{VERSION} {GIT_COMMIT}")
+    app.add_middleware(
+        compression.CompressionMiddleware,
+        route_levels={r: _LARGE_BODY_LEVELS for r in _LARGE_BODY_ROUTES},
+    )
+    app.add_middleware(metrics.MetricsMiddleware)
     app.include_router(ROUTER_GENERAL)
     app.include_router(ROUTER_COLLECTIONS)
     app.include_router(ROUTER_MATCHES)
     app.include_router(ROUTER_SELECTIONS)
     for dp in sorted(data_product_specs.get_data_products(),
                      key=lambda dp: str(dp.router.tags[0]).lower()):
-        app.include_router(dp.router, prefix="/collections/{collection_id}/data_products")
+        app.include_router(dp.router, prefix=_DATA_PRODUCT_PREFIX)
     app.include_router(ROUTER_COLLECTIONS_ADMIN)
     app.include_router(ROUTER_DANGER)
 
@@ -93,7 +119,8 @@ def create_app(noop=False):
             app,
             cfg,
             data_product_specs.get_data_products(),
-            matcher_registry.MATCHERS.values()
+            matcher_registry.MATCHERS.values(),
+            etags=etag_registry,
         )
     app.add_event_handler("startup", build_app_wrapper)
 
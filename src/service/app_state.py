@@ -6,18 +6,28 @@ calling the build_app() method
 """
 
 import asyncio
+from pathlib import Path
 
 from fastapi import FastAPI, Request
+from src.common.heatmap_matrix import HeatMapMatrixStore
 from src.service._app_state_build_storage import build_storage
+from src.service.aql_profiler import AQLProfiler
 from src.service.app_state_data_structures import CollectionsState
 from src.service.config import CollectionsServiceConfig
 from src.service.deletion import SubsetCleanup
+from src.service.etags import ETagRegistry
+from src.service.data_products import columnar_snapshots
 from src.service.data_products.common_models import DataProductSpec
 from src.service.kb_auth import KBaseAuth
 from src.service.matchers.common_models import Matcher
 from src.service.sdk_async_client import SDKAsyncClient
 from src.service.config_dynamic import DynamicConfigManager
 from src.service.filtering import analyzers
+from src.service.filtering.count_estimation import CountEstimator
+from src.service.filtering.query_shapes import QueryShapeRecorder
+from src.service.filtering.result_cache import ResultCache
+from src.service.single_flight import SingleFlight
+import src.common.storage.collection_and_field_names as names
 
 # The main point of this module is to handle all the application state in one place
 # to keep it consistent and allow for refactoring without breaking other code
@@ -28,6 +38,7 @@ async def build_app(
     cfg: CollectionsServiceConfig,
     data_products: list[DataProductSpec],
     matchers: list[Matcher],
+    etags: ETagRegistry | None = None,
 ) -> None:
     """
     Build the application state.
@@ -36,6 +47,7 @@ async def build_app(
     cfg - the collections service config.
     data_products - the data products installed in the system
     matchers - the matchers installed in the system
+    etags - the registry of ETags for data product responses, shared with the ETag middleware.
     """
     print("Connecting to KBase auth service... ", end="", flush=True)
     auth = await KBaseAuth.create(cfg.auth_url, cfg.auth_full_admin_roles)
@@ -46,8 +58,26 @@ async def build_app(
         cli, storage = await build_storage(cfg, data_products)
         await _check_workspace_url(sdk_client, cfg.workspace_url)
         await analyzers.install_analyzers(storage)
+        dyncfgman = DynamicConfigManager(storage)
+        profiler = AQLProfiler(storage.explain_aql, dyncfgman.get_config)
+        storage.set_profiler(profiler)
+        query_shapes = QueryShapeRecorder(storage)
+        storage.set_query_shape_recorder(query_shapes)
+        snapshots = None
+        if cfg.columnar_snapshot_dir:
+            snapshots = columnar_snapshots.ColumnarSnapshotManager(
+                storage,
+                Path(cfg.columnar_snapshot_dir),
+                names.GENOME_ATTRIBS_PRODUCT_ID,
+                names.COLL_GENOME_ATTRIBS,
+                names.COLL_GENOME_ATTRIBS_META,
+            )
+        matrices = None
+        if cfg.heatmap_matrix_dir:
+            matrices = HeatMapMatrixStore(Path(cfg.heatmap_matrix_dir))
         app.state._colstate = CollectionsState(
-            auth, sdk_client, cli, storage, matchers, cfg, DynamicConfigManager(storage)
+            auth, sdk_client, cli, storage, matchers, cfg, dyncfgman, profiler, snapshots, matrices,
+            CountEstimator(), ResultCache(), SingleFlight(), etags, query_shapes,
         )
         app.state._match_deletion = SubsetCleanup(
             app.state._colstate.get_pickleable_dependencies(),
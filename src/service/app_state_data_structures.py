@@ -2,9 +2,13 @@
 Data structures to store app state.
 """
 
+from typing import TYPE_CHECKING
+
 import aioarango
 
+from src.common.heatmap_matrix import HeatMapMatrixStore
 from src.service._app_state_build_storage import build_storage
+from src.service.aql_profiler import AQLProfiler
 from src.service.config import CollectionsServiceConfig
 from src.service import data_product_specs
 from src.service.kb_auth import KBaseAuth
@@ -13,6 +17,16 @@ from src.service.sdk_async_client import SDKAsyncClient
 from src.service.storage_arango import ArangoStorage
 from src.service.timestamp import now_epoch_millis
 from src.service.config_dynamic import DynamicConfigManager
+from src.service.etags import ETagRegistry
+from src.service.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    # the snapshot and filtering code depends on the data product code, which depends on
+    # this module
+    from src.service.data_products.columnar_snapshots import ColumnarSnapshotManager
+    from src.service.filtering.count_estimation import CountEstimator
+    from src.service.filtering.query_shapes import QueryShapeRecorder
+    from src.service.filtering.result_cache import ResultCache
 
 
 class PickleableDependencies:
@@ -51,6 +65,21 @@ class CollectionsState:
     arangostorage - an ArangoStorage wrapper.
     sdk_client - a client for communicating with KBase SDK services.
     dyncfgman - a manager for the service dynamic configuration
+    aql_profiler - the profiler for slow AQL queries.
+    genome_attribs_snapshots - the manager for genome attributes columnar snapshots, or None if
+        snapshots are disabled.
+    heatmap_matrices - the store for memory mapped heatmap matrices, or None if heatmap
+        matrices are disabled.
+    count_estimator - the estimator for approximate counts and cache for exact counts, or None
+        if counts are always performed in the database.
+    result_cache - the cache for filtered table query results, or None if results are not
+        cached.
+    single_flight - the coalescer for identical concurrent data product reads, or None if reads
+        are not coalesced.
+    etags - the registry of ETags for data product responses, or None if ETags are not
+        registered.
+    query_shapes - the recorder for the shapes of filtered data product queries, or None if
+        query shapes are not recorded.
     """
 
     def __init__(
@@ -62,6 +91,14 @@ class CollectionsState:
         matchers: list[Matcher],
         cfg: CollectionsServiceConfig,
         dyncfgman: DynamicConfigManager,
+        aql_profiler: AQLProfiler,
+        genome_attribs_snapshots: "ColumnarSnapshotManager | None" = None,
+        heatmap_matrices: HeatMapMatrixStore | None = None,
+        count_estimator: "CountEstimator | None" = None,
+        result_cache: "ResultCache | None" = None,
+        single_flight: SingleFlight | None = None,
+        etags: ETagRegistry | None = None,
+        query_shapes: "QueryShapeRecorder | None" = None,
     ):
         """
         Do not instantiate this class directly. Use `app_state.build_app` to create the app state
@@ -74,11 +111,21 @@ class CollectionsState:
         self._matchers = {m.id: m for m in matchers}
         self._cfg = cfg
         self.dyncfgman = dyncfgman
+        self.aql_profiler = aql_profiler
+        self.genome_attribs_snapshots = genome_attribs_snapshots
+        self.heatmap_matrices = heatmap_matrices
+        self.count_estimator = count_estimator
+        self.result_cache = result_cache
+        self.single_flight = single_flight
+        self.etags = etags
+        self.query_shapes = query_shapes
 
     async def destroy(self):
         """
         Destroy any resources held by this class. After this the class should be discarded.
         """
+        if self.query_shapes:
+            await self.query_shapes.close()
         await self._client.close()
         await self.sdk_client.close()
 
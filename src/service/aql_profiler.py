@@ -0,0 +1,278 @@
+"""
+Opt-in profiling of AQL queries.
+
+When profiling is enabled in the service dynamic configuration, queries that take longer than
+the configured threshold are explained (once per unique query string), logged along with the
+shape of the bind variables and the indexes and full collection scans in the query plan,
+and recorded so the slowest query signatures can be retrieved by an administrator.
+
+Profiling data is held in memory and is specific to a service instance.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from pydantic import BaseModel, Field
+
+from src.common.hash import md5_string
+from src.service.models import DynamicConfig
+
+
+# AQL, bind vars -> the query plan
+Explainer = Callable[[str, dict[str, Any]], Awaitable[dict[str, Any]]]
+
+_NODE_INDEX = "IndexNode"
+_NODE_FULL_SCAN = "EnumerateCollectionNode"
+
+
+def _logger() -> logging.Logger:
+    return logging.getLogger(__name__)
+
+
+class PlanSummary(BaseModel):
+    """ The parts of an AQL query plan relevant to diagnosing slow queries. """
+    indexes: list[str] = Field(
+        example=["genome_attribs.idx_coll_loadver_kbaseid (persistent: coll, load_ver, kbase_id)"],
+        description="The indexes used by the query plan."
+    )
+    full_scans: list[str] = Field(
+        example=["genome_attribs"],
+        description="The collections for which the query plan requires a full collection scan."
+    )
+    explain_error: str | None = Field(
+        example="[HTTP 400][ERR 1501] AQL: syntax error",
+        description="The error returned by the database if the query couldn't be explained."
+    )
+
+
+class SlowQuery(BaseModel):
+    """ Statistics for a slow AQL query signature. """
+    signature: str = Field(
+        example="fc2c3b1fd1b5a5a3ef8fcb1bb4a7b9a0",
+        description="The MD5 of the whitespace normalized query string."
+    )
+    query: str = Field(description="The whitespace normalized query string.")
+    op: str = Field(
+        example="query_table",
+        description="The operation that most recently executed the query."
+    )
+    bind_vars: dict[str, str] = Field(
+        example={"@coll": "genome_attribs", "limit": "int"},
+        description="The shape of the bind variables from the most recent execution. "
+            + "Collection and view bind variables are shown with their value, other bind "
+            + "variables with their type."
+    )
+    count: int = Field(example=3, description="The number of slow executions of the query.")
+    max_ms: float = Field(example=2345.6, description="The maximum execution time.")
+    mean_ms: float = Field(example=1803.2, description="The mean slow execution time.")
+    last_ms: float = Field(example=1500.1, description="The most recent slow execution time.")
+    plan: PlanSummary
+
+
+def normalize_query(aql_str: str) -> str:
+    """
+    Normalize an AQL query string by collapsing whitespace.
+
+    aql_str - the AQL query.
+    """
+    return " ".join(aql_str.split())
+
+
+def bind_var_shape(bind_vars: dict[str, Any] | None) -> dict[str, str]:
+    """
+    Get the shape of a set of bind variables. Collection and view bind variables are
+    included as is, as they define the structure of the query; otherwise only the type of the
+    bind variable is included.
+
+    bind_vars - the bind variables.
+    """
+    return {k: v if k.startswith("@") else type(v).__name__
+            for k, v in sorted((bind_vars or {}).items())}
+
+
+def summarize_plan(plan: dict[str, Any]) -> PlanSummary:
+    """
+    Summarize the index usage and full collection scans in an AQL query plan as returned by
+    the ArangoDB explain API.
+
+    plan - the plan.
+    """
+    indexes = []
+    full_scans = []
+    for node in plan.get("nodes", []):
+        if node.get("type") == _NODE_INDEX:
+            for idx in node.get("indexes", []):
+                indexes.append(f"{node.get('collection')}.{idx.get('name', idx.get('id'))} "
+                               + f"({idx.get('type')}: {', '.join(idx.get('fields', []))})")
+        elif node.get("type") == _NODE_FULL_SCAN:
+            full_scans.append(node.get("collection"))
+    return PlanSummary(indexes=indexes, full_scans=full_scans, explain_error=None)
+
+
+class _QueryStats:
+
+    __slots__ = [
+        "query", "op", "bind_vars", "plan", "count", "total_ms", "max_ms", "last_ms"]
+
+    def __init__(self, query: str):
+        self.query = query
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+
+class AQLProfiler:
+    """
+    Profiles slow AQL queries when enabled in the service dynamic configuration.
+    """
+
+    def __init__(
+        self,
+        explainer: Explainer,
+        config_provider: Callable[[], Awaitable[DynamicConfig]],
+        max_signatures: int = 1000,
+        max_plans: int = 1000,
+    ):
+        """
+        Create the profiler.
+
+        explainer - a function that returns the query plan for an AQL query and its bind
+            variables.
+        config_provider - a function that returns the service dynamic configuration. This
+            function is called for every query, and so the configuration should be cached.
+        max_signatures - the maximum number of slow query signatures to track. When the maximum
+            is reached, the fastest query signature is discarded in favor of slower queries.
+        max_plans - the maximum number of query plans to cache. The least recently used plan
+            is discarded when the maximum is reached.
+        """
+        if max_signatures < 1:
+            raise ValueError("max_signatures must be > 0")
+        if max_plans < 1:
+            raise ValueError("max_plans must be > 0")
+        self._explainer = explainer
+        self._config_provider = config_provider
+        self._max_signatures = max_signatures
+        self._max_plans = max_plans
+        self._stats: dict[str, _QueryStats] = {}
+        self._plans: OrderedDict[str, PlanSummary] = OrderedDict()
+        # keep references to the running tasks so they aren't garbage collected
+        self._tasks: set[asyncio.Task] = set()
+
+    def record(
+        self, op: str, aql_str: str, bind_vars: dict[str, Any] | None, elapsed_sec: float
+    ) -> asyncio.Task:
+        """
+        Record the execution of an AQL query. Does nothing if profiling is disabled or the
+        query is faster than the slow query threshold.
+
+        The query is recorded in a background task, so the query isn't delayed by getting the
+        configuration or explaining the query. Errors are logged rather than thrown.
+
+        op - the name of the operation that executed the query.
+        aql_str - the AQL query.
+        bind_vars - the query's bind variables.
+        elapsed_sec - the time taken to execute the query and return the first batch
+            of results.
+
+        Returns the background task.
+        """
+        task = asyncio.create_task(self._record(op, aql_str, bind_vars, elapsed_sec))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _record(
+        self, op: str, aql_str: str, bind_vars: dict[str, Any] | None, elapsed_sec: float
+    ):
+        try:
+            await self._record_slow_query(op, aql_str, bind_vars, elapsed_sec)
+        except Exception:
+            _logger().exception("Failed to profile AQL query for operation %s", op)
+
+    async def _record_slow_query(
+        self, op: str, aql_str: str, bind_vars: dict[str, Any] | None, elapsed_sec: float
+    ):
+        cfg = await self._config_provider()
+        elapsed_ms = elapsed_sec * 1000
+        if not cfg.aql_profiling or elapsed_ms < cfg.aql_slow_query_ms:
+            return
+        query = normalize_query(aql_str)
+        sig = md5_string(query)
+        plan = await self._get_plan(sig, aql_str, bind_vars)
+        shape = bind_var_shape(bind_vars)
+        self._update_stats(sig, query, op, shape, plan, elapsed_ms)
+        _logger().warning(
+            "Slow AQL query %s for operation %s took %.1f ms. query: %s bind vars: %s indexes: %s",
+            sig, op, elapsed_ms, query, shape, plan.indexes or "none",
+        )
+        for coll in plan.full_scans:
+            _logger().warning("Slow AQL query %s performs a full scan of collection %s",
+                              sig, coll)
+
+    async def _get_plan(
+        self, sig: str, aql_str: str, bind_vars: dict[str, Any] | None
+    ) -> PlanSummary:
+        if sig in self._plans:
+            self._plans.move_to_end(sig)
+            return self._plans[sig]
+        try:
+            plan = summarize_plan(await self._explainer(aql_str, bind_vars or {}))
+        except Exception as e:
+            _logger().exception("Failed to explain AQL query %s", sig)
+            plan = PlanSummary(indexes=[], full_scans=[], explain_error=str(e))
+        self._plans[sig] = plan
+        if len(self._plans) > self._max_plans:
+            self._plans.popitem(last=False)
+        return plan
+
+    def _update_stats(
+        self,
+        sig: str,
+        query: str,
+        op: str,
+        shape: dict[str, str],
+        plan: PlanSummary,
+        elapsed_ms: float,
+    ):
+        stats = self._stats.get(sig)
+        if not stats:
+            if len(self._stats) >= self._max_signatures:
+                fastest = min(self._stats.values(), key=lambda s: s.max_ms)
+                if fastest.max_ms >= elapsed_ms:
+                    return
+                del self._stats[md5_string(fastest.query)]
+            stats = self._stats[sig] = _QueryStats(query)
+        stats.op = op
+        stats.bind_vars = shape
+        stats.plan = plan
+        stats.count += 1
+        stats.total_ms += elapsed_ms
+        stats.max_ms = max(stats.max_ms, elapsed_ms)
+        stats.last_ms = elapsed_ms
+
+    def get_slowest(self, n: int) -> list[SlowQuery]:
+        """
+        Get the slowest query signatures recorded, ordered by maximum execution time.
+
+        n - the maximum number of query signatures to return.
+        """
+        stats = sorted(self._stats.items(), key=lambda s: s[1].max_ms, reverse=True)[:n]
+        return [SlowQuery(
+                    signature=sig,
+                    query=s.query,
+                    op=s.op,
+                    bind_vars=s.bind_vars,
+                    count=s.count,
+                    max_ms=s.max_ms,
+                    mean_ms=s.total_ms / s.count,
+                    last_ms=s.last_ms,
+                    plan=s.plan,
+                )
+                for sig, s in stats]
+
+    def clear(self):
+        """ Clear all recorded statistics and cached plans. """
+        self._stats.clear()
+        self._plans.clear()
@@ -0,0 +1,91 @@
+"""
+Adaptive sizing of AQL cursor batches.
+
+ArangoDB fixes the number of documents per cursor batch when the query is executed, and the
+default of 1000 documents suits neither very small documents, like keys or counts, which
+then need many round trips, nor very large documents, like heatmap rows, which produce huge
+batches. The batch sizer learns the average document size of each kind of query from the
+cursors it has seen and picks the batch size for the next execution of that kind of query so
+that a batch approaches a target size in bytes.
+"""
+
+from typing import Hashable
+
+
+class BatchSizer:
+    """
+    Chooses cursor batch sizes from the observed document sizes of prior queries of the same
+    kind.
+    """
+
+    def __init__(
+        self,
+        target_bytes: int = 2 * 1024 * 1024,
+        min_size: int = 10,
+        max_size: int = 10_000,
+        smoothing: float = 0.3,
+    ):
+        """
+        Create the batch sizer.
+
+        target_bytes - the target size of a batch in bytes.
+        min_size - the minimum batch size in documents.
+        max_size - the maximum batch size in documents.
+        smoothing - the weight of the most recent observation in the moving average of the
+            document size, between 0 exclusive and 1 inclusive.
+        """
+        if target_bytes < 1:
+            raise ValueError("target_bytes must be > 0")
+        if min_size < 1:
+            raise ValueError("min_size must be > 0")
+        if max_size < min_size:
+            raise ValueError("max_size must be >= min_size")
+        if not 0 < smoothing <= 1:
+            raise ValueError("smoothing must be > 0 and <= 1")
+        self._target_bytes = target_bytes
+        self._min_size = min_size
+        self._max_size = max_size
+        self._smoothing = smoothing
+        self._doc_bytes: dict[Hashable, float] = {}
+
+    def batch_size(self, key: Hashable, hint: int | None = None) -> int | None:
+        """
+        Get the batch size for a query.
+
+        key - the kind of query, e.g. the calling function and collection.
+        hint - the batch size to use if no queries of this kind have been observed. If None,
+            the server default is used.
+
+        Returns the batch size, or None to use the server default.
+        """
+        doc_bytes = self._doc_bytes.get(key)
+        if doc_bytes is None:
+            return hint
+        size = round(self._target_bytes / doc_bytes)
+        return max(self._min_size, min(self._max_size, size))
+
+    def record(self, key: Hashable, docs: int, size: int):
+        """
+        Record the documents received for a query.
+
+        key - the kind of query, e.g. the calling function and collection.
+        docs - the number of documents received.
+        size - the size in bytes of the responses containing the documents.
+        """
+        if docs < 1 or size < 1:
+            # no documents, or the size wasn't measured
+            return
+        doc_bytes = size / docs
+        prior = self._doc_bytes.get(key)
+        if prior is not None:
+            doc_bytes = self._smoothing * doc_bytes + (1 - self._smoothing) * prior
+        self._doc_bytes[key] = doc_bytes
+
+    def doc_bytes(self, key: Hashable) -> float | None:
+        """
+        Get the average document size for a kind of query, or None if no queries of that kind
+        have been observed.
+
+        key - the kind of query.
+        """
+        return self._doc_bytes.get(key)
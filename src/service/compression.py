@@ -0,0 +1,263 @@
+"""
+ASGI middleware for compressing responses with the best encoding the client accepts.
+
+zstd and brotli require the `zstandard` and `brotli` packages. If a package isn't installed,
+the corresponding encoding is never selected.
+"""
+
+import asyncio
+import zlib
+from typing import Any, NamedTuple, Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ZSTD = "zstd"
+BROTLI = "br"
+GZIP = "gzip"
+
+_IDENTITY = "identity"
+_ANY = "*"
+
+# Content types that are already compressed or that must be delivered to the client as they're
+# produced.
+_EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/", "application/zip", "application/gzip")
+
+
+class CompressionLevels(NamedTuple):
+    """ The compression levels for each encoding. """
+
+    zstd: int = 3
+    """ The zstd level, from 1 - 22. Levels above 19 require significant memory. """
+
+    br: int = 4
+    """ The brotli quality, from 0 - 11. Levels above 9 are very slow. """
+
+    gzip: int = 6
+    """ The gzip level, from 1 - 9. """
+
+    def get(self, encoding: str) -> int:
+        """
+        Get the level for an encoding.
+
+        encoding - the encoding, as it appears in the Content-Encoding header.
+        """
+        return self.br if encoding == BROTLI else getattr(self, encoding)
+
+
+class _Compressor(Protocol):
+
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    def flush(self) -> bytes:
+        ...
+
+
+class _BrotliCompressor:
+
+    def __init__(self, level: int):
+        self._comp = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._comp.process(data)
+
+    def flush(self) -> bytes:
+        return self._comp.finish()
+
+
+def _compressor(encoding: str, level: int) -> _Compressor:
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    if encoding == BROTLI:
+        return _BrotliCompressor(level)
+    return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+
+def compress(encoding: str, level: int, data: bytes) -> bytes:
+    """
+    Compress data in one shot.
+
+    encoding - the encoding to use, one of the encodings returned by `available_encodings`.
+    level - the compression level.
+    data - the data to compress.
+    """
+    if encoding == ZSTD:
+        # Unlike the streaming compressor, includes the content size in the frame header
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == BROTLI:
+        return brotli.compress(data, quality=level)
+    comp = _compressor(encoding, level)
+    return comp.compress(data) + comp.flush()
+
+
+def available_encodings() -> list[str]:
+    """
+    Get the encodings supported by the installed packages in order of server preference.
+    """
+    return ([ZSTD] if zstandard else []) + ([BROTLI] if brotli else []) + [GZIP]
+
+
+def negotiate_encoding(accept_encoding: str | None, encodings: list[str]) -> str | None:
+    """
+    Select an encoding based on an Accept-Encoding header.
+
+    The encoding with the highest quality value is selected, with ties broken by the order of
+    the encodings argument. Returns None if the client doesn't accept any of the encodings.
+
+    accept_encoding - the contents of the header.
+    encodings - the encodings the server supports in order of preference.
+    """
+    if not accept_encoding:
+        return None
+    qvals = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            name, _, val = p.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(val)
+                except ValueError:
+                    q = 0.0
+        qvals[coding] = q
+    best, bestq = None, 0.0
+    for enc in encodings:
+        q = qvals.get(enc, qvals.get(_ANY, 0.0))
+        if q > bestq:
+            best, bestq = enc, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses response bodies with zstd, brotli, or gzip, depending on
+    the client's Accept-Encoding header.
+
+    Bodies below a minimum size are not compressed. Bodies at or above a size threshold are
+    compressed in a thread so they don't block the event loop.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 1000,
+        levels: CompressionLevels = CompressionLevels(),
+        route_levels: dict[str, CompressionLevels] = None,
+        thread_size: int = 256 * 1024,
+        encodings: list[str] = None,
+    ):
+        """
+        Create the middleware.
+
+        app - the ASGI app to wrap.
+        minimum_size - the minimum size of a response body, in bytes, to compress.
+        levels - the default compression levels.
+        route_levels - compression levels for specific routes, keyed by the route path template,
+            e.g. `/collections/{collection_id}/data_products/samples/locations`.
+        thread_size - the minimum size of a response body or body chunk, in bytes, to compress
+            in a thread rather than the event loop.
+        encodings - the encodings to support in order of preference. Defaults to all available
+            encodings.
+        """
+        self._app = app
+        self._minimum_size = minimum_size
+        self._levels = levels
+        self._route_levels = route_levels or {}
+        self._thread_size = thread_size
+        available = available_encodings()
+        self._encodings = [e for e in encodings if e in available] if encodings else available
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self._app(scope, receive, send)
+        encoding = negotiate_encoding(
+            Headers(scope=scope).get("accept-encoding"), self._encodings)
+        if not encoding:
+            return await self._app(scope, receive, send)
+        await _CompressingResponder(self, scope, encoding, send).run(receive)
+
+    def _get_level(self, scope: dict[str, Any], encoding: str) -> int:
+        # the router sets the route in the scope when it finds a match
+        route = scope.get("route")
+        levels = self._route_levels.get(route.path, self._levels) if route else self._levels
+        return levels.get(encoding)
+
+    async def _compress(self, data: bytes, func, *args) -> bytes:
+        if len(data) >= self._thread_size:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+
+class _CompressingResponder:
+
+    def __init__(self, mw: CompressionMiddleware, scope, encoding: str, send):
+        self._mw = mw
+        self._scope = scope
+        self._encoding = encoding
+        self._send = send
+        self._start = None
+        self._compressor = None
+        self._passthrough = False
+
+    async def run(self, receive):
+        await self._mw._app(self._scope, receive, self._send_wrapper)
+
+    def _skip(self, headers: Headers) -> bool:
+        return ("content-encoding" in headers
+                or headers.get("content-type", "").startswith(_EXCLUDED_CONTENT_TYPES))
+
+    async def _send_wrapper(self, message):
+        if message["type"] == "http.response.start":
+            # wait for the body to decide whether to compress
+            self._start = message
+            self._passthrough = self._skip(Headers(raw=message["headers"]))
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            if self._start:
+                await self._send(self._start)
+                self._start = None
+            await self._send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        level = self._mw._get_level(self._scope, self._encoding)
+        if self._start:
+            start, self._start = self._start, None
+            if not more_body and len(body) < self._mw._minimum_size:
+                self._passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self._encoding
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body:
+                body = await self._mw._compress(body, compress, self._encoding, level, body)
+                headers["Content-Length"] = str(len(body))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            del headers["Content-Length"]
+            await self._send(start)
+            self._compressor = _compressor(self._encoding, level)
+        # streaming response
+        out = await self._mw._compress(body, self._compress_chunk, body, more_body)
+        await self._send({"type": "http.response.body", "body": out, "more_body": more_body})
+
+    def _compress_chunk(self, body: bytes, more_body: bool) -> bytes:
+        out = self._compressor.compress(body)
+        return out + self._compressor.flush() if not more_body else out
@@ -32,6 +32,12 @@ class CollectionsServiceConfig:
         documentation to function.
     create_db_on_startup: bool - True if the service should create the database on startup.
         Generally this should be false to allow admins to set up sharding as desired.
+    columnar_snapshot_dir: str | None - a local directory in which to store columnar snapshots
+        of data products for answering analytic queries in process. If absent, snapshots are
+        disabled and all queries are run against ArangoDB.
+    heatmap_matrix_dir: str | None - a local directory containing the memory mappable heatmap
+        matrix files written by the heatmap loaders. If absent, all heatmap queries are run
+        against ArangoDB.
 
     workspace_url: str - the URL of the KBase Workspace service.
     """
@@ -67,6 +73,10 @@ class CollectionsServiceConfig:
         self.service_root_path = _get_string_optional(config, _SEC_SERVICE, "root_path")
         self.create_db_on_startup = _get_string_optional(
             config, _SEC_SERVICE, "create_db_on_startup") == "true"
+        self.columnar_snapshot_dir = _get_string_optional(
+            config, _SEC_SERVICE, "columnar_snapshot_dir")
+        self.heatmap_matrix_dir = _get_string_optional(
+            config, _SEC_SERVICE, "heatmap_matrix_dir")
 
         self.workspace_url = _get_string_required(config, _SEC_SERVICE_DEPS, "workspace_url")
 
@@ -89,6 +99,8 @@ class CollectionsServiceConfig:
             f"Authentication full admin roles: {self.auth_full_admin_roles}\n",
             f"Service root path: {self.service_root_path}\n",
             f"Create database on start: {self.create_db_on_startup}\n"
+            f"Columnar snapshot directory: {self.columnar_snapshot_dir}\n"
+            f"Heatmap matrix directory: {self.heatmap_matrix_dir}\n"
             f"Workspace URL: {self.workspace_url}\n"
             "*** End Service Configuration ***\n\n"
         ])
@@ -0,0 +1,588 @@
+"""
+A read only, in process columnar tier for columnar attribute data products such as genome
+attributes.
+
+When a collection is activated, the data for a data product's load version is snapshotted from
+ArangoDB into a local numpy file, with one array per column, and loaded into memory. Analytic
+queries - counts, histograms, and scatter plots - with filters the snapshot supports can then be
+answered with vectorized numpy operations rather than ArangoSearch view scans.
+
+ArangoDB remains the source of truth. Snapshots do not contain match and selection marks,
+which change over time, but they do contain the document ordinals, so match and selection
+filters are applied by intersecting the stored subset bitmaps with the snapshot rows. Any query
+that the snapshot can't answer exactly, or for which the snapshot or a subset bitmap isn't
+available, should be run against ArangoDB.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from pyroaring import BitMap
+
+import src.common.storage.collection_and_field_names as names
+from src.common.product_models.columnar_attribs_common_models import ColumnType, FilterStrategy
+from src.service import models, subset_bitmaps
+from src.service.data_products import common_functions
+from src.service.filtering.filters import (
+    AbstractFilter,
+    BooleanFilter,
+    FilterSet,
+    RangeFilter,
+    StringFilter,
+)
+from src.service.storage_arango import ArangoStorage
+
+
+_SNAPSHOT_FORMAT_VERSION = 2
+_META = "meta"
+_ORDINALS = "ordinals"
+_NULL_CODE = -1
+
+_NUMERIC_TYPES = {ColumnType.INT: np.int64, ColumnType.FLOAT: np.float64}
+_STRING_TYPES = {ColumnType.STRING, ColumnType.DATE, ColumnType.ENUM}
+
+
+def _logger() -> logging.Logger:
+    return logging.getLogger(__name__)
+
+
+def _subset_ids(filters: FilterSet) -> frozenset[str]:
+    # the prefixed IDs of the subsets a query is filtered to
+    return frozenset(i for i in (filters.match_spec.get_subset_filtering_id(),
+                                 filters.selection_spec.get_subset_filtering_id()) if i)
+
+
+def _type_ok(type_: ColumnType, val: Any) -> bool:
+    if type_ == ColumnType.BOOL:
+        return isinstance(val, bool)
+    if isinstance(val, bool):
+        return False
+    if type_ == ColumnType.INT:
+        return isinstance(val, int)
+    if type_ == ColumnType.FLOAT:
+        return isinstance(val, (int, float))
+    return isinstance(val, str)
+
+
+class _Column:
+    """
+    A column of data. For numeric and boolean columns the values are stored directly, with
+    nulls replaced by zero / false. String and date columns are dictionary encoded, with the
+    values being indexes into a sorted array of the UTF-8 encoded unique strings, and nulls
+    encoded as -1. As the unique strings are sorted by byte, the same ordering ArangoDB uses for
+    strings, range comparisons can be performed on the codes.
+    """
+
+    __slots__ = ["type", "values", "nulls", "uniques"]
+
+    def __init__(
+        self,
+        type_: ColumnType,
+        values: np.ndarray,
+        nulls: np.ndarray,
+        uniques: np.ndarray | None = None,
+    ):
+        self.type = type_
+        self.values = values
+        self.nulls = nulls
+        self.uniques = uniques
+
+    @classmethod
+    def from_list(cls, type_: ColumnType, vals: list[Any]) -> "_Column":
+        nulls = np.fromiter((v is None for v in vals), dtype=np.bool_, count=len(vals))
+        if type_ in _STRING_TYPES:
+            uniques, codes = np.unique(
+                np.array([b"" if v is None else v.encode() for v in vals], dtype=np.bytes_),
+                return_inverse=True,
+            )
+            codes = codes.astype(np.int32)
+            codes[nulls] = _NULL_CODE
+            # remove the empty string added for nulls if there are no real empty strings
+            return cls(type_, codes, nulls, uniques).compact()
+        dtype = _NUMERIC_TYPES.get(type_, np.bool_)
+        return cls(type_, np.array([0 if v is None else v for v in vals], dtype=dtype), nulls)
+
+    def compact(self) -> "_Column":
+        used = np.zeros(len(self.uniques), dtype=np.bool_)
+        used[self.values[~self.nulls]] = True
+        if used.all():
+            return self
+        remap = np.cumsum(used, dtype=np.int32) - 1
+        codes = np.where(self.nulls, _NULL_CODE, remap[np.maximum(self.values, 0)])
+        return _Column(self.type, codes.astype(np.int32), self.nulls, self.uniques[used])
+
+    def _code_bound(self, val: str, inclusive: bool, low: bool) -> int:
+        side = "left" if inclusive == low else "right"
+        return int(np.searchsorted(self.uniques, val.encode(), side=side))
+
+    def range_mask(self, filter_: RangeFilter) -> np.ndarray:
+        mask = ~self.nulls
+        if self.uniques is not None:
+            # string comparisons are done on the dictionary codes
+            if filter_.low is not None:
+                mask &= self.values >= self._code_bound(filter_.low, filter_.low_inclusive, True)
+            if filter_.high is not None:
+                mask &= self.values < self._code_bound(
+                    filter_.high, filter_.high_inclusive, False)
+            return mask
+        if filter_.low is not None:
+            mask &= (self.values >= filter_.low if filter_.low_inclusive
+                     else self.values > filter_.low)
+        if filter_.high is not None:
+            mask &= (self.values <= filter_.high if filter_.high_inclusive
+                     else self.values < filter_.high)
+        return mask
+
+    def equals_mask(self, val: Any) -> np.ndarray:
+        if self.uniques is not None:
+            code = np.searchsorted(self.uniques, val.encode())
+            if code == len(self.uniques) or self.uniques[code] != val.encode():
+                return np.zeros(len(self.values), dtype=np.bool_)
+            return self.values == code
+        return ~self.nulls & (self.values == val)
+
+
+class ColumnarSnapshot:
+    """
+    An immutable, in memory, columnar snapshot of a load version of a columnar attributes data
+    product.
+    """
+
+    def __init__(
+        self,
+        collection_id: str,
+        load_ver: str,
+        columns: dict[str, _Column],
+        size: int,
+        ordinals: np.ndarray | None = None,
+        subsets: dict[str, np.ndarray] | None = None,
+    ):
+        """
+        Do not instantiate this class directly; use `from_columns`, `from_docs`, or `load`.
+        """
+        self.collection_id = collection_id
+        self.load_ver = load_ver
+        self.size = size
+        self._columns = columns
+        self._ordinals = ordinals
+        self._subsets = subsets or {}
+
+    @classmethod
+    def from_columns(
+        cls,
+        collection_id: str,
+        load_ver: str,
+        types: dict[str, ColumnType],
+        columns: dict[str, list[Any]],
+        ordinals: list[int] | None = None,
+    ):
+        """
+        Create a snapshot from lists of column data.
+
+        Columns with values that do not match the column type are not included in the
+        snapshot, and so queries against those columns will not be supported.
+
+        collection_id - the ID of the KBase collection containing the data.
+        load_ver - the load version of the data.
+        types - a mapping of column name to column type for the columns to include in
+            the snapshot.
+        columns - a mapping of column name to the column values, with null values represented
+            as None. Every list must be the same length.
+        ordinals - the document ordinals of the rows, if any, in the same order as the column
+            values. Match and selection filters can only be applied if the ordinals
+            are provided.
+        """
+        sizes = {len(columns[k]) for k in types}
+        if ordinals is not None:
+            sizes.add(len(ordinals))
+        if len(sizes) > 1:
+            raise ValueError("All columns must be the same length")
+        cols = {}
+        for key, type_ in types.items():
+            vals = columns[key]
+            if not all(v is None or _type_ok(type_, v) for v in vals):
+                _logger().warning(
+                    "Column %s in collection %s load version %s contains values that are not "
+                    + "of type %s and is excluded from the columnar snapshot",
+                    key, collection_id, load_ver, type_.value)
+                continue
+            cols[key] = _Column.from_list(type_, vals)
+        return ColumnarSnapshot(
+            collection_id,
+            load_ver,
+            cols,
+            sizes.pop() if sizes else 0,
+            None if ordinals is None else np.array(ordinals, dtype=np.int64),
+        )
+
+    @classmethod
+    def from_docs(
+        cls,
+        collection_id: str,
+        load_ver: str,
+        types: dict[str, ColumnType],
+        docs: list[dict[str, Any]],
+    ):
+        """
+        Create a snapshot from data documents. As with `from_columns`, columns with values that
+        do not match the column type are not included in the snapshot.
+
+        collection_id - the ID of the KBase collection containing the data.
+        load_ver - the load version of the data.
+        types - a mapping of column name to column type for the columns to include in
+            the snapshot.
+        docs - the documents. Missing keys are treated as null values. If every document has
+            an ordinal, the ordinals are included in the snapshot.
+        """
+        columns = {k: [d.get(k) for d in docs] for k in types}
+        ordinals = [d.get(names.FLD_ORDINAL) for d in docs]
+        # load versions loaded before ordinals were assigned have no ordinals
+        if not docs or None in ordinals:
+            ordinals = None
+        return cls.from_columns(collection_id, load_ver, types, columns, ordinals)
+
+    def save(self, path: Path):
+        """
+        Save the snapshot to a file. The file is written atomically.
+
+        path - the path to the file.
+        """
+        meta = {
+            "format": _SNAPSHOT_FORMAT_VERSION,
+            "collection_id": self.collection_id,
+            "load_ver": self.load_ver,
+            "size": self.size,
+            "columns": [[k, c.type.value] for k, c in self._columns.items()],
+        }
+        arrays = {_META: np.array(json.dumps(meta))}
+        if self._ordinals is not None:
+            arrays[_ORDINALS] = self._ordinals
+        for i, c in enumerate(self._columns.values()):
+            arrays[f"{i}_values"] = c.values
+            arrays[f"{i}_nulls"] = c.nulls
+            if c.uniques is not None:
+                arrays[f"{i}_uniques"] = c.uniques
+        # other worker processes may be writing the same snapshot, so use a unique temporary
+        # file in the same directory to keep the replace atomic
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=path.name + ".", suffix=".tmp", delete=False
+        ) as f:
+            try:
+                np.savez(f, **arrays)
+            except BaseException:
+                f.close()
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, path: Path):
+        """
+        Load a snapshot from a file created by `save`.
+
+        path - the path to the file.
+        """
+        with np.load(path, allow_pickle=False) as npz:
+            meta = json.loads(str(npz[_META]))
+            if meta["format"] != _SNAPSHOT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported snapshot format: {meta['format']}")
+            cols = {}
+            for i, (key, type_) in enumerate(meta["columns"]):
+                cols[key] = _Column(
+                    ColumnType(type_),
+                    npz[f"{i}_values"],
+                    npz[f"{i}_nulls"],
+                    npz[f"{i}_uniques"] if f"{i}_uniques" in npz else None,
+                )
+            ordinals = npz[_ORDINALS] if _ORDINALS in npz else None
+        return ColumnarSnapshot(
+            meta["collection_id"], meta["load_ver"], cols, meta["size"], ordinals)
+
+    @property
+    def has_ordinals(self) -> bool:
+        """ True if the snapshot has the row ordinals and `with_subsets` can be used. """
+        return self._ordinals is not None
+
+    def with_subsets(self, bitmaps: dict[str, BitMap]) -> "ColumnarSnapshot":
+        """
+        Get a view of this snapshot restricted to the rows in a set of matches and / or
+        selections. The view supports queries filtered to exactly those subsets. Any subsets
+        already applied to this snapshot are replaced.
+
+        bitmaps - a mapping of the prefixed internal subset ID, as used when marking the data,
+            to the subset bitmap of row ordinals.
+        """
+        if self._ordinals is None:
+            raise ValueError("The snapshot rows have no ordinals")
+        subsets = {i: np.isin(self._ordinals, np.frombuffer(b.to_array(), dtype=np.uint32))
+                   for i, b in bitmaps.items()}
+        return ColumnarSnapshot(
+            self.collection_id, self.load_ver, self._columns, self.size, self._ordinals, subsets)
+
+    def _filter_supported(self, field: str, filter_: AbstractFilter) -> bool:
+        col = self._columns.get(field)
+        if not col:
+            return False
+        if isinstance(filter_, RangeFilter):
+            if filter_.type == ColumnType.DATE:
+                return col.type == ColumnType.DATE
+            return col.type in _NUMERIC_TYPES
+        if isinstance(filter_, BooleanFilter):
+            return col.type == ColumnType.BOOL
+        if isinstance(filter_, StringFilter):
+            # other strategies depend on ArangoSearch analyzers
+            return filter_.strategy == FilterStrategy.IDENTITY and col.uniques is not None
+        return False
+
+    def supports(self, filters: FilterSet) -> bool:
+        """
+        Check whether this snapshot can answer a query exactly.
+
+        Queries against a different collection or load version, queries that filter on
+        matches or selections other than those applied with `with_subsets`, and queries that use
+        columns not in the snapshot or filters that depend on ArangoSearch analyzers are not
+        supported.
+
+        filters - the filters for the query.
+        """
+        return (
+            filters.collection_id == self.collection_id
+            and filters.load_ver == self.load_ver
+            and _subset_ids(filters) == self._subsets.keys()
+            and all(k in self._columns for k in filters.keep)
+            and all(self._filter_supported(f, flt) for f, flt in filters.filters.items())
+        )
+
+    def _filter_mask(self, field: str, filter_: AbstractFilter) -> np.ndarray:
+        col = self._columns[field]
+        if isinstance(filter_, RangeFilter):
+            return col.range_mask(filter_)
+        if isinstance(filter_, BooleanFilter):
+            return col.equals_mask(filter_.bool_value)
+        return col.equals_mask(filter_.string)
+
+    def select(self, filters: FilterSet) -> np.ndarray:
+        """
+        Get a boolean mask of the rows that match a set of filters. Skip, limit, sorting,
+        and the count flag are ignored.
+
+        filters - the filters to apply. The filters must be supported by this snapshot.
+        """
+        if not self.supports(filters):
+            raise ValueError("The filters are not supported by this snapshot")
+        mask = np.ones(self.size, dtype=np.bool_)
+        for subset in self._subsets.values():
+            mask &= subset
+        if filters.keep_filter_nulls:
+            for k in filters.keep:
+                mask &= ~self._columns[k].nulls
+        fmasks = [self._filter_mask(f, flt) for f, flt in filters.filters.items()]
+        if fmasks:
+            reduce = np.logical_and if filters.conjunction else np.logical_or
+            mask &= reduce.reduce(fmasks)
+        return mask
+
+    def count(self, filters: FilterSet) -> int:
+        """
+        Count the rows that match a set of filters.
+
+        filters - the filters to apply. The filters must be supported by this snapshot.
+        """
+        return int(np.count_nonzero(self.select(filters)))
+
+    def get_values(self, filters: FilterSet, *columns: str) -> list[np.ndarray]:
+        """
+        Get the values of one or more numeric or boolean columns for the rows that match a set
+        of filters, in the same row order for each column. Null values are returned as zero
+        or false; set keep_filter_nulls in the filters to exclude them.
+
+        filters - the filters to apply. The filters must be supported by this snapshot.
+        columns - the columns for which to return values.
+        """
+        for c in columns:
+            if c not in self._columns:
+                raise ValueError(f"No such column in snapshot: {c}")
+            if self._columns[c].uniques is not None:
+                raise ValueError(f"Column {c} is not a numeric or boolean column")
+        mask = self.select(filters)
+        return [self._columns[c].values[mask] for c in columns]
+
+
+class ColumnarSnapshotManager:
+    """
+    Builds, caches, and provides columnar snapshots for a columnar attributes data product.
+
+    Snapshots are built and loaded in the background; a query never waits for a snapshot.
+    Snapshots are only built for the active load version of a collection, so queries against
+    other load versions, such as load version overrides, are run against ArangoDB unless the
+    snapshot is already in memory.
+    """
+
+    def __init__(
+        self,
+        storage: ArangoStorage,
+        directory: Path,
+        data_product: str,
+        arango_collection: str,
+        meta_collection: str,
+        max_snapshots: int = 4,
+        retry_sec: int = 300,
+    ):
+        """
+        Create the manager.
+
+        storage - the storage system from which to read the data product data.
+        directory - the directory in which to store snapshot files.
+        data_product - the ID of the data product.
+        arango_collection - the arango collection containing the data product data.
+        meta_collection - the arango collection containing the columnar attributes
+            metadata for the data product.
+        max_snapshots - the maximum number of snapshots to hold in memory. The least recently
+            used snapshot is discarded when the maximum is reached.
+        retry_sec - the time to wait before retrying a failed snapshot build.
+        """
+        if max_snapshots < 1:
+            raise ValueError("max_snapshots must be > 0")
+        self._storage = storage
+        self._dir = Path(directory) / data_product
+        self._data_product = data_product
+        self._coll = arango_collection
+        self._meta_coll = meta_collection
+        self._max_snapshots = max_snapshots
+        self._retry_sec = retry_sec
+        self._snapshots: OrderedDict[tuple[str, str], ColumnarSnapshot] = OrderedDict()
+        self._tasks: dict[tuple[str, str], asyncio.Task] = {}
+        self._failed: dict[tuple[str, str], float] = {}
+
+    def _path(self, collection_id: str, load_ver: str) -> Path:
+        return self._dir / collection_id / f"{load_ver}.npz"
+
+    async def get_snapshot(
+        self, filters: FilterSet, active: models.ActiveCollection | None
+    ) -> ColumnarSnapshot | None:
+        """
+        Get a snapshot that can answer a query exactly, or None if the query should be run
+        against ArangoDB. If the snapshot for the query's collection and load version is not
+        in memory and the load version is the active load version, loading or building the
+        snapshot is started in the background.
+
+        If the query is filtered to matches or selections, the subset bitmaps are fetched and
+        applied to the snapshot. If the snapshot has no ordinals or any bitmap is missing,
+        None is returned.
+
+        filters - the filters for the query.
+        active - the active version of the query's collection, or None if the query's load
+            version is not known to be active, e.g. if it was overridden.
+        """
+        key = (filters.collection_id, filters.load_ver)
+        snap = self._snapshots.get(key)
+        if not snap:
+            if self._is_active(key, active):
+                self._schedule(key)
+            return None
+        self._snapshots.move_to_end(key)
+        subsets = _subset_ids(filters)
+        if subsets:
+            if not snap.has_ordinals:
+                return None
+            bitmaps = {}
+            for subset in subsets:
+                bitmap = await subset_bitmaps.get_subset_bitmap(
+                    self._storage, self._coll, *key, subset)
+                if bitmap is None:
+                    return None
+                bitmaps[subset] = bitmap
+            snap = snap.with_subsets(bitmaps)
+        return snap if snap.supports(filters) else None
+
+    def _is_active(self, key: tuple[str, str], active: models.ActiveCollection | None) -> bool:
+        if not active or active.id != key[0]:
+            return False
+        return any(dp.product == self._data_product and dp.version == key[1]
+                   for dp in active.data_products)
+
+    def activate(self, col: models.ActiveCollection) -> asyncio.Task | None:
+        """
+        Start building the snapshot for a newly activated collection in the background if it
+        includes this manager's data product, and remove any snapshots for the collection's
+        other load versions from disk. Returns the background task, if any.
+
+        col - the activated collection.
+        """
+        for dp in col.data_products:
+            if dp.product == self._data_product:
+                key = (col.id, dp.version)
+                for k in [k for k in self._snapshots if k[0] == col.id and k != key]:
+                    del self._snapshots[k]
+                coldir = self._dir / col.id
+                if coldir.is_dir():
+                    for p in coldir.iterdir():
+                        if p != self._path(*key):
+                            p.unlink(missing_ok=True)
+                self._failed.pop(key, None)
+                return self._schedule(key)
+        return None
+
+    def _schedule(self, key: tuple[str, str]) -> asyncio.Task | None:
+        if key in self._snapshots:
+            return None
+        if key in self._tasks:
+            return self._tasks[key]
+        failed = self._failed.get(key)
+        if failed is not None and time.monotonic() - failed < self._retry_sec:
+            return None
+        task = asyncio.create_task(self._load(key))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return task
+
+    async def _load(self, key: tuple[str, str]):
+        path = self._path(*key)
+        try:
+            snap = None
+            if path.is_file():
+                try:
+                    snap = await asyncio.to_thread(ColumnarSnapshot.load, path)
+                except Exception:
+                    _logger().exception("Failed to load columnar snapshot %s, rebuilding", path)
+            if not snap:
+                snap = await self._build(*key)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                await asyncio.to_thread(snap.save, path)
+            self._snapshots[key] = snap
+            self._failed.pop(key, None)
+            while len(self._snapshots) > self._max_snapshots:
+                self._snapshots.popitem(last=False)
+            _logger().info("Loaded %s columnar snapshot for collection %s load version %s",
+                           self._data_product, *key)
+        except Exception:
+            self._failed[key] = time.monotonic()
+            _logger().exception(
+                "Failed to build %s columnar snapshot for collection %s load version %s",
+                self._data_product, *key)
+
+    async def _build(self, collection_id: str, load_ver: str) -> ColumnarSnapshot:
+        meta = await common_functions.get_columnar_attribs_meta(
+            self._storage, self._meta_coll, collection_id, load_ver, False)
+        types = {c.key: c.type for c in meta.columns}
+        docs = []
+        filters = FilterSet(
+            collection_id,
+            load_ver,
+            collection=self._coll,
+            keep=list(types) + [names.FLD_ORDINAL],
+            limit=0,
+        )
+        # Only collect the documents on the event loop. Splitting them into columns touches
+        # every value in the load version, so do it in a thread to avoid blocking requests
+        await common_functions.query_simple_collection_list(self._storage, filters, docs.append)
+        return await asyncio.to_thread(
+            ColumnarSnapshot.from_docs, collection_id, load_ver, types, docs)
@@ -4,6 +4,7 @@ Functions common to all data products
 from typing import Any, Callable, NamedTuple
 
 from fastapi import Request
+from pyroaring import BitMap
 
 import src.common.storage.collection_and_field_names as names
 from src.common.product_models import columnar_attribs_common_models as col_models
@@ -11,9 +12,13 @@ from src.common.storage.db_doc_conversions import (
     collection_load_version_key,
     collection_data_id_key,
 )
-from src.service import errors, kb_auth, models, app_state
+from src.service import errors, etags, kb_auth, models, app_state, subset_bitmaps
+from src.service.filtering.count_estimation import CountEstimate, CountEstimator
 from src.service.filtering.filters import FilterSet
+from src.service.filtering.query_shapes import query_shape
+from src.service.filtering.result_cache import ResultCache, result_key
 from src.service.processing import SubsetSpecification
+from src.service.single_flight import SingleFlight
 from src.service.storage_arango import ArangoStorage
 
 
@@ -27,6 +32,19 @@ def override_load_version(
     return None if match_id or selection_id else load_ver_override
 
 
+def split_fields(fields: str | None) -> list[str] | None:
+    """
+    Split a comma separated list of fields provided in a query parameter into a list of fields,
+    removing whitespace and duplicates. Returns None if no fields are provided.
+    """
+    if not fields or not fields.strip():
+        return None
+    ret = {f.strip(): None for f in fields.split(",")}
+    if "" in ret:
+        raise errors.IllegalParameterError(f"Empty field name in fields list '{fields}'")
+    return list(ret)
+
+
 async def get_load_version(
     store: ArangoStorage,
     collection_id: str,
@@ -57,9 +75,12 @@ async def get_load_version(
         if not user or user.admin_perm != kb_auth.AdminPermission.FULL:
             raise errors.UnauthorizedError(
                 "To override the load version a user must be a system administrator")
+        etags.record_load_version(collection_id, load_ver, override=True)
         return None, load_ver
     ac = await store.get_collection_active(collection_id)
-    return ac, _get_load_ver_from_collection(ac, data_product)
+    load_ver = _get_load_ver_from_collection(ac, data_product)
+    etags.record_load_version(collection_id, load_ver)
+    return ac, load_ver
 
 
 def _get_load_ver_from_collection(collection: models.SavedCollection, data_product: str) -> str:
@@ -110,6 +131,7 @@ async def get_collection_singleton_from_db(
         collection_load_version_key(collection_id, load_ver),
         f"No data loaded for {collection_id} collection load version {load_ver}",
         no_data_error,
+        "get_collection_singleton",
     )
 
 
@@ -119,7 +141,8 @@ async def get_columnar_attribs_meta(
         collection_id: str,
         load_ver: str,
         load_ver_override: bool,
-        return_only_visible: bool = False
+        return_only_visible: bool = False,
+        single_flight: SingleFlight = None,
 ) -> col_models.ColumnarAttributesMeta:
     """
     Get the columnar attributes meta document for a collection. The document is expected to be
@@ -131,8 +154,17 @@ async def get_columnar_attribs_meta(
     load_ver - the load version of the collection.
     load_ver_override - whether to override the load version.
     return_only_visible - whether to return only visible columns.
-
+    single_flight - a coalescer for concurrent identical reads. The returned document may be
+        shared with other callers and must not be modified.
     """
+    if single_flight:
+        return await single_flight.run(
+            ("meta", collection, collection_id, load_ver, bool(load_ver_override),
+             return_only_visible),
+            lambda: get_columnar_attribs_meta(
+                storage, collection, collection_id, load_ver, load_ver_override,
+                return_only_visible),
+        )
     doc = await get_collection_singleton_from_db(
             storage,
             collection,
@@ -172,14 +204,16 @@ async def get_product_meta(
 
     """
 
-    storage = app_state.get_app_state(r).arangostorage
+    appstate = app_state.get_app_state(r)
+    storage = appstate.arangostorage
     _, load_ver = await get_load_version(storage, collection_id, data_product, load_ver_override, user)
     meta = await get_columnar_attribs_meta(storage,
                                            collection,
                                            collection_id,
                                            load_ver,
                                            bool(load_ver_override),
-                                           return_only_visible=True)
+                                           return_only_visible=True,
+                                           single_flight=appstate.single_flight)
 
     return meta
 
@@ -214,6 +248,7 @@ async def get_doc_from_collection_by_unique_id(
         f"No {data_type} found for {collection_id} collection load version "
             + f"{load_ver} ID {data_id}",
         no_data_error,
+        "get_doc_by_unique_id",
     )
 
 
@@ -223,26 +258,14 @@ async def _query_collection(
     key: str,
     err: str,
     no_data_error: bool,
+    op: str,
 ) -> dict[str, Any]:
-    aql = f"""
-        FOR d IN @@coll
-            FILTER d.{names.FLD_ARANGO_KEY} == @key
-            RETURN d
-    """
-    bind_vars = {
-        "@coll": collection,
-        "key": key,
-    }
-    cur = await store.execute_aql(aql, bind_vars=bind_vars, count=True)
-    try:
-        if cur.count() < 1:
-            if no_data_error:
-                raise errors.NoDataFoundError(err)
-            raise ValueError(err)
-        # since we're getting a doc by _key > 1 is impossible
-        return await cur.next()
-    finally:
-        await cur.close(ignore_missing=True)
+    doc = await store.get_doc_by_key(collection, key, op=op)
+    if not doc:
+        if no_data_error:
+            raise errors.NoDataFoundError(err)
+        raise ValueError(err)
+    return doc
 
 
 async def query_simple_collection_list(
@@ -264,7 +287,8 @@ async def query_simple_collection_list(
         be stored.
     """
     aql, bind_vars = filters.to_aql()
-    cur = await storage.execute_aql(aql, bind_vars=bind_vars)
+    cur = await storage.execute_aql(
+        aql, bind_vars=bind_vars, query_shape=query_shape(filters), op="query_table")
     try:
         async for d in cur:
             if not filters.count:
@@ -277,6 +301,39 @@ async def query_simple_collection_list(
         await cur.close(ignore_missing=True)
 
 
+async def count_documents(
+    storage: ArangoStorage,
+    filters: FilterSet,
+    count_estimator: CountEstimator = None,
+    approximate: bool = False,
+) -> CountEstimate:
+    """
+    Count the documents that match a set of filters. The count flag must be set in the filters.
+
+    storage - the storage system.
+    filters - the filters to apply to the search.
+    count_estimator - an estimator that caches exact counts and provides approximate counts.
+        If not provided, the count is always performed in the database.
+    approximate - whether to return an estimated count if the count isn't cached and an
+        estimate is available.
+    """
+    if not filters.count:
+        raise ValueError("The count flag must be set in the filters")
+    if count_estimator and approximate:
+        est = await count_estimator.estimate(storage, filters)
+        if est:
+            return est
+    elif count_estimator:
+        count = count_estimator.get_exact(filters)
+        if count is not None:
+            return CountEstimate(count, 0, False)
+    count = []
+    await query_simple_collection_list(storage, filters, count.append)
+    if count_estimator:
+        count_estimator.record_exact(filters, count[0])
+    return CountEstimate(count[0], 0, False)
+
+
 def _get_matchsel(spec: SubsetSpecification, doc: dict[str, Any]) -> bool:
     if not doc.get(names.FLD_MATCHES_SELECTIONS):
         return False
@@ -289,17 +346,13 @@ def _query_acceptor(
     doc: dict[str, Any],
     output_table: bool,
     document_mutator: Callable[[dict[str, Any]], dict[str, Any]],
-    count: bool,
 ):
-    if count:
-        data.append(doc)
+    doc = document_mutator(doc)
+    # it's not guaranteed that all "rows" have all fields
+    if output_table:
+        data.append([doc.get(k) for k in fields])
     else:
-        doc = document_mutator(doc)
-        # it's not guaranteed that all "rows" have all fields
-        if output_table:
-            data.append([doc.get(k) for k in fields])
-        else:
-            data.append({k: doc.get(k) for k in fields})
+        data.append({k: doc.get(k) for k in fields})
 
 
 class QueryTableResult(NamedTuple):
@@ -310,6 +363,13 @@ class QueryTableResult(NamedTuple):
     """ The provided limit value. """
     count: int = None
     """ The count of the results. If provided, fields, table, and data will be null. """
+    count_estimated: bool = None
+    """ Whether the count is an estimate. Provided if count is provided. """
+    count_error: int = None
+    """
+    The half width of the 95% confidence interval of the count. 0 for exact counts.
+    Provided if count is provided.
+    """
     fields: list[dict[str, str]] = None
     """
     The list of fields in the table, provided as "name" -> <field name> dictionaries.
@@ -335,6 +395,10 @@ async def query_table(
     filters: FilterSet,
     output_table: bool = True,
     document_mutator: Callable[[dict[str, Any]], dict[str, Any]] = lambda x: x,
+    count_estimator: CountEstimator = None,
+    approximate_count: bool = False,
+    result_cache: ResultCache = None,
+    single_flight: SingleFlight = None,
 ) -> QueryTableResult:
     f"""
     Similar to query_simple_collections_list, but tailored to querying what is effectively a
@@ -344,6 +408,8 @@ async def query_table(
     the special keys `{names.FLD_MATCHED_SAFE}` and `{names.FLD_SELECTED_SAFE}`
     will be used to mark which rows are matched / selected by a value of `True`.
 
+    If the filter set specifies fields to keep, only those columns are returned.
+
     storage - the storage system.
     columns - the expected columns in the table data.
     filters - the filters to apply to the search
@@ -351,12 +417,46 @@ async def query_table(
         fields entry defining the key for each table column, or a list of key / value dictionaries.
     document_mutator - a function applied to a document retrieved from the database before
         returning the results.
+    count_estimator - an estimator that caches exact counts and provides approximate counts
+        when filters.count is set.
+    approximate_count - whether to return an estimated count when filters.count is set.
+    result_cache - a cache for the query results. The document mutator is part of the cache key
+        and so must be the same object, e.g. a module level function, for each call.
+    single_flight - a coalescer for concurrent identical queries. As for the result cache, the
+        document mutator is part of the key. The results may be shared with other callers and
+        must not be modified.
     """
+    if single_flight:
+        key = ("table",) + result_key(
+            filters, tuple(c.key for c in columns), output_table, document_mutator,
+            approximate_count)
+        return await single_flight.run(key, lambda: query_table(
+            store,
+            columns,
+            filters,
+            output_table=output_table,
+            document_mutator=document_mutator,
+            count_estimator=count_estimator,
+            approximate_count=approximate_count,
+            result_cache=result_cache,
+        ))
     fields = [c.key for c in columns]
     if filters.sort_on not in fields:
         raise errors.IllegalParameterError(
                 f"No such field for collection {filters.collection_id} load version "
                 + f"{filters.load_ver}: {filters.sort_on}")
+    if filters.keep:
+        keep = set(filters.keep)
+        fields = [f for f in fields if f in keep]
+    if filters.count:
+        est = await count_documents(store, filters, count_estimator, approximate_count)
+        return QueryTableResult(
+            skip=0, limit=0, count=est.count, count_estimated=est.estimated, count_error=est.error)
+    cache_args = (tuple(fields), output_table, document_mutator)
+    if result_cache:
+        res = result_cache.get(filters, *cache_args)
+        if res is not None:
+            return res
     if not filters.selection_spec.is_null_subset():
         fields = [names.FLD_SELECTED_SAFE] + fields
     if not filters.match_spec.is_null_subset():
@@ -366,17 +466,18 @@ async def query_table(
         store,
         filters,
         lambda doc: _query_acceptor(
-            fields, data, doc, output_table, document_mutator, filters.count),
+            fields, data, doc, output_table, document_mutator),
         match_field=names.FLD_MATCHED_SAFE,
         selection_field=names.FLD_SELECTED_SAFE,
     )
-    if filters.count:
-        return QueryTableResult(skip=0, limit=0, count=data[0])
     if output_table:
         fields = [{"name": f} for f in fields]
-        return QueryTableResult(skip=filters.skip, limit=filters.limit, fields=fields, table=data)
+        res = QueryTableResult(skip=filters.skip, limit=filters.limit, fields=fields, table=data)
     else:
-        return QueryTableResult(skip=filters.skip, limit=filters.limit, data=data)
+        res = QueryTableResult(skip=filters.skip, limit=filters.limit, data=data)
+    if result_cache:
+        result_cache.put(filters, res, len(data), *cache_args)
+    return res
 
 
 async def mark_data_by_kbase_id(
@@ -396,7 +497,9 @@ async def mark_data_by_kbase_id(
     `{names.FLD_COLLECTION_ID}, {names.FLD_LOAD_VERSION}, {names.FLD_KBASE_ID} /
     {names.FLD_KBASE_IDS}`.
 
-    The subset internal ID is added to the `{names.FLD_MATCHES_SELECTIONS}` field.
+    The subset internal ID is added to the `{names.FLD_MATCHES_SELECTIONS}` field. If the data
+    entries have `{names.FLD_ORDINAL}` ordinals, the ordinals of the marked entries are also
+    saved as a subset bitmap.
 
     Returns a sorted list of any IDs in the match or selection that weren't found.
 
@@ -420,6 +523,7 @@ async def mark_data_by_kbase_id(
         "load_ver": load_ver,
         "internal_id": subset_internal_id,
         "retfield": idfield,
+        "ordfield": names.FLD_ORDINAL,
     }
     aql = f"""
         FOR d IN @@coll
@@ -443,15 +547,27 @@ async def mark_data_by_kbase_id(
             }} IN @@coll
             OPTIONS {{exclusive: true}}
             LET updated = NEW
-            RETURN KEEP(updated, @retfield)
+            RETURN KEEP(updated, @retfield, @ordfield)
         """
     matched = set()
-    cur = await storage.execute_aql(aql, bind_vars=bind_vars)
+    ordinals = []
+    cur = await storage.execute_aql(aql, bind_vars=bind_vars, op="mark_data")
     try:
         async for d in cur:
             matched.update(d[idfield]) if multiple_ids else matched.add(d[idfield])
+            ordinals.append(d.get(names.FLD_ORDINAL))
     finally:
         await cur.close(ignore_missing=True)
+    # load versions loaded before ordinals were assigned have no ordinals
+    if ordinals and None not in ordinals:
+        await subset_bitmaps.save_subset_bitmap(
+            storage,
+            collection,
+            collection_id,
+            load_ver,
+            subset_internal_id,
+            BitMap(ordinals),
+        )
     return sorted(set(kbase_ids) - matched)
 
 
@@ -463,13 +579,15 @@ async def remove_marked_subset(
     f"""
     Remove a set of marks from a set of data. The marks are removed from the
     `{names.FLD_MATCHES_SELECTIONS} field, and it is strongly recommended to have an index on
-    that field.
+    that field. Any subset bitmap for the subset is also removed.
 
     storage - the storage system.
     collection - the name of the arango collection to modify.
     subset_internal_id - the internal ID of the subset to remove, including any prefixes that
     may have been applied when marking the data.
     """
+    # remove the bitmap first so the in memory tiers never apply marks that are being removed
+    await subset_bitmaps.remove_subset_bitmap(storage, collection, subset_internal_id)
     m = names.FLD_MATCHES_SELECTIONS
     bind_vars = {
         f"@coll": collection,
@@ -483,5 +601,5 @@ async def remove_marked_subset(
             }} IN @@coll
             OPTIONS {{exclusive: true}}
         """
-    cur = await storage.execute_aql(aql, bind_vars=bind_vars)
+    cur = await storage.execute_aql(aql, bind_vars=bind_vars, op="remove_marked_subset")
     await cur.close(ignore_missing=True)
@@ -7,7 +7,7 @@ from pydantic import field_validator, ConfigDict, BaseModel, Field
 from src.common.product_models.common_models import SubsetProcessStates
 from src.common.storage import collection_and_field_names as names
 from src.service import models
-from typing import Annotated
+from typing import Annotated, Literal
 
 
 class DBCollection(BaseModel):
@@ -32,6 +32,14 @@ class DBCollection(BaseModel):
     Whether the collection requires a generic ArangoSearch view. `view_required` flag is ignored if this flag is set.
     """
 
+    view_primary_sort: str | None = None
+    """
+    The field on which the documents in the collection's ArangoSearch view are sorted, typically
+    the default sort field for the data product. Sorted queries with a limit on this field are
+    answered in index order rather than by sorting all the documents matching the search.
+    Changing the field requires new views.
+    """
+
     indexes: list[list[str]]
     """
     The indexes in the collection. Each item in the outer list is an index, with the inner
@@ -135,9 +143,15 @@ QUERY_VALIDATOR_LIMIT = Annotated[int, Query(
 )]
 
 
-QUERY_VALIDATOR_COUNT = Annotated[bool, Query(
+COUNT_APPROXIMATE = "approx"
+""" The value of the count query parameter that requests an estimated count. """
+
+
+QUERY_VALIDATOR_COUNT = Annotated[bool | Literal[COUNT_APPROXIMATE], Query(
     description="Whether to return the number of records that match the query rather than "
-        + "the records themselves. Paging parameters are ignored."
+        + "the records themselves. Paging parameters are ignored. "
+        + f"`{COUNT_APPROXIMATE}` returns a fast estimate of the count with an error bound, "
+        + "which may be much faster than an exact count for filtered queries."
 )]
 
 
@@ -220,6 +234,14 @@ QUERY_VALIDATOR_OUTPUT_TABLE = Annotated[bool, Query(
 )]
 
 
+QUERY_VALIDATOR_FIELDS = Annotated[str, Query(
+    example=f"{names.FLD_KBASE_ID},checkm_completeness",
+    description="A comma separated list of the fields to return. All fields are returned if "
+        + "omitted. Requesting only the fields needed can greatly reduce the size of the "
+        + "response. Ignored when counting."
+)]
+
+
 QUERY_VALIDATOR_CONJUNCTION = Annotated[bool, Query(
     description="Whether to AND (true) or OR (false) filters together."
 )]
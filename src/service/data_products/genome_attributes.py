@@ -8,6 +8,7 @@ from typing import Any, Callable, Annotated
 
 import numpy as np
 from fastapi import APIRouter, Request, Depends, Query
+from fastapi.responses import Response
 from pydantic import BaseModel
 from pydantic import Field
 
@@ -15,18 +16,21 @@ import src.common.storage.collection_and_field_names as names
 from src.common.product_models import columnar_attribs_common_models as col_models
 from src.service import app_state
 from src.service import errors
+from src.service import etags
 from src.service import kb_auth
 from src.service import models
 from src.service import processing_matches
 from src.service import processing_selections
 from src.service.app_state_data_structures import CollectionsState, PickleableDependencies
 from src.service.data_products import common_models
+from src.service.data_products.columnar_snapshots import ColumnarSnapshot
 from src.service.data_products.common_functions import (
     get_load_version,
     mark_data_by_kbase_id,
     remove_marked_subset,
     override_load_version,
     query_table,
+    split_fields,
     query_simple_collection_list,
     get_columnar_attribs_meta,
     get_product_meta,
@@ -38,8 +42,11 @@ from src.service.data_products.data_product_processing import (
 )
 from src.service.data_products.table_models import TableAttributes
 from src.service.filtering.filtering_processing import get_filters, FILTER_STRATEGY_TEXT
+from src.service.filtering.filters import FilterSet
+from src.service.filtering.result_cache import result_key
 from src.service.http_bearer import KBaseHTTPBearer
 from src.service.processing import SubsetSpecification
+from src.service.responses import FastJSONResponse
 from src.service.routes_common import PATH_VALIDATOR_COLLECTION_ID
 from src.service.storage_arango import ArangoStorage, remove_arango_keys
 from src.service.timestamp import now_epoch_millis
@@ -201,6 +208,7 @@ GENOME_ATTRIBS_SPEC = GenomeAttribsSpec(
         common_models.DBCollection(
             name=names.COLL_GENOME_ATTRIBS,
             view_required=True,
+            view_primary_sort=names.FLD_KBASE_ID,  # the default sort field, see below
             indexes=[
                 [
                     names.FLD_COLLECTION_ID,
@@ -233,7 +241,8 @@ GENOME_ATTRIBS_SPEC = GenomeAttribsSpec(
 
 _OPT_AUTH = KBaseHTTPBearer(optional=True)
 
-_KEYS_TO_REMOVE = (COLLECTION_KEYS | {names.FLD_MATCHES_SELECTIONS, names.FLD_UPA_MAP})
+_KEYS_TO_REMOVE = (COLLECTION_KEYS
+    | {names.FLD_MATCHES_SELECTIONS, names.FLD_ORDINAL, names.FLD_UPA_MAP})
 
 def _remove_keys(doc):
     doc = remove_arango_keys(doc)
@@ -242,6 +251,16 @@ def _remove_keys(doc):
     return doc
 
 
+async def _get_snapshot(
+    appstate: CollectionsState, filters: FilterSet, coll: models.ActiveCollection | None
+) -> ColumnarSnapshot | None:
+    # returns None if the query should go to Arango. coll is None if the load version was
+    # overridden, in which case a snapshot isn't built
+    if not appstate.genome_attribs_snapshots:
+        return None
+    return await appstate.genome_attribs_snapshots.get_snapshot(filters, coll)
+
+
 _FLD_COL_ID = "colid"
 _FLD_COL_NAME = "colname"
 _FLD_COL_LV = "colload"
@@ -265,13 +284,13 @@ async def get_genome_attributes_meta(
     collection_id: str = PATH_VALIDATOR_COLLECTION_ID,
     load_ver_override: common_models.QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-    ) -> col_models.ColumnarAttributesMeta:
-    return await get_product_meta(r,
-                                  names.COLL_GENOME_ATTRIBS_META,
-                                  collection_id,
-                                  ID,
-                                  load_ver_override,
-                                  user)
+    ) -> Response:
+    return FastJSONResponse(await get_product_meta(r,
+                                                   names.COLL_GENOME_ATTRIBS_META,
+                                                   collection_id,
+                                                   ID,
+                                                   load_ver_override,
+                                                   user))
 
 
 @_ROUTER.get(
@@ -298,6 +317,7 @@ async def get_genome_attributes(
     skip: common_models.QUERY_VALIDATOR_SKIP = 0,
     limit: common_models.QUERY_VALIDATOR_LIMIT = 1000,
     output_table: common_models.QUERY_VALIDATOR_OUTPUT_TABLE = True,
+    fields: common_models.QUERY_VALIDATOR_FIELDS = None,
     count: common_models.QUERY_VALIDATOR_COUNT = False,
     conjunction: common_models.QUERY_VALIDATOR_CONJUNCTION = True,
     match_id: common_models.QUERY_VALIDATOR_MATCH_ID = None,
@@ -307,7 +327,7 @@ async def get_genome_attributes(
     selection_mark: common_models.QUERY_VALIDATOR_SELECTION_MARK_SAFE = False,
     load_ver_override: common_models.QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-):
+) -> Response:
     # sorting only works here since we expect the largest collection to be ~300K records and
     # we have a max limit of 1000, which means sorting is O(n log2 1000).
     # Otherwise we need indexes for every sort
@@ -321,7 +341,8 @@ async def get_genome_attributes(
             names.COLL_GENOME_ATTRIBS_META,
             collection_id,
             load_ver,
-            load_ver_override)
+            load_ver_override,
+            single_flight=appstate.single_flight)
     ).columns
     filters = await get_filters(
         r,
@@ -332,31 +353,42 @@ async def get_genome_attributes(
         ID,
         cols,
         view_name=coll.get_data_product(ID).search_view if coll else None,
-        count=count,
+        count=bool(count),
         sort_on=sort_on,
         sort_desc=sort_desc,
         filter_conjunction=conjunction,
         match_spec=match_spec,
         selection_spec=sel_spec,
+        keep=None if count else {f: None for f in split_fields(fields) or []},
         skip=skip,
         limit=limit,
     )
+    snapshot = await _get_snapshot(appstate, filters, coll) if count else None
+    if snapshot:
+        return FastJSONResponse(TableAttributes.model_construct(
+            skip=0, limit=0, count=snapshot.count(filters), count_estimated=False, count_error=0))
     res = await query_table(
         appstate.arangostorage,
         # for now sort alphabetically by key, might want to do something else later
         [c for c in sorted(cols, key=lambda col: col.key) if c.key not in _KEYS_TO_REMOVE],
         filters,
         output_table=output_table,
-        document_mutator=_remove_keys
+        document_mutator=_remove_keys,
+        count_estimator=appstate.count_estimator,
+        approximate_count=count == common_models.COUNT_APPROXIMATE,
+        result_cache=appstate.result_cache,
+        single_flight=appstate.single_flight,
     )
-    return {
-        _FLD_SKIP: res.skip,
-        _FLD_LIMIT: res.limit,
-        _FLD_COUNT: res.count,
-        "fields": res.fields,
-        "table": res.table,
-        "data": res.data
-    }
+    return FastJSONResponse(TableAttributes.model_construct(
+        skip=res.skip,
+        limit=res.limit,
+        count=res.count,
+        count_estimated=res.count_estimated,
+        count_error=res.count_error,
+        fields=res.fields,
+        table=res.table,
+        data=res.data,
+    ))
 
 
 class Histogram(BaseModel):
@@ -400,7 +432,7 @@ async def get_histogram(
     selection_id: common_models.QUERY_VALIDATOR_SELECTION_ID_NO_MARK = None,
     load_ver_override: common_models.QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-):
+) -> Response:
     appstate = app_state.get_app_state(r)
     lvo = override_load_version(load_ver_override, match_id, selection_id)
     coll, load_ver = await get_load_version(appstate.arangostorage, collection_id, ID, lvo, user)
@@ -419,7 +451,8 @@ async def get_histogram(
             names.COLL_GENOME_ATTRIBS_META,
             collection_id,
             load_ver,
-            load_ver_override)).columns,
+            load_ver_override,
+            single_flight=appstate.single_flight)).columns,
         view_name=coll.get_data_product(ID).search_view if coll else None,
         filter_conjunction=conjunction,
         match_spec=match_spec,
@@ -431,15 +464,34 @@ async def get_histogram(
         keep_filter_nulls=True,
         limit=0,
     )
-    data = []
-    await query_simple_collection_list(
-        appstate.arangostorage,
-        filters,
-        lambda d: data.append(d[column]),
-    )
+    if appstate.single_flight:
+        hist, bin_edges = await appstate.single_flight.run(
+            ("hist", column) + result_key(filters),
+            lambda: _get_histogram(appstate, filters, coll, column),
+        )
+    else:
+        hist, bin_edges = await _get_histogram(appstate, filters, coll, column)
+    return FastJSONResponse(Histogram.model_construct(bins=bin_edges, values=hist))
+
+
+async def _get_histogram(
+    appstate: CollectionsState,
+    filters: FilterSet,
+    coll: models.ActiveCollection | None,
+    column: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    snapshot = await _get_snapshot(appstate, filters, coll)
+    if snapshot:
+        data = snapshot.get_values(filters, column)[0]
+    else:
+        data = []
+        await query_simple_collection_list(
+            appstate.arangostorage,
+            filters,
+            lambda d: data.append(d[column]),
+        )
     # may want to add some controls for histogram, like bin count / range?
-    hist, bin_edges = np.histogram(data)
-    return Histogram(bins=bin_edges, values=hist)
+    return np.histogram(data)
 
 
 class XYScatter(BaseModel):
@@ -488,7 +540,7 @@ async def get_xy_scatter(
     selection_id: common_models.QUERY_VALIDATOR_SELECTION_ID_NO_MARK = None,
     load_ver_override: common_models.QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-):
+) -> Response:
     appstate = app_state.get_app_state(r)
     lvo = override_load_version(load_ver_override, match_id, selection_id)
     coll, load_ver = await get_load_version(appstate.arangostorage, collection_id, ID, lvo, user)
@@ -506,7 +558,8 @@ async def get_xy_scatter(
             names.COLL_GENOME_ATTRIBS_META,
             collection_id,
             load_ver,
-            load_ver_override)).columns,
+            load_ver_override,
+            single_flight=appstate.single_flight)).columns,
         view_name=coll.get_data_product(ID).search_view if coll else None,
         filter_conjunction=conjunction,
         match_spec=match_spec,
@@ -519,13 +572,18 @@ async def get_xy_scatter(
         keep_filter_nulls=True,
         limit=0,
     )
-    data = []
-    await query_simple_collection_list(
-        appstate.arangostorage,
-        filters,
-        lambda d: data.append({"x": d[xcolumn], "y": d[ycolumn]}),
-    )
-    return XYScatter(xcolumn=xcolumn, ycolumn=ycolumn, data=data)
+    snapshot = await _get_snapshot(appstate, filters, coll)
+    if snapshot:
+        xs, ys = snapshot.get_values(filters, xcolumn, ycolumn)
+        data = [{"x": x, "y": y} for x, y in zip(xs.tolist(), ys.tolist())]
+    else:
+        data = []
+        await query_simple_collection_list(
+            appstate.arangostorage,
+            filters,
+            lambda d: data.append({"x": d[xcolumn], "y": d[ycolumn]}),
+        )
+    return FastJSONResponse(XYScatter.model_construct(xcolumn=xcolumn, ycolumn=ycolumn, data=data))
 
 
 async def _get_match_spec(
@@ -546,6 +604,7 @@ async def _get_match_spec(
         require_complete=True,
         require_collection=coll
     )
+    etags.record_subset(models.SubsetType.MATCH.value, match_.internal_match_id, True)
     return SubsetSpecification(
         internal_subset_id=match_.internal_match_id, mark_only=match_mark, prefix=MATCH_ID_PREFIX)
 
@@ -560,6 +619,8 @@ async def _get_selection_spec(
         return SubsetSpecification()
     internal_sel = await processing_selections.get_selection_full(
             appstate, selection_id, require_complete=True, require_collection=coll)
+    etags.record_subset(
+        models.SubsetType.SELECTION.value, internal_sel.internal_selection_id, True)
     return SubsetSpecification(
         internal_subset_id=internal_sel.internal_selection_id,
         mark_only=selection_mark,
@@ -642,7 +703,7 @@ async def _mark_gtdb_matches_complete(
     bind_vars: dict[str, Any],
     internal_match_id: str
 ):
-    cur = await storage.execute_aql(aql, bind_vars=bind_vars)
+    cur = await storage.execute_aql(aql, bind_vars=bind_vars, op="mark_gtdb_matches")
     genome_ids = []
     try:
         async for d in cur:
@@ -748,7 +809,7 @@ async def process_subset_documents(
             RETURN d
         """
 
-    cur = await storage.execute_aql(aql, bind_vars=bind_vars)
+    cur = await storage.execute_aql(aql, bind_vars=bind_vars, op="process_subset_documents")
     try:
         async for d in cur:
             acceptor(d)
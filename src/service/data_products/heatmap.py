@@ -2,25 +2,30 @@
 Reusable code for creating a heatmap based data product.
 """
 
-import json
 from typing import Annotated, Any
 
 from fastapi import APIRouter, Depends, Request, Query, Path, Response
+import numpy as np
 
 import src.common.storage.collection_and_field_names as names
+from src.common.heatmap_matrix import HeatMapMatrix
 from src.common.product_models import columnar_attribs_common_models as col_models
 from src.common.product_models.common_models import FIELD_MATCH_STATE, FIELD_SELECTION_STATE
 from src.common.product_models import heatmap_common_models as heatmap_models
-from src.service import app_state, kb_auth, models
+from src.service import app_state, errors, kb_auth, models, subset_bitmaps
+from src.service.app_state_data_structures import CollectionsState
 from src.service.data_products.common_functions import (
+    count_documents,
     get_load_version,
     get_collection_singleton_from_db,
     get_doc_from_collection_by_unique_id,
     remove_collection_keys,
     query_simple_collection_list,
     remove_marked_subset,
+    split_fields,
 )
 from src.service.data_products.common_models import (
+    COUNT_APPROXIMATE,
     DataProductSpec,
     DBCollection,
     DataProductMissingIDs,
@@ -39,11 +44,16 @@ from src.service.data_products.data_product_processing import (
     get_load_version_and_processes,
     get_missing_ids,
 )
+from src.service.filtering.count_estimation import CountEstimate
 from src.service.filtering.filtering_processing import get_filters, FILTER_STRATEGY_TEXT
 from src.service.filtering.filters import FilterSet
-from src.service.filtering.generic_view import get_generic_view_name
+from src.service.filtering.generic_view import (
+    get_generic_view_name,
+    get_legacy_generic_view_name,
+)
 from src.service.http_bearer import KBaseHTTPBearer
 from src.service.processing import SubsetSpecification
+from src.service.responses import FastJSONResponse
 from src.service.routes_common import PATH_VALIDATOR_COLLECTION_ID
 from src.service.storage_arango import ArangoStorage, remove_arango_keys
 
@@ -53,6 +63,8 @@ _OPT_AUTH = KBaseHTTPBearer(optional=True)
 # Default string columns present in heatmap row data but not existing in the HeatMapMeta
 _ID_COLS = [names.FLD_KBASE_ID]
 _NGRAM_COLS = [names.FLD_KB_DISPLAY_NAME]
+# Fields in the heatmap row data other than the cells
+_ROW_FIELDS = [names.FLD_KBASE_ID, names.FLD_KB_DISPLAY_NAME, heatmap_models.FIELD_HEATMAP_ROW_META]
 
 
 def _bools_to_ints(list_: list):
@@ -151,6 +163,16 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
             summary=f"Get a cell in a {self._api_category} heatmap",
             description=f"Get detailed information about a cell in a {self._api_category} heatmap."
         )
+        router.add_api_route(
+            "/column/{col_id}",
+            self.get_column,
+            methods=["GET"],
+            response_model=heatmap_models.HeatMapColumn,
+            summary=f"Get a column in a {self._api_category} heatmap",
+            description=f"Get the cells in a column of a {self._api_category} heatmap for all "
+                + "the rows in the heatmap, ordered by "
+                + f"`{names.FLD_KB_DISPLAY_NAME}`."
+        )
         router.add_api_route(
             "/missing",
             self.get_missing_ids,
@@ -198,6 +220,7 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
                 DBCollection(
                     name=self._colname_data,
                     generic_view_required=True,
+                    view_primary_sort=names.FLD_KB_DISPLAY_NAME,  # the default sort field
                     indexes=[
                         [
                             names.FLD_COLLECTION_ID,
@@ -240,12 +263,13 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
         collection_id: Annotated[str, PATH_VALIDATOR_COLLECTION_ID],
         load_ver_override: QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
         user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-    ) -> heatmap_models.HeatMapMeta:
+    ) -> Response:
         storage = app_state.get_app_state(r).arangostorage
         _, load_ver = await get_load_version(
             storage, collection_id, self._id, load_ver_override, user)
 
-        return await self._get_heatmap_meta(storage, collection_id, load_ver, load_ver_override)
+        return FastJSONResponse(
+            await self._get_heatmap_meta(storage, collection_id, load_ver, load_ver_override))
 
     async def _get_heatmap_meta(
             self,
@@ -259,6 +283,35 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
             storage, self._colname_meta, collection_id, load_ver, bool(load_ver_override))
         return heatmap_models.HeatMapMeta(**remove_collection_keys(doc))
 
+    def _get_matrix(
+            self, appstate: CollectionsState, collection_id: str, load_ver: str
+    ) -> HeatMapMatrix | None:
+        if not appstate.heatmap_matrices:
+            return None
+        return appstate.heatmap_matrices.get_matrix(self._id, collection_id, load_ver)
+
+    async def _get_ordered_matrix(
+            self, appstate: CollectionsState, collection_id: str, load_ver: str
+    ) -> HeatMapMatrix | None:
+        # ArangoDB sorts the display names with its ICU collation, so rather than trying to
+        # reproduce that order, record the order from ArangoDB the first time a matrix is used
+        matrix = self._get_matrix(appstate, collection_id, load_ver)
+        if matrix and not matrix.has_row_order:
+            field = names.FLD_ORDINAL if matrix.has_ordinals else names.FLD_KBASE_ID
+            filters = FilterSet(
+                collection_id,
+                load_ver,
+                collection=self._colname_data,
+                sort_on=names.FLD_KB_DISPLAY_NAME,
+                keep=[field],
+                limit=0,
+            )
+            ids = []
+            await query_simple_collection_list(
+                appstate.arangostorage, filters, lambda doc: ids.append(doc[field]))
+            matrix.set_row_order(ids)
+        return matrix
+
     async def get_cell(
         self,
         r: Request,
@@ -269,14 +322,81 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
         ),
         load_ver_override: QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
         user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-    ) -> heatmap_models.CellDetail:
-        storage = app_state.get_app_state(r).arangostorage
+    ) -> Response:
+        appstate = app_state.get_app_state(r)
+        storage = appstate.arangostorage
         _, load_ver = await get_load_version(
             storage, collection_id, self._id, load_ver_override, user)
+        matrix = self._get_matrix(appstate, collection_id, load_ver)
+        if matrix:
+            doc = matrix.get_cell_detail(cell_id)
+            if not doc:
+                raise errors.NoDataFoundError(
+                    f"No cell detail found for {collection_id} collection load version "
+                    + f"{load_ver} ID {cell_id}")
+            return FastJSONResponse(heatmap_models.CellDetail(**doc))
         doc = await get_doc_from_collection_by_unique_id(
             storage, self._colname_cells, collection_id, load_ver, cell_id, "cell detail", True,
         )
-        return heatmap_models.CellDetail(**remove_collection_keys(doc))
+        return FastJSONResponse(heatmap_models.CellDetail(**remove_collection_keys(doc)))
+
+    async def get_column(
+        self,
+        r: Request,
+        collection_id: Annotated[str, PATH_VALIDATOR_COLLECTION_ID],
+        col_id: str = Path(
+            example="8",
+            description="The ID of the column in the heatmap."
+        ),
+        load_ver_override: QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
+        user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
+    ) -> Response:
+        appstate = app_state.get_app_state(r)
+        _, load_ver = await get_load_version(
+            appstate.arangostorage, collection_id, self._id, load_ver_override, user)
+        matrix = await self._get_ordered_matrix(appstate, collection_id, load_ver)
+        if matrix:
+            col = matrix.get_column(col_id)
+        else:
+            col = await self._get_column_from_db(
+                appstate.arangostorage, collection_id, load_ver, load_ver_override, col_id)
+        if not col:
+            raise errors.NoDataFoundError(
+                f"No column with ID '{col_id}' exists in the {self._api_category} heatmap")
+        kbase_ids, cell_ids, values = col
+        return FastJSONResponse(heatmap_models.HeatMapColumn.model_construct(
+            col_id=col_id, kbase_ids=kbase_ids, cell_ids=cell_ids, values=values))
+
+    async def _get_column_from_db(
+            self,
+            storage: ArangoStorage,
+            collection_id: str,
+            load_ver: str,
+            load_ver_override: bool,
+            col_id: str,
+    ) -> tuple[list[str], list[str | None], list[Any]] | None:
+        meta = await self._get_heatmap_meta(storage, collection_id, load_ver, load_ver_override)
+        if col_id not in {col.col_id for cat in meta.categories for col in cat.columns}:
+            return None
+        id_key = heatmap_models.form_heatmap_cell_id_key(col_id)
+        val_key = heatmap_models.form_heatmap_cell_val_key(col_id)
+        kbase_ids, cell_ids, values = [], [], []
+
+        def acceptor(doc: dict[str, Any]):
+            kbase_ids.append(doc[names.FLD_KBASE_ID])
+            cell_ids.append(doc.get(id_key))
+            values.append(doc.get(val_key))
+
+        filters = FilterSet(
+            collection_id,
+            load_ver,
+            collection=self._colname_data,
+            sort_on=names.FLD_KB_DISPLAY_NAME,
+            keep=[names.FLD_KBASE_ID, id_key, val_key],
+            limit=0,
+        )
+        await query_simple_collection_list(storage, filters, acceptor)
+        return kbase_ids, cell_ids, values
 
     def _append_col(
             self,
@@ -314,6 +434,33 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
 
         return columns
 
+    def _get_column_ids(
+            self,
+            columns: list[col_models.AttributesColumn],
+            fields: str | None,
+            collection_id: str,
+            load_ver: str,
+    ) -> list[str] | None:
+        # Returns the requested heatmap column IDs or None if all columns were requested.
+        col_ids = split_fields(fields)
+        if col_ids:
+            heatmap_cols = {c.key for c in columns} - set(_ID_COLS) - set(_NGRAM_COLS)
+            for col_id in col_ids:
+                if col_id not in heatmap_cols:
+                    raise errors.IllegalParameterError(
+                        f"No such column in the {self._api_category} heatmap for collection "
+                        + f"{collection_id} load version {load_ver}: {col_id}")
+        return col_ids
+
+    def _projection(self, col_ids: list[str] | None) -> list[str] | None:
+        # Returns the fields to return from the database for a set of heatmap column IDs.
+        if not col_ids:
+            return None
+        return _ROW_FIELDS + [key for col_id in col_ids for key in (
+            heatmap_models.form_heatmap_cell_id_key(col_id),
+            heatmap_models.form_heatmap_cell_val_key(col_id),
+        )]
+
     def _trans_field_func(self, field_name: str) -> str:
         # Transforms the field name into a valid column name extracted from the filter query.
         # For instance, converts a query field name '1' into a valid column name 'col_1_val'.
@@ -332,6 +479,13 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
                 + "the last row in the previous set of data."
         ),
         limit: QUERY_VALIDATOR_LIMIT = 1000,
+        fields: str = Query(
+            default=None,
+            example="2,5,8",
+            description="A comma separated list of the IDs of the columns to return. All "
+                + "columns are returned if omitted. Requesting only the columns needed can "
+                + "greatly reduce the size of the response. Ignored when counting."
+        ),
         count: QUERY_VALIDATOR_COUNT = False,
         match_id: QUERY_VALIDATOR_MATCH_ID = None,
         # TODO FEATURE support a choice of AND or OR for matches & selections
@@ -358,6 +512,7 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
         if status_only:
             return self._response(dp_match=dp_match, dp_sel=dp_sel)
         columns = await self._get_heatmap_columns(appstate.arangostorage, collection_id, load_ver, load_ver_override)
+        col_ids = None if count else self._get_column_ids(columns, fields, collection_id, load_ver)
         filters = await get_filters(
             r,
             arango_coll=self._colname_data,
@@ -367,7 +522,8 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
             data_product=self._id,
             columns=columns,
             view_name=get_generic_view_name(self._id),
-            count=count,
+            fallback_view_name=get_legacy_generic_view_name(self._id),
+            count=bool(count),
             sort_on=names.FLD_KB_DISPLAY_NAME,
             sort_desc=False,
             match_spec=SubsetSpecification(
@@ -376,8 +532,31 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
                 subset_process=dp_sel, mark_only=selection_mark, prefix=SELECTION_ID_PREFIX),
             start_after=start_after,
             limit=limit,
+            projection=self._projection(col_ids),
             trans_field_func=self._trans_field_func
         )
+        matrix = await self._get_ordered_matrix(appstate, collection_id, load_ver)
+        # column filters require a search, so they're always run in ArangoDB, as are start_after
+        # values that aren't a display name in the heatmap, since their place in the ArangoDB
+        # collation order isn't known
+        if (matrix and not len(filters)
+                and matrix.start_position(filters.start_after) is not None):
+            return await self._query_matrix(
+                appstate.arangostorage,
+                matrix,
+                filters,
+                match_proc=dp_match,
+                selection_proc=dp_sel,
+                col_ids=col_ids,
+            )
+        if filters.count:
+            est = await count_documents(
+                appstate.arangostorage,
+                filters,
+                appstate.count_estimator,
+                approximate=count == COUNT_APPROXIMATE,
+            )
+            return self._response(dp_match=dp_match, dp_sel=dp_sel, count=est)
         return await self._query(
             appstate.arangostorage, filters, match_proc=dp_match, selection_proc=dp_sel)
 
@@ -388,8 +567,8 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
         match_id: Annotated[str, Query(description="A match ID.")] = None,
         selection_id: Annotated[str, Query(description="A selection ID.")] = None,
         user: kb_auth.KBaseUser = Depends(_OPT_AUTH),
-    ) -> DataProductMissingIDs:
-        return await get_missing_ids(
+    ) -> Response:
+        return FastJSONResponse(await get_missing_ids(
             app_state.get_app_state(r),
             self._colname_data,
             collection_id,
@@ -397,31 +576,33 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
             match_id=match_id,
             selection_id=selection_id,
             user=user,
-        )
+        ))
 
     def _response(
         self,
         dp_match: models.DataProductProcess = None,
         dp_sel: models.DataProductProcess = None,
-        count: int = None,
+        count: CountEstimate = None,
         data: list[heatmap_models.HeatMapRow] = None,
         min_value: int = None,
         max_value: int = None,
     ) -> Response:
-        j = {
+        return FastJSONResponse({
             FIELD_MATCH_STATE: dp_match.state if dp_match else None,
             FIELD_SELECTION_STATE: dp_sel.state if dp_sel else None,
             heatmap_models.FIELD_HEATMAP_DATA: data,
             heatmap_models.FIELD_HEATMAP_MIN_VALUE: min_value,
             heatmap_models.FIELD_HEATMAP_MAX_VALUE: max_value,
-            heatmap_models.FIELD_HEATMAP_COUNT: count,
-        }
-        return Response(content=json.dumps(j), media_type="application/json")
+            heatmap_models.FIELD_HEATMAP_COUNT: count.count if count else None,
+            heatmap_models.FIELD_HEATMAP_COUNT_ESTIMATED: count.estimated if count else None,
+            heatmap_models.FIELD_HEATMAP_COUNT_ERROR: count.error if count else None,
+        })
     
     def _remove_doc_keys(self, doc: dict[str, Any]) -> dict[str, Any]:
         # removes in place
         doc = remove_arango_keys(remove_collection_keys(doc))
         doc.pop(names.FLD_MATCHES_SELECTIONS, None)
+        doc.pop(names.FLD_ORDINAL, None)
 
         heatmap_models.revert_transformed_heatmap_row_cells(doc)
 
@@ -436,22 +617,101 @@ GET <host>/collections/PMI/data_products/{self._id}/?filter_kbase_id=69278_1006_
     ) -> Response:
         data = []
         await query_simple_collection_list(
-            store,
-            filters,
-            lambda doc: data.append(doc) if filters.count else
-                data.append(self._remove_doc_keys(doc)),
+            store, filters, lambda doc: data.append(self._remove_doc_keys(doc)))
+        vals = set()
+        for r in data:  # lazy lazy lazy
+            vals |= {c[heatmap_models.FIELD_HEATMAP_CELL_VALUE]
+                     for c in r[heatmap_models.FIELD_HEATMAP_ROW_CELLS]}
+        return self._response(
+            dp_match=match_proc,
+            dp_sel=selection_proc,
+            data=data,
+            min_value=min(_bools_to_ints(vals)) if vals else None,
+            max_value=max(_bools_to_ints(vals)) if vals else None
+        )
+
+    async def _get_subset_members(
+        self,
+        store: ArangoStorage,
+        filters: FilterSet,
+        spec: SubsetSpecification,
+        field: str,
+    ) -> list[Any]:
+        subset_filters = FilterSet(
+            filters.collection_id,
+            filters.load_ver,
+            collection=self._colname_data,
+            match_spec=SubsetSpecification(
+                internal_subset_id=spec.internal_subset_id, prefix=spec.prefix),
+            keep=[field],
+            limit=0,
         )
+        members = []
+        await query_simple_collection_list(
+            store, subset_filters, lambda doc: members.append(doc[field]))
+        return members
+
+    async def _get_subset_mask(
+        self,
+        store: ArangoStorage,
+        matrix: HeatMapMatrix,
+        filters: FilterSet,
+        spec: SubsetSpecification,
+    ) -> np.ndarray:
+        # the subset bitmap is a single small document, and ordinals are much smaller than
+        # kbase IDs to transfer, decode, and look up
+        if matrix.has_ordinals:
+            bitmap = await subset_bitmaps.get_subset_bitmap(
+                store,
+                self._colname_data,
+                filters.collection_id,
+                filters.load_ver,
+                spec.get_prefixed_subset_id(),
+            )
+            if bitmap is not None:
+                return matrix.bitmap_mask(bitmap)
+            return matrix.ordinal_mask(
+                await self._get_subset_members(store, filters, spec, names.FLD_ORDINAL))
+        return matrix.row_mask(
+            await self._get_subset_members(store, filters, spec, names.FLD_KBASE_ID))
+
+    async def _query_matrix(
+        self,
+        store: ArangoStorage,
+        matrix: HeatMapMatrix,
+        filters: FilterSet,
+        match_proc: models.DataProductProcess | None,
+        selection_proc: models.DataProductProcess | None,
+        col_ids: list[str] | None = None,
+    ) -> Response:
+        # The matrix holds the heatmap data, but the match and selection marks change over time
+        # and are only stored in ArangoDB, so get the subset membership from there, preferably
+        # from the subset bitmap.
+        in_subsets = {}
+        include = np.ones(matrix.count, dtype=np.bool_)
+        for spec, field in ((filters.match_spec, names.FLD_MATCHED),
+                            (filters.selection_spec, names.FLD_SELECTED)):
+            if not spec.is_null_subset():
+                in_subsets[field] = await self._get_subset_mask(store, matrix, filters, spec)
+                if not spec.mark_only:
+                    include &= in_subsets[field]
         if filters.count:
-            return self._response(dp_match=match_proc, dp_sel=selection_proc, count=data[0])
-        else:
-            vals = set()
-            for r in data:  # lazy lazy lazy
-                vals |= {c[heatmap_models.FIELD_HEATMAP_CELL_VALUE]
-                         for c in r[heatmap_models.FIELD_HEATMAP_ROW_CELLS]}
             return self._response(
                 dp_match=match_proc,
                 dp_sel=selection_proc,
-                data=data,
-                min_value=min(_bools_to_ints(vals)) if vals else None,
-                max_value=max(_bools_to_ints(vals)) if vals else None
+                count=CountEstimate(int(include.sum()), 0, False),
             )
+        order = matrix.row_order[matrix.start_position(filters.start_after):]
+        rows = order[include[order]]
+        rows = rows[filters.skip:filters.skip + filters.limit if filters.limit else None]
+        data, min_value, max_value = matrix.get_rows(rows, columns=col_ids)
+        for field, in_subset in in_subsets.items():
+            for doc, mark in zip(data, in_subset[rows].tolist()):
+                doc[field] = mark
+        return self._response(
+            dp_match=match_proc,
+            dp_sel=selection_proc,
+            data=data,
+            min_value=min_value,
+            max_value=max_value,
+        )
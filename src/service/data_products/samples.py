@@ -4,16 +4,20 @@ The samples data product, which provides sample information for a collection.
 from typing import Any, Annotated
 
 from fastapi import APIRouter, Request, Depends, Query
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 
 import src.common.storage.collection_and_field_names as names
+from src.common import sample_tiles
 from src.common.product_models import columnar_attribs_common_models as col_models
 from src.common.product_models.common_models import SubsetProcessStates
+from src.common.storage.db_doc_conversions import sample_tiles_key
 from src.service import app_state, errors, kb_auth, models
 from src.service.data_products import common_models
 from src.service.data_products.common_functions import (
     remove_marked_subset,
     query_table,
+    split_fields,
     get_load_version,
     QueryTableResult,
     get_product_meta,
@@ -30,6 +34,7 @@ from src.service.data_products.table_models import TableAttributes
 from src.service.filtering.filtering_processing import get_filters, FILTER_STRATEGY_TEXT
 from src.service.http_bearer import KBaseHTTPBearer
 from src.service.processing import SubsetSpecification
+from src.service.responses import FastJSONResponse, construct_all
 from src.service.routes_common import PATH_VALIDATOR_COLLECTION_ID
 from src.service.storage_arango import ArangoStorage, remove_arango_keys
 
@@ -47,6 +52,12 @@ _ROUTER = APIRouter(tags=["Samples"], prefix=f"/{ID}")
 
 _MAX_SAMPLE_IDS = 1000
 
+_MAX_TILES = 4096
+
+# location and tile documents are small and there may be many of them, so start with large
+# cursor batches
+_LOCATION_BATCH_SIZE = 10_000
+
 _FILTERING_TEXT = """
 **FILTERING:**
 
@@ -92,9 +103,14 @@ SAMPLES_SPEC = SamplesSpec(
             name=names.COLL_SAMPLES_META,
             indexes=[]  # lookup is by key
         ),
+        common_models.DBCollection(
+            name=names.COLL_SAMPLES_TILES,
+            indexes=[]  # lookup is by key
+        ),
         common_models.DBCollection(
             name=names.COLL_SAMPLES,
             view_required=True,
+            view_primary_sort=names.FLD_KB_DISPLAY_NAME,  # the default sort field, see below
             indexes=[
                 [
                     names.FLD_COLLECTION_ID,
@@ -134,7 +150,8 @@ SAMPLES_SPEC = SamplesSpec(
 _OPT_AUTH = KBaseHTTPBearer(optional=True)
 
 _KEYS_TO_REMOVE = (COLLECTION_KEYS
-     | {names.FLD_MATCHES_SELECTIONS, names.FLD_SAMPLE_GEO, names.FLD_KBASE_IDS})
+     | {names.FLD_MATCHES_SELECTIONS, names.FLD_ORDINAL, names.FLD_SAMPLE_GEO,
+        names.FLD_KBASE_IDS})
 
 def _remove_keys(doc):
     doc = remove_arango_keys(doc)
@@ -171,6 +188,33 @@ class SampleLocations(SubsetProcessStates):
     locs: list[SampleLocation] | None = None
 
 
+class SampleTile(BaseModel):
+    """
+    A slippy map tile containing one or more samples.
+    """
+    x: int = Field(example=12, description="The x coordinate of the tile.")
+    y: int = Field(example=24, description="The y coordinate of the tile.")
+    lat: float = Field(
+        example=36.1, description="The mean latitude of the samples in the tile in degrees.")
+    lon: float = Field(
+        example=-28.2, description="The mean longitude of the samples in the tile in degrees.")
+    count: int = Field(example=3, description="The number of genomes found in the tile.")
+    sample_count: int = Field(example=2, description="The number of samples found in the tile.")
+    ids: list[str] = Field(
+        example=["993eeea2-5323-44dd-80d5-18b1f7cb57bf"],
+        description="Representative sample IDs found in the tile. At most "
+            + f"{names.SAMPLE_TILE_MAX_IDS} IDs are returned."
+    )
+
+
+class SampleTiles(SubsetProcessStates):
+    """
+    Sample locations aggregated into slippy map tiles.
+    """
+    zoom: int | None = Field(default=None, example=4, description="The zoom level of the tiles.")
+    tiles: list[SampleTile] | None = None
+
+
 class Samples(BaseModel):
     """
     A list of samples with their attributes.
@@ -194,14 +238,14 @@ async def get_samples_meta(
     collection_id: str = PATH_VALIDATOR_COLLECTION_ID,
     load_ver_override: common_models.QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-) -> col_models.ColumnarAttributesMeta:
+) -> Response:
 
-    return await get_product_meta(r,
-                                  names.COLL_SAMPLES_META,
-                                  collection_id,
-                                  ID,
-                                  load_ver_override,
-                                  user)
+    return FastJSONResponse(await get_product_meta(r,
+                                                   names.COLL_SAMPLES_META,
+                                                   collection_id,
+                                                   ID,
+                                                   load_ver_override,
+                                                   user))
 
 
 # At some point we're going to want to filter/sort on fields. We may want a list of fields
@@ -228,6 +272,7 @@ async def get_samples(
     skip: common_models.QUERY_VALIDATOR_SKIP = 0,
     limit: common_models.QUERY_VALIDATOR_LIMIT = 1000,
     output_table: common_models.QUERY_VALIDATOR_OUTPUT_TABLE = True,
+    fields: common_models.QUERY_VALIDATOR_FIELDS = None,
     count: common_models.QUERY_VALIDATOR_COUNT = False,
     match_id: common_models.QUERY_VALIDATOR_MATCH_ID = None,
     # TODO FEATURE support a choice of AND or OR for matches & selections
@@ -237,7 +282,7 @@ async def get_samples(
     status_only: common_models.QUERY_VALIDATOR_STATUS_ONLY = False,
     load_ver_override: common_models.QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-) -> SamplesTable:
+) -> Response:
     # sorting only works here since we expect the largest collection to be ~300K records and
     # we have a max limit of 1000, which means sorting is O(n log2 1000).
     # Otherwise we need indexes for every sort
@@ -254,14 +299,15 @@ async def get_samples(
         multiple_ids=True,
     )
     if status_only:
-        return _response(dp_match=dp_match, dp_sel=dp_sel)
+        return FastJSONResponse(_response(dp_match=dp_match, dp_sel=dp_sel))
 
     cols = (await get_columnar_attribs_meta(
             appstate.arangostorage,
             names.COLL_SAMPLES_META,
             collection_id,
             load_ver,
-            load_ver_override)
+            load_ver_override,
+            single_flight=appstate.single_flight)
     ).columns
     filters = await get_filters(
         r,
@@ -272,13 +318,14 @@ async def get_samples(
         ID,
         cols,
         view_name=coll.get_data_product(ID).search_view if coll else None,
-        count=count,
+        count=bool(count),
         sort_on=sort_on,
         sort_desc=sort_desc,
         match_spec=SubsetSpecification(
             subset_process=dp_match, mark_only=match_mark, prefix=MATCH_ID_PREFIX),
         selection_spec=SubsetSpecification(
             subset_process=dp_sel, mark_only=selection_mark, prefix=SELECTION_ID_PREFIX),
+        keep=None if count else {f: None for f in split_fields(fields) or []},
         skip=skip,
         limit=limit,
     )
@@ -288,9 +335,13 @@ async def get_samples(
         [c for c in sorted(cols, key=lambda col: col.key) if c.key not in _KEYS_TO_REMOVE],
         filters,
         output_table=output_table,
-        document_mutator=_remove_keys
+        document_mutator=_remove_keys,
+        count_estimator=appstate.count_estimator,
+        approximate_count=count == common_models.COUNT_APPROXIMATE,
+        result_cache=appstate.result_cache,
+        single_flight=appstate.single_flight,
     )
-    return _response(dp_match=dp_match, dp_sel=dp_sel, res=res)
+    return FastJSONResponse(_response(dp_match=dp_match, dp_sel=dp_sel, res=res))
 
 
 def _response(
@@ -299,10 +350,12 @@ def _response(
     res: QueryTableResult = None,
 ) -> SamplesTable:
     if res:
-        return SamplesTable(
+        return SamplesTable.model_construct(
             skip=res.skip,
             limit=res.limit,
             count=res.count,
+            count_estimated=res.count_estimated,
+            count_error=res.count_error,
             match_state=dp_match.state if dp_match else None,
             selection_state=dp_sel.state if dp_sel else None,
             fields=res.fields,
@@ -310,7 +363,7 @@ def _response(
             data=res.data,
         )
     else:
-        return SamplesTable(
+        return SamplesTable.model_construct(
             skip=0,
             limit=0,
             match_state=dp_match.state if dp_match else None,
@@ -328,7 +381,9 @@ def _get_subset_id(subset_process: models.DataProductProcess, subset_prefix: str
     "/locations",
     response_model=SampleLocations,
     description="Get sample locations and the number of genomes at each location. "
-        + "Currently all sample locations are returned."
+        + "Currently all sample locations are returned. For large collections, prefer the "
+        + "`/tiles` endpoint, which returns locations aggregated into map tiles for a "
+        + "viewport."
         + "\n\n "
         + "Authentication is not required unless submitting a match ID or overriding the load "
         + "version; in the latter case service administration permissions are required.\n"
@@ -358,8 +413,7 @@ async def get_sample_locations(
     status_only: common_models.QUERY_VALIDATOR_STATUS_ONLY = False,
     load_ver_override: common_models.QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-) -> SampleLocations:
-    # might need to return a bare Response if the pydantic checking gets too expensive
+) -> Response:
     # might need some sort of pagination
     appstate = app_state.get_app_state(r)
     load_ver, dp_match, dp_sel, _ = await get_load_version_and_processes(
@@ -374,9 +428,9 @@ async def get_sample_locations(
         multiple_ids=True,
     )
     if status_only:
-        return _location_response(dp_match=dp_match, dp_sel=dp_sel)
-    return await _query_location(
-        appstate.arangostorage, collection_id, load_ver, dp_match, dp_sel, include_sample_ids)
+        return FastJSONResponse(_location_response(dp_match=dp_match, dp_sel=dp_sel))
+    return FastJSONResponse(await _query_location(
+        appstate.arangostorage, collection_id, load_ver, dp_match, dp_sel, include_sample_ids))
 
 
 def _location_response(
@@ -384,7 +438,7 @@ def _location_response(
     dp_sel: models.DataProductProcess = None,
     locs: list[SampleLocation] = None
 ) -> SampleLocations:
-    return SampleLocations(
+    return SampleLocations.model_construct(
         match_state=dp_match.state if dp_match else None,
         selection_state=dp_sel.state if dp_sel else None,
         locs=locs
@@ -398,7 +452,7 @@ async def _query_location(
     dp_match: models.DataProductProcess = None,
     dp_sel: models.DataProductProcess = None,
     include_sample_ids = False,
-) -> SampleLocation:
+) -> SampleLocations:
     internal_match_id = _get_subset_id(dp_match, MATCH_ID_PREFIX)
     internal_selection_id = _get_subset_id(dp_sel, SELECTION_ID_PREFIX)
     bind_vars = {
@@ -446,20 +500,217 @@ async def _query_location(
             }}
         """
     res = []
-    cur = await storage.execute_aql(aql, bind_vars=bind_vars)
+    cur = await storage.execute_aql(
+        aql, bind_vars=bind_vars, batch_size=_LOCATION_BATCH_SIZE, op="query_sample_locations")
     try:
         async for d in cur:
             if include_sample_ids:
-                res.append(SampleLocation(
+                res.append(SampleLocation.model_construct(
                     lat=d["lat"], lon=d["lon"], count=d["count"], ids=d["sampleids"]
                 ))
             else:
-                res.append(SampleLocation(lat=d["lat"], lon=d["lon"], count=d["count"]))
+                res.append(SampleLocation.model_construct(
+                    lat=d["lat"], lon=d["lon"], count=d["count"]))
     finally:
         await cur.close(ignore_missing=True)
     return _location_response(dp_match=dp_match, dp_sel=dp_sel, locs=res)
 
 
+@_ROUTER.get(
+    "/tiles",
+    response_model=SampleTiles,
+    description="Get sample locations aggregated into slippy map (web mercator XYZ) tiles "
+        + "for a zoom level and bounding box. Each tile contains the number of samples and "
+        + "genomes in the tile, the mean sample location, and representative sample IDs.\n\n"
+        + f"At most {_MAX_TILES} tiles may intersect the bounding box at the zoom level.\n\n"
+        + "Authentication is not required unless submitting a match ID or overriding the load "
+        + "version; in the latter case service administration permissions are required.\n"
+)
+async def get_sample_tiles(
+    r: Request,
+    collection_id: str = PATH_VALIDATOR_COLLECTION_ID,
+    zoom: Annotated[int, Query(
+        example=3,
+        ge=0,
+        le=sample_tiles.MAX_ZOOM,
+        description="The zoom level of the tiles. At zoom level z, the world is divided into "
+            + "2^z x 2^z tiles."
+    )] = 0,
+    bbox: Annotated[str, Query(
+        example="-125.0,24.0,-66.0,50.0",
+        description="The bounding box of the viewport in degrees as "
+            + "`west,south,east,north`. If west is greater than east, the bounding box crosses "
+            + "the antimeridian. Tiles intersecting the bounding box are returned. "
+            + "Defaults to the entire world."
+    )] = None,
+    match_id: Annotated[str, Query(
+        description="A match ID to set the view to the match rather than "
+            + "the entire collection. Authentication is required. If a match ID is "
+            # matches are against a specific load version, so...
+            + "set, any load version override is ignored. "
+            + "If a selection filter and a match filter are provided, they are ANDed together. "
+    )] = None,
+    # TODO FEATURE support a choice of AND or OR for matches & selections
+    selection_id: Annotated[str, Query(
+        description="A selection ID to set the view to the selection rather than the entire "
+            + "collection. If a selection ID is set, any load version override is ignored. "
+            + "If a selection filter and a match filter are provided, they are ANDed together. "
+    )] = None,
+    status_only: common_models.QUERY_VALIDATOR_STATUS_ONLY = False,
+    load_ver_override: common_models.QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
+    user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
+) -> Response:
+    try:
+        tiles = sample_tiles.tile_range(
+            sample_tiles.parse_bbox(bbox) if bbox else sample_tiles.WORLD, zoom)
+    except ValueError as e:
+        raise errors.IllegalParameterError(str(e)) from e
+    if tiles.tile_count() > _MAX_TILES:
+        raise errors.IllegalParameterError(
+            f"The bounding box intersects {tiles.tile_count()} tiles at zoom level {zoom}. "
+            + f"At most {_MAX_TILES} tiles are allowed")
+    appstate = app_state.get_app_state(r)
+    load_ver, dp_match, dp_sel, _ = await get_load_version_and_processes(
+        appstate,
+        user,
+        names.COLL_SAMPLES,
+        collection_id,
+        ID,
+        load_ver_override=load_ver_override,
+        match_id=match_id,
+        selection_id=selection_id,
+        multiple_ids=True,
+    )
+    if status_only:
+        return FastJSONResponse(_tiles_response(dp_match=dp_match, dp_sel=dp_sel))
+    return FastJSONResponse(_tiles_response(
+        dp_match=dp_match,
+        dp_sel=dp_sel,
+        zoom=zoom,
+        tiles=await _get_tiles(
+            appstate.arangostorage,
+            collection_id,
+            load_ver,
+            tiles,
+            internal_match_id=_get_subset_id(dp_match, MATCH_ID_PREFIX),
+            internal_selection_id=_get_subset_id(dp_sel, SELECTION_ID_PREFIX),
+        )
+    ))
+
+
+def _tiles_response(
+    dp_match: models.DataProductProcess = None,
+    dp_sel: models.DataProductProcess = None,
+    zoom: int = None,
+    tiles: list[dict[str, Any]] = None
+) -> SampleTiles:
+    return SampleTiles.model_construct(
+        match_state=dp_match.state if dp_match else None,
+        selection_state=dp_sel.state if dp_sel else None,
+        zoom=zoom,
+        tiles=construct_all(SampleTile, tiles) if tiles is not None else None,
+    )
+
+
+async def _get_tiles(
+    storage: ArangoStorage,
+    collection_id: str,
+    load_ver: str,
+    tiles: sample_tiles.TileRange,
+    internal_match_id: str = None,
+    internal_selection_id: str = None,
+) -> list[dict[str, Any]]:
+    if (tiles.zoom <= names.SAMPLE_TILES_PRECOMPUTED_MAX_ZOOM
+            and not internal_match_id and not internal_selection_id):
+        doc = await storage.get_doc_by_key(
+            names.COLL_SAMPLES_TILES,
+            sample_tiles_key(collection_id, load_ver, tiles.zoom),
+            op="get_sample_tiles",
+        )
+        if doc:
+            return [t for t in doc[names.FLD_SAMPLE_TILES]
+                    if tiles.contains(t[sample_tiles.FLD_TILE_X], t[sample_tiles.FLD_TILE_Y])]
+        # otherwise the data was loaded before tiles were precomputed
+    return await _query_tiles(
+        storage, collection_id, load_ver, tiles, internal_match_id, internal_selection_id)
+
+
+async def _query_tiles(
+    storage: ArangoStorage,
+    collection_id: str,
+    load_ver: str,
+    tiles: sample_tiles.TileRange,
+    internal_match_id: str = None,
+    internal_selection_id: str = None,
+) -> list[dict[str, Any]]:
+    # restrict the query to the bounds of the tile range so the location index can be used,
+    # and then filter on the tile coordinates to get exactly the tiles in the range
+    north = sample_tiles.tile_bounds(tiles.zoom, tiles.x_min, tiles.y_min).north
+    south = sample_tiles.tile_bounds(tiles.zoom, tiles.x_max, tiles.y_max).south
+    bind_vars = {
+        f"@coll": names.COLL_SAMPLES,
+        "coll_id": collection_id,
+        "load_ver": load_ver,
+        "tiles_per_side": 1 << tiles.zoom,
+        "west": sample_tiles.tile_bounds(tiles.zoom, tiles.x_min, tiles.y_min).west,
+        "east": sample_tiles.tile_bounds(tiles.zoom, tiles.x_max, tiles.y_max).east,
+        # tiles at the edges include the latitudes beyond the web mercator limits
+        "south": -90 if tiles.y_max == (1 << tiles.zoom) - 1 else south,
+        "north": 90 if tiles.y_min == 0 else north,
+        "x_min": tiles.x_min,
+        "x_max": tiles.x_max,
+        "y_min": tiles.y_min,
+        "y_max": tiles.y_max,
+        "max_ids": names.SAMPLE_TILE_MAX_IDS,
+    }
+    lon_op = "OR" if tiles.wraps else "AND"
+    aql = f"""
+    FOR d IN @@coll
+        FILTER d.{names.FLD_COLLECTION_ID} == @coll_id
+        FILTER d.{names.FLD_LOAD_VERSION} == @load_ver
+        FILTER d.{names.FLD_SAMPLE_LONGITUDE} >= @west {lon_op} d.{names.FLD_SAMPLE_LONGITUDE} <= @east
+        FILTER d.{names.FLD_SAMPLE_LATITUDE} >= @south AND d.{names.FLD_SAMPLE_LATITUDE} <= @north
+    """
+    if internal_match_id:
+        bind_vars["internal_match_id"] = internal_match_id
+        aql += f"""
+            FILTER @internal_match_id IN d.{names.FLD_MATCHES_SELECTIONS}
+        """
+    # this will AND the match and selection.
+    if internal_selection_id:
+        bind_vars["internal_selection_id"] = internal_selection_id
+        aql += f"""
+            FILTER @internal_selection_id IN d.{names.FLD_MATCHES_SELECTIONS}
+        """
+    aql += sample_tiles.aql_tile_coordinates("d")
+    aql += f"""
+        FILTER y >= @y_min AND y <= @y_max
+        FILTER x >= @x_min {lon_op} x <= @x_max
+        COLLECT tx = x, ty = y
+            AGGREGATE lat = AVG(d.{names.FLD_SAMPLE_LATITUDE}),
+                      lon = AVG(d.{names.FLD_SAMPLE_LONGITUDE}),
+                      count = SUM(d.{names.FLD_KB_GENOME_COUNT}),
+                      sample_count = LENGTH(1),
+                      ids = UNIQUE(d.{names.FLD_KB_SAMPLE_ID})
+        SORT ty, tx
+        RETURN {{
+            "{sample_tiles.FLD_TILE_X}": tx,
+            "{sample_tiles.FLD_TILE_Y}": ty,
+            "{sample_tiles.FLD_TILE_LAT}": lat,
+            "{sample_tiles.FLD_TILE_LON}": lon,
+            "{sample_tiles.FLD_TILE_COUNT}": count,
+            "{sample_tiles.FLD_TILE_SAMPLE_COUNT}": sample_count,
+            "{sample_tiles.FLD_TILE_IDS}": SLICE(SORTED(ids), 0, @max_ids)
+        }}
+    """
+    cur = await storage.execute_aql(
+        aql, bind_vars=bind_vars, batch_size=_LOCATION_BATCH_SIZE, op="query_sample_tiles")
+    try:
+        return [d async for d in cur]
+    finally:
+        await cur.close(ignore_missing=True)
+
+
 @_ROUTER.get(
     "/byid",
     response_model=Samples,
@@ -478,12 +729,12 @@ async def get_samples_by_id(
     )],
     load_ver_override: common_models.QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH),
-):
+) -> Response:
     storage = app_state.get_app_state(r).arangostorage
     _, load_ver = await get_load_version(
         storage, collection_id, ID, load_ver_override, user)
     if not sample_ids or not sample_ids.strip():
-        return Samples(samples=[])
+        return FastJSONResponse(Samples.model_construct(samples=[]))
     sample_ids = {s.strip() for s in sample_ids.split(",")}
     if len(sample_ids) > _MAX_SAMPLE_IDS:
         raise errors.IllegalParameterError(
@@ -503,7 +754,7 @@ async def get_samples_by_id(
     """
     res = []
     found_ids = set()
-    cur = await storage.execute_aql(aql, bind_vars=bind_vars)
+    cur = await storage.execute_aql(aql, bind_vars=bind_vars, op="get_samples_by_id")
     try:
         async for d in cur:
             d = _remove_keys(d)
@@ -519,7 +770,7 @@ async def get_samples_by_id(
         else:
             err += f"; showing 10: {list(sorted(missing_ids))[:10]}"
         raise errors.NoDataFoundError(err)
-    return Samples(samples=res)
+    return FastJSONResponse(Samples.model_construct(samples=res))
 
 
 @_ROUTER.get(
@@ -535,8 +786,8 @@ async def get_missing_ids(
     match_id: Annotated[str, Query(description="A match ID.")] = None,
     selection_id: Annotated[str, Query(description="A selection ID.")] = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH),
-) -> common_models.DataProductMissingIDs:
-    return await _get_missing_ids(
+) -> Response:
+    return FastJSONResponse(await _get_missing_ids(
         app_state.get_app_state(r),
         names.COLL_SAMPLES,
         collection_id,
@@ -545,4 +796,4 @@ async def get_missing_ids(
         selection_id=selection_id,
         user=user,
         multiple_ids=True,
-    )
\ No newline at end of file
+    ))
\ No newline at end of file
@@ -43,3 +43,13 @@ class TableAttributes(BaseModel):
         example=42,
         description="The number of attribute records that match the query.",
     )] = None
+    count_estimated: Annotated[bool | None, Field(
+        example=False,
+        description="Whether the count is an estimate. Only estimated counts may be returned "
+            + "when an approximate count is requested. Null if count is null.",
+    )] = None
+    count_error: Annotated[int | None, Field(
+        example=0,
+        description="The half width of the 95% confidence interval of the count, or 0 if the "
+            + "count is exact. Null if count is null.",
+    )] = None
@@ -3,10 +3,15 @@ The taxa_count data product, which provides taxa counts for a collection at each
 """
 
 from fastapi import APIRouter, Request, Depends, Path, Query
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 from src.common.gtdb_lineage import GTDBTaxaCount
 from src.common.product_models.common_models import SubsetProcessStates
-from src.common.storage.db_doc_conversions import taxa_node_count_to_doc
+from src.common.storage.db_doc_conversions import (
+    taxa_count_top_key,
+    taxa_count_top_to_doc,
+    taxa_node_count_to_doc,
+)
 import src.common.storage.collection_and_field_names as names
 from src.service import app_state
 from src.service.app_state_data_structures import PickleableDependencies
@@ -28,6 +33,7 @@ from src.service.data_products.common_models import (
 )
 from src.service.data_products import genome_attributes
 from src.service.http_bearer import KBaseHTTPBearer
+from src.service.responses import FastJSONResponse, construct_all
 from src.service.routes_common import PATH_VALIDATOR_COLLECTION_ID
 from src.service.storage_arango import ArangoStorage, remove_arango_keys
 from typing import Any, Annotated
@@ -42,7 +48,7 @@ _TYPE2PREFIX = {
     models.SubsetType.SELECTION: "s_",
 }
 
-_MAX_COUNT = 20  # max number of taxa count records to return
+_MAX_COUNT = 20  # default max number of taxa count records to return
 
 # TaxaCount fields. These need to match the field names in the TaxaCount class below
 _FLD_TAXA_COUNT_MATCH_COUNT = "match_count"
@@ -100,7 +106,13 @@ TAXA_COUNT_SPEC = TaxaCountSpec(
                 ],
                 [names.FLD_INTERNAL_ID]  # for deleting match / selection data
             ]
-        )
+        ),
+        DBCollection(
+            name=names.COLL_TAXA_COUNT_TOP,
+            indexes=[
+                [names.FLD_INTERNAL_ID]  # for deleting match / selection data
+            ]
+        ),
     ]
 )
 
@@ -179,10 +191,11 @@ async def get_ranks(
     collection_id: str = PATH_VALIDATOR_COLLECTION_ID,
     load_ver_override: QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-):
+) -> Response:
     store = app_state.get_app_state(r).arangostorage
     _, load_ver = await get_load_version(store, collection_id, ID, load_ver_override, user)
-    return await get_ranks_from_db(store, collection_id, load_ver, bool(load_ver_override))
+    return FastJSONResponse(
+        await get_ranks_from_db(store, collection_id, load_ver, bool(load_ver_override)))
 
 
 async def get_ranks_from_db(
@@ -190,16 +203,17 @@ async def get_ranks_from_db(
     collection_id: str,
     load_ver: str,
     load_ver_overridden: bool,
-):
+) -> Ranks:
     doc = await get_collection_singleton_from_db(
         store, names.COLL_TAXA_COUNT_RANKS, collection_id, load_ver, load_ver_overridden)
-    return Ranks(data=doc[names.FLD_TAXA_COUNT_RANKS])
+    return Ranks.model_construct(data=doc[names.FLD_TAXA_COUNT_RANKS])
 
 
 @_ROUTER.get(
     "/counts/{rank}/",
     response_model=TaxaCounts,
-    description="Get the taxonomy counts in descending order. At most 20 taxa are returned.\n\n "
+    description="Get the taxonomy counts in descending order. At most 20 taxa are returned "
+        + "by default.\n\n "
         + "Authentication is not required unless providing a match ID or overriding the load "
         + "version; in the latter case service administration permissions are required.")
 async def get_taxa_counts(
@@ -226,10 +240,17 @@ async def get_taxa_counts(
         description=f"A comma separated list of sort priorities. Valid values are: "
                     f"{', '.join(_SORT_PRIORITY_ORDER_MAP.keys())}. ",
     ),
+    limit: int = Query(
+        default=_MAX_COUNT,
+        ge=1,
+        le=names.TAXA_COUNT_TOP_K,
+        example=_MAX_COUNT,
+        description="The maximum number of taxa to return."
+    ),
     status_only: QUERY_VALIDATOR_STATUS_ONLY = False,
     load_ver_override: QUERY_VALIDATOR_LOAD_VERSION_OVERRIDE = None,
     user: kb_auth.KBaseUser = Depends(_OPT_AUTH)
-):
+) -> Response:
     appstate = app_state.get_app_state(r)
     store = appstate.arangostorage
     dp_match, dp_sel = None, None
@@ -245,19 +266,45 @@ async def get_taxa_counts(
             appstate, coll, selection_id, ID, _process_taxa_count_subset
         )
     if status_only:
-        return _taxa_counts(dp_match=dp_match, dp_sel=dp_sel)
+        return FastJSONResponse(_taxa_counts(dp_match=dp_match, dp_sel=dp_sel))
     ranks = await get_ranks_from_db(store, collection_id, load_ver, bool(load_ver_override))
     if rank not in ranks.data:
         raise errors.IllegalParameterError(f"Invalid rank: {rank}")
-    count_records = await _query(store, collection_id, load_ver, rank)
-    retrieved_new = False
-    for dp_proc in [dp_match, dp_sel]:
-        retrieved_new = await _add_subset_data_in_place(
-            count_records, store, collection_id, load_ver, rank, dp_proc) or retrieved_new
+    args = (store, collection_id, load_ver, rank, limit, sort_priority, dp_match, dp_sel)
+    if appstate.single_flight:
+        key = ("taxa_count", collection_id, load_ver, rank, limit, sort_priority,
+               _process_key(dp_match), _process_key(dp_sel))
+        count_records = await appstate.single_flight.run(key, lambda: _get_count_records(*args))
+    else:
+        count_records = await _get_count_records(*args)
+    return FastJSONResponse(_taxa_counts(dp_match=dp_match, dp_sel=dp_sel, data=count_records))
 
-    _sort_taxa_counts(count_records, sort_priority, [dp_match, dp_sel], sort_by_count_already=not retrieved_new)
 
-    return _taxa_counts(dp_match=dp_match, dp_sel=dp_sel, data=count_records)
+def _process_key(dp_proc: models.DataProductProcess | None) -> tuple[str, str] | None:
+    return (dp_proc.internal_id, dp_proc.state) if dp_proc else None
+
+
+async def _get_count_records(
+    store: ArangoStorage,
+    collection_id: str,
+    load_ver: str,
+    rank: str,
+    limit: int,
+    sort_priority: str | None,
+    dp_match: models.DataProductProcess | None,
+    dp_sel: models.DataProductProcess | None,
+) -> list[dict[str, Any]]:
+    # fetch the precomputed top counts for the collection and any subsets in one request
+    top_docs = await _get_top_count_docs(
+        store, collection_id, load_ver, rank, [dp_match, dp_sel])
+    count_records = await _get_top_counts(
+        store, collection_id, load_ver, rank, limit, top_docs=top_docs)
+    for dp_proc in [dp_match, dp_sel]:
+        await _add_subset_data_in_place(
+            count_records, store, collection_id, load_ver, rank, dp_proc, limit, top_docs)
+
+    _sort_taxa_counts(count_records, sort_priority, [dp_match, dp_sel], limit)
+    return count_records
 
 
 def _fill_missing_orders(sort_order: list[str], processed_count: list[str]):
@@ -276,8 +323,8 @@ def _sort_taxa_counts(
         count_records: list[dict[str, Any]],
         sort_priority: str,
         dp_list: list[models.DataProductProcess],
-        sort_by_count_already: bool = True):
-    # Sort taxa count records in place by the sort_priority list.
+        limit: int = _MAX_COUNT):
+    # Sort taxa count records in place by the sort_priority list and truncate to the limit.
 
     processed_count = [_TYPE2FIELD[dp.type] for dp in dp_list if dp and dp.is_complete()]
 
@@ -303,16 +350,13 @@ def _sort_taxa_counts(
     # fill in missing orders with the default precedence order
     sort_order = _fill_missing_orders(sort_order_rev[::-1], processed_count)
 
-    if sort_by_count_already:
-        # remove unnecessary sort order if records are already sorted by count
-        sort_order.pop(0) if sort_order[0] == names.FLD_TAXA_COUNT_COUNT else None
-
-    for k in sort_order:
-        count_records.sort(key=lambda x: x[k], reverse=True)
-
-    if not sort_by_count_already:
-        # indicating that we have added more taxa count records in _add_subset_data_in_place step.
-        count_records[:] = count_records[:_MAX_COUNT]
+    # sort_order is least significant first. Sort once on all the counts, descending, with ties
+    # broken by name to match the order of the precomputed top counts
+    sort_order = sort_order[::-1]
+    count_records.sort(key=lambda x: tuple(-x[k] for k in sort_order)
+                                     + (x[names.FLD_TAXA_COUNT_NAME],))
+    # more records than the limit may have been added in the _add_subset_data_in_place step.
+    count_records[:] = count_records[:limit]
 
     # fill in 0 for any record with null counts
     # We append missed records associated with the matching/selection process in the previous step. But do not fill
@@ -327,10 +371,11 @@ def _taxa_counts(
     dp_sel: models.DataProductProcess = None,
     data: list[dict[str, Any]] = None,
 ) -> TaxaCounts:
-    return TaxaCounts(
+    # the data is from the DB and so is trusted, skip validation
+    return TaxaCounts.model_construct(
         match_state=dp_match.state if dp_match else None,
         selection_state=dp_sel.state if dp_sel else None,
-        data=data,
+        data=construct_all(TaxaCount, data) if data is not None else None,
     )
 
 
@@ -341,16 +386,19 @@ async def _add_subset_data_in_place(
     load_ver: str,
     rank: str,
     dp_process: models.DataProductProcess,
+    limit: int = _MAX_COUNT,
+    top_docs: dict[str, dict[str, Any]] | None = None,
 ):
-    found_new = False
     if dp_process and dp_process.is_complete():
-        matchq = await _query(
+        matchq = await _get_top_counts(
             store,
             collection_id,
             load_ver,
             rank,
+            limit,
             internal_id=dp_process.internal_id,
             type_=dp_process.type,
+            top_docs=top_docs,
         )
         name, count = names.FLD_TAXA_COUNT_NAME, names.FLD_TAXA_COUNT_COUNT
         mqd = {d[name]: d[count] for d in matchq}
@@ -364,13 +412,10 @@ async def _add_subset_data_in_place(
                                               rank,
                                               name_list=list(missing_names),
                                               limit=len(missing_names)))
-            found_new = True
 
         for d in count_records:
             d[_TYPE2FIELD[dp_process.type]] = mqd.get(d[name], 0)
 
-    return found_new
-
 
 def _check_genome_attribs(coll: models.ActiveCollection, match: bool, selection: bool):
     # I'm kind of uncomfortable hard coding this dependency... but it's real so... I dunno.
@@ -387,6 +432,68 @@ def _check_genome_attribs(coll: models.ActiveCollection, match: bool, selection:
                 + f"{genome_attributes.ID} data product")
 
 
+def _top_key(
+    collection_id: str,
+    load_ver: str,
+    rank: str,
+    internal_id: str | None,
+    type_: models.SubsetType | None,
+) -> str:
+    return taxa_count_top_key(
+        collection_id, load_ver, rank, _TYPE2PREFIX[type_] + internal_id if internal_id else None)
+
+
+async def _get_top_count_docs(
+    store: ArangoStorage,
+    collection_id: str,
+    load_ver: str,
+    rank: str,
+    dp_processes: list[models.DataProductProcess | None],
+) -> dict[str, dict[str, Any]]:
+    # Get the precomputed top counts documents for a rank and any complete subsets by key
+    keys = [_top_key(collection_id, load_ver, rank, None, None)] + [
+        _top_key(collection_id, load_ver, rank, dp.internal_id, dp.type)
+        for dp in dp_processes if dp and dp.is_complete()
+    ]
+    return await store.get_docs_by_key(names.COLL_TAXA_COUNT_TOP, keys, op="get_top_taxa_counts")
+
+
+async def _get_top_counts(
+    store: ArangoStorage,
+    collection_id: str,
+    load_ver: str,
+    rank: str,
+    limit: int,
+    internal_id: str | None = None,
+    type_: models.SubsetType | None = None,
+    top_docs: dict[str, dict[str, Any]] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Get the highest taxa counts for a rank from the precomputed top counts document. If the
+    document doesn't exist, e.g. for data loaded prior to the addition of top counts documents,
+    the taxa counts are queried directly.
+
+    store - the storage system
+    collection_id - the ID of the Collection for which to retrieve the taxa counts information
+    load_ver - the load version of the collection.
+    rank - the rank at which to retrieve the taxa counts
+    limit - the maximum number of records to return.
+    internal_id - the internal ID of a related match or selection, if any
+    type_ - the type of the subset data, match or selection
+    top_docs - top counts documents already fetched from the database by key. If provided, the
+        document is looked up here rather than fetched.
+    """
+    key = _top_key(collection_id, load_ver, rank, internal_id, type_)
+    if top_docs is not None:
+        doc = top_docs.get(key)
+    else:
+        doc = await store.get_doc_by_key(names.COLL_TAXA_COUNT_TOP, key, op="get_top_taxa_counts")
+    if doc:
+        return doc[names.FLD_TAXA_COUNT_TOP][:limit]
+    return await _query(
+        store, collection_id, load_ver, rank, internal_id=internal_id, type_=type_, limit=limit)
+
+
 async def _query(
     store: ArangoStorage,
     collection_id: str,
@@ -433,14 +540,14 @@ async def _query(
             FILTER d.{names.FLD_INTERNAL_ID} == @internal_id
             FILTER d.{names.FLD_TAXA_COUNT_RANK} == @{_FLD_COL_RANK}
             {aql_name_list}
-            SORT d.{names.FLD_TAXA_COUNT_COUNT} DESC
+            SORT d.{names.FLD_TAXA_COUNT_COUNT} DESC, d.{names.FLD_TAXA_COUNT_NAME} ASC
             LIMIT {limit}
             RETURN d
     """
 
     # could get the doc count, but that'll be slower since all docs have to be counted vs. just
     # getting LIMIT docs. YAGNI for now
-    cur = await store.execute_aql(aql, bind_vars=bind_vars)
+    cur = await store.execute_aql(aql, bind_vars=bind_vars, op="query_taxa_counts")
     ret = []
     try:
         async for d in cur:
@@ -472,10 +579,11 @@ async def _process_taxa_count_subset(
         lambda doc: count.add(doc[names.FLD_GENOME_ATTRIBS_GTDB_LINEAGE]),
         fields=[names.FLD_GENOME_ATTRIBS_GTDB_LINEAGE]
     )
-    docs = [
-        taxa_node_count_to_doc(
-            coll.id, load_ver, tc, _TYPE2PREFIX[dpid.type] + dpid.internal_id
-        ) for tc in count
+    internal_id = _TYPE2PREFIX[dpid.type] + dpid.internal_id
+    docs = [taxa_node_count_to_doc(coll.id, load_ver, tc, internal_id) for tc in count]
+    top_docs = [
+        taxa_count_top_to_doc(coll.id, load_ver, rank.value, top, internal_id)
+        for rank, top in count.top_k(names.TAXA_COUNT_TOP_K).items()
     ]
     # May need to batch this?
     # The other option I considered here was adding the match counts to the records directly.
@@ -486,6 +594,7 @@ async def _process_taxa_count_subset(
     # Ignore collisions so that if two match processes get kicked off at once the result
     # is the same and neither fails.
     await storage.import_bulk_ignore_collisions(names.COLL_TAXA_COUNT, docs)
+    await storage.import_bulk_ignore_collisions(names.COLL_TAXA_COUNT_TOP, top_docs)
     await storage.update_data_product_process_state(
         dpid, models.ProcessState.COMPLETE, deps.get_epoch_ms())
 
@@ -511,15 +620,16 @@ async def delete_selection(storage: ArangoStorage, internal_selection_id: str):
 
 
 async def _delete_subset(storage: ArangoStorage, internal_id: str, type_: models.SubsetType):
-    bind_vars = {
-        f"@{_FLD_COL_NAME}": names.COLL_TAXA_COUNT,
-        "internal_id": _TYPE2PREFIX[type_] + internal_id,
-    }
-    aql = f"""
-        FOR d IN @@{_FLD_COL_NAME}
-            FILTER d.{names.FLD_INTERNAL_ID} == @internal_id
-            REMOVE d IN @@{_FLD_COL_NAME}
-            OPTIONS {{exclusive: true}}
-    """
-    cur = await storage.execute_aql(aql, bind_vars=bind_vars)
-    await cur.close(ignore_missing=True)
+    for arango_coll in [names.COLL_TAXA_COUNT, names.COLL_TAXA_COUNT_TOP]:
+        bind_vars = {
+            f"@{_FLD_COL_NAME}": arango_coll,
+            "internal_id": _TYPE2PREFIX[type_] + internal_id,
+        }
+        aql = f"""
+            FOR d IN @@{_FLD_COL_NAME}
+                FILTER d.{names.FLD_INTERNAL_ID} == @internal_id
+                REMOVE d IN @@{_FLD_COL_NAME}
+                OPTIONS {{exclusive: true}}
+        """
+        cur = await storage.execute_aql(aql, bind_vars=bind_vars, op="delete_taxa_counts")
+        await cur.close(ignore_missing=True)
@@ -0,0 +1,264 @@
+"""
+Conditional GET support for data product responses.
+
+A data product response is determined by the load version of the data, the request path and
+query, and the state of any match or selection applied to the data. While a request is
+processed, the data product code records the load version and subsets it uses via
+`record_load_version` and `record_subset`. The middleware derives a strong ETag from those
+values, without reading the response body, and answers requests with a matching
+If-None-Match header with 304 Not Modified.
+
+ETags for responses that don't depend on a subset or a load version override, and therefore
+don't require an authorization check, are also kept in an in memory registry. Repeated
+conditional requests for those responses are answered without calling the route at all, and
+so without touching the database. Registry entries are removed when a collection version is
+activated in this process and otherwise expire after a short time, which bounds how long
+other worker processes may answer with 304 after an activation.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Callable, NamedTuple
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from src.service import metrics
+
+
+_CACHE_CONTROL_PROCESSING = "no-store"
+_CACHE_CONTROL_PUBLIC = "no-cache"
+_CACHE_CONTROL_PRIVATE = "private, no-cache"
+
+# headers to include in a 304 response, see RFC 9110 section 15.4.5
+_NOT_MODIFIED_HEADERS = ("etag", "cache-control", "vary")
+
+
+class _RequestState:
+
+    def __init__(self):
+        self.collection_id = None
+        self.load_ver = None
+        self.load_ver_override = False
+        self.subsets: list[tuple[str, str, bool]] = []
+
+    def cache_control(self) -> str:
+        if any(not complete for _, _, complete in self.subsets):
+            return _CACHE_CONTROL_PROCESSING
+        if self.load_ver_override or any(t == "match" for t, _, _ in self.subsets):
+            # matches and overrides require authorization
+            return _CACHE_CONTROL_PRIVATE
+        return _CACHE_CONTROL_PUBLIC
+
+    def registrable(self) -> bool:
+        return not self.load_ver_override and not self.subsets
+
+
+_STATE: ContextVar[_RequestState | None] = ContextVar("etag_request_state", default=None)
+
+
+def record_load_version(collection_id: str, load_ver: str, override: bool = False):
+    """
+    Record the load version of the data used to create the response to the current request.
+    A no-op outside of a request handled by the `ETagMiddleware`.
+
+    collection_id - the ID of the collection containing the data.
+    load_ver - the load version of the data.
+    override - whether the load version was provided by the user as an override.
+    """
+    state = _STATE.get()
+    if state:
+        state.collection_id = collection_id
+        state.load_ver = load_ver
+        state.load_ver_override = override
+
+
+def record_subset(subset_type: str, internal_id: str, complete: bool):
+    """
+    Record a match or selection applied to the data used to create the response to the current
+    request. A no-op outside of a request handled by the `ETagMiddleware`.
+
+    subset_type - the type of the subset, e.g. match or selection.
+    internal_id - the internal ID of the subset.
+    complete - whether the subset has been completely applied to the data.
+    """
+    state = _STATE.get()
+    if state:
+        state.subsets.append((subset_type, internal_id, complete))
+
+
+class _Entry(NamedTuple):
+    collection_id: str
+    etag: str
+    expires: float
+
+
+class ETagRegistry:
+    """
+    A least recently used registry of the current ETags of responses that do not require
+    authorization, keyed by the request.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl_sec: float = 30,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Create the registry.
+
+        max_entries - the maximum number of ETags to keep.
+        ttl_sec - the time an ETag is kept, in seconds.
+        timer - a function returning the current time in seconds.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be > 0")
+        if ttl_sec <= 0:
+            raise ValueError("ttl_sec must be > 0")
+        self._max_entries = max_entries
+        self._ttl_sec = ttl_sec
+        self._timer = timer
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+
+    def get(self, key: tuple) -> str | None:
+        """
+        Get the ETag for a request, or None if the ETag is unknown or expired.
+
+        key - the key for the request.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= self._timer():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry.etag
+
+    def put(self, key: tuple, collection_id: str, etag: str):
+        """
+        Register the ETag for a request.
+
+        key - the key for the request.
+        collection_id - the ID of the collection containing the data in the response.
+        etag - the ETag.
+        """
+        self._entries.pop(key, None)
+        self._entries[key] = _Entry(collection_id, etag, self._timer() + self._ttl_sec)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, collection_id: str):
+        """
+        Remove all ETags for a collection.
+
+        collection_id - the ID of the collection.
+        """
+        for key in [k for k, e in self._entries.items() if e.collection_id == collection_id]:
+            del self._entries[key]
+
+    @property
+    def size(self) -> int:
+        """ The number of registered ETags, including any that have expired. """
+        return len(self._entries)
+
+
+def _request_key(scope, headers: Headers) -> tuple[str, str, str]:
+    # sort by parameter name only, since the order of repeated parameters may be significant
+    query = sorted(parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True),
+                   key=lambda p: p[0])
+    # the response body differs by content encoding, so the ETag must as well
+    return scope["path"], urlencode(query), headers.get("accept-encoding", "")
+
+
+def _parse_if_none_match(header: str | None) -> set[str]:
+    if not header:
+        return set()
+    # If-None-Match uses the weak comparison function
+    return {t.strip().removeprefix("W/") for t in header.split(",") if t.strip()}
+
+
+def _matches(etag: str, if_none_match: set[str]) -> bool:
+    return etag in if_none_match or "*" in if_none_match
+
+
+class ETagMiddleware:
+    """
+    ASGI middleware that adds ETag and Cache-Control headers to data product responses and
+    answers conditional GET requests with 304 Not Modified.
+    """
+
+    def __init__(self, app, registry: ETagRegistry = None, version: str = ""):
+        """
+        Create the middleware.
+
+        app - the ASGI app to wrap.
+        registry - the registry for ETags of responses that don't require authorization. If not
+            provided, the route is always called.
+        version - the version of the service, included in the ETags so that responses from
+            a new version of the service don't match cached responses from the prior version.
+        """
+        self._app = app
+        self._registry = registry
+        self._version = version
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self._app(scope, receive, send)
+        headers = Headers(scope=scope)
+        key = _request_key(scope, headers)
+        if_none_match = _parse_if_none_match(headers.get("if-none-match"))
+        if if_none_match and self._registry:
+            etag = self._registry.get(key)
+            if etag and _matches(etag, if_none_match):
+                metrics.NOT_MODIFIED_RESPONSES.labels("registry").inc()
+                await _send_not_modified(send, [
+                    (b"etag", etag.encode("latin-1")),
+                    (b"cache-control", _CACHE_CONTROL_PUBLIC.encode("latin-1")),
+                ])
+                return
+        state = _RequestState()
+        token = _STATE.set(state)
+        not_modified = False
+
+        async def send_wrapper(message):
+            nonlocal not_modified
+            if not_modified:
+                # the response has already been sent, drop the body
+                return
+            if message["type"] == "http.response.start" and message["status"] == 200 \
+                    and state.load_ver:
+                resp_headers = MutableHeaders(raw=message["headers"])
+                resp_headers["Cache-Control"] = state.cache_control()
+                if resp_headers["Cache-Control"] != _CACHE_CONTROL_PROCESSING:
+                    etag = self._etag(state, key)
+                    resp_headers["ETag"] = etag
+                    if self._registry and state.registrable():
+                        self._registry.put(key, state.collection_id, etag)
+                    if _matches(etag, if_none_match):
+                        not_modified = True
+                        metrics.NOT_MODIFIED_RESPONSES.labels("route").inc()
+                        await _send_not_modified(send, [
+                            (k, v) for k, v in resp_headers.raw
+                            if k.decode("latin-1").lower() in _NOT_MODIFIED_HEADERS
+                        ])
+                        return
+            await send(message)
+
+        try:
+            await self._app(scope, receive, send_wrapper)
+        finally:
+            _STATE.reset(token)
+
+    def _etag(self, state: _RequestState, key: tuple[str, str, str]) -> str:
+        parts = (self._version, state.collection_id, state.load_ver, state.load_ver_override,
+                 tuple(sorted(state.subsets)), key)
+        return f'"{hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()}"'
+
+
+async def _send_not_modified(send, headers: list[tuple[bytes, bytes]]):
+    await send({"type": "http.response.start", "status": 304, "headers": headers})
+    await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,351 @@
+"""
+Estimation of the number of documents matching a filter set, for `count=approx` requests.
+
+An exact count of a filtered query requires ArangoDB to visit every matching document, which
+for broad filters on an ArangoSearch view can cost as much as returning a page of data.
+An estimate is provided, in order of preference, from:
+
+* a cached exact count for the same filters and load version. Load versions are immutable, so
+  a count never goes stale.
+* an exact count if the filter set has no column filters, as the count can be answered from
+  the collection / load version index.
+* a uniform random sample of the documents in the load version, which is drawn once per
+  load version and kept in memory. The filters are evaluated against the sample in process and
+  the count is extrapolated to the size of the load version with a 95% confidence bound.
+
+Filter evaluation against the sample approximates the ArangoSearch analyzers for the full text,
+prefix, and ngram string filter strategies, and so is not exact even for a complete sample.
+"""
+
+import asyncio
+import math
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
+from src.common.product_models.columnar_attribs_common_models import ColumnType, FilterStrategy
+import src.common.storage.collection_and_field_names as names
+from src.service.filtering.filters import (
+    AbstractFilter,
+    BooleanFilter,
+    FilterSet,
+    RangeFilter,
+    StringFilter,
+)
+from src.service.storage_arango import ArangoStorage
+
+
+# z score for a 95% confidence interval
+_Z = 1.959964
+
+_TOKEN_RE = re.compile(r"\w+")
+_NGRAM_LEN = 3
+
+
+class CountEstimate(NamedTuple):
+    """ A count of documents, which may be estimated. """
+
+    count: int
+    """ The count. """
+
+    error: int
+    """
+    The half width of the 95% confidence interval of the count. 0 for exact counts.
+    """
+
+    estimated: bool
+    """ Whether the count is an estimate. """
+
+
+def filter_signature(filters: FilterSet) -> tuple:
+    """
+    Get a canonical signature for the set of documents a filter set selects, ignoring sorting,
+    paging, and the order in which filters were added. Two filter sets with the same signature
+    select the same documents.
+
+    filters - the filter set.
+    """
+    return (
+        filters.collection_id,
+        filters.load_ver,
+        filters.view if len(filters) else filters.collection,
+        filters.conjunction if len(filters) > 1 else None,
+        filters.match_spec.get_subset_filtering_id(),
+        filters.selection_spec.get_subset_filtering_id(),
+        tuple(sorted(filters.keep)) if filters.keep_filter_nulls else None,
+        tuple(sorted((f, repr(flt)) for f, flt in filters.filters.items())),
+    )
+
+
+def _fold(s: str) -> str:
+    # lower case and remove accents as the service's analyzers do
+    return "".join(c for c in unicodedata.normalize("NFKD", s.lower())
+                   if not unicodedata.combining(c))
+
+
+def _tokens(s: str) -> list[str]:
+    return _TOKEN_RE.findall(_fold(s))
+
+
+def _ngrams(s: str) -> set[str]:
+    s = _fold(s)
+    return {s[i:i + _NGRAM_LEN] for i in range(len(s) - _NGRAM_LEN + 1)}
+
+
+def _string_match(filter_: StringFilter, val: Any) -> bool:
+    if not isinstance(val, str):
+        return False
+    match filter_.strategy:
+        case FilterStrategy.IDENTITY:
+            return val == filter_.string
+        case FilterStrategy.FULL_TEXT:
+            return set(_tokens(filter_.string)) <= set(_tokens(val))
+        case FilterStrategy.PREFIX:
+            toks = _tokens(val)
+            return all(any(t.startswith(p) for t in toks) for p in _tokens(filter_.string))
+        case FilterStrategy.NGRAM:
+            return _ngrams(filter_.string) <= _ngrams(val)
+    return False
+
+
+def _range_match(filter_: RangeFilter, val: Any) -> bool:
+    if filter_.type == ColumnType.DATE:
+        if not isinstance(val, str):
+            return False
+    elif isinstance(val, bool) or not isinstance(val, (int, float)):
+        return False
+    if filter_.low is not None:
+        if val < filter_.low or (val == filter_.low and not filter_.low_inclusive):
+            return False
+    if filter_.high is not None:
+        if val > filter_.high or (val == filter_.high and not filter_.high_inclusive):
+            return False
+    return True
+
+
+def _filter_match(filter_: AbstractFilter, val: Any) -> bool:
+    if isinstance(filter_, RangeFilter):
+        return _range_match(filter_, val)
+    if isinstance(filter_, BooleanFilter):
+        return val is filter_.bool_value
+    if isinstance(filter_, StringFilter):
+        return _string_match(filter_, val)
+    raise ValueError(f"Unsupported filter type: {type(filter_).__name__}")
+
+
+def _approximated(filters: FilterSet) -> bool:
+    return any(isinstance(flt, StringFilter) and flt.strategy != FilterStrategy.IDENTITY
+               for flt in filters.filters.values())
+
+
+def document_matches(filters: FilterSet, doc: dict[str, Any]) -> bool:
+    """
+    Check whether a document matches a filter set, approximating the ArangoSearch analyzers
+    for string filters other than identity filters. The collection ID and load version
+    are not checked.
+
+    filters - the filters to apply.
+    doc - the document to check.
+    """
+    subsets = doc.get(names.FLD_MATCHES_SELECTIONS) or []
+    for spec in [filters.match_spec, filters.selection_spec]:
+        subset_id = spec.get_subset_filtering_id()
+        if subset_id and subset_id not in subsets:
+            return False
+    if filters.keep_filter_nulls and any(doc.get(k) is None for k in filters.keep):
+        return False
+    flts = filters.filters
+    if not flts:
+        return True
+    matches = (_filter_match(flt, doc.get(f)) for f, flt in flts.items())
+    return all(matches) if filters.conjunction else any(matches)
+
+
+def extrapolate(matches: int, sample_size: int, total: int) -> CountEstimate:
+    """
+    Extrapolate a count from the number of matches in a uniform random sample without
+    replacement, using the Wilson score interval with a finite population correction for the
+    error bound.
+
+    matches - the number of documents in the sample that matched.
+    sample_size - the size of the sample.
+    total - the number of documents from which the sample was drawn.
+    """
+    if sample_size >= total:
+        return CountEstimate(matches, 0, False)
+    if sample_size < 1:
+        raise ValueError("sample_size must be > 0")
+    p = matches / sample_size
+    count = round(p * total)
+    # the effective sample size, accounting for sampling without replacement
+    n = sample_size * (total - 1) / (total - sample_size)
+    z2 = _Z * _Z
+    denom = 1 + z2 / n
+    center = (p + z2 / (2 * n)) / denom
+    half = _Z * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n)) / denom
+    low = max(0.0, center - half) * total
+    high = min(1.0, center + half) * total
+    return CountEstimate(count, math.ceil(max(count - low, high - count)), True)
+
+
+class _Sample(NamedTuple):
+    total: int
+    docs: list[dict[str, Any]]
+
+
+class CountEstimator:
+    """
+    Provides exact or estimated document counts for filter sets and caches exact counts.
+    """
+
+    def __init__(
+        self,
+        sample_size: int = 1000,
+        max_samples: int = 8,
+        max_counts: int = 10000,
+    ):
+        """
+        Create the estimator.
+
+        sample_size - the number of documents to sample per load version.
+        max_samples - the maximum number of load version samples to keep in memory.
+        max_counts - the maximum number of exact counts to cache.
+        """
+        if sample_size < 1:
+            raise ValueError("sample_size must be > 0")
+        if max_samples < 1:
+            raise ValueError("max_samples must be > 0")
+        if max_counts < 1:
+            raise ValueError("max_counts must be > 0")
+        self._sample_size = sample_size
+        self._max_samples = max_samples
+        self._max_counts = max_counts
+        self._counts = OrderedDict()
+        self._samples = OrderedDict()
+        self._pending = {}
+
+    def get_exact(self, filters: FilterSet) -> int | None:
+        """
+        Get a cached exact count for a filter set, or None if there is no cached count.
+
+        filters - the filter set.
+        """
+        sig = filter_signature(filters)
+        count = self._counts.get(sig)
+        if count is not None:
+            self._counts.move_to_end(sig)
+        return count
+
+    def record_exact(self, filters: FilterSet, count: int):
+        """
+        Cache an exact count for a filter set.
+
+        filters - the filter set.
+        count - the exact number of documents the filter set selects.
+        """
+        sig = filter_signature(filters)
+        self._counts[sig] = count
+        self._counts.move_to_end(sig)
+        while len(self._counts) > self._max_counts:
+            self._counts.popitem(last=False)
+
+    async def estimate(self, store: ArangoStorage, filters: FilterSet) -> CountEstimate | None:
+        """
+        Estimate the number of documents a filter set selects. Returns None if an estimate
+        isn't available and the count should be performed exactly, in which case the caller
+        should provide the result to `record_exact`.
+
+        store - the storage system.
+        filters - the filter set.
+        """
+        count = self.get_exact(filters)
+        if count is not None:
+            return CountEstimate(count, 0, False)
+        if not len(filters) or not filters.collection:
+            return None
+        sample = await self._get_sample(store, filters)
+        docs = sample.docs
+        if filters.match_spec.get_subset_filtering_id() or (
+                filters.selection_spec.get_subset_filtering_id()):
+            # match and selection marks change over time, so get the current marks
+            docs = await self._refresh_marks(store, filters.collection, docs)
+        matches = sum(1 for d in docs if document_matches(filters, d))
+        est = extrapolate(matches, len(docs), sample.total)
+        if _approximated(filters):
+            # even a complete sample only approximates the analyzers
+            est = est._replace(estimated=True)
+        return est
+
+    async def _get_sample(self, store: ArangoStorage, filters: FilterSet) -> _Sample:
+        key = (filters.collection, filters.collection_id, filters.load_ver)
+        sample = self._samples.get(key)
+        if sample:
+            self._samples.move_to_end(key)
+            return sample
+        if key not in self._pending:
+            # share the sampling query between concurrent requests
+            self._pending[key] = asyncio.create_task(self._draw_sample(store, *key))
+        try:
+            sample = await asyncio.shield(self._pending[key])
+        finally:
+            if key in self._pending and self._pending[key].done():
+                del self._pending[key]
+        self._samples[key] = sample
+        self._samples.move_to_end(key)
+        while len(self._samples) > self._max_samples:
+            self._samples.popitem(last=False)
+        return sample
+
+    async def _draw_sample(
+        self, store: ArangoStorage, collection: str, collection_id: str, load_ver: str
+    ) -> _Sample:
+        bind_vars = {
+            "@collection": collection,
+            "collid": collection_id,
+            "load_ver": load_ver,
+        }
+        base_aql = f"""
+            FOR d IN @@collection
+                FILTER d.{names.FLD_COLLECTION_ID} == @collid
+                FILTER d.{names.FLD_LOAD_VERSION} == @load_ver
+            """
+        total = await self._first(store, base_aql + """
+                COLLECT WITH COUNT INTO total
+                RETURN total
+            """, bind_vars)
+        # This scans the collection / load version index, but only once per load version
+        docs = await self._all(store, base_aql + """
+                SORT RAND()
+                LIMIT @sample
+                RETURN d
+            """, bind_vars | {"sample": self._sample_size})
+        return _Sample(total, docs)
+
+    async def _refresh_marks(
+        self, store: ArangoStorage, collection: str, docs: list[dict[str, Any]]
+    ) -> list[dict[str, Any]]:
+        marks = {
+            d[names.FLD_ARANGO_KEY]: d.get(names.FLD_MATCHES_SELECTIONS)
+            for d in await self._all(store, f"""
+                FOR d IN @@collection
+                    FILTER d.{names.FLD_ARANGO_KEY} IN @keys
+                    RETURN KEEP(d, "{names.FLD_ARANGO_KEY}", "{names.FLD_MATCHES_SELECTIONS}")
+            """, {
+                "@collection": collection,
+                "keys": [d[names.FLD_ARANGO_KEY] for d in docs]
+            })
+        }
+        return [d | {names.FLD_MATCHES_SELECTIONS: marks.get(d[names.FLD_ARANGO_KEY])}
+                for d in docs]
+
+    async def _all(self, store: ArangoStorage, aql: str, bind_vars: dict[str, Any]) -> list:
+        cur = await store.execute_aql(aql, bind_vars=bind_vars, op="estimate_count")
+        try:
+            return [d async for d in cur]
+        finally:
+            await cur.close(ignore_missing=True)
+
+    async def _first(self, store: ArangoStorage, aql: str, bind_vars: dict[str, Any]) -> Any:
+        res = await self._all(store, aql, bind_vars)
+        return res[0]
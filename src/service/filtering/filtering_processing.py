@@ -7,6 +7,7 @@ from src.service import errors, app_state
 from src.service.filtering import analyzers
 from src.service.filtering.filters import FilterSet
 from src.service.processing import SubsetSpecification
+from src.service.storage_arango import ArangoStorage
 
 FILTER_PREFIX = "filter_"
 FILTER_STRATEGY_TEXT = """
@@ -110,6 +111,16 @@ def _append_filters(
     return fs
 
 
+async def _get_existing_view(
+        store: ArangoStorage, data_product: str, view_name: str, fallback_view_name: str | None
+) -> str:
+    if await store.has_search_view(view_name):
+        return view_name
+    if fallback_view_name and await store.has_search_view(fallback_view_name):
+        return fallback_view_name
+    raise ValueError(f"View {view_name} does not exist for data product {data_product}")
+
+
 async def get_filters(
         r: Request,
         arango_coll: str,
@@ -119,6 +130,7 @@ async def get_filters(
         data_product: str,
         columns: list[col_models.AttributesColumn],
         view_name: str = None,
+        fallback_view_name: str = None,
         count: bool = False,
         sort_on: str = None,
         sort_desc: bool = False,
@@ -127,6 +139,7 @@ async def get_filters(
         selection_spec: SubsetSpecification = None,
         keep: dict[str, set[col_models.ColumnType]] = None,
         keep_filter_nulls: bool = False,
+        projection: list[str] = None,
         skip: int = 0,
         limit: int = 1000,
         start_after: str = None,
@@ -149,6 +162,9 @@ async def get_filters(
     columns - the column definitions for the data product and KBase Collection.
     view_name - The name of the ArangoSearch view to use for filtering, if any.
         A view must be supplied if any filter query parameters are passed in the request.
+    fallback_view_name - The name of an ArangoSearch view to use for filtering if the view
+        named by `view_name` does not exist, for example while a view for new view definitions
+        has yet to be created.
     count - Whether or not to return the count of matching documents.
     sort_on - The name of the field to sort on.
     sort_desc - Whether or not to sort in descending order.
@@ -158,6 +174,8 @@ async def get_filters(
     keep - A dictionary mapping column names to keep in the returned data set to
         allowable column types for the column names.
     keep_filter_nulls - Whether or not to keep null values when filtering.
+    projection - Fields to return from the database in addition to any fields in `keep`.
+        The fields are not validated against the columns or transformed.
 
     skip - the number of records to skip. Use this parameter wisely, as paging
         through records via increasing skip incrementally is an O(n^2) operation.
@@ -180,8 +198,8 @@ async def get_filters(
             raise ValueError("Filtering is not supported with a load version override.")
 
         if view_name:
-            if not await appstate.arangostorage.has_search_view(view_name):
-                raise ValueError(f"View {view_name} does not exist for data product {data_product}")
+            view_name = await _get_existing_view(
+                appstate.arangostorage, data_product, view_name, fallback_view_name)
         else:
             raise ValueError(f"No search view name configured for collection {coll_id}, "
                              + f"data product {data_product}. Cannot perform filtering operation")
@@ -204,6 +222,9 @@ async def get_filters(
 
         # Translate the field names to valid column names if necessary.
         keep_cols = [trans_field_func(col) if trans_field_func else col for col in keep.keys()]
+    if projection:
+        keep_cols = keep_cols or []
+        keep_cols += [f for f in projection if f not in keep_cols]
 
     fs = FilterSet(
         coll_id,
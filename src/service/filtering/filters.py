@@ -467,7 +467,9 @@ class FilterSet:
             through records via increasing skip incrementally is an O(n^2) operation.
         limit - the maximum number of records to return. 0 indicates no limit, which is usually
             a bad idea.
-        keep - the fields to return from the database.
+        keep - the fields to return from the database. If a match or selection is specified
+            the match and selection field is also returned so that matches and selections can be
+            marked.
         keep_filter_nulls - filter out any documents where any of the keep values are null.
         doc_var - the variable to use for the ArangoSearch document.
         """
@@ -498,6 +500,14 @@ class FilterSet:
     def __len__(self):
         return len(self._filters)
 
+    @property
+    def filters(self) -> dict[str, AbstractFilter]:
+        """
+        Get a copy of the filters in this filter set as a mapping of field to filter, in the
+        order the filters were added.
+        """
+        return dict(self._filters)
+
     def append(
             self,
             field: str,  # currently this is inserted into the aql - use a bind var?
@@ -602,13 +612,19 @@ class FilterSet:
             ssl_aql, ssl_bind_vars = self._sort_skip_limit()
             aql += ssl_aql
             bind_vars |= ssl_bind_vars
-            if self.keep:
-                aql += f"    RETURN KEEP({self.doc_var}, @keep)\n"
-                bind_vars["keep"] = self.keep
-            else:
-                aql += f"    RETURN {self.doc_var}\n"
+            aql += self._return(bind_vars)
         return aql, bind_vars
 
+    def _return(self, bind_vars: dict[str, Any]) -> str:
+        if not self.keep:
+            return f"    RETURN {self.doc_var}\n"
+        keep = list(self.keep)
+        if not (self.match_spec.is_null_subset() and self.selection_spec.is_null_subset()):
+            if names.FLD_MATCHES_SELECTIONS not in keep:
+                keep.append(names.FLD_MATCHES_SELECTIONS)
+        bind_vars["keep"] = keep
+        return f"    RETURN KEEP({self.doc_var}, @keep)\n"
+
     def _sort_skip_limit(self) -> (str, dict[str, Any]):
         aql = ""
         bind_vars = {}
@@ -665,11 +681,7 @@ class FilterSet:
             ssl_aql, ssl_bind_vars = self._sort_skip_limit()
             aql += ssl_aql
             bind_vars |= ssl_bind_vars
-        if self.keep:
-            aql += f"    RETURN KEEP({self.doc_var}, @keep)\n"
-            bind_vars["keep"] = self.keep
-        else:
-            aql += f"    RETURN {self.doc_var}\n"
+        aql += self._return(bind_vars)
         # should check if there's a way to speed up counts by returning less stuff or if
         # the query optimizer is smart enough to just do the count and things are fine as is
         if self.count:
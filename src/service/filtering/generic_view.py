@@ -1,4 +1,5 @@
 from src.common.product_models.columnar_attribs_common_models import ColumnarAttributesSpec, AttributesColumnSpec
+from src.service.filtering.view_definitions import VIEW_DEFINITION_VERSION
 
 _FIELD_COL = {
     "kbase_display_name": {
@@ -27,5 +28,19 @@ def create_generic_spec() -> ColumnarAttributesSpec:
 def get_generic_view_name(data_product: str) -> str:
     """
     Get the name of the generic view for a data product.
+
+    The name includes the view definition version, so a view for a new version of the
+    definitions can be created while the service uses the view for the prior version.
+    """
+    return f"{data_product}{_GENERIC_VIEW_NAME_SUFFIX}_v{VIEW_DEFINITION_VERSION}"
+
+
+def get_legacy_generic_view_name(data_product: str) -> str:
+    """
+    Get the name of the generic view for a data product created prior to versioning the
+    view definitions.
+
+    The service falls back to this view until the view for the current view definitions
+    has been created by the service manager.
     """
     return f"{data_product}{_GENERIC_VIEW_NAME_SUFFIX}"
@@ -0,0 +1,367 @@
+"""
+Records the normalized shapes of filtered data product queries.
+
+A query shape is the structure of a FilterSet query stripped of its values - the fields that
+are filtered and how, the sort field and direction, the projected fields, and whether the
+query runs against an ArangoSearch view or a collection. Executions of each shape are counted
+in memory and periodically added to a counter document in the database for the current time
+window, so the counts from all service instances accumulate. Time windows older than the
+retention period are removed when counts are written.
+
+Along with the counts, the AQL of the most recent execution of each shape is stored with the
+names and types of its bind variables, but not their values, so the query can be explained
+later with example values.
+"""
+
+import asyncio
+import copy
+import logging
+from typing import Any, Callable, NamedTuple
+
+from pydantic import BaseModel, Field
+
+from src.common.hash import md5_string
+import src.common.storage.collection_and_field_names as names
+from src.service.aql_profiler import bind_var_shape
+from src.service.filtering.filters import (
+    BooleanFilter,
+    FilterSet,
+    RangeFilter,
+    StringFilter,
+)
+from src.service.storage_arango import ArangoStorage
+from src.service.timestamp import now_epoch_millis
+
+
+PATH_VIEW = "view"
+""" The query shape path for queries against an ArangoSearch view. """
+
+PATH_COLLECTION = "collection"
+""" The query shape path for queries against a collection. """
+
+_OP_BOOL = "bool"
+_OP_RANGE = "range"
+
+_FLD_SIGNATURE = "sig"
+_FLD_SHAPE = "shape"
+_FLD_COUNT = "count"
+_FLD_AQL = "aql"
+_FLD_BIND_VARS = "bind_vars"
+
+# Example values for redacted bind variables, by type name
+_EXAMPLE_VALUES = {"str": "a", "int": 1, "float": 1.0, "bool": True, "list": [], "dict": {}}
+
+
+def _logger() -> logging.Logger:
+    return logging.getLogger(__name__)
+
+
+class QueryShape(BaseModel):
+    """ The normalized shape of a filtered data product query. """
+    path: str = Field(
+        example=PATH_VIEW,
+        description=f"Whether the query runs against an ArangoSearch view ({PATH_VIEW}) or "
+            + f"a collection ({PATH_COLLECTION})."
+    )
+    relation: str = Field(
+        example="kbcoll_genome_attribs_view",
+        description="The name of the view or collection the query runs against."
+    )
+    filters: list[tuple[str, str]] = Field(
+        example=[["checkm_completeness", "range"], ["classification", "fulltext"]],
+        description="The filtered fields and the filter operators, sorted by field."
+    )
+    conjunction: bool = Field(
+        example=True, description="Whether the filters are ANDed (true) or ORed (false)."
+    )
+    sort_on: str | None = Field(example="kbase_id", description="The sort field, if any.")
+    sort_descending: bool | None = Field(
+        example=False, description="Whether the sort is descending, if there is a sort field."
+    )
+    count: bool = Field(example=False, description="Whether the query counts the documents.")
+    keep: list[str] = Field(
+        example=["kbase_id", "checkm_completeness"],
+        description="The fields returned by the query, sorted. Empty if the entire "
+            + "document is returned."
+    )
+    subset: bool = Field(
+        example=False,
+        description="Whether the query is restricted to the members of a match or selection."
+    )
+
+    def signature(self) -> str:
+        """ Get the MD5 of the shape, which uniquely identifies the shape. """
+        return md5_string(self.model_dump_json())
+
+
+def _operator(filter_) -> str:
+    if isinstance(filter_, StringFilter):
+        return filter_.strategy.value
+    if isinstance(filter_, RangeFilter):
+        return _OP_RANGE
+    if isinstance(filter_, BooleanFilter):
+        return _OP_BOOL
+    return type(filter_).__name__
+
+
+def query_shape(filters: FilterSet) -> QueryShape:
+    """
+    Get the shape of a query.
+
+    filters - the filters for the query.
+    """
+    view = bool(len(filters))
+    return QueryShape(
+        path=PATH_VIEW if view else PATH_COLLECTION,
+        relation=filters.view if view else filters.collection,
+        filters=sorted((field, _operator(f)) for field, f in filters.filters.items()),
+        conjunction=filters.conjunction if view else True,
+        sort_on=None if filters.count else filters.sort_on,
+        sort_descending=filters.sort_descending if filters.sort_on and not filters.count
+            else None,
+        count=filters.count,
+        keep=[] if filters.count else sorted(set(filters.keep)),
+        subset=bool(filters.match_spec.get_subset_filtering_id()
+                    or filters.selection_spec.get_subset_filtering_id()),
+    )
+
+
+class QueryShapeCount(NamedTuple):
+    """ The number of executions of a query shape. """
+    signature: str
+    """ The signature of the shape. """
+    shape: QueryShape
+    """ The shape. """
+    count: int
+    """ The number of executions. """
+    aql: str
+    """ The AQL of the most recent execution. """
+    bind_vars: dict[str, str]
+    """
+    The bind variables of the most recent execution, with the values of all but the collection
+    and view bind variables replaced by their type.
+    """
+
+
+def example_bind_vars(shape: QueryShape, bind_vars: dict[str, str]) -> dict[str, Any]:
+    """
+    Get bind variables for explaining a query from the redacted bind variables of an execution
+    of the query. The sort and projection bind variables are taken from the query shape,
+    and the remaining bind variables are given an example value for their type.
+
+    shape - the shape of the query.
+    bind_vars - the redacted bind variables.
+    """
+    ret = {}
+    for k, v in bind_vars.items():
+        if k.startswith("@"):
+            ret[k] = v
+        elif k == "sort":
+            ret[k] = shape.sort_on
+        elif k == "sortdir":
+            ret[k] = "DESC" if shape.sort_descending else "ASC"
+        elif k == "keep":
+            ret[k] = shape.keep
+        else:
+            ret[k] = copy.copy(_EXAMPLE_VALUES.get(v))
+    return ret
+
+
+async def save_query_shape_counts(
+    storage: ArangoStorage, bucket: int, counts: list[QueryShapeCount]
+):
+    """
+    Add query shape execution counts to the counts for a time window.
+
+    storage - the storage system.
+    bucket - the start of the time window in epoch milliseconds.
+    counts - the counts to add.
+    """
+    docs = [{
+            names.FLD_ARANGO_KEY: f"{bucket}_{c.signature}",
+            names.FLD_QUERY_SHAPE_BUCKET: bucket,
+            _FLD_SIGNATURE: c.signature,
+            _FLD_SHAPE: c.shape.model_dump(),
+            _FLD_COUNT: c.count,
+            _FLD_AQL: c.aql,
+            _FLD_BIND_VARS: c.bind_vars,
+        } for c in counts]
+    aql = f"""
+        FOR d IN @docs
+            UPSERT {{{names.FLD_ARANGO_KEY}: d.{names.FLD_ARANGO_KEY}}}
+                INSERT d
+                REPLACE MERGE(d, {{{_FLD_COUNT}: OLD.{_FLD_COUNT} + d.{_FLD_COUNT}}})
+                IN @@coll
+                OPTIONS {{exclusive: true}}
+        """
+    cur = await storage.execute_aql(
+        aql,
+        bind_vars={"@coll": names.COLL_SRV_QUERY_SHAPES, "docs": docs},
+        op="save_query_shape_counts",
+    )
+    await cur.close(ignore_missing=True)
+
+
+async def get_query_shape_counts(storage: ArangoStorage, since: int) -> list[QueryShapeCount]:
+    """
+    Get the execution counts of query shapes, summed over the time windows starting at or
+    after a time, ordered by the count, descending.
+
+    storage - the storage system.
+    since - the time, in epoch milliseconds, of the earliest time window to include.
+    """
+    aql = f"""
+        FOR d IN @@coll
+            FILTER d.{names.FLD_QUERY_SHAPE_BUCKET} >= @since
+            SORT d.{names.FLD_QUERY_SHAPE_BUCKET}
+            RETURN d
+        """
+    cur = await storage.execute_aql(
+        aql,
+        bind_vars={"@coll": names.COLL_SRV_QUERY_SHAPES, "since": since},
+        op="get_query_shape_counts",
+    )
+    counts = {}
+    try:
+        async for d in cur:
+            sig = d[_FLD_SIGNATURE]
+            prior = counts[sig].count if sig in counts else 0
+            # the most recent window provides the example query
+            counts[sig] = QueryShapeCount(
+                signature=sig,
+                shape=QueryShape.model_validate(d[_FLD_SHAPE]),
+                count=prior + d[_FLD_COUNT],
+                aql=d[_FLD_AQL],
+                bind_vars=d[_FLD_BIND_VARS],
+            )
+    finally:
+        await cur.close(ignore_missing=True)
+    return sorted(counts.values(), key=lambda c: (-c.count, c.signature))
+
+
+async def remove_query_shape_counts(storage: ArangoStorage, before: int):
+    """
+    Remove the query shape counts for time windows starting before a time.
+
+    storage - the storage system.
+    before - the time in epoch milliseconds.
+    """
+    aql = f"""
+        FOR d IN @@coll
+            FILTER d.{names.FLD_QUERY_SHAPE_BUCKET} < @before
+            REMOVE d IN @@coll
+            OPTIONS {{exclusive: true}}
+        """
+    cur = await storage.execute_aql(
+        aql,
+        bind_vars={"@coll": names.COLL_SRV_QUERY_SHAPES, "before": before},
+        op="remove_query_shape_counts",
+    )
+    await cur.close(ignore_missing=True)
+
+
+class QueryShapeRecorder:
+    """
+    Counts executions of query shapes in memory and periodically adds the counts to the
+    database.
+    """
+
+    def __init__(
+        self,
+        storage: ArangoStorage,
+        clock: Callable[[], int] = now_epoch_millis,
+        flush_interval_ms: int = 60 * 1000,
+        bucket_ms: int = 60 * 60 * 1000,
+        retention_ms: int = 7 * 24 * 60 * 60 * 1000,
+        max_pending: int = 1000,
+    ):
+        """
+        Create the recorder.
+
+        storage - the storage system where counts are saved.
+        clock - a function returning the current time in epoch milliseconds.
+        flush_interval_ms - how often to add the counts held in memory to the database.
+        bucket_ms - the length of the time windows in which counts are accumulated.
+        retention_ms - how long to keep counts in the database.
+        max_pending - the maximum number of shapes to count in memory. When the maximum is
+            reached the counts are added to the database regardless of the flush interval.
+        """
+        if flush_interval_ms < 1:
+            raise ValueError("flush_interval_ms must be > 0")
+        if bucket_ms < 1:
+            raise ValueError("bucket_ms must be > 0")
+        if retention_ms < bucket_ms:
+            raise ValueError("retention_ms must be >= bucket_ms")
+        if max_pending < 1:
+            raise ValueError("max_pending must be > 0")
+        self._storage = storage
+        self._clock = clock
+        self._flush_interval_ms = flush_interval_ms
+        self._bucket_ms = bucket_ms
+        self._retention_ms = retention_ms
+        self._max_pending = max_pending
+        self._pending: dict[str, QueryShapeCount] = {}
+        self._last_flush = clock()
+        self._flush_task: asyncio.Task | None = None
+
+    def record(
+        self, shape: QueryShape, aql_str: str, bind_vars: dict[str, Any] | None
+    ) -> asyncio.Task | None:
+        """
+        Record the execution of a query. When the counts held in memory are due to be added to
+        the database, they're added in a background task so the query isn't delayed.
+
+        shape - the shape of the query.
+        aql_str - the AQL of the query.
+        bind_vars - the query's bind variables. Only the names and types of the bind variables
+            are kept.
+
+        Returns the background task if one was started.
+        """
+        sig = shape.signature()
+        prior = self._pending.get(sig)
+        self._pending[sig] = QueryShapeCount(
+            sig, shape, prior.count + 1 if prior else 1, aql_str, bind_var_shape(bind_vars))
+        if self._flush_task and not self._flush_task.done():
+            return None
+        if (len(self._pending) >= self._max_pending
+                or self._clock() - self._last_flush >= self._flush_interval_ms):
+            self._flush_task = asyncio.create_task(self.flush())
+            return self._flush_task
+        return None
+
+    async def flush(self):
+        """
+        Add the counts held in memory to the database and remove expired counts. Errors are
+        logged rather than thrown, and the counts are discarded.
+        """
+        now = self._clock()
+        self._last_flush = now
+        # swap before awaiting so concurrent records go to the next flush
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            await save_query_shape_counts(
+                self._storage, now - now % self._bucket_ms, list(pending.values()))
+            await remove_query_shape_counts(self._storage, now - self._retention_ms)
+        except Exception:
+            _logger().exception("Failed to save %s query shape counts", len(pending))
+
+    async def get_counts(self) -> list[QueryShapeCount]:
+        """
+        Get the execution counts of query shapes within the retention period from all service
+        instances, ordered by the count, descending. Counts held in memory are added to the
+        database first.
+        """
+        await self.flush()
+        return await get_query_shape_counts(self._storage, self._clock() - self._retention_ms)
+
+    async def close(self):
+        """
+        Wait for any background task adding counts to the database to complete, and then add
+        the counts held in memory to the database.
+        """
+        if self._flush_task:
+            await self._flush_task
+        await self.flush()
@@ -0,0 +1,139 @@
+"""
+An in memory cache of filtered query results.
+
+The data in a load version is immutable, so the results of a query against a load version can
+be cached indefinitely, keyed by a canonical representation of the query. Match and selection
+marks are only applied to the data once the match or selection is complete, and the internal
+ID of a subset changes if it is recalculated, so queries including complete subsets are
+cacheable as well.
+
+The cache is cleared for a collection when a collection version is activated, in case a load
+version is reloaded in place during development.
+"""
+
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple
+
+from src.service import metrics
+from src.service.filtering.count_estimation import filter_signature
+from src.service.filtering.filters import FilterSet
+from src.service.processing import SubsetSpecification
+
+
+def _subset_key(spec: SubsetSpecification) -> tuple[str | None, bool]:
+    return spec.get_prefixed_subset_id(), spec.mark_only
+
+
+def result_key(filters: FilterSet, *args: Hashable) -> tuple:
+    """
+    Get a canonical key for the results of a query. Two queries with the same key return the
+    same results.
+
+    filters - the filters for the query, including sorting and paging.
+    args - any other parameters that determine the query results, for example the output format.
+    """
+    return (
+        filter_signature(filters),
+        filters.count,
+        filters.sort_on,
+        filters.sort_descending if filters.sort_on else None,
+        filters.start_after,
+        filters.skip,
+        filters.limit,
+        tuple(filters.keep),
+        _subset_key(filters.match_spec),
+        _subset_key(filters.selection_spec),
+    ) + args
+
+
+class _Entry(NamedTuple):
+    collection_id: str
+    value: Any
+    rows: int
+
+
+class ResultCache:
+    """
+    A least recently used cache of query results, bounded by the number of entries and
+    the total number of result rows held in memory.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_rows: int = 100_000):
+        """
+        Create the cache.
+
+        max_entries - the maximum number of results to cache.
+        max_rows - the maximum total number of rows, e.g. documents, to cache across all results.
+            Results with more rows are never cached.
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be > 0")
+        if max_rows < 1:
+            raise ValueError("max_rows must be > 0")
+        self._max_entries = max_entries
+        self._max_rows = max_rows
+        self._cache: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._rows = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, filters: FilterSet, *args: Hashable) -> Any | None:
+        """
+        Get a cached result, or None if the result is not in the cache.
+
+        filters - the filters for the query, including sorting and paging.
+        args - any other parameters that determine the query results.
+        """
+        key = result_key(filters, *args)
+        entry = self._cache.get(key)
+        if entry is None:
+            self._misses += 1
+            metrics.RESULT_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+        self._hits += 1
+        metrics.RESULT_CACHE_LOOKUPS.labels("hit").inc()
+        self._cache.move_to_end(key)
+        return entry.value
+
+    def put(self, filters: FilterSet, value: Any, rows: int, *args: Hashable):
+        """
+        Cache a result.
+
+        filters - the filters for the query, including sorting and paging.
+        value - the result. The result must not be modified after it is cached.
+        rows - the number of rows in the result, used to bound the cache size.
+        args - any other parameters that determine the query results.
+        """
+        if rows > self._max_rows:
+            return
+        key = result_key(filters, *args)
+        self._remove(key)
+        self._cache[key] = _Entry(filters.collection_id, value, rows)
+        self._rows += rows
+        while len(self._cache) > self._max_entries or self._rows > self._max_rows:
+            self._remove(next(iter(self._cache)))
+
+    def _remove(self, key: tuple):
+        entry = self._cache.pop(key, None)
+        if entry:
+            self._rows -= entry.rows
+
+    def invalidate(self, collection_id: str):
+        """
+        Remove all cached results for a collection.
+
+        collection_id - the ID of the collection.
+        """
+        for key in [k for k, e in self._cache.items() if e.collection_id == collection_id]:
+            self._remove(key)
+
+    @property
+    def hit_ratio(self) -> float:
+        """ The fraction of lookups that were cache hits, or 0 if there have been no lookups. """
+        total = self._hits + self._misses
+        return self._hits / total if total else 0.0
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """ The number of cached results and the total number of rows they contain. """
+        return len(self._cache), self._rows
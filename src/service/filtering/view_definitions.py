@@ -0,0 +1,188 @@
+"""
+Generates ArangoSearch view definitions from column specifications.
+
+Beyond the linked fields, a view definition includes:
+
+* A primary sort on the data product's default sort field. Sorted, limited queries that sort
+  on the primary sort field in ascending order are answered in index order, rather than by
+  sorting every document matching the search.
+* Stored values for the commonly projected fields - the sort field, and the numeric columns
+  read by histograms and range filters - so queries projecting only those fields don't need to
+  read the documents.
+* Commit and consolidation settings tuned for data that is bulk loaded once per load version
+  and read many times.
+
+The primary sort and stored values of a view cannot be changed after the view is created, so
+a change to them requires a new view. The commit and consolidation settings can be updated
+in place. Increment VIEW_DEFINITION_VERSION when the immutable parts of the definition change.
+"""
+
+import copy
+from typing import Any, Callable
+
+from aioarango.formatter import format_view_consolidation_policy
+
+from src.common.product_models.columnar_attribs_common_models import (
+    ColumnarAttributesSpec,
+    ColumnType,
+    FilterStrategy,
+)
+
+
+VIEW_DEFINITION_VERSION = 2
+"""
+The version of the view definitions. Version 1 views have no primary sort or stored values.
+"""
+
+_STORED_VALUE_TYPES = {ColumnType.INT, ColumnType.FLOAT}
+
+_COMPRESSION = "lz4"
+
+# Data is loaded in bulk and then only read, so commit less often than the 1s default and
+# consolidate into fewer, larger segments.
+_MUTABLE_PROPERTIES = {
+    "commitIntervalMsec": 5000,
+    "consolidationIntervalMsec": 60000,
+    "cleanupIntervalStep": 2,
+    "consolidationPolicy": {
+        "type": "tier",
+        "segmentsMin": 1,
+        "segmentsMax": 10,
+        "segmentsBytesMax": 8 * 1024 * 1024 * 1024,
+        "segmentsBytesFloor": 16 * 1024 * 1024,
+    },
+}
+
+# the keys of the mutable properties as returned by the aioarango client
+_FORMATTED_KEYS = {
+    "commitIntervalMsec": "commit_interval_msec",
+    "consolidationIntervalMsec": "consolidation_interval_msec",
+    "cleanupIntervalStep": "cleanup_interval_step",
+    "consolidationPolicy": "consolidation_policy",
+}
+
+
+def get_view_fields(
+    view_spec: ColumnarAttributesSpec,
+    analyzer_provider: Callable[[FilterStrategy, bool], str],
+) -> dict[str, Any]:
+    """
+    Get the linked fields for a view.
+
+    view_spec - the specification for the view.
+    analyzer_provider - a function, that given a filter strategy, provides the name of
+        an analyzer to use for that strategy. The second argument defines whether to
+        return None (True) or the name of the default analyzer (False) when the default
+        analyzer is to be returned.
+    """
+    fields = {}
+    for colattrib in view_spec.columns:
+        analyzer = analyzer_provider(colattrib.filter_strategy, True)
+        if not analyzer:
+            fields[colattrib.key] = {}
+        else:
+            # we may want > 1 analyzer per field at some point, deal with that when it happens.
+            fields[colattrib.key] = {"analyzers": [analyzer]}
+    return fields
+
+
+def get_stored_values(view_spec: ColumnarAttributesSpec, primary_sort: str | None
+) -> list[list[str]]:
+    """
+    Get the groups of fields to store in a view. Each group is stored in a separate column.
+
+    view_spec - the specification for the view.
+    primary_sort - the primary sort field for the view, if any.
+    """
+    stored = []
+    if primary_sort:
+        stored.append([primary_sort])
+    numeric = sorted({c.key for c in view_spec.columns
+                      if c.type in _STORED_VALUE_TYPES and c.key != primary_sort})
+    if numeric:
+        stored.append(numeric)
+    return stored
+
+
+def get_view_properties(
+    arango_collection: str,
+    view_spec: ColumnarAttributesSpec,
+    analyzer_provider: Callable[[FilterStrategy, bool], str],
+    primary_sort: str | None = None,
+    include_all_fields: bool = False,
+) -> dict[str, Any]:
+    """
+    Get the properties for creating a view, as expected by the ArangoDB API.
+
+    arango_collection - the collection name for which to create the view.
+    view_spec - the specification for the view.
+    analyzer_provider - a function, that given a filter strategy, provides the name of
+        an analyzer to use for that strategy. The second argument defines whether to
+        return None (True) or the name of the default analyzer (False) when the default
+        analyzer is to be returned.
+    primary_sort - the field on which to sort the documents in the view, typically the
+        default sort field for the data product.
+    include_all_fields - whether to set include_all_fields to true for the view.
+    """
+    props = {
+        "links": {arango_collection: {
+            "fields": get_view_fields(view_spec, analyzer_provider),
+            "includeAllFields": include_all_fields,
+        }},
+        "primarySort": [{"field": primary_sort, "asc": True}] if primary_sort else [],
+        "primarySortCompression": _COMPRESSION,
+        "storedValues": [{"fields": f, "compression": _COMPRESSION}
+                         for f in get_stored_values(view_spec, primary_sort)],
+    }
+    return props | get_mutable_properties()
+
+
+def get_mutable_properties() -> dict[str, Any]:
+    """
+    Get the view properties that can be updated on an existing view.
+    """
+    return copy.deepcopy(_MUTABLE_PROPERTIES)
+
+
+def view_matches(view: dict[str, Any], arango_collection: str, properties: dict[str, Any]
+) -> bool:
+    """
+    Check whether an existing view matches the immutable properties - the linked fields,
+    primary sort, and stored values - of a view definition.
+
+    view - the view as returned by the aioarango client.
+    arango_collection - the collection name associated with the view.
+    properties - the view properties as returned by get_view_properties.
+    """
+    link = view["links"].get(arango_collection)
+    want_link = properties["links"][arango_collection]
+    if not link:
+        return False
+    if (link["fields"] != want_link["fields"]
+            or link["include_all_fields"] != want_link["includeAllFields"]):
+        return False
+    # the server may add default values, so compare only the values we set
+    sort = [(s["field"], s["asc"]) for s in view.get("primary_sort") or []]
+    if sort != [(s["field"], s["asc"]) for s in properties["primarySort"]]:
+        return False
+    stored = [s["fields"] for s in view.get("stored_values") or []]
+    return stored == [s["fields"] for s in properties["storedValues"]]
+
+
+def view_needs_update(view: dict[str, Any]) -> bool:
+    """
+    Check whether the mutable properties of an existing view differ from the current view
+    definitions.
+
+    view - the view as returned by the aioarango client.
+    """
+    for key, value in _MUTABLE_PROPERTIES.items():
+        current = view.get(_FORMATTED_KEYS[key])
+        if key == "consolidationPolicy":
+            current = current or {}
+            if any(current.get(k) != v
+                   for k, v in format_view_consolidation_policy(value).items()):
+                return True
+        elif current != value:
+            return True
+    return False
@@ -0,0 +1,234 @@
+"""
+Suggests indexes and ArangoSearch view stored values from the recorded shapes of filtered data
+product queries.
+
+Each recorded query shape is explained with the AQL of its most recent execution and example
+values for the execution's bind variables, since the recorded bind variables don't include the
+filter values. The estimated cost of the query plan multiplied by the number of executions of the
+shape gives the shape's cumulative cost. The plan is then checked for work an index or stored
+values could avoid:
+
+* Collection queries that scan the entire collection, or sort the documents in memory, could
+  use a persistent index on the collection ID, load version, and sort field.
+* View queries that sort the documents in memory must read the sort field of every matching
+  document. Storing the sort field in the view allows reading it without the documents.
+* View queries that project a subset of fields, but read the documents to do so, could read
+  the fields from the view if they were stored.
+
+Suggestions are ranked by the summed cumulative cost of the query shapes that would benefit.
+"""
+
+import logging
+from typing import Any
+
+from pydantic import BaseModel, Field
+
+import src.common.storage.collection_and_field_names as names
+from src.service.aql_profiler import Explainer
+from src.service.filtering.query_shapes import (
+    PATH_VIEW,
+    QueryShape,
+    QueryShapeCount,
+    example_bind_vars,
+)
+
+
+SUGGEST_INDEX = "persistent_index"
+""" The suggestion kind for a persistent index on a collection. """
+
+SUGGEST_STORED_VALUES = "stored_values"
+""" The suggestion kind for stored values in an ArangoSearch view. """
+
+_NODE_INDEX = "IndexNode"
+_NODE_FULL_SCAN = "EnumerateCollectionNode"
+_NODE_VIEW = "EnumerateViewNode"
+_NODE_SORT = "SortNode"
+
+
+def _logger() -> logging.Logger:
+    return logging.getLogger(__name__)
+
+
+class IndexSuggestion(BaseModel):
+    """ A suggested index or set of view stored values. """
+    kind: str = Field(
+        example=SUGGEST_INDEX,
+        description=f"The kind of suggestion, either a persistent index ({SUGGEST_INDEX}) or "
+            + f"stored values in an ArangoSearch view ({SUGGEST_STORED_VALUES})."
+    )
+    relation: str = Field(
+        example="kbcoll_genome_attribs",
+        description="The collection to index or the view in which to store values."
+    )
+    fields: list[str] = Field(
+        example=["coll", "load_ver", "checkm_completeness"],
+        description="The fields to index, in order, or to store."
+    )
+    cost: float = Field(
+        example=123456.0,
+        description="The summed estimated cost of the query shapes that would benefit from "
+            + "the suggestion, where the estimated cost of each shape is the estimated cost "
+            + "of its query plan multiplied by its number of executions."
+    )
+    executions: int = Field(
+        example=42,
+        description="The number of executions of the query shapes that would benefit."
+    )
+    signatures: list[str] = Field(
+        example=["fc2c3b1fd1b5a5a3ef8fcb1bb4a7b9a0"],
+        description="The signatures of the query shapes that would benefit, ordered by "
+            + "their estimated cost, descending."
+    )
+
+
+class ExplainedShape(BaseModel):
+    """ A query shape and the estimated cost of its executions. """
+    signature: str = Field(
+        example="fc2c3b1fd1b5a5a3ef8fcb1bb4a7b9a0", description="The MD5 of the query shape."
+    )
+    shape: QueryShape
+    executions: int = Field(example=42, description="The number of executions of the shape.")
+    plan_cost: float | None = Field(
+        example=2939.4,
+        description="The estimated cost of the query plan, or null if the query couldn't "
+            + "be explained."
+    )
+    cost: float | None = Field(
+        example=123454.8,
+        description="The estimated cost of the query plan multiplied by the number of "
+            + "executions, or null if the query couldn't be explained."
+    )
+    explain_error: str | None = Field(
+        example="[HTTP 400][ERR 1501] AQL: syntax error",
+        description="The error returned by the database if the query couldn't be explained."
+    )
+
+
+class IndexAdvice(BaseModel):
+    """ Index and stored value suggestions derived from recorded query shapes. """
+    suggestions: list[IndexSuggestion] = Field(
+        description="The suggestions, ordered by cost, descending."
+    )
+    shapes: list[ExplainedShape] = Field(
+        description="The query shapes considered, ordered by cost, descending. Shapes that "
+            + "couldn't be explained are last."
+    )
+
+
+class _Suggestion:
+
+    __slots__ = ["kind", "relation", "fields", "cost", "executions", "shapes"]
+
+    def __init__(self, kind: str, relation: str, fields: tuple[str, ...]):
+        self.kind = kind
+        self.relation = relation
+        self.fields = fields
+        self.cost = 0.0
+        self.executions = 0
+        self.shapes = []
+
+
+def _view_stored_fields(value: Any) -> set[str]:
+    # the stored value variables of a view node are nested by stored value column
+    if isinstance(value, dict):
+        fields = {value["field"]} if isinstance(value.get("field"), str) else set()
+        for v in value.values():
+            fields |= _view_stored_fields(v)
+        return fields
+    if isinstance(value, list):
+        return set().union(*[_view_stored_fields(v) for v in value])
+    return set()
+
+
+def _index_fields(nodes: list[dict[str, Any]]) -> list[tuple[str, ...]]:
+    return [tuple(idx.get("fields", []))
+            for n in nodes if n.get("type") == _NODE_INDEX
+            for idx in n.get("indexes", [])]
+
+
+def _suggest(shape: QueryShape, plan: dict[str, Any]) -> list[tuple[str, tuple[str, ...]]]:
+    """
+    Get the suggestions for a query shape and its query plan as a list of (kind, fields).
+    """
+    nodes = plan.get("nodes", [])
+    types = {n.get("type") for n in nodes}
+    memsort = _NODE_SORT in types and shape.sort_on
+    if shape.path == PATH_VIEW:
+        stored = _view_stored_fields(
+            [n.get("viewValuesVars") for n in nodes if n.get("type") == _NODE_VIEW])
+        materialized = any(not n.get("noMaterialization")
+                           for n in nodes if n.get("type") == _NODE_VIEW)
+        ret = []
+        if memsort and shape.sort_on not in stored:
+            ret.append((SUGGEST_STORED_VALUES, (shape.sort_on,)))
+        keep = tuple(k for k in shape.keep
+                     if k not in stored and k != names.FLD_MATCHES_SELECTIONS)
+        if keep and materialized:
+            ret.append((SUGGEST_STORED_VALUES, keep))
+        return ret
+    fields = (names.FLD_COLLECTION_ID, names.FLD_LOAD_VERSION)
+    if shape.sort_on:
+        fields += (shape.sort_on,)
+    if any(idx[:len(fields)] == fields for idx in _index_fields(nodes)):
+        return []
+    if _NODE_FULL_SCAN in types or memsort:
+        return [(SUGGEST_INDEX, fields)]
+    return []
+
+
+async def advise(
+    shape_counts: list[QueryShapeCount],
+    explainer: Explainer,
+    max_shapes: int = 100,
+) -> IndexAdvice:
+    """
+    Explain recorded query shapes and suggest indexes and view stored values that would
+    reduce their cost.
+
+    shape_counts - the recorded query shapes and their execution counts.
+    explainer - a function that returns the query plan for an AQL query and its bind
+        variables.
+    max_shapes - the maximum number of shapes to explain. The shapes with the most executions
+        are explained.
+    """
+    if max_shapes < 1:
+        raise ValueError("max_shapes must be > 0")
+    shape_counts = sorted(shape_counts, key=lambda c: (-c.count, c.signature))[:max_shapes]
+    shapes = []
+    suggestions: dict[tuple[str, str, tuple[str, ...]], _Suggestion] = {}
+    for sc in shape_counts:
+        try:
+            plan = await explainer(sc.aql, example_bind_vars(sc.shape, sc.bind_vars))
+        except Exception as e:
+            _logger().exception("Failed to explain query shape %s", sc.signature)
+            shapes.append(ExplainedShape(
+                signature=sc.signature, shape=sc.shape, executions=sc.count, plan_cost=None,
+                cost=None, explain_error=str(e)))
+            continue
+        plan_cost = float(plan.get("estimatedCost", 0))
+        cost = plan_cost * sc.count
+        shapes.append(ExplainedShape(
+            signature=sc.signature, shape=sc.shape, executions=sc.count, plan_cost=plan_cost,
+            cost=cost, explain_error=None))
+        for kind, fields in _suggest(sc.shape, plan):
+            key = (kind, sc.shape.relation, fields)
+            sug = suggestions.get(key)
+            if not sug:
+                sug = suggestions[key] = _Suggestion(kind, sc.shape.relation, fields)
+            sug.cost += cost
+            sug.executions += sc.count
+            sug.shapes.append((cost, sc.signature))
+    shapes.sort(key=lambda s: (s.cost is None, -(s.cost or 0), s.signature))
+    sugs = sorted(suggestions.values(),
+                  key=lambda s: (-s.cost, s.kind, s.relation, s.fields))
+    return IndexAdvice(
+        suggestions=[IndexSuggestion(
+                kind=s.kind,
+                relation=s.relation,
+                fields=list(s.fields),
+                cost=s.cost,
+                executions=s.executions,
+                signatures=[sig for _, sig in sorted(s.shapes, key=lambda x: (-x[0], x[1]))],
+            ) for s in sugs],
+        shapes=shapes,
+    )
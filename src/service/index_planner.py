@@ -0,0 +1,88 @@
+"""
+Plans persistent indexes for sorting and range filtering on the columns of data products
+that are tables of attributes.
+
+Queries that don't use an ArangoSearch view filter on the collection ID and load version and
+may sort on any column. Without an index starting with those fields and ending with the sort
+column, such a query scans every document in the load version and sorts them in memory. Each
+index slows writes and uses memory and disk, so the number of indexes planned per database
+collection is limited by a budget. Columns present in the specs of more KBase collections are
+planned first.
+"""
+
+from typing import Callable, NamedTuple
+
+from src.common.collection_column_specs import load_specs
+from src.common.product_models.columnar_attribs_common_models import (
+    ColumnarAttributesSpec,
+    ColumnType,
+)
+import src.common.storage.collection_and_field_names as names
+from src.service.data_products.common_models import DataProductSpec
+
+
+DEFAULT_INDEX_BUDGET = 8
+""" The default maximum number of column indexes to plan per database collection. """
+
+_INDEXED_TYPES = {ColumnType.INT, ColumnType.FLOAT}
+
+
+class ColumnIndexPlan(NamedTuple):
+    """ The planned column indexes. """
+
+    indexes: dict[str, list[tuple[str, ...]]]
+    """
+    The planned indexes as a mapping of the database collection name to the index fields,
+    in priority order.
+    """
+
+    over_budget: dict[str, list[str]]
+    """
+    The columns that qualify for an index but were not planned due to the budget as a mapping
+    of the database collection name to the column names, in priority order.
+    """
+
+
+def _load_specs(data_product: str) -> dict[str, ColumnarAttributesSpec]:
+    return {coll: load_specs.load_spec(data_product, coll)
+            for coll in load_specs.get_collections_for_data_product(data_product)}
+
+
+def plan_column_indexes(
+    data_products: list[DataProductSpec],
+    budget: int = DEFAULT_INDEX_BUDGET,
+    spec_provider: Callable[[str], dict[str, ColumnarAttributesSpec]] = _load_specs,
+) -> ColumnIndexPlan:
+    """
+    Plan persistent indexes on (collection ID, load version, column) for the visible numeric
+    columns of data products with column specs.
+
+    Indexes for data products without a non-generic view, and therefore without column specs,
+    are not planned. Indexes already required by a data product are not planned and don't
+    count toward the budget.
+
+    data_products - the data products to plan.
+    budget - the maximum number of indexes to plan per database collection.
+    spec_provider - a function that, given a data product ID, provides the column specs for the
+        data product as a mapping of the KBase collection ID to the spec.
+    """
+    if budget < 0:
+        raise ValueError("budget must be >= 0")
+    indexes = {}
+    over_budget = {}
+    for dp in data_products:
+        for dbc in dp.db_collections:
+            if not dbc.view_required or dbc.generic_view_required:
+                continue
+            existing = {tuple(idx) for idx in dbc.indexes}
+            colcount = {}
+            for spec in spec_provider(dp.data_product).values():
+                for col in spec.columns:
+                    if col.type in _INDEXED_TYPES and not col.non_visible:
+                        colcount[col.key] = colcount.get(col.key, 0) + 1
+            cols = [c for c in sorted(colcount, key=lambda c: (-colcount[c], c))
+                    if (names.FLD_COLLECTION_ID, names.FLD_LOAD_VERSION, c) not in existing]
+            indexes[dbc.name] = [
+                (names.FLD_COLLECTION_ID, names.FLD_LOAD_VERSION, c) for c in cols[:budget]]
+            over_budget[dbc.name] = cols[budget:]
+    return ColumnIndexPlan(indexes=indexes, over_budget=over_budget)
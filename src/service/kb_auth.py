@@ -12,6 +12,7 @@ import logging
 import time
 from typing import List, NamedTuple, Self
 
+from src.service import metrics
 from src.service.arg_checkers import not_falsy as _not_falsy
 from src.service.user import UserID
 
@@ -31,11 +32,15 @@ class KBaseUser(NamedTuple):
     token: str
 
 
-async def _get(url, headers):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as r:
-            await _check_error(r)
-            return await r.json()
+async def _get(url, headers, metric_method):
+    start = time.perf_counter()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url, headers=headers) as r:
+                await _check_error(r)
+                return await r.json()
+    finally:
+        metrics.observe_outbound("auth", metric_method, start)
 
 
 async def _check_error(r):
@@ -77,7 +82,7 @@ class KBaseAuth:
         '''
         if not _not_falsy(auth_url, "auth_url").endswith('/'):
             auth_url += '/'
-        j = await _get(auth_url, {'Accept': 'application/json'})
+        j = await _get(auth_url, {'Accept': 'application/json'}, 'root')
         return KBaseAuth(
             auth_url, full_admin_roles, cache_max_size, cache_expiration, j.get('servicename')
         )
@@ -114,7 +119,7 @@ class KBaseAuth:
         admin_cache = self._admin_cache.get(token, default=False)
         if admin_cache:
             return KBaseUser(admin_cache[1], admin_cache[0], token) 
-        j = await _get(self._me_url, {"Authorization": token})
+        j = await _get(self._me_url, {"Authorization": token}, "me")
         v = (self._get_role(j['customroles']), UserID(j['user']))
         self._admin_cache.set(token, v)
         return KBaseUser(v[1], v[0], token)
@@ -0,0 +1,228 @@
+"""
+Prometheus metrics for the service.
+
+Metrics are registered in the default prometheus_client registry. If the
+PROMETHEUS_MULTIPROC_DIR environment variable is set, prometheus_client's multiprocess mode is
+used so that metrics from any worker processes are aggregated; see the prometheus_client
+documentation.
+"""
+
+import os
+import threading
+import time
+from multiprocessing.process import BaseProcess
+from typing import Any, Iterable
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from prometheus_client.registry import Collector
+
+
+_PROMETHEUS_MULTIPROC_DIR = "PROMETHEUS_MULTIPROC_DIR"
+
+_NAMESPACE = "collections"
+
+# Label used for requests that don't match a route, to prevent unbounded label cardinality
+# from arbitrary 404 paths.
+UNMATCHED_ROUTE = "<unmatched>"
+
+# Label used for AQL queries without a collection or view bind variable
+NO_COLLECTION = "<none>"
+
+# Label used for database operations that don't specify an operation name
+NO_OP = "<none>"
+
+_BATCH_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf"))
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status code.",
+    ["method", "route", "status"],
+    namespace=_NAMESPACE,
+)
+
+AQL_EXECUTE_LATENCY = Histogram(
+    "aql_execute_duration_seconds",
+    "Time to execute an AQL query and return the first batch of results, by the operation "
+        + "and the collection or view queried.",
+    ["op", "collection"],
+    namespace=_NAMESPACE,
+)
+
+AQL_CURSOR_BATCHES = Histogram(
+    "aql_cursor_batches",
+    "The number of batches fetched from the server per AQL cursor, by the operation "
+        + "and the collection or view queried. Recorded when the cursor is closed.",
+    ["op", "collection"],
+    namespace=_NAMESPACE,
+    buckets=_BATCH_BUCKETS,
+)
+
+DOCUMENT_READ_LATENCY = Histogram(
+    "document_read_duration_seconds",
+    "Time to read documents by key via the document API, by the operation and the "
+        + "collection read. Multi-document reads are recorded once per request.",
+    ["op", "collection"],
+    namespace=_NAMESPACE,
+)
+
+OUTBOUND_LATENCY = Histogram(
+    "outbound_request_duration_seconds",
+    "Latency of requests to other services, by service and method.",
+    ["service", "method"],
+    namespace=_NAMESPACE,
+)
+
+RESULT_CACHE_LOOKUPS = Counter(
+    "result_cache_lookups",
+    "Lookups in the filtered query result cache, by result (hit or miss). The hit ratio is "
+        + "the rate of hits divided by the rate of all lookups.",
+    ["result"],
+    namespace=_NAMESPACE,
+)
+
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls",
+    "Calls to coalesced data product reads, by whether the call ran (run) or waited for an "
+        + "identical call already in flight (coalesced).",
+    ["result"],
+    namespace=_NAMESPACE,
+)
+
+NOT_MODIFIED_RESPONSES = Counter(
+    "not_modified_responses",
+    "304 Not Modified responses to conditional requests, by whether the response was sent "
+        + "from the ETag registry without calling the route (registry) or after calling the "
+        + "route (route).",
+    ["source"],
+    namespace=_NAMESPACE,
+)
+
+
+def get_collection_label(bind_vars: dict[str, Any] | None) -> str:
+    """
+    Get the name of the collection or view queried by an AQL query from the query's bind
+    variables, or a placeholder if there is no collection or view bind variable. If there is more
+    than one, the first is used.
+
+    bind_vars - the bind variables for the query.
+    """
+    if bind_vars:
+        for k, v in bind_vars.items():
+            if k.startswith("@"):
+                return v
+    return NO_COLLECTION
+
+
+class _RunningProcessCollector(Collector):
+    """
+    Tracks processes started by the service and reports the number of running processes
+    by name when the metrics are collected.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._procs: dict[BaseProcess, str] = {}
+
+    def add(self, process: BaseProcess, name: str):
+        with self._lock:
+            self._procs[process] = name
+
+    def collect(self) -> Iterable[GaugeMetricFamily]:
+        g = GaugeMetricFamily(
+            f"{_NAMESPACE}_subset_processes_running",
+            "The number of running subset and subset cleanup processes started by this "
+                + "service instance, by process name.",
+            labels=["process"],
+        )
+        counts = {}
+        with self._lock:
+            for p, name in list(self._procs.items()):
+                if p.is_alive():
+                    counts[name] = counts.get(name, 0) + 1
+                else:
+                    del self._procs[p]
+                    counts.setdefault(name, 0)
+        for name, count in sorted(counts.items()):
+            g.add_metric([name], count)
+        yield g
+
+
+_RUNNING_PROCESSES = _RunningProcessCollector()
+REGISTRY.register(_RUNNING_PROCESSES)
+
+
+def track_process(process: BaseProcess, name: str):
+    """
+    Track a running process for the purposes of reporting the number of running processes.
+
+    process - the process.
+    name - the name of the process to use in the metrics.
+    """
+    _RUNNING_PROCESSES.add(process, name)
+
+
+def observe_outbound(service: str, method: str, start: float):
+    """
+    Record the latency of a request to another service.
+
+    service - the name of the service.
+    method - the method or endpoint called.
+    start - the start time of the call from time.perf_counter().
+    """
+    OUTBOUND_LATENCY.labels(service, method).observe(time.perf_counter() - start)
+
+
+def generate_metrics() -> tuple[bytes, str]:
+    """
+    Generate the metrics in the Prometheus text format.
+
+    Returns a tuple of the metrics and the content type.
+    """
+    if os.environ.get(_PROMETHEUS_MULTIPROC_DIR):
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        # the running process collector isn't file based, so add it separately
+        registry.register(_RUNNING_PROCESSES)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records request latency by route template and status code.
+    """
+
+    def __init__(self, app):
+        self._app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self._app(scope, receive, send)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self._app(scope, receive, send_wrapper)
+        finally:
+            # the router sets the route in the scope when it finds a match
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], route.path if route else UNMATCHED_ROUTE, str(status)
+            ).observe(time.perf_counter() - start)
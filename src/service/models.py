@@ -139,9 +139,23 @@ class DynamicConfig(BaseModel):
             + "after the new view is built."
          
     )] = {}
+    aql_profiling: Annotated[bool, Field(
+        example=True,
+        description="Whether to profile AQL queries. When enabled, queries that take longer "
+            + "than aql_slow_query_ms to return the first batch of results are explained, "
+            + "logged, and recorded for the slow query admin endpoint. Each service instance "
+            + "profiles its own queries."
+    )] = False
+    aql_slow_query_ms: Annotated[int, Field(
+        example=500,
+        ge=0,
+        description="The threshold in milliseconds above which a query is considered slow "
+            + "when AQL profiling is enabled."
+    )] = 1000
     
     def is_empty(self):
-        return not self.search_views
+        # fields explicitly set to their default values are not empty
+        return not self.model_fields_set
 
 
 class DataProduct(BaseModel):
@@ -521,6 +535,19 @@ class SubsetType(str, Enum):
     """ A subset based on a user selection. """
 
 
+class SetOperation(str, Enum):
+    """ An operation combining the members of data subsets. """
+
+    UNION = "union"
+    """ The data in any of the subsets. """
+
+    INTERSECTION = "intersection"
+    """ The data in all of the subsets. """
+
+    DIFFERENCE = "difference"
+    """ The data in the first subset that is not in any of the other subsets. """
+
+
 class DataProductProcessIdentifier(BaseModel):
     """
     Uniquely identifies a data product process based on the internal ID of the parent data,
@@ -11,6 +11,8 @@ import multiprocessing
 from pydantic import BaseModel, Field
 from typing import Callable, Any, Awaitable
 from src.service.app_state_data_structures import PickleableDependencies, CollectionsState
+from src.service import etags
+from src.service import metrics
 from src.service import models
 from src.service.storage_arango import ArangoStorage
 from src.service.timestamp import now_epoch_millis
@@ -58,7 +60,9 @@ def run_async_process(target: Callable, args: list[Any]):
     loop.
     """
     ctx = multiprocessing.get_context("forkserver")
-    ctx.Process(target=_run_async_process, args=[target, args]).start()
+    proc = ctx.Process(target=_run_async_process, args=[target, args])
+    proc.start()
+    metrics.track_process(proc, f"{target.__module__.split('.')[-1]}.{target.__qualname__}")
 
 
 def _run_async_process(target: Callable, args: list[Any]):
@@ -194,6 +198,7 @@ async def get_or_create_data_product_process(
         )
         _start_process(
             dpid.internal_id, _process_subset, appstate.get_pickleable_dependencies(), args)
+    etags.record_subset(dp_proc.type.value, dp_proc.internal_id, dp_proc.is_complete())
     return dp_proc
 
 
@@ -6,6 +6,7 @@ import hashlib
 import logging
 import uuid
 
+from collections.abc import Iterable
 from typing import Callable, Awaitable, Any
 
 from src.service.app_state_data_structures import CollectionsState, PickleableDependencies
@@ -15,12 +16,15 @@ from src.service import errors
 from src.service import kb_auth
 from src.service import models
 from src.service import processing
+from src.service import processing_matches
 from src.service.storage_arango import ArangoStorage
 from src.service.workspace_wrapper import WorkspaceWrapper, SetSpec
 
 
 MAX_SELECTION_IDS = 10000
 
+MAX_SET_OPERANDS = 10
+
 # The set descriptions go in the workspace metadata, which has a maximum size of 900 for the
 # key and value
 _MAX_DESCRIPTION_LENGTH=800
@@ -87,10 +91,22 @@ async def save_selection(
         raise errors.IllegalParameterError(f"No selection IDs specified")
     if len(selection_ids) > MAX_SELECTION_IDS:
         raise errors.IllegalParameterError(f"At most {MAX_SELECTION_IDS} can be submitted")
+    coll = await _get_selectable_collection(appstate, collection_id)
+    return await _save_selection(appstate, coll, selection_ids)
+
+
+async def _get_selectable_collection(appstate: CollectionsState, collection_id: str
+) -> models.SavedCollection:
     coll = await appstate.arangostorage.get_collection_active(collection_id)
     if not coll.default_select:
         raise errors.IllegalParameterError(
             f"Collection {coll.id} version {coll.ver_num} is not configured to allow selections")
+    return coll
+
+
+async def _save_selection(
+    appstate: CollectionsState, coll: models.SavedCollection, selection_ids: list[str]
+) -> models.Selection:
     selection_ids = sorted(set(selection_ids))  # remove duplicates
     now = appstate.get_epoch_ms()
     int_sel = models.InternalSelection(
@@ -113,6 +129,140 @@ async def save_selection(
     return curr_sel
 
 
+def combine_memberships(operation: models.SetOperation, memberships: list[Iterable[str]]
+) -> list[str]:
+    """
+    Combine the members of data subsets.
+
+    Returns the sorted IDs of the data in the combined subset.
+
+    operation - the operation to apply. The difference operation removes the members of all
+        the subsets after the first from the first subset.
+    memberships - the IDs of the data in each subset.
+    """
+    if not memberships:
+        raise ValueError("At least one subset is required")
+    first, rest = set(memberships[0]), [set(m) for m in memberships[1:]]
+    if operation == models.SetOperation.UNION:
+        result = first.union(*rest)
+    elif operation == models.SetOperation.INTERSECTION:
+        result = first.intersection(*rest)
+    elif operation == models.SetOperation.DIFFERENCE:
+        result = first.difference(*rest)
+    else:
+        raise ValueError(f"Unsupported operation: {operation}")
+    return sorted(result)
+
+
+async def combine_subsets(
+    appstate: CollectionsState,
+    collection_id: str,
+    operation: models.SetOperation,
+    operands: list[tuple[models.SubsetType, str]],
+    user: kb_auth.KBaseUser = None,
+) -> models.Selection:
+    """
+    Save a selection combining the members of existing matches and selections and start the
+    process to apply the selection to the collection data.
+
+    The members are taken from the match and selection records in the service database, so the
+    data IDs are never sent to or from the client. The matches and selections must be complete
+    and must be for the active version of the collection, or for a prior version with the same
+    load version of the collection's selection data product.
+
+    As with save_selection, the resulting selection may contain at most MAX_SELECTION_IDS
+    data IDs.
+
+    appstate - the application state, including the database where the selection will be saved.
+    collection_id - the ID of collection the selection applies to.
+    operation - the operation to apply. The difference operation removes the members of all
+        the subsets after the first from the first subset.
+    operands - the matches and selections to combine, as (type, ID) tuples.
+    user - the user combining the subsets. Required if any of the subsets are matches.
+    """
+    if len(operands) < 2:
+        raise errors.IllegalParameterError("At least 2 matches or selections are required")
+    if len(operands) > MAX_SET_OPERANDS:
+        raise errors.IllegalParameterError(
+            f"At most {MAX_SET_OPERANDS} matches or selections can be combined")
+    coll = await _get_selectable_collection(appstate, collection_id)
+    load_vers = {coll.ver_num: coll.get_data_product(coll.default_select).version}
+    memberships = []
+    for type_, id_ in operands:
+        if type_ == models.SubsetType.MATCH:
+            subset, ids = await _get_match_membership(appstate, coll, id_, user)
+        else:
+            subset, ids = await _get_selection_membership(appstate, coll, id_)
+        await _check_load_version(appstate, coll, load_vers, type_, id_, subset)
+        memberships.append(ids)
+    selection_ids = combine_memberships(operation, memberships)
+    if not selection_ids:
+        raise errors.IllegalParameterError(
+            f"The {operation.value} of the matches and selections contains no data")
+    if len(selection_ids) > MAX_SELECTION_IDS:
+        raise errors.IllegalParameterError(
+            f"The {operation.value} of the matches and selections contains "
+            + f"{len(selection_ids)} data IDs, but a selection may contain at most "
+            + f"{MAX_SELECTION_IDS}")
+    return await _save_selection(appstate, coll, selection_ids)
+
+
+async def _get_match_membership(
+    appstate: CollectionsState,
+    coll: models.SavedCollection,
+    match_id: str,
+    user: kb_auth.KBaseUser,
+) -> tuple[models.CollectionSpec, list[str]]:
+    if not user:
+        raise errors.UnauthorizedError("Authentication is required to combine matches")
+    match = await processing_matches.get_match_full(
+        appstate, match_id, user, verbose=True, require_complete=True)
+    matcher = appstate.get_matcher(match.matcher_id)
+    if not matcher or coll.default_select not in matcher.required_data_products:
+        raise errors.IllegalParameterError(
+            f"Match {match_id} from matcher {match.matcher_id} does not match data in the "
+            + f"{coll.default_select} data product")
+    return match, match.matches
+
+
+async def _get_selection_membership(
+    appstate: CollectionsState, coll: models.SavedCollection, selection_id: str
+) -> tuple[models.CollectionSpec, set[str]]:
+    sel = await get_selection_full(appstate, selection_id, verbose=True, require_complete=True)
+    if sel.data_product != coll.default_select:
+        raise errors.IllegalParameterError(
+            f"Selection {selection_id} applies to the {sel.data_product} data product, not "
+            + f"{coll.default_select}")
+    # IDs that weren't found in the data are not members of the selection
+    return sel, set(sel.selection_ids) - set(sel.unmatched_ids or [])
+
+
+async def _check_load_version(
+    appstate: CollectionsState,
+    coll: models.SavedCollection,
+    load_vers: dict[int, str],
+    type_: models.SubsetType,
+    subset_id: str,
+    subset: models.CollectionSpec,
+):
+    # Code is similar to the collection checks when getting a match or selection, but the
+    # collection version may differ as long as the data is the same
+    err = (errors.InvalidMatchStateError if type_ == models.SubsetType.MATCH
+           else errors.InvalidSelectionStateError)
+    name = type_.value.capitalize()
+    if subset.collection_id != coll.id:
+        raise err(f"{name} {subset_id} is for collection {subset.collection_id}, not {coll.id}")
+    if subset.collection_ver not in load_vers:
+        subcoll = await appstate.arangostorage.get_collection_version_by_num(
+            coll.id, subset.collection_ver)
+        dps = {dp.product: dp.version for dp in subcoll.data_products}
+        load_vers[subset.collection_ver] = dps.get(coll.default_select)
+    if load_vers[subset.collection_ver] != load_vers[coll.ver_num]:
+        raise err(f"{name} {subset_id} is for collection version {subset.collection_ver}, "
+                  + f"which has a different {coll.default_select} load version than the "
+                  + f"current version {coll.ver_num}")
+
+
 # assumes selection_ids are sorted
 def _calc_selection_md5(coll: models.SavedCollection, selection_ids: list[str]) -> str:
     # this would be better if it just happened automatically when constructing the pydantic
@@ -5,7 +5,7 @@ Routes for general collections endpoints, as opposed to endpoint for a particula
 import asyncio
 import jsonschema
 
-from fastapi import APIRouter, Request, Depends, Path, Query, Body
+from fastapi import APIRouter, Request, Depends, Path, Query, Body, Response
 from typing import Any, Annotated
 from pydantic import BaseModel, Field
 from src.common.git_commit import GIT_COMMIT
@@ -13,10 +13,13 @@ from src.common.version import VERSION
 from src.service import app_state
 from src.service import data_product_specs
 from src.service import errors
+from src.service import index_advisor
 from src.service import kb_auth
+from src.service import metrics
 from src.service import models
 from src.service import processing_matches
 from src.service import processing_selections
+from src.service.aql_profiler import SlowQuery
 from src.service.http_bearer import KBaseHTTPBearer
 from src.service.matchers.common_models import Matcher
 from src.service.routes_common import PATH_VALIDATOR_COLLECTION_ID, err_on_control_chars
@@ -35,6 +38,7 @@ ROUTER_COLLECTIONS_ADMIN = APIRouter(tags=["Collection Administration"])
 ROUTER_DANGER = APIRouter(tags=["Here be Dragons"])
 
 _AUTH = KBaseHTTPBearer()
+_OPT_AUTH = KBaseHTTPBearer(optional=True)
 
 
 def _ensure_admin(user: kb_auth.KBaseUser, err_msg: str):
@@ -86,7 +90,7 @@ async def _check_collection_state(
 
 
 async def _activate_collection_version(
-    user: kb_auth.KBaseUser, store: ArangoStorage, col: models.SavedCollection
+    r: Request, user: kb_auth.KBaseUser, store: ArangoStorage, col: models.SavedCollection
 ) -> models.ActiveCollection:
     doc = col.dict()
     doc.update({
@@ -98,6 +102,13 @@ async def _activate_collection_version(
     })
     ac = models.ActiveCollection.construct(**doc)
     await store.save_collection_active(ac)
+    appstate = app_state.get_app_state(r)
+    if appstate.genome_attribs_snapshots:
+        appstate.genome_attribs_snapshots.activate(ac)
+    if appstate.result_cache:
+        appstate.result_cache.invalidate(ac.id)
+    if appstate.etags:
+        appstate.etags.invalidate(ac.id)
     return ac
 
 
@@ -132,6 +143,23 @@ _QUERY_MAX_VER = Query(
         + "the versions"
 )
 
+_QUERY_SLOW_QUERY_LIMIT = Query(
+    default=20,
+    ge=1,
+    le=1000,
+    example=10,
+    description="The maximum number of slow query signatures to return."
+)
+
+_QUERY_ADVICE_MAX_SHAPES = Query(
+    default=100,
+    ge=1,
+    le=1000,
+    example=10,
+    description="The maximum number of query shapes to explain. The shapes with the most "
+        + "executions are explained."
+)
+
 _QUERY_MATCH_VERBOSE = Query(
     default=False,
     example=False,
@@ -199,6 +227,33 @@ class SelectionInput(BaseModel):
     )
 
 
+class SubsetOperand(BaseModel):
+    """ A match or selection to combine with other matches and selections. """
+    type: models.SubsetType = Field(
+        example=models.SubsetType.MATCH.value,
+        description="The type of the subset."
+    )
+    id: str = Field(
+        example="fc2c3b1fd1b5a5a3ef8fcb1bb4a7b9a0",
+        description="The ID of the match or selection."
+    )
+
+
+class SelectionCombination(BaseModel):
+    """ A combination of the data in matches and selections. """
+    operation: models.SetOperation = Field(
+        example=models.SetOperation.INTERSECTION.value,
+        description="The operation to apply to the matches and selections. The difference "
+            + "operation removes the data in all the subsets after the first from the first "
+            + "subset."
+    )
+    subsets: list[SubsetOperand] = Field(
+        min_length=2,
+        max_length=processing_selections.MAX_SET_OPERANDS,
+        description="The matches and selections to combine, in order."
+    )
+
+
 class SelectionTypes(BaseModel):
     """ The set of types available for export to a workspace in a collection. """
     types: list[str] = Field(
@@ -242,6 +297,11 @@ class CollectionVersions(BaseModel):
     data: list[models.SavedCollection]
 
 
+class SlowQueries(BaseModel):
+    """ The slowest AQL query signatures recorded by the AQL profiler. """
+    data: list[SlowQuery]
+
+
 class DeletedSubsets(BaseModel):
     """
     IDs of the matches and selections that were moved to the deleted state.
@@ -260,6 +320,19 @@ async def root():
     }
 
 
+@ROUTER_GENERAL.get(
+    "/metrics",
+    response_class=Response,
+    summary="Get service metrics",
+    description="Get service metrics in the Prometheus text exposition format, including "
+        + "request latency by route, AQL query latency and cursor batch counts, latency of "
+        + "calls to other services, and the number of running subset processes.",
+)
+async def get_metrics():
+    content, content_type = metrics.generate_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 @ROUTER_GENERAL.get("/whoami/", response_model = WhoAmI)
 async def whoami(user: kb_auth.KBaseUser=Depends(_AUTH)):
     return {
@@ -336,6 +409,32 @@ async def create_selection(
         appstate, collection_id, selection.selection_ids)
 
 
+@ROUTER_COLLECTIONS.post(
+    "/collections/{collection_id}/selections/combine",
+    response_model=models.Selection,
+    summary="Create a data selection from matches and selections",
+    description="Create a data selection from the union, intersection, or difference of the "
+        + "data in existing matches and selections. The matches and selections must be "
+        + "complete and must be for the same load version of the data as the current "
+        + "version of the collection. The resulting selection may contain at most "
+        + f"{processing_selections.MAX_SELECTION_IDS} data IDs. Authentication is required "
+        + "if any of the subsets are matches."
+)
+async def combine_selections(
+    r: Request,
+    combination: SelectionCombination,
+    collection_id: str = PATH_VALIDATOR_COLLECTION_ID,
+    user: kb_auth.KBaseUser = Depends(_OPT_AUTH),
+) -> models.Selection:
+    return await processing_selections.combine_subsets(
+        app_state.get_app_state(r),
+        collection_id,
+        combination.operation,
+        [(s.type, s.id) for s in combination.subsets],
+        user,
+    )
+
+
 @ROUTER_MATCHES.get(
     "/matchers/",
     response_model=MatcherList,
@@ -538,7 +637,7 @@ async def activate_collection_by_ver_tag(
 ) -> models.ActiveCollection:
     store = _precheck_admin_and_get_storage(r, user, ver_tag, "activate a collection version")
     col = await store.get_collection_version_by_tag(collection_id, ver_tag)
-    return await _activate_collection_version(user, store, col)
+    return await _activate_collection_version(r, user, store, col)
 
 
 @ROUTER_COLLECTIONS_ADMIN.get(
@@ -567,7 +666,7 @@ async def activate_collection_by_ver_num(
 ) -> models.ActiveCollection:
     store = _precheck_admin_and_get_storage(r, user, "", "activate a collection version")
     col = await store.get_collection_version_by_num(collection_id, ver_num)
-    return await _activate_collection_version(user, store, col)
+    return await _activate_collection_version(r, user, store, col)
 
 
 @ROUTER_COLLECTIONS_ADMIN.get(
@@ -603,6 +702,44 @@ async def get_config(r: Request, user: kb_auth.KBaseUser=Depends(_AUTH)) -> mode
     return await app_state.get_app_state(r).dyncfgman.get_config()
 
 
+@ROUTER_COLLECTIONS_ADMIN.get(
+    "/slowqueries/",
+    response_model=SlowQueries,
+    description="Get the slowest AQL query signatures recorded by this service instance, "
+        + "ordered by maximum execution time. Queries are only recorded when AQL profiling is "
+        + "enabled in the service dynamic configuration. Statistics are held in memory and "
+        + "are lost on a service restart."
+)
+async def get_slow_queries(
+    r: Request,
+    limit: int = _QUERY_SLOW_QUERY_LIMIT,
+    user: kb_auth.KBaseUser=Depends(_AUTH)
+) -> SlowQueries:
+    _ensure_admin(user, "Only collections service admins can view slow queries")
+    return SlowQueries(data=app_state.get_app_state(r).aql_profiler.get_slowest(limit))
+
+
+@ROUTER_COLLECTIONS_ADMIN.get(
+    "/indexadvice/",
+    response_model=index_advisor.IndexAdvice,
+    description="Suggest indexes and ArangoSearch view stored values for the shapes of "
+        + "filtered data product queries recorded by all service instances in the last week. "
+        + "Each query shape is explained and suggestions are ranked by the summed estimated "
+        + "cost of the query plans of the shapes that would benefit, multiplied by the number "
+        + "of executions of each shape. Suggestions are not applied automatically."
+)
+async def get_index_advice(
+    r: Request,
+    max_shapes: int = _QUERY_ADVICE_MAX_SHAPES,
+    user: kb_auth.KBaseUser=Depends(_AUTH)
+) -> index_advisor.IndexAdvice:
+    _ensure_admin(user, "Only collections service admins can view index advice")
+    appstate = app_state.get_app_state(r)
+    counts = await appstate.query_shapes.get_counts() if appstate.query_shapes else []
+    return await index_advisor.advise(
+        counts, appstate.arangostorage.explain_aql, max_shapes=max_shapes)
+
+
 @ROUTER_DANGER.delete(
     "/admin/matches/{match_id}/",
     response_model=models.MatchVerbose,
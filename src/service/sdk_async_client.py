@@ -4,8 +4,11 @@ A minimal async client for talking to KBase SDK generated servers (for example t
 
 import aiohttp
 import random
+import time
 from typing import Any
 
+from src.service import metrics
+
 
 class ServerError(Exception):
 
@@ -46,6 +49,14 @@ class SDKAsyncClient:
 
         Returns will be as documented in the spec for the respective service.
         """
+        start = time.perf_counter()
+        try:
+            return await self._call(method, params, token)
+        finally:
+            # the service name is the module name, e.g. Workspace for Workspace.ver
+            metrics.observe_outbound(method.split(".")[0], method, start)
+
+    async def _call(self, method: str, params: list[Any], token: str):
         body = {
             'method': method,
             'params': params or [],
@@ -0,0 +1,75 @@
+"""
+Coalescing of identical concurrent requests.
+
+When many clients request the same data at the same time, for example when a popular collection
+page loads, each request would otherwise run its own database queries. A `SingleFlight` runs
+only the first of a set of concurrent calls with the same key and hands its result, or
+exception, to all the callers.
+
+Keys must include everything that determines the result - the operation, the canonical
+parameters, the load version, and any subsets - and the calls must be made after any
+authorization checks, since a caller receives results computed for another caller.
+Results are shared between callers and so must not be modified.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from src.service import metrics
+
+
+T = TypeVar("T")
+
+
+class _Call:
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, sharing the result between concurrent callers.
+
+    The shared call runs in its own task, so a cancelled caller, e.g. on a client disconnect,
+    does not cancel the call for the other callers. The call is cancelled only when all its
+    callers are cancelled.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a call, or wait for the result of an in flight call with the same key.
+
+        key - the key for the call. Calls with the same key must return the same result.
+        func - a function returning the awaitable to run if no call with the key is in flight.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            metrics.SINGLE_FLIGHT_CALLS.labels("run").inc()
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._remove(key, call))
+        else:
+            metrics.SINGLE_FLIGHT_CALLS.labels("coalesced").inc()
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                # all the callers were cancelled
+                call.task.cancel()
+                self._remove(key, call)
+
+    def _remove(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    @property
+    def in_flight(self) -> int:
+        """ The number of calls currently in flight. """
+        return len(self._calls)
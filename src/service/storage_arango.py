@@ -12,6 +12,9 @@ A storage system for collections based on an Arango backend.
 #
 #
 
+import asyncio
+import time
+
 from aioarango.cursor import Cursor
 from aioarango.database import StandardDatabase
 from aioarango.exceptions import (
@@ -22,7 +25,7 @@ from aioarango.exceptions import (
 )
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from typing import Any, Callable, Awaitable, Self
+from typing import TYPE_CHECKING, Any, Callable, Awaitable, NamedTuple, Self
 from src.common.hash import md5_string
 from src.common.product_models.columnar_attribs_common_models import (
     ColumnarAttributesSpec,
@@ -31,7 +34,15 @@ from src.common.product_models.columnar_attribs_common_models import (
 from src.common.storage import collection_and_field_names as names
 from src.service import models
 from src.service import errors
+from src.service import metrics
+from src.service.aql_profiler import AQLProfiler
+from src.service.batch_sizer import BatchSizer
 from src.service.data_products.common_models import DataProductSpec
+from src.service.filtering import view_definitions
+
+if TYPE_CHECKING:
+    # the query shape code depends on this module
+    from src.service.filtering.query_shapes import QueryShape, QueryShapeRecorder
 
 
 _ERRMAP = {
@@ -50,6 +61,9 @@ _FLD_COUNTER = "counter"
 _FLD_VER_NUM = "ver_num"
 _FLD_LIMIT = "limit"
 
+# the maximum number of documents to fetch per request in get_docs_by_key
+_MULTI_GET_BATCH = 1000
+
 _ARANGO_SPECIAL_KEYS = [names.FLD_ARANGO_KEY, names.FLD_ARANGO_ID, "_rev"]
 _ARANGO_ERR_COLL_OR_VIEW_NOT_FOUND = 1203
 ARANGO_ERR_NAME_EXISTS = 1207
@@ -65,6 +79,8 @@ _COLLECTIONS = [  # Might want to define this in names?
     names.COLL_SRV_DATA_PRODUCT_PROCESSES,
     names.COLL_SRV_SELECTIONS,
     names.COLL_SRV_SELECTIONS_DELETED,
+    names.COLL_SRV_SUBSET_BITMAPS,
+    names.COLL_SRV_QUERY_SHAPES,
     names.COLL_EXPORT_TYPES,
 ]
 _BUILTIN = "builtin"
@@ -82,11 +98,6 @@ class ViewExistsError(Exception):
 # Seems incredibly unlikely
 
 
-async def _check_collection_exists(db: StandardDatabase, col_name: str):
-    if not await db.has_collection(col_name):
-        raise ValueError(f"Collection {col_name} does not exist")
-
-
 async def _create_collection(db: StandardDatabase, col_name: str):
     """
     Create a collection, ignoring a duplicate name error
@@ -98,6 +109,108 @@ async def _create_collection(db: StandardDatabase, col_name: str):
             raise  # if collection exists, ignore, otherwise raise
 
 
+# service collection -> indexes
+_SERVICE_INDEXES = {
+    names.COLL_SRV_VERSIONS: [[models.FIELD_COLLECTION_ID, models.FIELD_VER_NUM]],
+    names.COLL_SRV_MATCHES: [
+        # find matches ready to be moved to the deleted state
+        [models.FIELD_LAST_ACCESS],
+        # find matches by internal match ID
+        [models.FIELD_MATCH_INTERNAL_MATCH_ID],
+        # find matches by collection version
+        [models.FIELD_COLLSPEC_COLLECTION_ID, models.FIELD_COLLSPEC_COLLECTION_VER],
+    ],
+    names.COLL_SRV_SELECTIONS: [
+        # find selections ready to be moved to the deleted state
+        [models.FIELD_LAST_ACCESS],
+        # find selections by internal selection ID
+        [models.FIELD_SELECTION_INTERNAL_SELECTION_ID],
+        # find selections by collection version
+        [models.FIELD_COLLSPEC_COLLECTION_ID, models.FIELD_COLLSPEC_COLLECTION_VER],
+    ],
+    names.COLL_SRV_QUERY_SHAPES: [
+        # find expired query shape counts
+        [names.FLD_QUERY_SHAPE_BUCKET],
+    ],
+    names.COLL_EXPORT_TYPES: [
+        [names.FLD_COLLECTION_ID, names.FLD_DATA_PRODUCT, names.FLD_LOAD_VERSION]
+    ],
+}
+
+
+class SchemaChanges(NamedTuple):
+    """ Changes required to bring the database schema in line with the service requirements. """
+
+    collections: list[str]
+    """ The names of the collections that do not exist. """
+
+    indexes: list[tuple[str, tuple[str, ...]]]
+    """
+    The persistent indexes that do not exist as a list of tuples of the collection name
+    and the index fields.
+    """
+
+
+def _index_exists(existing: list[dict[str, Any]], fields: tuple[str, ...]) -> bool:
+    # matches what add_persistent_index would create with the default arguments, in which
+    # case arango returns the existing index rather than creating a new one
+    return any(idx.get("type") == "persistent"
+               and tuple(idx["fields"]) == fields
+               and not idx.get("unique")
+               and not idx.get("sparse")
+               for idx in existing)
+
+
+async def get_schema_changes(
+    db: StandardDatabase,
+    data_products: list[DataProductSpec] = None,
+    concurrency: int = 10,
+    extra_indexes: dict[str, list[tuple[str, ...]]] = None,
+) -> SchemaChanges:
+    """
+    Determine which collections and indexes need to be created for the service to run, without
+    making any changes to the database. The collection list is fetched once, and the
+    index list is fetched once per existing collection.
+
+    db - the database where the data is stored. The DB must exist.
+    data_products - any data products the database must support.
+    concurrency - the maximum number of concurrent index list requests.
+    extra_indexes - any indexes to check in addition to those required by the service and
+        data products as a mapping of collection name to the index fields, for example
+        the planned column indexes.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be > 0")
+    dps = data_products or []
+    colnames = _get_and_check_col_names(dps)
+    desired = {col: [tuple(idx) for idx in idxs] for col, idxs in _SERVICE_INDEXES.items()}
+    for dp in dps:
+        for col in dp.db_collections:
+            desired.setdefault(col.name, []).extend(tuple(idx) for idx in col.indexes)
+    for col, idxs in (extra_indexes or {}).items():
+        desired.setdefault(col, []).extend(tuple(idx) for idx in idxs)
+    existing_colls = {c["name"] for c in await db.collections()}
+    sem = asyncio.Semaphore(concurrency)
+
+    async def get_indexes(colname):
+        if colname not in existing_colls:
+            return []
+        async with sem:
+            return await db.collection(colname).indexes()
+
+    existing_idxs = await asyncio.gather(*[get_indexes(col) for col in desired])
+    indexes = []
+    for (col, fields_list), existing in zip(desired.items(), existing_idxs):
+        # dict.fromkeys de-duplicates while preserving order
+        for fields in dict.fromkeys(fields_list):
+            if not _index_exists(existing, fields):
+                indexes.append((col, fields))
+    return SchemaChanges(
+        collections=[c for c in colnames if c not in existing_colls],
+        indexes=indexes,
+    )
+
+
 def _version_key(collection_id: str, ver_tag: str):
     return md5_string(f"{collection_id}_{ver_tag}")
 
@@ -165,7 +278,8 @@ class ArangoStorage:
         cls,
         db: StandardDatabase,
         data_products: list[DataProductSpec] = None,
-        create_collections_on_startup: bool = False
+        create_collections_on_startup: bool = False,
+        concurrency: int = 10,
     ) -> Self:
         """
         Create the ArangoDB wrapper.
@@ -178,52 +292,58 @@ class ArangoStorage:
             rather than just checking for their existence. Usually this should be false to
             allow for system administrators to set up sharding to their liking, but auto
             creation is useful for quickly standing up a test service.
+        concurrency - the maximum number of concurrent collection and index creation requests.
+
+        To check what collections and indexes would be created without creating them, use
+        get_schema_changes.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be > 0")
+        changes = await get_schema_changes(db, data_products, concurrency)
+        if changes.collections and not create_collections_on_startup:
+            raise ValueError(f"Collection {changes.collections[0]} does not exist")
+        sem = asyncio.Semaphore(concurrency)
+
+        async def run(coro):
+            async with sem:
+                await coro
+
+        await asyncio.gather(*[run(_create_collection(db, colname))
+                               for colname in changes.collections])
+        await asyncio.gather(*[run(db.collection(colname).add_persistent_index(list(fields)))
+                               for colname, fields in changes.indexes])
+        return ArangoStorage(db)
+
+    def __init__(self, db: StandardDatabase, batch_sizer: BatchSizer = None):
+        self._db = db
+        self._profiler = None
+        self._shape_recorder = None
+        self._batch_sizer = batch_sizer or BatchSizer()
+
+    def set_profiler(self, profiler: AQLProfiler):
         """
-        dps = data_products or []
-        for colname in _get_and_check_col_names(dps):
-            if create_collections_on_startup:
-                await _create_collection(db, colname)
-            else:
-                await _check_collection_exists(db, colname)
-        
-        vercol = db.collection(names.COLL_SRV_VERSIONS)
-        await vercol.add_persistent_index([models.FIELD_COLLECTION_ID, models.FIELD_VER_NUM])
-        
-        matchcol = db.collection(names.COLL_SRV_MATCHES)
-        # find matches ready to be moved to the deleted state
-        await matchcol.add_persistent_index([models.FIELD_LAST_ACCESS])
-        # find matches by internal match ID
-        await matchcol.add_persistent_index([models.FIELD_MATCH_INTERNAL_MATCH_ID])
-        # find matches by collection version
-        await matchcol.add_persistent_index(
-            [models.FIELD_COLLSPEC_COLLECTION_ID, models.FIELD_COLLSPEC_COLLECTION_VER])
+        Set a profiler to record slow AQL queries executed via execute_aql.
 
-        selcol = db.collection(names.COLL_SRV_SELECTIONS)
-        # find selections ready to be moved to the deleted state
-        await selcol.add_persistent_index([models.FIELD_LAST_ACCESS])
-        # find selections by internal selection ID
-        await selcol.add_persistent_index([models.FIELD_SELECTION_INTERNAL_SELECTION_ID])
-        # find selections by collection version
-        await selcol.add_persistent_index(
-            [models.FIELD_COLLSPEC_COLLECTION_ID, models.FIELD_COLLSPEC_COLLECTION_VER])
-        
-        typescol = db.collection(names.COLL_EXPORT_TYPES)
-        await typescol.add_persistent_index(
-            [names.FLD_COLLECTION_ID, names.FLD_DATA_PRODUCT, names.FLD_LOAD_VERSION]
-        )
-        
-        for dp in dps:
-            for col in dp.db_collections:
-                dbcol = db.collection(col.name)
-                for index in col.indexes:
-                    await dbcol.add_persistent_index(index)
+        profiler - the profiler.
+        """
+        self._profiler = profiler
 
-        return ArangoStorage(db)
+    def set_query_shape_recorder(self, recorder: "QueryShapeRecorder"):
+        """
+        Set a recorder to count the shapes of queries executed via execute_aql.
 
-    def __init__(self, db: StandardDatabase):
-        self._db = db
+        recorder - the recorder.
+        """
+        self._shape_recorder = recorder
 
-    async def execute_aql(self, aql_str: str, bind_vars: dict[str, Any] = None, count: bool = False
+    async def execute_aql(
+        self,
+        aql_str: str,
+        bind_vars: dict[str, Any] = None,
+        count: bool = False,
+        batch_size: int = None,
+        query_shape: "QueryShape" = None,
+        op: str = None,
     ) -> Cursor:
         """
         Execute an aql statement.
@@ -232,8 +352,93 @@ class ArangoStorage:
         bind_vars - any bind variables for the AQL string.
         count - True to return the total count for the match. This can be significantly more
              expensive than the query so use the option wisely.
+        batch_size - a hint for the number of documents to fetch from the server per round
+            trip. Once queries for the same operation against the same collection have been
+            closed, the batch size is instead chosen from the observed document size to
+            approach a target batch size in bytes.
+        query_shape - the normalized shape of the query, if the query was generated from a
+            filter set. The execution is counted by the query shape recorder, if any.
+        op - a short, fixed name for the operation executing the query, e.g.
+            `get_collection_active`. Used to label metrics and slow queries and to group
+            queries for batch sizing. Never include request specific values.
+
+        Batches after the first are parsed as they arrive, so documents are returned by the
+        cursor before the remainder of the batch has been received.
+        """
+        op = op or metrics.NO_OP
+        coll = metrics.get_collection_label(bind_vars)
+        start = time.perf_counter()
+        cur = await self._db.aql.execute(
+            aql_str,
+            bind_vars=bind_vars or {},
+            count=count,
+            batch_size=self._batch_sizer.batch_size((op, coll), batch_size),
+            stream_batches=True,
+        )
+        elapsed = time.perf_counter() - start
+        metrics.AQL_EXECUTE_LATENCY.labels(op, coll).observe(elapsed)
+        batches = metrics.AQL_CURSOR_BATCHES.labels(op, coll)
+
+        def on_close(c: Cursor):
+            batches.observe(c.fetch_count())
+            self._batch_sizer.record((op, coll), c.received_count(), c.received_bytes())
+
+        cur.set_close_callback(on_close)
+        if self._profiler:
+            self._profiler.record(op, aql_str, bind_vars, elapsed)
+        if self._shape_recorder and query_shape:
+            self._shape_recorder.record(query_shape, aql_str, bind_vars)
+        return cur
+
+    async def get_doc_by_key(self, collection: str, key: str, op: str = None
+    ) -> dict[str, Any] | None:
         """
-        return await self._db.aql.execute(aql_str, bind_vars=bind_vars or {}, count=count)
+        Get a document by its key via the document API, avoiding the cost of parsing and
+        optimizing an AQL query. Returns None if the document does not exist.
+
+        collection - the arango collection containing the document.
+        key - the document's key.
+        op - a short, fixed name for the operation reading the document, used to label metrics.
+        """
+        start = time.perf_counter()
+        doc = await self._db.collection(collection).get(key)
+        metrics.DOCUMENT_READ_LATENCY.labels(op or metrics.NO_OP, collection).observe(
+            time.perf_counter() - start)
+        return doc
+
+    async def get_docs_by_key(self, collection: str, keys: list[str], op: str = None
+    ) -> dict[str, dict[str, Any]]:
+        """
+        Get documents by key via the document API, fetching up to 1000 documents per request.
+
+        Returns a mapping of key to document. Keys for documents that do not exist are
+        not included.
+
+        collection - the arango collection containing the documents.
+        keys - the documents' keys.
+        op - a short, fixed name for the operation reading the documents, used to label
+            metrics.
+        """
+        op = op or metrics.NO_OP
+        col = self._db.collection(collection)
+        keys = list(dict.fromkeys(keys))
+        ret = {}
+        for i in range(0, len(keys), _MULTI_GET_BATCH):
+            start = time.perf_counter()
+            docs = await col.get_many_by_key(keys[i:i + _MULTI_GET_BATCH])
+            metrics.DOCUMENT_READ_LATENCY.labels(op, collection).observe(
+                time.perf_counter() - start)
+            ret.update({d[names.FLD_ARANGO_KEY]: d for d in docs if d is not None})
+        return ret
+
+    async def explain_aql(self, aql_str: str, bind_vars: dict[str, Any] = None) -> dict[str, Any]:
+        """
+        Get the optimal query plan for an aql statement without executing it.
+
+        aql_str - the AQL string to explain.
+        bind_vars - any bind variables for the AQL string.
+        """
+        return await self._db.aql.explain(aql_str, bind_vars=bind_vars or {})
     
     async def create_analyzer(
         self, name: str, type_: str, properties: dict[str, Any] = None, features: list[str] = None
@@ -255,7 +460,8 @@ class ArangoStorage:
         arango_collection: str,
         view_spec: ColumnarAttributesSpec,
         analyzer_provider: Callable[[FilterStrategy, bool], str],
-        include_all_fields: bool = False
+        include_all_fields: bool = False,
+        primary_sort: str = None,
     ):
         """
         Create a search view for a collection.
@@ -268,44 +474,29 @@ class ArangoStorage:
             return None (True) or the name of the default analyzer (False) when the default
             analyzer is to be returned.
         include_all_fields - whether to set include_all_fields to true for the created search view.
+        primary_sort - the field on which to sort the documents in the view, typically the
+            default sort field for the data product.
         """
-        view_fields = self._view_spec_to_fields(view_spec, analyzer_provider)
+        props = view_definitions.get_view_properties(
+            arango_collection, view_spec, analyzer_provider, primary_sort, include_all_fields)
         try:
-            await self._db.create_arangosearch_view(
-                name, {"links": {arango_collection: {
-                                                    "fields": view_fields,
-                                                    "includeAllFields": include_all_fields}}}
-            )
+            await self._db.create_arangosearch_view(name, props)
         except ViewCreateError as e:
             if e.error_code == ARANGO_ERR_NAME_EXISTS:
                 view = await self._db.view(name)
-                if view["links"][arango_collection]["fields"] != view_fields:
+                if not view_definitions.view_matches(view, arango_collection, props):
                     raise ViewExistsError(f"The view '{name}' already exists and differs from "
                         + "the requested specification.") from e
             else:
                 raise
     
-    def _view_spec_to_fields(
-            self,
-            view_spec: ColumnarAttributesSpec,
-            analyzer_provider: Callable[[FilterStrategy, bool], str]
-        ) -> dict[str, Any]:
-        fields = {}
-        for colattrib in view_spec.columns:
-            analyzer = analyzer_provider(colattrib.filter_strategy, True)
-            if not analyzer:
-                fields[colattrib.key] = {}
-            else:
-                # we may want > 1 analyzer per field at some point, deal with that when it happens.
-                fields[colattrib.key] = {"analyzers": [analyzer]}
-        return fields
-    
     async def get_search_views_from_spec(
         self,
         arango_collection: str,
         view_spec: ColumnarAttributesSpec,
         analyzer_provider: Callable[[FilterStrategy, bool], str],
-        include_all_fields: bool = False
+        include_all_fields: bool = False,
+        primary_sort: str = None,
         ) -> list:
         """
         Given a view spec, find a matching views in a collection if any.
@@ -317,18 +508,41 @@ class ArangoStorage:
             return None (True) or the name of the default analyzer (False) when the default
             analyzer is to be returned.
         include_all_fields - returned matching views must have the include_all_fields flag set.
+        primary_sort - returned matching views must be sorted on this field, and have the
+            stored values generated for the spec and sort field.
             
         Returns the names of any matching views found.
         """
-        view_fields = self._view_spec_to_fields(view_spec, analyzer_provider)
-        views = await self._db.views()
+        props = view_definitions.get_view_properties(
+            arango_collection, view_spec, analyzer_provider, primary_sort, include_all_fields)
+        views = await self._get_search_view_details(arango_collection)
+        return [name for name, view in views.items()
+                if view_definitions.view_matches(view, arango_collection, props)]
+
+    async def update_search_views(self, arango_collection: str) -> list[str]:
+        """
+        Update the commit and consolidation settings of all the views for a collection to those
+        of the current view definitions. Views created from older view definitions or specs
+        are updated as well, since those settings can be changed in place.
+
+        arango_collection - the collection name associated with the views.
+
+        Returns the names of the updated views.
+        """
         ret = []
-        for v in views:
+        for name, view in (await self._get_search_view_details(arango_collection)).items():
+            if view_definitions.view_needs_update(view):
+                await self._db.update_arangosearch_view(
+                    name, view_definitions.get_mutable_properties())
+                ret.append(name)
+        return ret
+
+    async def _get_search_view_details(self, arango_collection: str) -> dict[str, dict[str, Any]]:
+        ret = {}
+        for v in await self._db.views():
             view = await self._db.view(v["name"])
             if arango_collection in view["links"]:
-                if (view["links"][arango_collection]["fields"] == view_fields and
-                        view["links"][arango_collection]["include_all_fields"] == include_all_fields):
-                    ret.append(v["name"])
+                ret[v["name"]] = view
         return ret
     
     async def has_search_view(self, name) -> bool:
@@ -356,8 +570,8 @@ class ArangoStorage:
     
     async def get_dynamic_config(self) -> models.DynamicConfig:
         """ Get the dynamic configuration from the database. """
-        col = self._db.collection(names.COLL_SRV_CONFIG)
-        doc = await col.get(_DYNCFG_KEY)
+        doc = await self.get_doc_by_key(
+            names.COLL_SRV_CONFIG, _DYNCFG_KEY, op="get_dynamic_config")
         if not doc:
             return models.DynamicConfig()  # use default values
         return models.DynamicConfig(**doc)
@@ -365,13 +579,13 @@ class ArangoStorage:
     async def update_dynamic_config(self, cfg: models.DynamicConfig) -> models.DynamicConfig:
         """
         Update the dynamic configuration, overwriting any existing config keys but 
-        leaving non-conflicting keys alone.
+        leaving non-conflicting keys alone. Only keys explicitly set in the config are written.
         
         Returns the updated config.
         """
         if cfg.is_empty():
             return
-        doc = cfg.model_dump() | {names.FLD_ARANGO_KEY: _DYNCFG_KEY}
+        doc = cfg.model_dump(exclude_unset=True) | {names.FLD_ARANGO_KEY: _DYNCFG_KEY}
         bind_vars = {"@coll": names.COLL_SRV_CONFIG, "cfg": doc}
         aql = f"""
             UPSERT {{{names.FLD_ARANGO_KEY}: "{_DYNCFG_KEY}"}}
@@ -381,7 +595,7 @@ class ArangoStorage:
                 OPTIONS {{exclusive: true}}
             RETURN NEW
         """
-        cur = await self.execute_aql(aql, bind_vars, count=True)
+        cur = await self.execute_aql(aql, bind_vars, count=True, op="update_dynamic_config")
         try:
             doc = await cur.next()
             return models.DynamicConfig(**doc)
@@ -402,7 +616,7 @@ class ArangoStorage:
                 OPTIONS {{exclusive: true}}
                 RETURN NEW
         """
-        cur = await self._db.aql.execute(aql, bind_vars=bind_vars)
+        cur = await self.execute_aql(aql, bind_vars=bind_vars, op="get_next_version")
         try:
             verdoc = await cur.next()
         finally:
@@ -411,8 +625,8 @@ class ArangoStorage:
 
     async def get_current_version(self, collection_id: str) -> int:
         """ Get the current version counter value for a collection. """
-        col = self._db.collection(names.COLL_SRV_COUNTERS)
-        countdoc = await col.get(collection_id)
+        countdoc = await self.get_doc_by_key(
+            names.COLL_SRV_COUNTERS, collection_id, op="get_current_version")
         if not countdoc:
             raise errors.NoSuchCollectionError(f"There is no collection {collection_id}")
         return countdoc[_FLD_COUNTER]
@@ -459,7 +673,7 @@ class ArangoStorage:
                 SORT d.{names.FLD_ARANGO_KEY} ASC
                 RETURN d.{names.FLD_ARANGO_KEY}
             """
-        cur = await self._db.aql.execute(aql, bind_vars=bind_vars)
+        cur = await self.execute_aql(aql, bind_vars=bind_vars, op="get_collection_ids")
         try:
             return [d async for d in cur]
         finally:
@@ -473,8 +687,11 @@ class ArangoStorage:
                 SORT d.{names.FLD_ARANGO_KEY} ASC
                 RETURN d
             """
-        cur = await self._db.aql.execute(
-            aql, bind_vars={f"@{_FLD_COLLECTION}": names.COLL_SRV_ACTIVE})
+        cur = await self.execute_aql(
+            aql,
+            bind_vars={f"@{_FLD_COLLECTION}": names.COLL_SRV_ACTIVE},
+            op="get_collections_active",
+        )
         try:
             return [_doc_to_active_coll(d) async for d in cur]
         finally:
@@ -482,8 +699,8 @@ class ArangoStorage:
 
     async def get_collection_active(self, collection_id: str) -> models.ActiveCollection:
         """ Get an active collection. """
-        col = self._db.collection(names.COLL_SRV_ACTIVE)
-        doc = await col.get(collection_id)
+        doc = await self.get_doc_by_key(
+            names.COLL_SRV_ACTIVE, collection_id, op="get_collection_active")
         if doc is None:
             raise errors.NoSuchCollectionError(
                 f"There is no active collection {collection_id}")
@@ -497,8 +714,11 @@ class ArangoStorage:
     async def get_collection_version_by_tag(self, collection_id: str, ver_tag: str
     ) -> models.SavedCollection:
         """ Get a collection version by its version tag. """
-        col = self._db.collection(names.COLL_SRV_VERSIONS)
-        doc = await col.get(_version_key(collection_id, ver_tag))
+        doc = await self.get_doc_by_key(
+            names.COLL_SRV_VERSIONS,
+            _version_key(collection_id, ver_tag),
+            op="get_collection_version_by_tag",
+        )
         if doc is None:
             raise errors.NoSuchCollectionVersionError(
                 f"No collection {collection_id} with version tag {ver_tag}")
@@ -563,7 +783,7 @@ class ArangoStorage:
                     LIMIT @{_FLD_LIMIT}
                     RETURN d
                 """
-        cur = await self._db.aql.execute(aql, bind_vars=bind_vars)
+        cur = await self.execute_aql(aql, bind_vars=bind_vars, op="get_collection_versions")
         try:
             return [_doc_to_saved_coll(d) async for d in cur]
         finally:
@@ -637,7 +857,7 @@ class ArangoStorage:
             "subset_id": subset_id,
             "last_access": last_access,
         }
-        cur = await self._db.aql.execute(aql, bind_vars=bind_vars)
+        cur = await self.execute_aql(aql, bind_vars=bind_vars, op="remove_subset")
         # having a count > 1 is impossible since keys are unique
         try:
             return not cur.empty()
@@ -673,7 +893,8 @@ class ArangoStorage:
             _FLD_CHECK_TIME: check_time,
             "KEEP_LIST": list(models.Match.__fields__.keys()),  # @UndefinedVariable
         }
-        cur = await self._db.aql.execute(aql, bind_vars=bind_vars)
+        cur = await self.execute_aql(
+            aql, bind_vars=bind_vars, op="update_match_permissions_check")
         # having a count > 1 is impossible since keys are unique
         try:
             if cur.empty():
@@ -715,7 +936,8 @@ class ArangoStorage:
             "item_id": item_id,
             _FLD_CHECK_TIME: last_access,
         }
-        return await self._execute_aql_and_check_item_exists(aql, bind_vars, item_id, errclass)
+        return await self._execute_aql_and_check_item_exists(
+            aql, bind_vars, item_id, errclass, op="update_last_access")
 
     async def send_match_heartbeat(self, internal_match_id: str, heartbeat_timestamp: int):
         """
@@ -755,7 +977,8 @@ class ArangoStorage:
             "key": key,
             "heartbeat": heartbeat_timestamp,
         }
-        await self._execute_aql_and_check_item_exists(aql, bind_vars, key, errclass)
+        await self._execute_aql_and_check_item_exists(
+            aql, bind_vars, key, errclass, op="send_heartbeat")
 
     async def _execute_aql_and_check_item_exists(
         self,
@@ -766,8 +989,9 @@ class ArangoStorage:
         #             descending from errors.CollectionsError. Java would be Class<CollectionError>
         errclass,
         exception: bool = True,
+        op: str = None,
     ) -> dict[str, Any] | None:
-        cur = await self._db.aql.execute(aql, bind_vars=bind_vars, count=True)
+        cur = await self.execute_aql(aql, bind_vars=bind_vars, count=True, op=op)
         try:
             if cur.empty():
                 if exception:
@@ -787,8 +1011,7 @@ class ArangoStorage:
         return doc
 
     async def _get_doc(self, coll: str, doc_id: str, errclass, exception: bool = True):
-        col = self._db.collection(coll)
-        doc = await col.get(doc_id)
+        doc = await self.get_doc_by_key(coll, doc_id, op="get_subset")
         if doc is None:
             if not exception:
                 return None
@@ -860,7 +1083,8 @@ class ArangoStorage:
             "internal_id": internal_id,
         }
         doc = await self._execute_aql_and_check_item_exists(
-            aql, bind_vars, internal_id, errclass, exception=exception)
+            aql, bind_vars, internal_id, errclass, exception=exception,
+            op="get_subset_by_internal_id")
         return self._correct_process_doc_in_place(doc) if doc else None
 
     async def update_match_state(
@@ -931,7 +1155,8 @@ class ArangoStorage:
                 LET updated = NEW
                 RETURN KEEP(updated, "{names.FLD_ARANGO_KEY}")
             """
-        await self._execute_aql_and_check_item_exists(aql, bind_vars, data_id, errclass)
+        await self._execute_aql_and_check_item_exists(
+            aql, bind_vars, data_id, errclass, op="update_state")
 
     async def process_old_matches(
         self,
@@ -1008,7 +1233,7 @@ class ArangoStorage:
         aql += """
                 RETURN d
             """
-        cur = await self._db.aql.execute(aql, bind_vars=bind_vars)
+        cur = await self.execute_aql(aql, bind_vars=bind_vars, op="process_subsets")
         try:
             async for d in cur:
                 await processor(converter(self._correct_process_doc_in_place(d)))
@@ -1106,7 +1331,11 @@ class ArangoStorage:
             if e.error_code == _ARANGO_ERR_UNIQUE_CONSTRAINT:
                 # Could possibly improve bandwidth by not getting missing_ids key,
                 # would need to use AQL vs get()
-                doc = await col.get({names.FLD_ARANGO_KEY: key})
+                doc = await self.get_doc_by_key(
+                    names.COLL_SRV_DATA_PRODUCT_PROCESSES,
+                    key,
+                    op="create_or_get_data_product_process",
+                )
                 if not doc:
                     # This is highly unlikely. Not worth spending any time trying to recover
                     raise ValueError(
@@ -1464,5 +1693,5 @@ class ArangoStorage:
             "data_product": data_product
         }
         doc = await self._execute_aql_and_check_item_exists(
-            aql, bind_vars, None, None, exception=False)
+            aql, bind_vars, None, None, exception=False, op="get_export_types")
         return doc[names.FLD_TYPES] if doc else []
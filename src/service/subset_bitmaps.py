@@ -0,0 +1,128 @@
+"""
+Storage for match and selection membership as compressed bitmaps of document ordinals.
+
+The loaders assign each matchable document in a data product load version a dense integer
+ordinal. When a match or selection marks the documents in a load version, the ordinals of the
+marked documents are stored once, as a roaring bitmap in the portable serialization format
+(https://github.com/RoaringBitmap/RoaringFormatSpec), in a single document keyed by the
+data product's ArangoDB collection and the prefixed internal ID of the subset. The in process
+tiers that hold the ordinals of the load version, the heatmap matrices and the columnar
+snapshots, can then determine subset membership by fetching one small document rather than
+querying every member of the subset.
+
+The `_mtchsel` arrays on the data documents are still written, as the ArangoDB filters and
+ArangoSearch views rely on them.
+"""
+
+import base64
+
+from pyroaring import BitMap
+
+import src.common.storage.collection_and_field_names as names
+from src.service.storage_arango import ArangoStorage
+
+
+_FLD_DATA_COLL = "data_coll"
+_FLD_INTERNAL_ID = "internal_id"
+_FLD_COUNT = "count"
+
+
+def _key(collection: str, subset_internal_id: str) -> str:
+    return f"{collection}_{subset_internal_id}"
+
+
+async def save_subset_bitmap(
+    storage: ArangoStorage,
+    collection: str,
+    collection_id: str,
+    load_ver: str,
+    subset_internal_id: str,
+    bitmap: BitMap,
+):
+    """
+    Save a subset bitmap, overwriting any existing bitmap for the subset.
+
+    storage - the storage system.
+    collection - the name of the arango collection containing the marked data.
+    collection_id - the ID of the KBase collection containing the marked data.
+    load_ver - the load version of the marked data.
+    subset_internal_id - the internal ID of the subset, including any prefixes applied when
+        marking the data.
+    bitmap - the bitmap of the ordinals of the documents in the subset.
+    """
+    doc = {
+        names.FLD_ARANGO_KEY: _key(collection, subset_internal_id),
+        _FLD_DATA_COLL: collection,
+        names.FLD_COLLECTION_ID: collection_id,
+        names.FLD_LOAD_VERSION: load_ver,
+        _FLD_INTERNAL_ID: subset_internal_id,
+        _FLD_COUNT: len(bitmap),
+        names.FLD_SUBSET_BITMAP: base64.b64encode(bitmap.serialize()).decode("ascii"),
+    }
+    aql = f"""
+        UPSERT {{{names.FLD_ARANGO_KEY}: @key}}
+            INSERT @doc
+            REPLACE @doc
+            IN @@coll
+            OPTIONS {{exclusive: true}}
+        """
+    bind_vars = {
+        "@coll": names.COLL_SRV_SUBSET_BITMAPS,
+        "key": doc[names.FLD_ARANGO_KEY],
+        "doc": doc,
+    }
+    cur = await storage.execute_aql(aql, bind_vars=bind_vars, op="save_subset_bitmap")
+    await cur.close(ignore_missing=True)
+
+
+async def get_subset_bitmap(
+    storage: ArangoStorage,
+    collection: str,
+    collection_id: str,
+    load_ver: str,
+    subset_internal_id: str,
+) -> BitMap | None:
+    """
+    Get a subset bitmap, or None if no bitmap is stored for the subset, for instance if the
+    load version documents have no ordinals.
+
+    storage - the storage system.
+    collection - the name of the arango collection containing the marked data.
+    collection_id - the ID of the KBase collection containing the marked data.
+    load_ver - the load version of the marked data.
+    subset_internal_id - the internal ID of the subset, including any prefixes applied when
+        marking the data.
+    """
+    doc = await storage.get_doc_by_key(
+        names.COLL_SRV_SUBSET_BITMAPS,
+        _key(collection, subset_internal_id),
+        op="get_subset_bitmap",
+    )
+    if (not doc
+            or doc[names.FLD_COLLECTION_ID] != collection_id
+            or doc[names.FLD_LOAD_VERSION] != load_ver):
+        return None
+    return BitMap.deserialize(base64.b64decode(doc[names.FLD_SUBSET_BITMAP]))
+
+
+async def remove_subset_bitmap(storage: ArangoStorage, collection: str, subset_internal_id: str):
+    """
+    Remove a subset bitmap if it exists.
+
+    storage - the storage system.
+    collection - the name of the arango collection containing the marked data.
+    subset_internal_id - the internal ID of the subset, including any prefixes applied when
+        marking the data.
+    """
+    aql = f"""
+        FOR d IN @@coll
+            FILTER d.{names.FLD_ARANGO_KEY} == @key
+            REMOVE d IN @@coll
+            OPTIONS {{exclusive: true}}
+        """
+    bind_vars = {
+        "@coll": names.COLL_SRV_SUBSET_BITMAPS,
+        "key": _key(collection, subset_internal_id),
+    }
+    cur = await storage.execute_aql(aql, bind_vars=bind_vars, op="remove_subset_bitmap")
+    await cur.close(ignore_missing=True)
@@ -11,11 +11,16 @@ import time
 import src.common.storage.collection_and_field_names as names
 from src.service.config import CollectionsServiceConfig
 from src.service._app_state_build_storage import build_arango_db
-from src.service.storage_arango import ARANGO_ERR_NAME_EXISTS, ArangoStorage, ViewExistsError
+from src.service.storage_arango import (
+    ARANGO_ERR_NAME_EXISTS,
+    ArangoStorage,
+    ViewExistsError,
+    get_schema_changes,
+)
 from typing import get_type_hints, Any
-from src.service import data_product_specs
+from src.service import data_product_specs, index_planner
 from src.common.collection_column_specs import load_specs
-from src.service.filtering import analyzers, generic_view
+from src.service.filtering import analyzers, generic_view, view_definitions
 
 
 REPLICATION = 3
@@ -31,7 +36,16 @@ required for the KBase Collections service and specify their sharding.
   shell / UI etc.
 
 Next, we'll check for any needed updates for ArangoSearch views and
-create new views if necessary.
+create new views if necessary. Views are created from version
+{view_definitions.VIEW_DEFINITION_VERSION} of the view definitions. Views created from older
+definitions or specs have their commit and consolidation settings updated
+in place, but must be replaced with new views to get the current primary
+sort and stored values. The service continues to filter heatmaps with the
+unversioned generic view until the versioned generic view is created.
+
+Finally, we'll check for indexes for sorting on the numeric columns of
+data products with column specs, and create missing indexes if
+necessary.
 """.strip() + "\n"
 
 _CONF_SHARDS = "confshards"
@@ -55,10 +69,24 @@ def _get_config() -> CollectionsServiceConfig:
             + "file don't have permissions for the _system database; however the target database "
             + "must already exist."
     )
+    parser.add_argument(
+        "-n", "--dry-run", action="store_true",
+        help="Print the collections and indexes that need to be created for the service and "
+            + "installed data products and exit without making any changes. The database "
+            + "must already exist."
+    )
+    parser.add_argument(
+        "-b", "--column-index-budget", type=int, default=index_planner.DEFAULT_INDEX_BUDGET,
+        help="The maximum number of indexes to create per database collection for sorting "
+            + "and range filtering on numeric data product columns. Default "
+            + f"{index_planner.DEFAULT_INDEX_BUDGET}."
+    )
     args = parser.parse_args()
+    if args.column_index_budget < 0:
+        parser.error("The column index budget must be >= 0")
     with open(args.config, 'rb') as cfgfile:
         cfg = CollectionsServiceConfig(cfgfile)
-    return cfg, args.skip_database_creation
+    return cfg, args.skip_database_creation, args.dry_run, args.column_index_budget
     
 
 def _get_required_collections() -> dict[str, dict[str, Any]]:
@@ -145,19 +173,22 @@ async def _get_missing_collections(
     return {m: required_cols[m] for m in missing}
 
 
-def _print_view_status(data_product, db_collection_name, views_matching_spec):
+def _print_view_status(data_product, db_collection_name, views_matching_spec, other_views):
     print(f"View status for data product {data_product}:")
     print("    Arango collection name:")
     print(f"        {db_collection_name}")
     print("    Database views matching current specs: ")
     print(f"        {views_matching_spec}")
+    print("    Database views for prior specs or view definitions: ")
+    print(f"        {other_views}")
 
 
 async def _create_view(
         store: ArangoStorage,
         data_product: str,
         db_collection_name: str,
-        create_generic_view: bool = False
+        create_generic_view: bool = False,
+        primary_sort: str = None,
     ):
     if create_generic_view:
         print(f"Creating generic view for data product {data_product}...")
@@ -170,12 +201,17 @@ async def _create_view(
         for v in sorted(view_spec.spec_files):
             print(f"   {v}")
 
+    updated = await store.update_search_views(db_collection_name)
+    for v in sorted(updated):
+        print(f"Updated commit and consolidation settings for view {v}")
     views = sorted(await store.get_search_views_from_spec(
         db_collection_name,
         view_spec,
         analyzers.get_analyzer,
-        include_all_fields=create_generic_view))
-    _print_view_status(data_product, db_collection_name, views)
+        include_all_fields=create_generic_view,
+        primary_sort=primary_sort))
+    other_views = sorted(await store.get_search_views(db_collection_name) - set(views))
+    _print_view_status(data_product, db_collection_name, views, other_views)
     if views:
         print("    Setup ok.")
     elif click.confirm("No view present for current view specifications. Create now?"):
@@ -191,7 +227,8 @@ async def _create_view(
                 db_collection_name,
                 view_spec,
                 analyzers.get_analyzer,
-                include_all_fields=create_generic_view)
+                include_all_fields=create_generic_view,
+                primary_sort=primary_sort)
             print(f"done in {time.time() - t0:.2f} seconds.")
             return view_name
         except ViewExistsError:
@@ -216,12 +253,76 @@ async def _update_views(store: ArangoStorage):
                     store,
                     dp.data_product,
                     dbc.name,
-                    create_generic_view=dbc.generic_view_required
+                    create_generic_view=dbc.generic_view_required,
+                    primary_sort=dbc.view_primary_sort,
                 )
 
 
+async def _print_schema_changes(
+        db: aioarango.database.StandardDatabase,
+        index_plan: index_planner.ColumnIndexPlan
+    ):
+    print("Checking for missing collections and indexes... ", end="", flush=True)
+    changes = await get_schema_changes(
+        db, data_product_specs.get_data_products(), extra_indexes=index_plan.indexes)
+    print("done")
+    print(f"Collections to be created: {len(changes.collections)}")
+    for c in changes.collections:
+        print(f"    {c}")
+    print(f"Indexes to be created: {len(changes.indexes)}")
+    for c, fields in changes.indexes:
+        print(f"    {c}: {list(fields)}")
+    _print_over_budget(index_plan)
+
+
+def _print_over_budget(index_plan: index_planner.ColumnIndexPlan):
+    for c, cols in index_plan.over_budget.items():
+        if cols:
+            print(f"Columns in {c} not indexed due to the column index budget: {cols}")
+
+
+async def _provision_column_indexes(
+        db: aioarango.database.StandardDatabase,
+        index_plan: index_planner.ColumnIndexPlan
+    ):
+    print("Checking column index status")
+    changes = await get_schema_changes(
+        db, data_product_specs.get_data_products(), extra_indexes=index_plan.indexes)
+    for c in index_plan.indexes:
+        print(f"Persistent indexes for collection {c}:")
+        for idx in await db.collection(c).indexes():
+            if idx.get("type") == "persistent":
+                print(f"    {idx['fields']}")
+    _print_over_budget(index_plan)
+    planned = {(c, f) for c, fields in index_plan.indexes.items() for f in fields}
+    missing = [(c, f) for c, f in changes.indexes if (c, f) in planned]
+    if not missing:
+        print("    Setup ok.")
+        return
+    print(f"Column indexes to be created: {len(missing)}")
+    for c, fields in missing:
+        print(f"    {c}: {list(fields)}")
+    if click.confirm("Create the column indexes now? The indexes are built in the background"):
+        for c, fields in missing:
+            t0 = time.time()
+            print(f"Creating index {list(fields)} in {c}... ", end="", flush=True)
+            await db.collection(c).add_persistent_index(list(fields), in_background=True)
+            print(f"done in {time.time() - t0:.2f} seconds.")
+
+
 async def main():
-    config, skip_db_creation = _get_config()
+    config, skip_db_creation, dry_run, index_budget = _get_config()
+    index_plan = index_planner.plan_column_indexes(
+        data_product_specs.get_data_products(), index_budget)
+    if dry_run:
+        print("Connecting to db... ", end="")
+        cli, db = await build_arango_db(config)
+        print("done")
+        try:
+            await _print_schema_changes(db, index_plan)
+        finally:
+            await cli.close()
+        return
     colls = _get_required_collections()
     print(_START_TEXT)
     print("Connecting to db... ", end="")
@@ -238,6 +339,8 @@ async def main():
         store = await ArangoStorage.create(db)
         await analyzers.install_analyzers(store)  # must happen before creating views
         await _update_views(store)
+        print()
+        await _provision_column_indexes(db, index_plan)
     finally:
         await cli.close()
 
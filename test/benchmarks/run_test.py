@@ -0,0 +1,56 @@
+import pytest
+
+from benchmarks import run
+from benchmarks.cases import CASES
+from benchmarks.fake_storage import FakeStorage, keep_resolver
+
+
+# Smoke tests to keep the benchmarks from rotting as the service code changes.
+
+
+def test_run_benchmarks():
+    res = run.run_benchmarks(50, repeat=2, warmup=0)
+    assert res["rows"] == 50
+    assert [r["name"] for r in res["results"]] == list(CASES)
+    for r in res["results"]:
+        assert len(r["runs_sec"]) == 2
+        assert r["min_sec"] <= r["median_sec"]
+        assert r["ops"] > 0
+
+
+def test_run_benchmarks_unknown():
+    with pytest.raises(ValueError, match=r"Unknown benchmarks: \['foo'\]"):
+        run.run_benchmarks(50, ["gtdb_lineage_parse", "foo"])
+
+
+def test_compare():
+    old = {"rows": 10, "results": [{"name": "a", "min_sec": 2.0}]}
+    new = {"rows": 20, "results": [{"name": "a", "min_sec": 1.0}, {"name": "b", "min_sec": 1.0}]}
+    lines = run.compare(old, new)
+    assert lines[1].split() == ["a", "2.0000", "1.0000", "0.50"]
+    assert lines[2].split() == ["b", "-", "1.0000", "-"]
+    assert lines[3] == "WARNING: row counts differ: 10 vs 20"
+
+
+@pytest.mark.asyncio
+async def test_fake_storage():
+    docs = [{"a": i, "b": i * 2} for i in range(5)]
+    store = FakeStorage(keep_resolver(docs), batch_size=2)
+
+    cur = await store.execute_aql(
+        "FOR d in @@coll RETURN KEEP(d, @keep)", bind_vars={"keep": ["b"], "skip": 1, "limit": 3})
+    assert [d async for d in cur] == [{"b": 2}, {"b": 4}, {"b": 6}]
+    assert cur.fetches == 2
+
+    cur = await store.execute_aql("FOR d in @@coll RETURN d", count=True)
+    assert cur.count() == 5
+    got = [d async for d in cur]
+    assert got == docs
+    got[0]["a"] = 100  # docs are copied
+    assert docs[0]["a"] == 0
+    await cur.close()
+    assert cur.closed
+
+    cur = await store.execute_aql("FOR d in @@coll COLLECT WITH COUNT INTO length RETURN length")
+    assert await cur.next() == 5
+    assert len(store.queries) == 3
@@ -9,6 +9,8 @@ from src.common.gtdb_lineage import (
     GTDBLineageParseError,
     GTDBLineageRankError,
     GTDBLineageResolutionError,
+    clear_lineage_cache,
+    top_k_taxa,
 )
 
 # TODO TEST add more tests
@@ -173,3 +175,122 @@ def test_taxa_count():
         TaxaNodeCount(rank=GTDBRank.SPECIES, name='Parvibaculum lavamentivorans', count=1),
     ]
     assert got == expected
+
+
+def test_top_k_taxa():
+    counts = [
+        TaxaNodeCount(GTDBRank.GENUS, "c", 2),
+        TaxaNodeCount(GTDBRank.GENUS, "b", 5),
+        TaxaNodeCount(GTDBRank.GENUS, "a", 2),
+        TaxaNodeCount(GTDBRank.GENUS, "d", 7),
+        TaxaNodeCount(GTDBRank.GENUS, "e", 2),
+    ]
+    assert top_k_taxa(counts, 4) == [
+        TaxaNodeCount(GTDBRank.GENUS, "d", 7),
+        TaxaNodeCount(GTDBRank.GENUS, "b", 5),
+        TaxaNodeCount(GTDBRank.GENUS, "a", 2),
+        TaxaNodeCount(GTDBRank.GENUS, "c", 2),
+    ]
+    assert top_k_taxa(iter(counts), 100) == sorted(counts, key=lambda c: (-c.count, c.name))
+    assert top_k_taxa([], 3) == []
+
+
+def test_top_k_taxa_fail():
+    for k in [0, -1]:
+        with raises(Exception) as got:
+            top_k_taxa([], k)
+        assert_exception_correct(got.value, ValueError("k must be > 0"))
+        with raises(Exception) as got:
+            GTDBTaxaCount().top_k(k)
+        assert_exception_correct(got.value, ValueError("k must be > 0"))
+
+
+def test_taxa_count_top_k():
+    tc = GTDBTaxaCount()
+    for lin in [
+        "d__Bacteria;p__Firmicutes;c__Bacilli",
+        "d__Bacteria;p__Proteobacteria;c__Alphaproteobacteria",
+        "d__Bacteria;p__Proteobacteria;c__Gammaproteobacteria",
+        "d__Archaea;p__Halobacteriota",
+    ]:
+        tc.add(lin)
+    assert tc.top_k(1) == {
+        GTDBRank.DOMAIN: [TaxaNodeCount(GTDBRank.DOMAIN, "Bacteria", 3)],
+        GTDBRank.PHYLUM: [TaxaNodeCount(GTDBRank.PHYLUM, "Proteobacteria", 2)],
+        GTDBRank.CLASS: [TaxaNodeCount(GTDBRank.CLASS, "Alphaproteobacteria", 1)],
+    }
+    assert tc.top_k(5)[GTDBRank.PHYLUM] == [
+        TaxaNodeCount(GTDBRank.PHYLUM, "Proteobacteria", 2),
+        TaxaNodeCount(GTDBRank.PHYLUM, "Firmicutes", 1),
+        TaxaNodeCount(GTDBRank.PHYLUM, "Halobacteriota", 1),
+    ]
+
+
+def test_lineage_cached_and_shared():
+    linstr = ("d__Bacteria;p__Firmicutes;c__Bacilli;o__Thermoactinomycetales;"
+              + "f__DSM-45169;g__Marininema;s__Marininema halotolerans")
+    lin1 = GTDBLineage(linstr)
+    lin2 = GTDBLineage(linstr, force_complete=True)
+    assert lin1 is not lin2
+    assert lin1.lineage is lin2.lineage
+    # nodes are shared between different lineage strings
+    lin3 = GTDBLineage("d__Bacteria;p__Firmicutes;c__Foo")
+    assert lin3.lineage[1] is lin1.lineage[1]
+
+    with raises(Exception) as got:
+        lin1.lineage[0].name = "foo"
+    assert_exception_correct(got.value, AttributeError("GTDBLineageNode is immutable"))
+
+    # errors from cached parses
+    with raises(Exception) as got:
+        GTDBLineage("d__Bacteria;p__Firmicutes", force_complete=True)
+    assert_exception_correct(got.value, GTDBLineageResolutionError(
+        "Lineage 'd__Bacteria;p__Firmicutes' does not end with species"))
+    for _ in range(2):
+        with raises(Exception) as got:
+            GTDBLineage("d__Bacteria;c__Firmicutes")
+        assert_exception_correct(got.value, GTDBLineageRankError(
+            "Bad rank order in lineage 'd__Bacteria;c__Firmicutes'"))
+    clear_lineage_cache()
+    assert GTDBLineage(linstr).lineage is not lin1.lineage
+    assert GTDBLineage(linstr) == lin1
+
+
+def test_parse_many():
+    strs = ["d__Bacteria;p__Firmicutes", "d__Archaea", "d__Bacteria;p__Firmicutes;"]
+    got = GTDBLineage.parse_many(strs + strs[:1])
+    assert [str(g) for g in got] == [
+        "d__Bacteria;p__Firmicutes", "d__Archaea", "d__Bacteria;p__Firmicutes",
+        "d__Bacteria;p__Firmicutes"]
+    assert got[0] is not got[3]
+    assert got[0].lineage is got[3].lineage
+    assert GTDBLineage.parse_many([]) == []
+
+    with raises(Exception) as got:
+        GTDBLineage.parse_many(["d__Archaea", "d__Bacteria;x__foo"])
+    assert_exception_correct(got.value, GTDBLineageParseError(
+        "Illegal rank in lineage string 'd__Bacteria;x__foo': No such GTDB rank abbreviation: x"))
+    with raises(Exception) as got:
+        GTDBLineage.parse_many(["d__Archaea"], force_complete=True)
+    assert_exception_correct(got.value, GTDBLineageResolutionError(
+        "Lineage 'd__Archaea' does not end with species"))
+
+
+def test_taxa_count_add_many():
+    lins = [
+        "d__Bacteria;p__Firmicutes;c__Bacilli",
+        "d__Bacteria;p__Proteobacteria",
+        "d__Bacteria;p__Firmicutes;c__Bacilli",
+    ]
+    tc1 = GTDBTaxaCount()
+    for lin in lins:
+        tc1.add(lin)
+    tc2 = GTDBTaxaCount()
+    tc2.add_many(iter(lins))
+    assert list(tc2) == list(tc1)
+    assert list(tc2) == [
+        TaxaNodeCount(rank=GTDBRank.DOMAIN, name='Bacteria', count=3),
+        TaxaNodeCount(rank=GTDBRank.PHYLUM, name='Firmicutes', count=2),
+        TaxaNodeCount(rank=GTDBRank.PHYLUM, name='Proteobacteria', count=1),
+        TaxaNodeCount(rank=GTDBRank.CLASS, name='Bacilli', count=2),
+    ]
@@ -0,0 +1,329 @@
+import json
+
+import numpy as np
+from pyroaring import BitMap
+from pytest import raises
+
+from conftest import assert_exception_correct
+from src.common.heatmap_matrix import HeatMapMatrix, HeatMapMatrixStore, write_heatmap_matrix
+
+
+def _meta(coll="PMI", load_ver="1", types=("float", "int", "bool")):
+    return {
+        "_key": f"{coll}_{load_ver}",
+        "coll": coll,
+        "load_ver": load_ver,
+        "categories": [
+            {"category": "c1", "columns": [
+                {"col_id": str(i), "name": f"n{i}", "description": f"d{i}", "type": t}
+                for i, t in enumerate(types[:2])]},
+            {"category": "c2", "columns": [
+                {"col_id": str(i + 2), "name": f"n{i + 2}", "description": f"d{i + 2}",
+                 "type": t}
+                for i, t in enumerate(types[2:])]},
+        ],
+        "min_value": 0,
+        "max_value": 1,
+        "count": 3,
+    }
+
+
+def _row(kbase_id, name, vals, meta=None):
+    doc = {
+        "_key": f"PMI_1_{kbase_id}",
+        "coll": "PMI",
+        "load_ver": "1",
+        "kbase_id": kbase_id,
+        "kbase_display_name": name,
+        "_mtchsel": [],
+        "meta": meta,
+    }
+    for col_id, val in vals.items():
+        doc[f"col_{col_id}_cell_id"] = f"{kbase_id}_{col_id}"
+        doc[f"col_{col_id}_val"] = val
+    return doc
+
+
+_ROWS = [
+    _row("k2", "name_b", {"0": 3.5, "1": 7, "2": True}, {"growth_media": "m1"}),
+    _row("k1", "name_a", {"0": 0.25, "1": -2, "2": False}),
+    _row("k3", None, {"0": 1.0, "2": True}),
+    _row("k4", "name_ü", {"0": 9, "1": 1, "2": False}),
+]
+
+_DETAILS = [
+    {"_key": "PMI_1_k1_0", "coll": "PMI", "load_ver": "1", "cell_id": "k1_0",
+     "values": [{"id": "gene1", "val": 1.5}]},
+    {"_key": "PMI_1_k3_2", "coll": "PMI", "load_ver": "1", "cell_id": "k3_2", "values": []},
+]
+
+
+def _write(tmp_path, rows=_ROWS, details=_DETAILS) -> HeatMapMatrix:
+    write_heatmap_matrix(tmp_path / "m", _meta(), rows, details)
+    return HeatMapMatrix(tmp_path / "m")
+
+
+def _cells(kbase_id, vals):
+    return [{"col_id": c, "cell_id": f"{kbase_id}_{c}", "val": v} for c, v in vals.items()]
+
+
+def test_write_and_get_rows(tmp_path):
+    m = _write(tmp_path)
+    assert m.collection_id == "PMI"
+    assert m.load_ver == "1"
+    assert m.count == 4
+    assert m.column_ids == ["0", "1", "2"]
+    assert not (tmp_path / "m.tmp").exists()
+
+    rows, min_, max_ = m.get_rows(np.arange(4))
+    assert rows == [
+        {"kbase_id": "k3", "kbase_display_name": None, "meta": None,
+         "cells": _cells("k3", {"0": 1.0, "2": True})},
+        {"kbase_id": "k1", "kbase_display_name": "name_a", "meta": None,
+         "cells": _cells("k1", {"0": 0.25, "1": -2, "2": False})},
+        {"kbase_id": "k2", "kbase_display_name": "name_b", "meta": {"growth_media": "m1"},
+         "cells": _cells("k2", {"0": 3.5, "1": 7, "2": True})},
+        {"kbase_id": "k4", "kbase_display_name": "name_ü", "meta": None,
+         "cells": _cells("k4", {"0": 9.0, "1": 1, "2": False})},
+    ]
+    assert [type(c["val"]) for c in rows[1]["cells"]] == [float, int, bool]
+    assert min_ == -2
+    assert max_ == 9.0
+
+    rows, min_, max_ = m.get_rows(np.array([0]))
+    assert [r["kbase_id"] for r in rows] == ["k3"]
+    assert min_ == 1
+    assert max_ == 1.0
+
+    rows, min_, max_ = m.get_rows(np.array([], dtype=np.int64))
+    assert rows == []
+    assert min_ is None
+    assert max_ is None
+
+
+def test_get_rows_with_columns(tmp_path):
+    m = _write(tmp_path)
+    # cells are returned in render order regardless of the requested order
+    rows, min_, max_ = m.get_rows(np.arange(4), columns=["2", "1"])
+    assert rows == [
+        {"kbase_id": "k3", "kbase_display_name": None, "meta": None,
+         "cells": _cells("k3", {"2": True})},
+        {"kbase_id": "k1", "kbase_display_name": "name_a", "meta": None,
+         "cells": _cells("k1", {"1": -2, "2": False})},
+        {"kbase_id": "k2", "kbase_display_name": "name_b", "meta": {"growth_media": "m1"},
+         "cells": _cells("k2", {"1": 7, "2": True})},
+        {"kbase_id": "k4", "kbase_display_name": "name_ü", "meta": None,
+         "cells": _cells("k4", {"1": 1, "2": False})},
+    ]
+    assert min_ == -2
+    assert max_ == 7
+
+    rows, min_, max_ = m.get_rows(np.array([0, 3]), columns=["0"])
+    assert [r["cells"] for r in rows] == [_cells("k3", {"0": 1.0}), _cells("k4", {"0": 9.0})]
+    assert min_ == 1.0
+    assert max_ == 9.0
+
+    rows, min_, max_ = m.get_rows(np.array([0]), columns=["1"])
+    assert rows[0]["cells"] == []
+    assert min_ is None
+    assert max_ is None
+
+    rows, min_, max_ = m.get_rows(np.array([0]), columns=[])
+    assert rows[0]["cells"] == []
+    assert min_ is None
+
+
+def test_rewrite(tmp_path):
+    _write(tmp_path)
+    m = _write(tmp_path, rows=_ROWS[:1])
+    assert m.count == 1
+    assert [r["kbase_id"] for r in m.get_rows(np.arange(1))[0]] == ["k2"]
+
+
+def test_write_empty(tmp_path):
+    m = _write(tmp_path, rows=[], details=[])
+    assert m.count == 0
+    assert m.get_rows(np.arange(0)) == ([], None, None)
+    assert m.start_position("foo") is None
+    assert m.row_mask(["k1"]).tolist() == []
+    assert m.get_column("1") == ([], [], [])
+    assert m.get_cell_detail("k1_0") is None
+
+
+def test_write_fail_bad_value(tmp_path):
+    for col, val, type_ in [
+        ("0", "1.0", "float"), ("0", True, "float"), ("1", 1.5, "int"), ("1", False, "int"),
+        ("2", 1, "bool")
+    ]:
+        vals = {"0": 1.0, "1": 1, "2": True}
+        vals[col] = val
+        with raises(Exception) as got:
+            write_heatmap_matrix(tmp_path / "m", _meta(), [_row("k1", "n", vals)], [])
+        assert_exception_correct(got.value, ValueError(
+            f"Illegal value for column {col} of type {type_}: {val}"))
+
+
+def test_start_position(tmp_path):
+    m = _write(tmp_path)
+    assert m.has_row_order is False
+    assert m.row_order.tolist() == [0, 1, 2, 3]
+    assert m.start_position(None) == 0
+    assert m.start_position("") == 0
+    assert m.start_position("name_a") == 2
+    assert m.start_position("name_b") == 3
+    assert m.start_position("name_ü") == 4
+    # names that aren't in the heatmap can't be placed in the ArangoDB collation order
+    for name in ["a", "name_a1", "name_z", "zzz"]:
+        assert m.start_position(name) is None
+
+
+def _rows_with_names(names):
+    return [_row(f"k{i}", n, {"0": 1.0, "1": i, "2": True}) for i, n in enumerate(names)]
+
+
+def test_set_row_order(tmp_path):
+    # the rows are written in byte order but ArangoDB uses an ICU collation
+    names = ["zoo", "Émile", "apple", "Zebra", "apple", None, "Banana"]
+    collated = ["k5", "k2", "k4", "k6", "k1", "k3", "k0"]
+    for with_ords in [False, True]:
+        rows = _rows_with_names(names)
+        if with_ords:
+            rows = [r | {"_ord": 10 + i} for i, r in enumerate(rows)]
+        m = _write(tmp_path, rows=rows)
+        assert m.has_ordinals is with_ords
+        assert [r["kbase_id"] for r in m.get_rows(m.row_order)[0]] == [
+            "k5", "k6", "k3", "k2", "k4", "k0", "k1"]
+        m.set_row_order([10 + int(k[1:]) for k in collated] if with_ords else collated)
+        assert m.has_row_order is True
+        assert [r["kbase_id"] for r in m.get_rows(m.row_order)[0]] == collated
+        assert m.get_column("1")[0] == collated
+        assert m.get_column("1")[2] == [5, 2, 4, 6, 1, 3, 0]
+        assert m.start_position("apple") == 3
+        assert m.start_position("Banana") == 4
+        assert m.start_position("Zebra") == 6
+        assert m.start_position("zoo") == 7
+        assert m.start_position("Apple") is None
+
+
+def test_set_row_order_empty(tmp_path):
+    m = _write(tmp_path, rows=[], details=[])
+    m.set_row_order([])
+    assert m.has_row_order is True
+    assert m.row_order.tolist() == []
+
+
+def test_set_row_order_fail(tmp_path):
+    m = _write(tmp_path)
+    for ids in [
+        ["k1", "k2", "k3"],
+        ["k1", "k2", "k3", "k4", "k5"],
+        ["k1", "k2", "k3", "k3"],
+        ["k1", "k2", "k3", "k5"],
+        ["k1", "k2", "k3", "k4_long_id"],
+    ]:
+        with raises(Exception) as got:
+            m.set_row_order(ids)
+        assert_exception_correct(got.value, ValueError(
+            "The row order does not contain each heatmap row exactly once"))
+    assert m.has_row_order is False
+    rows = [r | {"_ord": i} for i, r in enumerate(_ROWS)]
+    m = _write(tmp_path, rows=rows)
+    with raises(Exception) as got:
+        m.set_row_order([0, 1, 2, 2])
+    assert_exception_correct(got.value, ValueError(
+        "The row order does not contain each heatmap row exactly once"))
+
+
+def test_row_mask(tmp_path):
+    m = _write(tmp_path)
+    assert m.row_mask([]).tolist() == [False] * 4
+    assert m.row_mask(["k1", "k4", "k5"]).tolist() == [False, True, False, True]
+    assert m.row_mask({"k3"}).tolist() == [True, False, False, False]
+
+
+def test_ordinal_mask(tmp_path):
+    rows = [r | {"_ord": i} for i, r in enumerate(sorted(_ROWS, key=lambda r: r["_key"]))]
+    m = _write(tmp_path, rows=rows)
+    assert m.has_ordinals is True
+    # display name order is k3, k1, k2, k4, ordinal order is k1, k2, k3, k4
+    assert m.ordinal_mask([]).tolist() == [False] * 4
+    assert m.ordinal_mask([0, 3, 7]).tolist() == [False, True, False, True]
+    assert m.ordinal_mask({2}).tolist() == [True, False, False, False]
+    # ordinals aren't returned in the rows
+    data, _, _ = m.get_rows(np.array([0]))
+    assert "_ord" not in data[0]
+
+
+def test_bitmap_mask(tmp_path):
+    rows = [r | {"_ord": i} for i, r in enumerate(sorted(_ROWS, key=lambda r: r["_key"]))]
+    m = _write(tmp_path, rows=rows)
+    # display name order is k3, k1, k2, k4, ordinal order is k1, k2, k3, k4
+    assert m.bitmap_mask(BitMap()).tolist() == [False] * 4
+    assert m.bitmap_mask(BitMap([0, 3, 7, 100_000])).tolist() == [False, True, False, True]
+    assert m.bitmap_mask(BitMap([2])).tolist() == [True, False, False, False]
+
+
+def test_ordinal_and_bitmap_mask_fail_no_ordinals(tmp_path):
+    m = _write(tmp_path)
+    assert m.has_ordinals is False
+    for mask in [lambda: m.ordinal_mask([1]), lambda: m.bitmap_mask(BitMap([1]))]:
+        with raises(Exception) as got:
+            mask()
+        assert_exception_correct(got.value, ValueError("The heatmap rows have no ordinals"))
+
+
+def test_get_column(tmp_path):
+    m = _write(tmp_path)
+    assert m.get_column("0") == (
+        ["k3", "k1", "k2", "k4"], ["k3_0", "k1_0", "k2_0", "k4_0"], [1.0, 0.25, 3.5, 9.0])
+    assert m.get_column("1") == (
+        ["k3", "k1", "k2", "k4"], [None, "k1_1", "k2_1", "k4_1"], [None, -2, 7, 1])
+    assert m.get_column("2") == (
+        ["k3", "k1", "k2", "k4"], ["k3_2", "k1_2", "k2_2", "k4_2"], [True, False, True, False])
+    assert m.get_column("3") is None
+
+
+def test_get_cell_detail(tmp_path):
+    m = _write(tmp_path)
+    assert m.get_cell_detail("k1_0") == {"cell_id": "k1_0", "values": [{"id": "gene1", "val": 1.5}]}
+    assert m.get_cell_detail("k3_2") == {"cell_id": "k3_2", "values": []}
+    assert m.get_cell_detail("k1_1") is None
+    assert m.get_cell_detail("a") is None
+    assert m.get_cell_detail("z") is None
+
+
+def test_fail_bad_format_version(tmp_path):
+    _write(tmp_path)
+    with open(tmp_path / "m" / "index.json") as f:
+        index = json.load(f)
+    index["format_version"] = 2
+    with open(tmp_path / "m" / "index.json", "w") as f:
+        json.dump(index, f)
+    with raises(Exception) as got:
+        HeatMapMatrix(tmp_path / "m")
+    assert_exception_correct(got.value, ValueError(
+        f"Unsupported heatmap matrix format version 2 in {tmp_path / 'm'}"))
+
+
+def test_store(tmp_path):
+    write_heatmap_matrix(tmp_path / "biolog" / "PMI" / "1", _meta(), _ROWS, _DETAILS)
+    write_heatmap_matrix(tmp_path / "biolog" / "PMI" / "2", _meta(load_ver="2"), _ROWS, [])
+    write_heatmap_matrix(tmp_path / "biolog" / "GTDB" / "3", _meta(), _ROWS, [])
+    store = HeatMapMatrixStore(tmp_path, max_open=1)
+
+    assert store.get_matrix("microtrait", "PMI", "1") is None
+    assert store.get_matrix("biolog", "PMI", "3") is None
+    m = store.get_matrix("biolog", "PMI", "1")
+    assert m.load_ver == "1"
+    assert store.get_matrix("biolog", "PMI", "1") is m
+    m2 = store.get_matrix("biolog", "PMI", "2")
+    assert m2.load_ver == "2"
+    m3 = store.get_matrix("biolog", "PMI", "1")
+    assert m3 is not m
+    assert m3.count == 4
+
+    with raises(Exception) as got:
+        store.get_matrix("biolog", "GTDB", "3")
+    assert_exception_correct(got.value, ValueError(
+        f"Heatmap matrix at {tmp_path / 'biolog' / 'GTDB' / '3'} is for collection "
+        + "PMI load version 1"))
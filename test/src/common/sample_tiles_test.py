@@ -0,0 +1,164 @@
+import math
+import random
+
+from conftest import assert_exception_correct
+from pytest import raises
+
+from src.common import sample_tiles
+from src.common.sample_tiles import (
+    BoundingBox,
+    TileRange,
+    WORLD,
+    aggregate_tiles,
+    aql_tile_coordinates,
+    parse_bbox,
+    tile_bounds,
+    tile_range,
+    tile_x,
+    tile_y,
+)
+from src.common.storage import collection_and_field_names as names
+
+
+def _sample(sid, lat, lon, count=1):
+    return {
+        names.FLD_KB_SAMPLE_ID: sid,
+        names.FLD_SAMPLE_LATITUDE: lat,
+        names.FLD_SAMPLE_LONGITUDE: lon,
+        names.FLD_KB_GENOME_COUNT: count,
+    }
+
+
+def test_tile_coordinates():
+    assert (tile_x(0, 0), tile_y(0, 0)) == (0, 0)
+    assert (tile_x(-180, 1), tile_x(-0.01, 1), tile_x(0, 1), tile_x(180, 1)) == (0, 0, 1, 1)
+    assert (tile_y(90, 1), tile_y(0.01, 1), tile_y(-0.01, 1), tile_y(-90, 1)) == (0, 0, 1, 1)
+    # Berkeley, CA at zoom 10
+    assert (tile_x(-122.27, 10), tile_y(37.87, 10)) == (164, 395)
+    assert (tile_x(-122.27, 20), tile_y(37.87, 20)) == (168150, 404945)
+    # tiles at higher zoom levels nest in the tiles at lower levels
+    assert (168150 >> 10, 404945 >> 10) == (164, 395)
+    # beyond the mercator limit
+    assert tile_y(89.9, 5) == 0
+    assert tile_y(-89.9, 5) == 31
+
+
+def test_tile_bounds():
+    assert tile_bounds(0, 0, 0) == BoundingBox(
+        -180, -sample_tiles.MAX_LATITUDE, 180, sample_tiles.MAX_LATITUDE)
+    b = tile_bounds(10, 164, 395)
+    assert b.west <= -122.27 <= b.east
+    assert b.south <= 37.87 <= b.north
+    assert math.isclose(b.east - b.west, 360 / 1024)
+    # the tile coordinate calculation is consistent with the bounds
+    rand = random.Random(1)
+    for _ in range(1000):
+        zoom = rand.randint(0, 20)
+        x, y = rand.randrange(1 << zoom), rand.randrange(1 << zoom)
+        b = tile_bounds(zoom, x, y)
+        lon, lat = (b.west + b.east) / 2, (b.south + b.north) / 2
+        assert (tile_x(lon, zoom), tile_y(lat, zoom)) == (x, y)
+
+
+def test_parse_bbox():
+    assert parse_bbox("-125, 24.5,-66,50") == BoundingBox(-125, 24.5, -66, 50)
+    assert parse_bbox("170,-10,-170,10") == BoundingBox(170, -10, -170, 10)
+    assert parse_bbox("-180,-90,180,90") == WORLD
+
+
+def test_parse_bbox_fail():
+    for bbox, err in [
+        ("1,2,3", "A bounding box must have 4 comma separated values: west,south,east,north"),
+        ("1,2,3,4,5",
+         "A bounding box must have 4 comma separated values: west,south,east,north"),
+        ("1,2,x,4", "Illegal bounding box value in '1,2,x,4'"),
+        ("1,2,,4", "Illegal bounding box value in '1,2,,4'"),
+        ("1,2,nan,4", "Illegal bounding box value in '1,2,nan,4'"),
+        ("-180.1,2,3,4", "Bounding box longitudes must be between -180 and 180: -180.1"),
+        ("1,2,180.5,4", "Bounding box longitudes must be between -180 and 180: 180.5"),
+        ("1,-91,3,4", "Bounding box latitudes must be between -90 and 90: -91.0"),
+        ("1,2,3,90.2", "Bounding box latitudes must be between -90 and 90: 90.2"),
+        ("1,5,3,4", "The bounding box south latitude 5.0 is greater than the north latitude 4.0"),
+    ]:
+        with raises(Exception) as got:
+            parse_bbox(bbox)
+        assert_exception_correct(got.value, ValueError(err))
+
+
+def test_tile_range():
+    assert tile_range(WORLD, 0) == TileRange(0, 0, 0, 0, 0)
+    assert tile_range(WORLD, 0).tile_count() == 1
+    assert tile_range(WORLD, 3) == TileRange(3, 0, 7, 0, 7)
+    assert tile_range(WORLD, 3).tile_count() == 64
+    tr = tile_range(BoundingBox(-125, 24.5, -66, 50), 4)
+    assert tr == TileRange(4, 2, 5, 5, 6)
+    assert tr.tile_count() == 8
+    assert tr.contains(2, 5) and tr.contains(5, 6)
+    assert not tr.contains(1, 5) and not tr.contains(6, 5) and not tr.contains(3, 4)
+    # crossing the antimeridian
+    tr = tile_range(BoundingBox(170, -10, -170, 10), 4)
+    assert tr == TileRange(4, 15, 0, 7, 8, wraps=True)
+    assert tr.tile_count() == 4
+    assert tr.contains(15, 7) and tr.contains(0, 8)
+    assert not tr.contains(1, 7) and not tr.contains(14, 7)
+    # crossing the antimeridian in the same tile covers the world
+    tr = tile_range(BoundingBox(10, -10, 5, 10), 0)
+    assert tr.tile_count() == 1
+    assert tr.contains(0, 0)
+
+
+def test_tile_range_fail():
+    for zoom in [-1, 21]:
+        with raises(Exception) as got:
+            tile_range(WORLD, zoom)
+        assert_exception_correct(got.value, ValueError(f"zoom must be between 0 and 20: {zoom}"))
+
+
+def test_aggregate_tiles():
+    samples = [
+        _sample("s3", 37.8, -122.2, 2),
+        _sample("s1", 37.9, -122.4, 3),
+        _sample("s2", -33.9, 151.2),
+        _sample("s4", None, 10.0),
+        {names.FLD_KB_SAMPLE_ID: "s5"},
+    ]
+    assert aggregate_tiles(samples, 0) == [{
+        "x": 0,
+        "y": 0,
+        "lat": (37.8 + 37.9 - 33.9) / 3,
+        "lon": (-122.2 - 122.4 + 151.2) / 3,
+        "count": 6,
+        "sample_count": 3,
+        "ids": ["s1", "s2", "s3"],
+    }]
+    got = aggregate_tiles(samples, 4, max_ids=1)
+    assert [(t["x"], t["y"], t["count"], t["sample_count"], t["ids"]) for t in got] == [
+        (2, 6, 5, 2, ["s1"]),
+        (14, 9, 1, 1, ["s2"]),
+    ]
+    assert math.isclose(got[0]["lat"], 37.85)
+    got = aggregate_tiles(samples, 4, tiles=TileRange(4, 10, 15, 0, 15))
+    assert [(t["x"], t["y"]) for t in got] == [(14, 9)]
+    assert aggregate_tiles([], 4) == []
+
+
+def test_aggregate_tiles_many():
+    rand = random.Random(42)
+    samples = [_sample(f"s{i:04}", rand.uniform(-90, 90), rand.uniform(-180, 180), i % 5)
+               for i in range(5000)]
+    for zoom in [0, 2, 6]:
+        tiles = aggregate_tiles(samples, zoom)
+        assert sum(t["sample_count"] for t in tiles) == 5000
+        assert sum(t["count"] for t in tiles) == sum(s["genome_count"] for s in samples)
+        assert len(tiles) <= 4 ** zoom
+        assert all(len(t["ids"]) <= names.SAMPLE_TILE_MAX_IDS for t in tiles)
+        assert [(t["y"], t["x"]) for t in tiles] == sorted((t["y"], t["x"]) for t in tiles)
+
+
+def test_aql_tile_coordinates():
+    aql = aql_tile_coordinates("s")
+    assert "s.latitude" in aql
+    assert "s.longitude" in aql
+    assert "@tiles_per_side" in aql
+    assert "LET x =" in aql
+    assert "LET y =" in aql
@@ -21,3 +21,45 @@ def assert_exception_correct(got: Exception, expected: Exception):
     err = "".join(traceback.TracebackException.from_exception(got).format())
     assert got.args == expected.args, err
     assert type(got) == type(expected)
+
+
+class FakeCursor:
+    """
+    An in memory stand in for an ArangoDB cursor that iterates over a list of documents.
+    """
+
+    def __init__(self, docs):
+        self._docs = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._docs)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self, ignore_missing=False):
+        pass
+
+
+class FakeStorage:
+    """
+    An in memory stand in for ArangoStorage.execute_aql that records the AQL and bind
+    variables of each query and returns copies of a list of documents. Override `results` to
+    vary the documents by query.
+    """
+
+    def __init__(self, docs=None):
+        self.docs = docs or []
+        self.queries = []
+
+    def results(self, aql, bind_vars):
+        return [dict(d) for d in self.docs]
+
+    async def execute_aql(
+        self, aql, bind_vars=None, count=False, batch_size=None, query_shape=None, op=None
+    ):
+        self.queries.append((aql, bind_vars))
+        return FakeCursor(self.results(aql, bind_vars))
@@ -0,0 +1,177 @@
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+from src.loaders.common import arango_bulk_importer as abi
+from conftest import assert_exception_correct
+
+
+class FakeArango:
+    """
+    A fake ArangoDB import endpoint that records the chunks it receives and can inject failures.
+    """
+
+    def __init__(self, fail: dict[int, list[int]] = None, timeouts: dict[int, int] = None):
+        # first doc number in chunk -> list of status codes to return before succeeding
+        self.fail = {k: list(v) for k, v in (fail or {}).items()}
+        # first doc number in chunk -> number of timeouts to raise before succeeding
+        self.timeouts = dict(timeouts or {})
+        self.requests = []
+        self.received = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        docs = [json.loads(line) for line in request.content.decode().splitlines() if line.strip()]
+        first = docs[0]["n"]
+        if self.timeouts.get(first):
+            self.timeouts[first] -= 1
+            raise httpx.ReadTimeout("timeout", request=request)
+        if self.fail.get(first):
+            status = self.fail[first].pop(0)
+            return httpx.Response(status, json={"error": True, "errorMessage": "fail"})
+        self.received.append(first)
+        return httpx.Response(201, json={
+            "error": False, "created": len(docs), "errors": 0, "empty": 0, "updated": 0, "ignored": 0
+        })
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=httpx.MockTransport(self.handler), base_url="http://fake/_db/db")
+
+
+async def _no_sleep(_):
+    pass
+
+
+def _write_jsonl(tmp_path: Path, count: int) -> Path:
+    f = tmp_path / "docs.jsonl"
+    with open(f, "w") as out:
+        for i in range(count):
+            out.write(json.dumps({"_key": f"k{i}", "n": i}) + "\n")
+    return f
+
+
+@pytest.mark.asyncio
+async def test_import_file(tmp_path):
+    f = _write_jsonl(tmp_path, 25)
+    fake = FakeArango()
+    async with fake.client() as cli:
+        res = await abi.import_file(
+            cli, f, "mycoll", chunk_size=10, concurrency=2, on_duplicate="replace", sleep=_no_sleep)
+
+    assert res == abi.ImportResult(
+        chunks_total=3, chunks_skipped=0, created=25, errors=0, empty=0, updated=0, ignored=0,
+        throttle_events=0)
+    assert sorted(fake.received) == [0, 10, 20]
+    req = fake.requests[0]
+    assert req.url.path == "/_db/db/_api/import"
+    assert dict(req.url.params) == {
+        "type": "documents",
+        "collection": "mycoll",
+        "onDuplicate": "replace",
+        "complete": "true",
+        "details": "true",
+    }
+    assert not abi.checkpoint_path(f).exists()
+
+
+@pytest.mark.asyncio
+async def test_import_file_throttles_on_503_and_timeout(tmp_path):
+    f = _write_jsonl(tmp_path, 40)
+    fake = FakeArango(fail={10: [503, 503]}, timeouts={30: 1})
+    sleeps = []
+
+    async def sleep(t):
+        sleeps.append(t)
+
+    async with fake.client() as cli:
+        res = await abi.import_file(
+            cli, f, "mycoll", chunk_size=10, concurrency=4, backoff_sec=0.5, sleep=sleep)
+
+    assert res.created == 40
+    assert res.throttle_events == 3
+    assert sorted(fake.received) == [0, 10, 20, 30]
+    assert sorted(sleeps) == [0.5, 0.5, 1.0]
+
+
+@pytest.mark.asyncio
+async def test_import_file_resumes_from_checkpoint(tmp_path):
+    f = _write_jsonl(tmp_path, 30)
+    fake = FakeArango(fail={20: [500]})
+    async with fake.client() as cli:
+        with pytest.raises(abi.BulkImportError, match="Chunk 2 failed to import with status 500"):
+            await abi.import_file(cli, f, "mycoll", chunk_size=10, concurrency=1, sleep=_no_sleep)
+
+    ckpt = json.loads(abi.checkpoint_path(f).read_text())
+    assert ckpt["completed_chunks"] == [0, 1]
+    assert fake.received == [0, 10]
+
+    async with fake.client() as cli:
+        res = await abi.import_file(cli, f, "mycoll", chunk_size=10, concurrency=1, sleep=_no_sleep)
+
+    assert res.chunks_total == 3
+    assert res.chunks_skipped == 2
+    assert res.created == 10
+    assert fake.received == [0, 10, 20]
+    assert not abi.checkpoint_path(f).exists()
+
+
+@pytest.mark.asyncio
+async def test_import_file_retries_exhausted(tmp_path):
+    f = _write_jsonl(tmp_path, 5)
+    fake = FakeArango(fail={0: [503, 503, 503]})
+    async with fake.client() as cli:
+        with pytest.raises(abi.BulkImportError) as got:
+            await abi.import_file(cli, f, "mycoll", max_retries=2, sleep=_no_sleep)
+    assert_exception_correct(got.value, abi.BulkImportError(
+        "Chunk 0 could not be imported after 3 attempts due to server overload or timeouts"))
+    assert not abi.checkpoint_path(f).exists()
+
+
+@pytest.mark.asyncio
+async def test_import_file_checkpoint_mismatch(tmp_path):
+    f = _write_jsonl(tmp_path, 30)
+    fake = FakeArango(fail={10: [500]})
+    async with fake.client() as cli:
+        with pytest.raises(abi.BulkImportError):
+            await abi.import_file(cli, f, "mycoll", chunk_size=10, concurrency=1, sleep=_no_sleep)
+        with pytest.raises(abi.CheckpointMismatchError, match="chunk_size is 10 in the checkpoint"):
+            await abi.import_file(cli, f, "mycoll", chunk_size=5, concurrency=1, sleep=_no_sleep)
+        # restart ignores the checkpoint and imports everything
+        res = await abi.import_file(
+            cli, f, "mycoll", chunk_size=5, concurrency=1, restart=True, sleep=_no_sleep)
+    assert res.chunks_skipped == 0
+    assert res.created == 30
+
+
+@pytest.mark.asyncio
+async def test_import_file_bad_args(tmp_path):
+    f = _write_jsonl(tmp_path, 1)
+    async with FakeArango().client() as cli:
+        for kwargs, err in [
+            ({"chunk_size": 0}, "chunk_size must be > 0"),
+            ({"concurrency": 0}, "concurrency must be > 0"),
+            ({"max_retries": -1}, "max_retries must be >= 0"),
+            ({"on_duplicate": "foo"}, "on_duplicate must be one of "
+                + "['error', 'update', 'replace', 'ignore']"),
+        ]:
+            with pytest.raises(ValueError) as got:
+                await abi.import_file(cli, f, "mycoll", **kwargs)
+            assert_exception_correct(got.value, ValueError(err))
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter():
+    lim = abi._AdaptiveLimiter(8)
+    await lim.acquire()
+    await lim.release(True)
+    assert lim.limit == 4
+    await lim.acquire()
+    await lim.release(True)
+    assert lim.limit == 2
+    for _ in range(abi._RECOVERY_SUCCESSES):
+        await lim.acquire()
+        await lim.release(False)
+    assert lim.limit == 3
@@ -107,6 +107,24 @@ def test_create_json_default(setup_and_teardown):
     expected_ranks_inorder = ['domain', 'phylum', 'class', 'order', 'family', 'genus', 'species']
     ranks_result_file = _create_taxa_count_ranks_result_file(tmp_dir, env, expected_collection, load_version)
     _exam_rank_result_file(ranks_result_file, load_version, expected_collection, expected_ranks_inorder)
+    top_result_file = os.path.join(
+        tmp_dir, IMPORT_DIR, env, kbcoll, load_version,
+        f'{kbcoll}_{load_version}_{names.COLL_TAXA_COUNT_TOP}.jsonl')
+    _exam_top_result_file(top_result_file, count_result_file, expected_ranks_inorder)
+
+
+def _exam_top_result_file(top_result_file, count_result_file, expected_ranks):
+    with jsonlines.open(top_result_file, 'r') as jsonl_f:
+        top = {d['rank']: d for d in jsonl_f}
+    with jsonlines.open(count_result_file, 'r') as jsonl_f:
+        counts = [obj for obj in jsonl_f]
+
+    assert set(top.keys()) == set(expected_ranks)
+    for rank, doc in top.items():
+        assert set(doc.keys()) == {'_key', 'coll', 'load_ver', 'rank', 'internal_id', 'top'}
+        expected = sorted([{'name': c['name'], 'count': c['count']} for c in counts
+                           if c['rank'] == rank], key=lambda c: (-c['count'], c['name']))
+        assert doc['top'] == expected[:names.TAXA_COUNT_TOP_K]
 
 
 def test_create_json_option_input(setup_and_teardown):
@@ -3,3 +3,25 @@ import src.loaders.genome_collection.parse_tool_results as parse_tool_results
 
 def test_noop():
     assert True
+
+
+def test_create_sample_tiles_docs():
+    samples = [
+        {"kbase_sample_id": "s1", "latitude": 37.9, "longitude": -122.4, "genome_count": 3},
+        {"kbase_sample_id": "s2", "latitude": -33.9, "longitude": 151.2, "genome_count": 1},
+    ]
+    docs = parse_tool_results._create_sample_tiles_docs(iter(samples), "ENIGMA", "1")
+    assert [d["zoom"] for d in docs] == list(range(7))
+    assert docs[0]["coll"] == "ENIGMA"
+    assert docs[0]["load_ver"] == "1"
+    assert len({d["_key"] for d in docs}) == 7
+    assert docs[0]["tiles"] == [{
+        "x": 0,
+        "y": 0,
+        "lat": (37.9 - 33.9) / 2,
+        "lon": (-122.4 + 151.2) / 2,
+        "count": 4,
+        "sample_count": 2,
+        "ids": ["s1", "s2"],
+    }]
+    assert [len(d["tiles"]) for d in docs] == [1, 2, 2, 2, 2, 2, 2]
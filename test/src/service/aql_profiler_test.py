@@ -0,0 +1,169 @@
+import asyncio
+import logging
+
+import pytest
+
+from conftest import assert_exception_correct
+from src.service.aql_profiler import (
+    AQLProfiler,
+    PlanSummary,
+    bind_var_shape,
+    normalize_query,
+    summarize_plan,
+)
+from src.service.models import DynamicConfig
+
+
+_PLAN = {"nodes": [
+    {"type": "SingletonNode"},
+    {"type": "IndexNode", "collection": "coll1", "indexes": [
+        {"type": "persistent", "name": "idx_1", "fields": ["a", "b"]}]},
+    {"type": "EnumerateCollectionNode", "collection": "coll2"},
+    {"type": "ReturnNode"},
+]}
+
+
+class _Explainer:
+
+    def __init__(self, plan=None, err=None):
+        self.plan = plan or _PLAN
+        self.err = err
+        self.calls = []
+
+    async def __call__(self, aql, bind_vars):
+        self.calls.append((aql, bind_vars))
+        if self.err:
+            raise self.err
+        return self.plan
+
+
+def _cfg_provider(enabled=True, slow_ms=100):
+    async def provider():
+        return DynamicConfig(aql_profiling=enabled, aql_slow_query_ms=slow_ms)
+    return provider
+
+
+def test_normalize_query():
+    assert normalize_query("  FOR d IN @@coll\n\n    RETURN    d ") == "FOR d IN @@coll RETURN d"
+
+
+def test_bind_var_shape():
+    assert bind_var_shape(None) == {}
+    assert bind_var_shape({"limit": 3, "@coll": "c", "keep": ["a"], "view": None}) == {
+        "@coll": "c", "keep": "list", "limit": "int", "view": "NoneType"}
+
+
+def test_summarize_plan():
+    assert summarize_plan(_PLAN) == PlanSummary(
+        indexes=["coll1.idx_1 (persistent: a, b)"], full_scans=["coll2"], explain_error=None)
+    assert summarize_plan({}) == PlanSummary(indexes=[], full_scans=[], explain_error=None)
+
+
+def test_init_fail():
+    for kwargs, err in [
+        ({"max_signatures": 0}, "max_signatures must be > 0"),
+        ({"max_plans": 0}, "max_plans must be > 0"),
+    ]:
+        with pytest.raises(Exception) as got:
+            AQLProfiler(_Explainer(), _cfg_provider(), **kwargs)
+        assert_exception_correct(got.value, ValueError(err))
+
+
+@pytest.mark.asyncio
+async def test_disabled_and_fast_queries_ignored():
+    for enabled, elapsed in [(False, 10), (True, 0.099)]:
+        exp = _Explainer()
+        prof = AQLProfiler(exp, _cfg_provider(enabled))
+        await prof.record("op", "FOR d IN @@coll RETURN d", {"@coll": "c"}, elapsed)
+        assert exp.calls == []
+        assert prof.get_slowest(10) == []
+
+
+@pytest.mark.asyncio
+async def test_record_explains_once_and_logs(caplog):
+    exp = _Explainer()
+    prof = AQLProfiler(exp, _cfg_provider())
+    with caplog.at_level(logging.WARNING):
+        await prof.record("f1", "FOR d IN @@coll\n  RETURN d", {"@coll": "c", "x": 1}, 0.2)
+        await prof.record("f2", "FOR d IN @@coll RETURN d", {"@coll": "c", "x": "y"}, 0.4)
+    assert exp.calls == [("FOR d IN @@coll\n  RETURN d", {"@coll": "c", "x": 1})]
+    got = prof.get_slowest(10)
+    assert len(got) == 1
+    sq = got[0]
+    assert sq.query == "FOR d IN @@coll RETURN d"
+    assert sq.op == "f2"
+    assert sq.bind_vars == {"@coll": "c", "x": "str"}
+    assert sq.count == 2
+    assert sq.max_ms == pytest.approx(400)
+    assert sq.mean_ms == pytest.approx(300)
+    assert sq.last_ms == pytest.approx(400)
+    assert sq.plan == summarize_plan(_PLAN)
+    assert "Slow AQL query" in caplog.records[0].getMessage()
+    assert "coll1.idx_1" in caplog.records[0].getMessage()
+    assert caplog.records[1].getMessage() == (
+        f"Slow AQL query {sq.signature} performs a full scan of collection coll2")
+
+
+@pytest.mark.asyncio
+async def test_explain_error():
+    exp = _Explainer(err=ValueError("no explain for you"))
+    prof = AQLProfiler(exp, _cfg_provider())
+    await prof.record("f", "RETURN 1", None, 1)
+    await prof.record("f", "RETURN 1", None, 1)
+    assert exp.calls == [("RETURN 1", {})]
+    assert prof.get_slowest(1)[0].plan == PlanSummary(
+        indexes=[], full_scans=[], explain_error="no explain for you")
+
+
+@pytest.mark.asyncio
+async def test_record_in_background():
+    release = asyncio.Event()
+
+    class BlockingExplainer(_Explainer):
+        async def __call__(self, aql, bind_vars):
+            await release.wait()
+            return await super().__call__(aql, bind_vars)
+
+    exp = BlockingExplainer()
+    prof = AQLProfiler(exp, _cfg_provider())
+    task = prof.record("f", "RETURN 1", None, 1)
+    await asyncio.sleep(0)
+    assert not task.done()
+    assert prof.get_slowest(1) == []
+    release.set()
+    await task
+    assert [s.query for s in prof.get_slowest(1)] == ["RETURN 1"]
+
+
+@pytest.mark.asyncio
+async def test_record_logs_config_error(caplog):
+    async def provider():
+        raise ValueError("no config for you")
+
+    exp = _Explainer()
+    prof = AQLProfiler(exp, provider)
+    with caplog.at_level(logging.ERROR):
+        await prof.record("f", "RETURN 1", None, 1)
+    assert caplog.records[0].getMessage() == "Failed to profile AQL query for operation f"
+    assert exp.calls == []
+    assert prof.get_slowest(1) == []
+
+
+@pytest.mark.asyncio
+async def test_slowest_ordering_and_bounds():
+    exp = _Explainer()
+    prof = AQLProfiler(exp, _cfg_provider(), max_signatures=2, max_plans=1)
+    await prof.record("f", "RETURN 1", None, 0.3)
+    await prof.record("f", "RETURN 2", None, 0.5)
+    # slower than the fastest signature, replaces it
+    await prof.record("f", "RETURN 3", None, 0.4)
+    # faster than all the signatures, ignored
+    await prof.record("f", "RETURN 4", None, 0.2)
+    assert [s.query for s in prof.get_slowest(10)] == ["RETURN 2", "RETURN 3"]
+    assert [s.query for s in prof.get_slowest(1)] == ["RETURN 2"]
+    # plan for RETURN 2 was evicted from the cache
+    await prof.record("f", "RETURN 2", None, 0.6)
+    assert [c[0] for c in exp.calls] == [
+        "RETURN 1", "RETURN 2", "RETURN 3", "RETURN 4", "RETURN 2"]
+    prof.clear()
+    assert prof.get_slowest(10) == []
@@ -0,0 +1,44 @@
+import pytest
+
+from conftest import assert_exception_correct
+from src.service.batch_sizer import BatchSizer
+
+
+def test_init_fail():
+    for kwargs, err in [
+        ({"target_bytes": 0}, "target_bytes must be > 0"),
+        ({"min_size": 0}, "min_size must be > 0"),
+        ({"min_size": 10, "max_size": 9}, "max_size must be >= min_size"),
+        ({"smoothing": 0}, "smoothing must be > 0 and <= 1"),
+        ({"smoothing": 1.1}, "smoothing must be > 0 and <= 1"),
+    ]:
+        with pytest.raises(Exception) as got:
+            BatchSizer(**kwargs)
+        assert_exception_correct(got.value, ValueError(err))
+
+
+def test_batch_size_hint():
+    bs = BatchSizer()
+    assert bs.batch_size("k") is None
+    assert bs.batch_size("k", 500) == 500
+    assert bs.doc_bytes("k") is None
+    # empty results and unmeasured sizes don't count
+    bs.record("k", 0, 100)
+    bs.record("k", 10, 0)
+    assert bs.batch_size("k", 500) == 500
+
+
+def test_batch_size_adapts():
+    bs = BatchSizer(target_bytes=100_000, min_size=5, max_size=5000, smoothing=0.5)
+    bs.record("small", 1000, 20_000)
+    bs.record("large", 10, 200_000)
+    assert bs.doc_bytes("small") == 20
+    # the hint is ignored once the document size is known
+    assert bs.batch_size("small", 100) == 5000
+    assert bs.batch_size("large", 100) == 5
+    bs.record("medium", 100, 100_000)
+    assert bs.batch_size("medium") == 100
+    # moving average
+    bs.record("medium", 100, 300_000)
+    assert bs.doc_bytes("medium") == 2000
+    assert bs.batch_size("medium") == 50
@@ -0,0 +1,183 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+import pytest
+
+from src.service import compression
+from src.service.compression import (
+    BROTLI,
+    GZIP,
+    ZSTD,
+    CompressionLevels,
+    CompressionMiddleware,
+    negotiate_encoding,
+)
+
+
+_BIG = "a big body " * 200
+
+
+def test_negotiate_encoding():
+    encs = [ZSTD, BROTLI, GZIP]
+    for header, expected in [
+        (None, None),
+        ("", None),
+        ("identity", None),
+        ("deflate", None),
+        ("gzip", GZIP),
+        ("GZip", GZIP),
+        ("gzip, deflate, br", BROTLI),
+        ("gzip, deflate, br, zstd", ZSTD),
+        ("br;q=0.5, gzip", GZIP),
+        ("br;q=0.5, gzip;q=0.5", BROTLI),
+        ("zstd;q=0, gzip;q=0.1", GZIP),
+        ("zstd;q=foo, gzip;q=0.1", GZIP),
+        ("*", ZSTD),
+        ("*;q=0.5, br", BROTLI),
+        ("*, zstd;q=0", BROTLI),
+        ("gzip;q=0", None),
+        (" , gzip ; q=1 ,", GZIP),
+    ]:
+        assert negotiate_encoding(header, encs) == expected, header
+    assert negotiate_encoding("zstd, br", [GZIP]) is None
+    assert negotiate_encoding("zstd, br, gzip", [GZIP, BROTLI]) == GZIP
+
+
+def test_compression_levels():
+    lv = CompressionLevels()
+    assert (lv.get(ZSTD), lv.get(BROTLI), lv.get(GZIP)) == (3, 4, 6)
+    lv = CompressionLevels(zstd=1, br=2, gzip=9)
+    assert (lv.get(ZSTD), lv.get(BROTLI), lv.get(GZIP)) == (1, 2, 9)
+
+
+def test_available_encodings():
+    encs = compression.available_encodings()
+    assert encs[-1] == GZIP
+    assert encs == [e for e in [ZSTD, BROTLI, GZIP] if e in encs]
+
+
+def _app(**kwargs):
+    app = FastAPI()
+
+    @app.get("/small")
+    async def small():
+        return PlainTextResponse("small")
+
+    @app.get("/big")
+    async def big():
+        return PlainTextResponse(_BIG)
+
+    @app.get("/big/{thing}")
+    async def big_thing(thing: str):
+        return PlainTextResponse(thing + _BIG)
+
+    @app.get("/encoded")
+    async def encoded():
+        return PlainTextResponse(_BIG, headers={"Content-Encoding": "custom"})
+
+    @app.get("/stream")
+    async def stream():
+        async def gen():
+            for i in range(5):
+                yield f"chunk {i} " * 100
+        return StreamingResponse(gen(), media_type="text/plain")
+
+    @app.get("/events")
+    async def events():
+        async def gen():
+            yield "data: foo\n\n" * 200
+        return StreamingResponse(gen(), media_type="text/event-stream")
+
+    app.add_middleware(CompressionMiddleware, encodings=[GZIP], **kwargs)
+    return app
+
+
+def _get(cli, path, accept="gzip"):
+    # httpx decodes the body based on the content encoding
+    return cli.get(path, headers={"Accept-Encoding": accept})
+
+
+def test_middleware_gzip():
+    cli = TestClient(_app())
+    res = _get(cli, "/big")
+    assert res.status_code == 200
+    assert res.headers["content-encoding"] == "gzip"
+    assert res.headers["vary"] == "Accept-Encoding"
+    assert res.text == _BIG
+    assert int(res.headers["content-length"]) < len(_BIG) / 10
+
+
+def test_middleware_no_compression():
+    cli = TestClient(_app())
+    for path, accept, body in [
+        ("/big", "identity", _BIG),
+        ("/big", "br", _BIG),
+        ("/small", "gzip", "small"),
+        ("/events", "gzip", "data: foo\n\n" * 200),
+    ]:
+        res = _get(cli, path, accept)
+        assert "content-encoding" not in res.headers, path
+        assert res.text == body
+    res = _get(cli, "/encoded")
+    assert res.headers["content-encoding"] == "custom"
+    assert res.content == _BIG.encode()
+
+
+def test_middleware_minimum_size():
+    cli = TestClient(_app(minimum_size=len(_BIG) + 1))
+    assert "content-encoding" not in _get(cli, "/big").headers
+    assert _get(cli, "/big/x").headers["content-encoding"] == "gzip"
+
+
+def test_middleware_stream():
+    cli = TestClient(_app(thread_size=1000))
+    res = _get(cli, "/stream")
+    assert res.headers["content-encoding"] == "gzip"
+    assert "content-length" not in res.headers
+    assert res.text == "".join(f"chunk {i} " * 100 for i in range(5))
+
+
+def test_middleware_thread():
+    cli = TestClient(_app(thread_size=1))
+    res = _get(cli, "/big")
+    assert res.headers["content-encoding"] == "gzip"
+    assert res.text == _BIG
+
+
+def test_middleware_route_levels():
+    cli = TestClient(_app(
+        levels=CompressionLevels(gzip=1),
+        route_levels={"/big/{thing}": CompressionLevels(gzip=9)},
+    ))
+    # the gzip header records whether the fastest or maximum compression level was used
+    raw = _raw(cli, "/big")
+    assert raw[8] == 4  # fastest
+    assert gzip.decompress(raw).decode() == _BIG
+    raw = _raw(cli, "/big/x")
+    assert raw[8] == 2  # maximum compression
+    assert gzip.decompress(raw).decode() == "x" + _BIG
+
+
+def _raw(cli, path):
+    with cli.stream("GET", path, headers={"Accept-Encoding": "gzip"}) as res:
+        return b"".join(res.iter_raw())
+
+
+@pytest.mark.parametrize("encoding", [ZSTD, BROTLI])
+def test_optional_encodings(encoding):
+    if encoding not in compression.available_encodings():
+        pytest.skip(f"{encoding} is not installed")
+    data = _BIG.encode()
+    comp = compression.compress(encoding, 3, data)
+    assert len(comp) < len(data) / 10
+    app = FastAPI()
+
+    @app.get("/big")
+    async def big():
+        return PlainTextResponse(_BIG)
+
+    app.add_middleware(CompressionMiddleware)
+    res = TestClient(app).get("/big", headers={"Accept-Encoding": encoding})
+    assert res.headers["content-encoding"] == encoding
@@ -24,4 +24,6 @@ def test_config_minimal():
     assert cfg.auth_url == "foobar"
     assert cfg.auth_full_admin_roles == []
     assert cfg.service_root_path == None
+    assert cfg.columnar_snapshot_dir == None
+    assert cfg.heatmap_matrix_dir == None
     assert cfg.workspace_url == "whee"
@@ -0,0 +1,592 @@
+import asyncio
+import operator
+from concurrent.futures import ThreadPoolExecutor
+import random
+import re
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from pyroaring import BitMap
+
+from conftest import FakeCursor, assert_exception_correct
+from src.common.product_models.columnar_attribs_common_models import ColumnType, FilterStrategy
+from src.common.storage import collection_and_field_names as names
+from src.common.storage.db_doc_conversions import collection_load_version_key
+from src.service import models, subset_bitmaps
+from src.service.data_products import columnar_snapshots
+from src.service.data_products.columnar_snapshots import (
+    ColumnarSnapshot,
+    ColumnarSnapshotManager,
+)
+from src.service.filtering.filters import FilterSet
+from src.service.processing import SubsetSpecification
+
+
+_COLL = "GTDB"
+_LV = "r207"
+
+_TYPES = {
+    "kbase_id": ColumnType.STRING,
+    "completeness": ColumnType.FLOAT,
+    "contigs": ColumnType.INT,
+    "release_date": ColumnType.DATE,
+    "classification": ColumnType.STRING,
+    "rep": ColumnType.BOOL,
+}
+
+
+def _maybe(rand, val, null_frac=0.15):
+    return None if rand.random() < null_frac else val
+
+
+def _docs(count=600, seed=7):
+    rand = random.Random(seed)
+    classes = ["a__foo", "a__bar", "é__bär", "", "b__foo"]
+    docs = []
+    for i in range(count):
+        d = {
+            "kbase_id": f"GB_GCA_{i:06}.1",
+            "completeness": _maybe(rand, rand.choice(
+                [100, 50, 90, round(rand.uniform(0, 100), 2)])),
+            "contigs": _maybe(rand, rand.randint(0, 200)),
+            "release_date": _maybe(rand, f"20{rand.randint(18, 22)}-{rand.randint(1, 12):02}-"
+                                   + f"{rand.randint(1, 28):02}T00:00:00+0000"),
+            "classification": _maybe(rand, rand.choice(classes)),
+            "rep": _maybe(rand, rand.random() < 0.5),
+        }
+        if rand.random() < 0.05:
+            # missing fields are treated as null
+            del d["contigs"]
+        docs.append(d)
+    return docs
+
+
+def _columns(docs, types=None):
+    return {k: [d.get(k) for d in docs] for k in (types or _TYPES)}
+
+
+def _snapshot(docs, types=None):
+    return ColumnarSnapshot.from_columns(_COLL, _LV, types or _TYPES, _columns(docs, types))
+
+
+def _fs(*filters, conjunction=True, keep=None, keep_filter_nulls=False, **kwargs):
+    fs = FilterSet(
+        _COLL,
+        _LV,
+        view="view",
+        collection="coll",
+        conjunction=conjunction,
+        keep=keep,
+        keep_filter_nulls=keep_filter_nulls,
+        **kwargs
+    )
+    for f in filters:
+        fs.append(*f)
+    return fs
+
+
+# A minimal evaluator for the ArangoSearch AQL generated by the filters for the operators
+# the snapshots support. ArangoSearch only matches values of the same type as the search term,
+# and null or missing values never match.
+
+_CMP = re.compile(r'^doc\["(?P<f>[^"]+)"\] (?P<op>==|>=|<=|>|<) @(?P<var>\w+)$')
+_RANGE = re.compile(r'^IN_RANGE\(doc\["(?P<f>[^"]+)"\], @(?P<low>\w+), @(?P<high>\w+), '
+                    + r'(?P<li>true|false), (?P<hi>true|false)\)$')
+_OPS = {"==": operator.eq, ">=": operator.ge, "<=": operator.le,
+        ">": operator.gt, "<": operator.lt}
+
+
+def _arango_type(val):
+    if isinstance(val, bool):
+        return "bool"
+    if isinstance(val, (int, float)):
+        return "number"
+    return type(val).__name__
+
+
+def _aql_match(line, bind_vars, doc):
+    m = _CMP.match(line)
+    if m:
+        val, target = doc.get(m["f"]), bind_vars[m["var"]]
+        return (_arango_type(val) == _arango_type(target)
+                and _OPS[m["op"]](val, target))
+    m = _RANGE.match(line)
+    assert m, f"unsupported AQL: {line}"
+    val, low, high = doc.get(m["f"]), bind_vars[m["low"]], bind_vars[m["high"]]
+    if _arango_type(val) != _arango_type(low):
+        return False
+    return ((val >= low if m["li"] == "true" else val > low)
+            and (val <= high if m["hi"] == "true" else val < high))
+
+
+def _aql_select(fs, docs):
+    parts = [flt.to_arangosearch_aql(f'doc["{field}"]', f"v{i}_")
+             for i, (field, flt) in enumerate(fs.filters.items(), start=1)]
+    ret = []
+    for d in docs:
+        if fs.keep_filter_nulls and any(d.get(k) is None for k in fs.keep):
+            continue
+        res = [all(_aql_match(l, p.bind_vars, d) for l in p.aql_lines) for p in parts]
+        if parts and not (all(res) if fs.conjunction else any(res)):
+            continue
+        ret.append(d["kbase_id"])
+    return ret
+
+
+_F = ColumnType.FLOAT
+_I = ColumnType.INT
+_D = ColumnType.DATE
+_S = ColumnType.STRING
+_B = ColumnType.BOOL
+_ID = FilterStrategy.IDENTITY
+
+_FILTERS = [
+    ("completeness", _F, "[50, 90]"),
+    ("completeness", _F, "(50,"),
+    ("completeness", _F, ",90]"),
+    ("completeness", _F, "[100,100]"),
+    ("completeness", _F, "(49.5, 50.5)"),
+    ("contigs", _I, "(10, 100)"),
+    ("contigs", _I, "[0,"),
+    ("contigs", _I, ",5]"),
+    ("release_date", _D, "[2020-01-01,"),
+    ("release_date", _D, "(2019-06-01, 2021-01-01)"),
+    ("release_date", _D, ",2019-03-15T00:00:00+0000]"),
+    ("release_date", _D, "[2000-01-01,2001-01-01]"),
+    ("rep", _B, "true"),
+    ("rep", _B, "false"),
+    ("classification", _S, "a__foo", None, _ID),
+    ("classification", _S, "é__bär", None, _ID),
+    ("classification", _S, "c__nope", None, _ID),
+    ("classification", _S, "zzz", None, _ID),
+]
+
+
+def _assert_equivalent(snap, fs, docs):
+    expected = _aql_select(fs, docs)
+    ids = np.array([d["kbase_id"] for d in docs])
+    assert list(ids[snap.select(fs)]) == expected
+    assert snap.count(fs) == len(expected)
+
+
+def test_equivalence_single_filters():
+    docs = _docs()
+    snap = _snapshot(docs)
+    for f in _FILTERS:
+        _assert_equivalent(snap, _fs(f), docs)
+
+
+def test_equivalence_combined_filters():
+    docs = _docs()
+    snap = _snapshot(docs)
+    rand = random.Random(42)
+    for _ in range(100):
+        filters = {}
+        for f in rand.sample(_FILTERS, rand.randint(2, 4)):
+            filters.setdefault(f[0], f)
+        for conj in [True, False]:
+            _assert_equivalent(snap, _fs(*filters.values(), conjunction=conj), docs)
+
+
+def test_equivalence_no_filters_and_keep_nulls():
+    docs = _docs()
+    snap = _snapshot(docs)
+    _assert_equivalent(snap, _fs(), docs)
+    _assert_equivalent(snap, _fs(keep=["completeness", "contigs"], keep_filter_nulls=True), docs)
+    _assert_equivalent(snap, _fs(keep=["completeness"]), docs)
+    _assert_equivalent(snap, _fs(
+        _FILTERS[0], _FILTERS[-4], keep=["contigs"], keep_filter_nulls=True, conjunction=False
+    ), docs)
+
+
+def test_equivalence_histogram():
+    docs = _docs()
+    snap = _snapshot(docs)
+    fs = _fs(("release_date", _D, "[2020-01-01,"), keep=["contigs"], keep_filter_nulls=True)
+    expected = [d["contigs"] for d in docs if d["kbase_id"] in set(_aql_select(fs, docs))]
+    got = snap.get_values(fs, "contigs")[0]
+    assert got.tolist() == expected
+    np.testing.assert_array_equal(np.histogram(got)[0], np.histogram(expected)[0])
+    np.testing.assert_array_equal(np.histogram(got)[1], np.histogram(expected)[1])
+
+
+def test_get_values_multiple_columns():
+    docs = [
+        {"kbase_id": "a", "completeness": 1.5, "contigs": 3, "rep": True},
+        {"kbase_id": "b", "completeness": None, "contigs": 4, "rep": False},
+        {"kbase_id": "c", "completeness": 2.5, "contigs": None, "rep": True},
+        {"kbase_id": "d", "completeness": 3, "contigs": 6, "rep": None},
+    ]
+    snap = _snapshot(docs)
+    fs = _fs(keep=["completeness", "contigs"], keep_filter_nulls=True)
+    x, y = snap.get_values(fs, "completeness", "contigs")
+    assert x.tolist() == [1.5, 3.0]
+    assert y.tolist() == [3, 6]
+    assert [type(v) for v in y.tolist()] == [int, int]
+    assert snap.get_values(_fs(("rep", _B, "true")), "rep")[0].tolist() == [True, True]
+
+
+def test_get_values_fail():
+    snap = _snapshot(_docs(10))
+    for col, err in [
+        ("foo", "No such column in snapshot: foo"),
+        ("release_date", "Column release_date is not a numeric or boolean column"),
+    ]:
+        with pytest.raises(Exception) as got:
+            snap.get_values(_fs(), "contigs", col)
+        assert_exception_correct(got.value, ValueError(err))
+
+
+def test_from_columns_fail():
+    with pytest.raises(Exception) as got:
+        ColumnarSnapshot.from_columns(
+            _COLL, _LV, {"a": _I, "b": _I}, {"a": [1, 2], "b": [1]})
+    assert_exception_correct(got.value, ValueError("All columns must be the same length"))
+    with pytest.raises(Exception) as got:
+        ColumnarSnapshot.from_columns(
+            _COLL, _LV, {"a": _I}, {"a": [1, 2]}, ordinals=[0, 1, 2])
+    assert_exception_correct(got.value, ValueError("All columns must be the same length"))
+
+
+def _ordinal_docs(count=600):
+    # ordinals are assigned in _key order, which differs from the row order
+    docs = _docs(count)
+    for d, o in zip(docs, random.Random(3).sample(range(count), count)):
+        d["_ord"] = o
+    return docs
+
+
+def _members(docs, *bitmaps):
+    return [d["kbase_id"] for d in docs if all(d["_ord"] in b for b in bitmaps)]
+
+
+def test_from_docs_ordinals():
+    docs = _ordinal_docs(10)
+    assert ColumnarSnapshot.from_docs(_COLL, _LV, _TYPES, docs).has_ordinals is True
+    docs[4].pop("_ord")
+    assert ColumnarSnapshot.from_docs(_COLL, _LV, _TYPES, docs).has_ordinals is False
+    assert ColumnarSnapshot.from_docs(_COLL, _LV, _TYPES, []).has_ordinals is False
+    assert _snapshot(docs).has_ordinals is False
+
+
+def test_with_subsets():
+    docs = _ordinal_docs()
+    snap = ColumnarSnapshot.from_docs(_COLL, _LV, _TYPES, docs)
+    rand = random.Random(11)
+    mbits = BitMap(rand.sample(range(len(docs)), 200))
+    sbits = BitMap(rand.sample(range(len(docs)), 300) + [10_000])
+    match = SubsetSpecification(internal_subset_id="m1", prefix="m_")
+    sel = SubsetSpecification(internal_subset_id="s1", prefix="s_")
+    msnap = snap.with_subsets({"m_m1": mbits})
+    both = snap.with_subsets({"m_m1": mbits, "s_s1": sbits})
+    for f in [None] + _FILTERS:
+        filters = [f] if f else []
+        members = set(_members(docs, mbits))
+        fs = _fs(*filters, match_spec=match)
+        assert msnap.count(fs) == len([k for k in _aql_select(fs, docs) if k in members])
+        members = set(_members(docs, mbits, sbits))
+        fs = _fs(*filters, match_spec=match, selection_spec=sel)
+        assert both.count(fs) == len([k for k in _aql_select(fs, docs) if k in members])
+    # the subsets must be exactly those in the filters
+    for s_, fs in [
+        (snap, _fs(match_spec=match)),
+        (msnap, _fs()),
+        (msnap, _fs(selection_spec=sel)),
+        (msnap, _fs(match_spec=SubsetSpecification(internal_subset_id="m2", prefix="m_"))),
+        (msnap, _fs(match_spec=match, selection_spec=sel)),
+        (both, _fs(match_spec=match)),
+    ]:
+        assert not s_.supports(fs)
+    # marks don't filter
+    mark = SubsetSpecification(internal_subset_id="m1", mark_only=True, prefix="m_")
+    assert snap.supports(_fs(match_spec=mark))
+    assert msnap.with_subsets({}).count(_fs()) == len(docs)
+
+
+def test_with_subsets_fail_no_ordinals():
+    with pytest.raises(Exception) as got:
+        _snapshot(_docs(10)).with_subsets({"m_m1": BitMap([1])})
+    assert_exception_correct(got.value, ValueError("The snapshot rows have no ordinals"))
+
+
+def test_supports():
+    docs = _docs(20)
+    docs[3]["contigs"] = "NA"
+    snap = _snapshot(docs)
+    assert snap.supports(_fs(*_FILTERS[0:1], keep=["completeness"]))
+    match = SubsetSpecification(internal_subset_id="m", prefix="m_")
+    mark = SubsetSpecification(internal_subset_id="m", mark_only=True, prefix="m_")
+    assert snap.supports(_fs(match_spec=mark))
+    for fs in [
+        FilterSet("other", _LV, collection="c"),
+        FilterSet(_COLL, "other", collection="c"),
+        _fs(match_spec=match),
+        _fs(selection_spec=match),
+        _fs(keep=["foo"]),
+        # column with wrongly typed values is excluded from the snapshot
+        _fs(keep=["contigs"]),
+        _fs(("contigs", _I, "[1,")),
+        _fs(("classification", _S, "foo", "text_en", FilterStrategy.PREFIX)),
+        _fs(("classification", _S, "foo", "text_en", FilterStrategy.FULL_TEXT)),
+        _fs(("classification", _S, "foo", "ngram", FilterStrategy.NGRAM)),
+        # mismatched column types
+        _fs(("release_date", _F, "[1,")),
+        _fs(("completeness", _D, "[2020-01-01,")),
+        _fs(("rep", _S, "true", None, _ID)),
+    ]:
+        assert not snap.supports(fs)
+    with pytest.raises(Exception) as got:
+        snap.select(_fs(keep=["foo"]))
+    assert_exception_correct(
+        got.value, ValueError("The filters are not supported by this snapshot"))
+
+
+def test_save_load(tmp_path):
+    docs = _docs()
+    snap = _snapshot(docs)
+    path = tmp_path / "snap.npz"
+    snap.save(path)
+    assert [p.name for p in tmp_path.iterdir()] == ["snap.npz"]
+    loaded = ColumnarSnapshot.load(path)
+    assert (loaded.collection_id, loaded.load_ver, loaded.size) == (_COLL, _LV, len(docs))
+    for f in _FILTERS:
+        _assert_equivalent(loaded, _fs(f), docs)
+    assert loaded.has_ordinals is False
+
+    docs = _ordinal_docs()
+    ColumnarSnapshot.from_docs(_COLL, _LV, _TYPES, docs).save(path)
+    bits = BitMap(range(0, len(docs), 3))
+    loaded = ColumnarSnapshot.load(path).with_subsets({"m_m1": bits})
+    fs = _fs(match_spec=SubsetSpecification(internal_subset_id="m1", prefix="m_"))
+    assert loaded.count(fs) == len(_members(docs, bits))
+
+
+def test_save_concurrent(tmp_path):
+    # simulates worker processes building the same snapshot at the same time
+    docs = _docs()
+    path = tmp_path / "snap.npz"
+    with ThreadPoolExecutor(4) as ex:
+        for f in [ex.submit(_snapshot(docs).save, path) for _ in range(8)]:
+            f.result()
+    assert [p.name for p in tmp_path.iterdir()] == ["snap.npz"]
+    assert ColumnarSnapshot.load(path).size == len(docs)
+
+
+def test_save_fail_removes_temp_file(tmp_path, monkeypatch):
+    def savez(f, **arrays):
+        f.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(columnar_snapshots.np, "savez", savez)
+    with pytest.raises(Exception) as got:
+        _snapshot(_docs()).save(tmp_path / "snap.npz")
+    assert_exception_correct(got.value, OSError("disk full"))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_empty_snapshot():
+    snap = _snapshot([])
+    assert snap.size == 0
+    assert snap.count(_fs(("classification", _S, "a__foo", None, _ID))) == 0
+    assert snap.count(_fs(("release_date", _D, "[2020-01-01,"))) == 0
+
+
+class _FakeStorage:
+
+    def __init__(self, docs, err=None):
+        self.docs = docs
+        self.err = err
+        self.queries = []
+        self.bitmaps = {}
+
+    async def get_doc_by_key(self, collection, key, op=None):
+        self.queries.append({"@coll": collection, "key": key})
+        if self.err:
+            raise self.err
+        if collection == names.COLL_SRV_SUBSET_BITMAPS:
+            return self.bitmaps.get(key)
+        assert collection == names.COLL_GENOME_ATTRIBS_META
+        cols = [{"key": k, "type": t.value, "filter_strategy": _ID if t == _S else None}
+                for k, t in _TYPES.items()]
+        return {
+            names.FLD_ARANGO_KEY: key,
+            names.FLD_COLLECTION_ID: _COLL,
+            names.FLD_LOAD_VERSION: _LV,
+            "columns": cols,
+            "count": len(self.docs),
+        }
+
+    async def execute_aql(
+        self, aql, bind_vars=None, count=False, query_shape=None, op=None
+    ):
+        self.queries.append(bind_vars)
+        if self.err:
+            raise self.err
+        if "@coll" in bind_vars:
+            assert bind_vars["@coll"] == names.COLL_SRV_SUBSET_BITMAPS
+            self.bitmaps[bind_vars["key"]] = bind_vars["doc"]
+            return FakeCursor([])
+        assert bind_vars["@collection"] == names.COLL_GENOME_ATTRIBS
+        assert bind_vars["keep"] == list(_TYPES) + ["_ord"]
+        return FakeCursor([dict(d) for d in self.docs])
+
+
+def _manager(store, tmp_path, **kwargs):
+    return ColumnarSnapshotManager(
+        store,
+        tmp_path,
+        names.GENOME_ATTRIBS_PRODUCT_ID,
+        names.COLL_GENOME_ATTRIBS,
+        names.COLL_GENOME_ATTRIBS_META,
+        **kwargs
+    )
+
+
+def _active_collection(load_ver=_LV, product=names.GENOME_ATTRIBS_PRODUCT_ID):
+    return SimpleNamespace(
+        id=_COLL,
+        data_products=[
+            models.DataProduct(product="taxa_count", version="other"),
+            models.DataProduct(product=product, version=load_ver),
+        ]
+    )
+
+
+def test_manager_init_fail(tmp_path):
+    with pytest.raises(Exception) as got:
+        _manager(_FakeStorage([]), tmp_path, max_snapshots=0)
+    assert_exception_correct(got.value, ValueError("max_snapshots must be > 0"))
+
+
+@pytest.mark.asyncio
+async def test_manager_activate_build_and_reload(tmp_path):
+    docs = _docs(50)
+    store = _FakeStorage(docs)
+    mgr = _manager(store, tmp_path)
+    coldir = tmp_path / names.GENOME_ATTRIBS_PRODUCT_ID / _COLL
+    coldir.mkdir(parents=True)
+    (coldir / "r1.npz").write_text("stale")
+    assert mgr.activate(_active_collection(product="other")) is None
+
+    fs = _fs(("rep", _B, "true"))
+    task = mgr.activate(_active_collection())
+    assert await mgr.get_snapshot(fs, _active_collection()) is None
+    await task
+    assert [p.name for p in coldir.iterdir()] == [f"{_LV}.npz"]
+    assert store.queries[0]["key"] == collection_load_version_key(_COLL, _LV)
+    snap = await mgr.get_snapshot(fs, _active_collection())
+    assert snap.count(fs) == len(_aql_select(fs, docs))
+    # unsupported queries go to Arango
+    assert await mgr.get_snapshot(_fs(keep=["foo"]), _active_collection()) is None
+    assert len(store.queries) == 2
+
+    # a new manager loads the snapshot from disk rather than the DB
+    store2 = _FakeStorage(docs)
+    mgr2 = _manager(store2, tmp_path)
+    assert await mgr2.get_snapshot(fs, _active_collection()) is None
+    await asyncio.gather(*mgr2._tasks.values())
+    assert (await mgr2.get_snapshot(fs, _active_collection())).count(fs) == snap.count(fs)
+    assert store2.queries == []
+
+
+@pytest.mark.asyncio
+async def test_manager_corrupt_file_rebuilds(tmp_path):
+    store = _FakeStorage(_docs(5))
+    mgr = _manager(store, tmp_path)
+    path = tmp_path / names.GENOME_ATTRIBS_PRODUCT_ID / _COLL / f"{_LV}.npz"
+    path.parent.mkdir(parents=True)
+    path.write_text("not a snapshot")
+    assert await mgr.get_snapshot(_fs(), _active_collection()) is None
+    await asyncio.gather(*mgr._tasks.values())
+    assert (await mgr.get_snapshot(_fs(), _active_collection())).count(_fs()) == 5
+    assert len(store.queries) == 2
+    assert ColumnarSnapshot.load(path).size == 5
+
+
+@pytest.mark.asyncio
+async def test_manager_lru(tmp_path):
+    mgr = _manager(_FakeStorage(_docs(5)), tmp_path, max_snapshots=1)
+    other = FilterSet(_COLL, "r1", collection="c")
+    for fs in [_fs(), other]:
+        await mgr.get_snapshot(fs, _active_collection(fs.load_ver))
+        await asyncio.gather(*mgr._tasks.values())
+    assert list(mgr._snapshots) == [(_COLL, "r1")]
+    # snapshots in memory are used for any load version
+    assert (await mgr.get_snapshot(other, None)).load_ver == "r1"
+    # the evicted snapshot is reloaded from disk
+    assert await mgr.get_snapshot(_fs(), _active_collection()) is None
+    await asyncio.gather(*mgr._tasks.values())
+    assert list(mgr._snapshots) == [(_COLL, _LV)]
+
+
+@pytest.mark.asyncio
+async def test_manager_only_builds_active_load_version(tmp_path):
+    store = _FakeStorage(_docs(5))
+    mgr = _manager(store, tmp_path)
+    other_coll = SimpleNamespace(id="PMI", data_products=_active_collection().data_products)
+    for active in [None, _active_collection("r1"), _active_collection(product="other"),
+                   other_coll]:
+        assert await mgr.get_snapshot(_fs(), active) is None
+        assert mgr._tasks == {}
+    assert store.queries == []
+    assert await mgr.get_snapshot(_fs(), _active_collection()) is None
+    await asyncio.gather(*mgr._tasks.values())
+    assert (await mgr.get_snapshot(_fs(), None)).count(_fs()) == 5
+
+
+@pytest.mark.asyncio
+async def test_manager_subsets(tmp_path):
+    docs = _ordinal_docs(50)
+    store = _FakeStorage(docs)
+    mgr = _manager(store, tmp_path)
+    await mgr.activate(_active_collection())
+    match = SubsetSpecification(internal_subset_id="m1", prefix="m_")
+    sel = SubsetSpecification(internal_subset_id="s1", prefix="s_")
+    fs = _fs(("rep", _B, "true"), match_spec=match, selection_spec=sel)
+    # no bitmaps stored, e.g. the subset was deleted
+    assert await mgr.get_snapshot(fs, _active_collection()) is None
+    mbits, sbits = BitMap(range(0, 50, 2)), BitMap(range(0, 50, 3))
+    await subset_bitmaps.save_subset_bitmap(
+        store, names.COLL_GENOME_ATTRIBS, _COLL, _LV, "m_m1", mbits)
+    assert await mgr.get_snapshot(fs, _active_collection()) is None
+    await subset_bitmaps.save_subset_bitmap(
+        store, names.COLL_GENOME_ATTRIBS, _COLL, _LV, "s_s1", sbits)
+    snap = await mgr.get_snapshot(fs, _active_collection())
+    members = set(_members(docs, mbits, sbits))
+    assert snap.count(fs) == len([k for k in _aql_select(fs, docs) if k in members])
+    # the cached snapshot isn't altered
+    assert (await mgr.get_snapshot(_fs(), _active_collection())).count(_fs()) == 50
+
+
+@pytest.mark.asyncio
+async def test_manager_subsets_no_ordinals(tmp_path):
+    store = _FakeStorage(_docs(5))
+    mgr = _manager(store, tmp_path)
+    await mgr.activate(_active_collection())
+    await subset_bitmaps.save_subset_bitmap(
+        store, names.COLL_GENOME_ATTRIBS, _COLL, _LV, "m_m1", BitMap([1]))
+    store.queries.clear()
+    fs = _fs(match_spec=SubsetSpecification(internal_subset_id="m1", prefix="m_"))
+    assert await mgr.get_snapshot(fs, _active_collection()) is None
+    # the bitmap isn't fetched if it can't be applied
+    assert store.queries == []
+
+
+@pytest.mark.asyncio
+async def test_manager_build_failure_retry(tmp_path):
+    store = _FakeStorage([], err=ValueError("arango is down"))
+    mgr = _manager(store, tmp_path)
+    assert await mgr.get_snapshot(_fs(), _active_collection()) is None
+    await asyncio.gather(*mgr._tasks.values())
+    # failed builds aren't retried until the retry interval elapses
+    assert await mgr.get_snapshot(_fs(), _active_collection()) is None
+    assert mgr._tasks == {}
+    assert len(store.queries) == 1
+
+    mgr = _manager(store, tmp_path, retry_sec=0)
+    await mgr.get_snapshot(_fs(), _active_collection())
+    await asyncio.gather(*mgr._tasks.values())
+    await mgr.get_snapshot(_fs(), _active_collection())
+    assert len(mgr._tasks) == 1
+    await asyncio.gather(*mgr._tasks.values())
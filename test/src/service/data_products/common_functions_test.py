@@ -0,0 +1,78 @@
+import base64
+
+import pytest
+from pyroaring import BitMap
+from pytest import raises
+
+from conftest import FakeStorage, assert_exception_correct
+from src.common.storage import collection_and_field_names as names
+from src.service import errors
+from src.service.data_products.common_functions import (
+    mark_data_by_kbase_id,
+    remove_marked_subset,
+    split_fields,
+)
+
+
+class _FakeStorage(FakeStorage):
+    """ Returns the documents as the marked documents when marking data. """
+
+    def results(self, aql, bind_vars):
+        if "UPDATE" in aql and "APPEND" in aql:
+            return super().results(aql, bind_vars)
+        return []
+
+
+def test_split_fields():
+    assert split_fields(None) is None
+    assert split_fields("") is None
+    assert split_fields("   ") is None
+    assert split_fields("kbase_id") == ["kbase_id"]
+    assert split_fields(" genes, kbase_id ,genes,contigs") == ["genes", "kbase_id", "contigs"]
+
+
+def test_split_fields_fail():
+    for fields in ["genes,", ",genes", "genes,  ,kbase_id"]:
+        with raises(Exception) as got:
+            split_fields(fields)
+        assert_exception_correct(got.value, errors.IllegalParameterError(
+            f"Empty field name in fields list '{fields}'"))
+
+
+@pytest.mark.asyncio
+async def test_mark_data_by_kbase_id_with_ordinals():
+    store = _FakeStorage([{"kbase_id": "k1", "_ord": 7}, {"kbase_id": "k3", "_ord": 2}])
+    missed = await mark_data_by_kbase_id(
+        store, "kbcoll_gen_att", "GTDB", "r207", ["k1", "k2", "k3"], "m_1")
+    assert missed == ["k2"]
+    assert len(store.queries) == 2
+    assert store.queries[0][1]["ordfield"] == "_ord"
+    aql, bind_vars = store.queries[1]
+    assert aql.strip().startswith("UPSERT")
+    assert bind_vars["@coll"] == names.COLL_SRV_SUBSET_BITMAPS
+    doc = bind_vars["doc"]
+    assert (doc["_key"], doc["coll"], doc["load_ver"], doc["internal_id"], doc["count"]) == (
+        "kbcoll_gen_att_m_1", "GTDB", "r207", "m_1", 2)
+    assert BitMap.deserialize(base64.b64decode(doc["bitmap"])) == BitMap([2, 7])
+
+
+@pytest.mark.asyncio
+async def test_mark_data_by_kbase_id_without_ordinals():
+    for marked in [[{"kbase_id": "k1"}, {"kbase_id": "k3", "_ord": 2}], []]:
+        store = _FakeStorage(marked)
+        missed = await mark_data_by_kbase_id(
+            store, "kbcoll_gen_att", "GTDB", "r207", ["k1", "k2", "k3"], "m_1")
+        assert missed == sorted({"k1", "k2", "k3"} - {d["kbase_id"] for d in marked})
+        # no bitmap is saved
+        assert len(store.queries) == 1
+        assert store.queries[0][1]["internal_id"] == "m_1"
+
+
+@pytest.mark.asyncio
+async def test_remove_marked_subset():
+    store = _FakeStorage([])
+    await remove_marked_subset(store, "kbcoll_gen_att", "m_1")
+    assert len(store.queries) == 2
+    assert store.queries[0][1] == {
+        "@coll": names.COLL_SRV_SUBSET_BITMAPS, "key": "kbcoll_gen_att_m_1"}
+    assert store.queries[1][1] == {"@coll": "kbcoll_gen_att", "internal_id": "m_1"}
@@ -1,6 +1,184 @@
+import json
+
+import pytest
+from pyroaring import BitMap
+
+from conftest import FakeStorage
+from src.common.heatmap_matrix import HeatMapMatrix, write_heatmap_matrix
+from src.service import subset_bitmaps
 from src.service.data_products import heatmap
+from src.service.filtering.filters import FilterSet
+from src.service.processing import SubsetSpecification
 
 # TODO TEST more
 
 def test_noop():
     pass
+
+
+class _FakeStorage(FakeStorage):
+    """
+    Returns the kept fields of the documents in the queried subset, and stores subset bitmaps.
+    """
+
+    def __init__(self, docs):
+        super().__init__(docs)
+        self.bitmaps = {}
+
+    def results(self, aql, bind_vars):
+        if aql.strip().startswith("UPSERT"):
+            self.bitmaps[bind_vars["key"]] = bind_vars["doc"]
+            return []
+        return [{k: d[k] for k in bind_vars["keep"]} for d in self.docs
+                if bind_vars["internal_match_id"] in d["_mtchsel"]]
+
+    async def get_doc_by_key(self, collection, key, op=None):
+        return self.bitmaps.get(key)
+
+
+def _row(kbase_id, name, ordinal, subsets):
+    return {
+        "_key": f"PMI_1_{kbase_id}",
+        "coll": "PMI",
+        "load_ver": "1",
+        "kbase_id": kbase_id,
+        "kbase_display_name": name,
+        "_ord": ordinal,
+        "_mtchsel": subsets,
+        "col_0_cell_id": f"{kbase_id}_0",
+        "col_0_val": 1,
+    }
+
+
+_ROWS = [
+    _row("k1", "name_c", 0, ["m_m1"]),
+    _row("k2", "name_a", 1, []),
+    _row("k3", "name_b", 2, ["m_m1", "s_s1"]),
+]
+
+_META = {
+    "_key": "PMI_1",
+    "coll": "PMI",
+    "load_ver": "1",
+    "categories": [{"category": "c", "columns": [
+        {"col_id": "0", "name": "n", "description": "d", "type": "int"}]}],
+    "min_value": 1,
+    "max_value": 1,
+    "count": 3,
+}
+
+
+@pytest.mark.asyncio
+async def test_get_subset_mask(tmp_path):
+    ctrl = heatmap.HeatMapController("hm", "cat", "meta", "data", "cells")
+    fs = FilterSet("PMI", "1", collection="data")
+    spec = SubsetSpecification(internal_subset_id="m1", prefix="m_")
+    # matrix rows are in display name order: k2, k3, k1
+    for rows, field in [(_ROWS, "_ord"),
+                        ([{k: v for k, v in r.items() if k != "_ord"} for r in _ROWS],
+                         "kbase_id")]:
+        write_heatmap_matrix(tmp_path / field, _META, rows, [])
+        matrix = HeatMapMatrix(tmp_path / field)
+        store = _FakeStorage(rows)
+        mask = await ctrl._get_subset_mask(store, matrix, fs, spec)
+        assert mask.tolist() == [False, True, True]
+        # only the ordinals are fetched if the matrix has them and there's no bitmap
+        assert [bv["keep"] for _, bv in store.queries] == [[field, "_mtchsel"]]
+
+
+@pytest.mark.asyncio
+async def test_get_subset_mask_from_bitmap(tmp_path):
+    ctrl = heatmap.HeatMapController("hm", "cat", "meta", "data", "cells")
+    spec = SubsetSpecification(internal_subset_id="m1", prefix="m_")
+    write_heatmap_matrix(tmp_path / "m", _META, _ROWS, [])
+    matrix = HeatMapMatrix(tmp_path / "m")
+    store = _FakeStorage(_ROWS)
+    # the bitmap deliberately differs from the marks to show it's used
+    await subset_bitmaps.save_subset_bitmap(store, "data", "PMI", "1", "m_m1", BitMap([1]))
+    store.queries.clear()
+    mask = await ctrl._get_subset_mask(store, matrix, FilterSet("PMI", "1", collection="data"), spec)
+    # matrix rows are in display name order: k2, k3, k1
+    assert mask.tolist() == [True, False, False]
+    assert store.queries == []
+    # a bitmap for another load version isn't used
+    mask = await ctrl._get_subset_mask(store, matrix, FilterSet("PMI", "2", collection="data"), spec)
+    assert mask.tolist() == [False, True, True]
+    assert len(store.queries) == 1
+
+
+# A stand in for the ArangoDB ICU collation, which differs from a byte or code point sort
+_COLLATION = [None, "Äpfel2", "apple", "Apple", "banana", "Banana", "eagle", "Émile", "Zebra", "zoo"]
+
+
+class _CollatingStorage(FakeStorage):
+    """ Sorts, filters, and pages the documents by display name in collation order. """
+
+    def results(self, aql, bind_vars):
+        rank = lambda d: _COLLATION.index(d["kbase_display_name"])
+        docs = sorted(self.docs, key=rank)
+        if "start_after" in bind_vars:
+            start = _COLLATION.index(bind_vars["start_after"])
+            docs = [d for d in docs if rank(d) > start]
+        if "limit" in bind_vars:
+            docs = docs[bind_vars["skip"]:bind_vars["skip"] + bind_vars["limit"]]
+        if "keep" in bind_vars:
+            docs = [{k: d[k] for k in bind_vars["keep"]} for d in docs]
+        return [dict(d) for d in docs]
+
+
+def _collation_rows():
+    names = ["Émile", "zoo", "banana", "Zebra", None, "Apple", "eagle", "Äpfel2", "apple",
+             "Banana"]
+    return [_row(f"k{i}", n, 10 + i, []) for i, n in enumerate(names)]
+
+
+async def _page_ids(ctrl, store, matrix, start_after):
+    fs = FilterSet("PMI", "1", collection="data", sort_on="kbase_display_name",
+                   start_after=start_after, limit=3)
+    if matrix:
+        res = await ctrl._query_matrix(store, matrix, fs, None, None)
+    else:
+        res = await ctrl._query(store, fs, None, None)
+    return [(d["kbase_id"], d["kbase_display_name"]) for d in json.loads(res.body)["data"]]
+
+
+@pytest.mark.asyncio
+async def test_matrix_order_matches_db_order(tmp_path):
+    ctrl = heatmap.HeatMapController("hm", "cat", "meta", "data", "cells")
+    for rows, field in [(_collation_rows(), "_ord"),
+                        ([{k: v for k, v in r.items() if k != "_ord"} for r in _collation_rows()],
+                         "kbase_id")]:
+        write_heatmap_matrix(tmp_path / field, _META, rows, [])
+        matrix = HeatMapMatrix(tmp_path / field)
+        store = _CollatingStorage(rows)
+        ordered = await ctrl._get_ordered_matrix(_AppState(store, matrix), "PMI", "1")
+        assert ordered is matrix
+        assert matrix.has_row_order is True
+        assert [bv["keep"] for _, bv in store.queries] == [[field]]
+
+        pages = {}
+        for m in [None, matrix]:
+            ids, start_after = [], None
+            while True:
+                page = await _page_ids(ctrl, store, m, start_after)
+                if not page:
+                    break
+                ids += page
+                start_after = page[-1][1]
+            pages[m is None] = ids
+        assert pages[True] == pages[False]
+        assert [i for i, _ in pages[True]] == [
+            "k4", "k7", "k8", "k5", "k2", "k9", "k6", "k0", "k3", "k1"]
+        # the column endpoint returns the rows in the same order
+        assert matrix.get_column("0")[0] == [i for i, _ in pages[True]]
+
+
+class _AppState:
+
+    def __init__(self, store, matrix):
+        self.arangostorage = store
+        self.heatmap_matrices = self
+        self._matrix = matrix
+
+    def get_matrix(self, data_product, collection_id, load_ver):
+        return self._matrix
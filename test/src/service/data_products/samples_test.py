@@ -1,4 +1,105 @@
+import pytest
+
+from conftest import FakeStorage
+from src.common import sample_tiles
+from src.common.sample_tiles import BoundingBox, TileRange, WORLD
+from src.common.storage import collection_and_field_names as names
+from src.common.storage.db_doc_conversions import sample_tiles_key
 from src.service.data_products import samples
 
+
+class _FakeStorage(FakeStorage):
+
+    def __init__(self, tile_docs, query_res=None):
+        super().__init__(query_res)
+        self.tile_docs = tile_docs
+        self.reads = []
+
+    async def get_doc_by_key(self, collection, key, op=None):
+        self.reads.append((collection, key))
+        return self.tile_docs.get(key) if collection == names.COLL_SAMPLES_TILES else None
+
+
+def _tile(x, y, count=1):
+    return {"x": x, "y": y, "lat": 1.0, "lon": 2.0, "count": count, "sample_count": 1,
+            "ids": ["s1"]}
+
+
 def test_noop():
     pass
+
+
+@pytest.mark.asyncio
+async def test_get_tiles_precomputed():
+    key = sample_tiles_key("ENIGMA", "1", 2)
+    store = _FakeStorage({key: {names.FLD_SAMPLE_TILES: [
+        _tile(0, 0), _tile(1, 1), _tile(3, 1), _tile(2, 3)]}})
+    got = await samples._get_tiles(store, "ENIGMA", "1", TileRange(2, 1, 3, 0, 2))
+    assert got == [_tile(1, 1), _tile(3, 1)]
+    got = await samples._get_tiles(store, "ENIGMA", "1", TileRange(2, 3, 0, 0, 3, wraps=True))
+    assert got == [_tile(0, 0), _tile(3, 1)]
+    assert store.queries == []
+    assert store.reads == [(names.COLL_SAMPLES_TILES, key)] * 2
+
+
+@pytest.mark.asyncio
+async def test_get_tiles_query():
+    store = _FakeStorage({}, query_res=[_tile(5, 6, 4)])
+    # not precomputed
+    tiles = sample_tiles.tile_range(BoundingBox(-125, 24.5, -66, 50), 7)
+    got = await samples._get_tiles(store, "ENIGMA", "1", tiles)
+    assert got == [_tile(5, 6, 4)]
+    assert len(store.queries) == 1
+    aql, bind_vars = store.queries[0]
+    assert bind_vars["@coll"] == names.COLL_SAMPLES
+    assert bind_vars["tiles_per_side"] == 128
+    assert (bind_vars["x_min"], bind_vars["x_max"], bind_vars["y_min"], bind_vars["y_max"]) == (
+        tiles.x_min, tiles.x_max, tiles.y_min, tiles.y_max)
+    assert bind_vars["west"] <= -125 and bind_vars["east"] >= -66
+    assert bind_vars["south"] <= 24.5 and bind_vars["north"] >= 50
+    assert bind_vars["max_ids"] == names.SAMPLE_TILE_MAX_IDS
+    assert "internal_match_id" not in bind_vars
+    assert "longitude <= @east" in aql and " AND d.longitude <= @east" in aql
+
+
+@pytest.mark.asyncio
+async def test_get_tiles_query_fallback_and_subsets():
+    # data loaded before tiles were precomputed
+    store = _FakeStorage({}, query_res=[_tile(0, 0)])
+    got = await samples._get_tiles(store, "ENIGMA", "1", sample_tiles.tile_range(WORLD, 0))
+    assert got == [_tile(0, 0)]
+    assert store.reads == [(names.COLL_SAMPLES_TILES, sample_tiles_key("ENIGMA", "1", 0))]
+    assert len(store.queries) == 1
+    _, bind_vars = store.queries[0]
+    assert (bind_vars["south"], bind_vars["north"]) == (-90, 90)
+    assert (bind_vars["west"], bind_vars["east"]) == (-180, 180)
+
+    # matches and selections are never precomputed
+    key = sample_tiles_key("ENIGMA", "1", 0)
+    store = _FakeStorage({key: {names.FLD_SAMPLE_TILES: [_tile(0, 0, 100)]}},
+                         query_res=[_tile(0, 0, 3)])
+    got = await samples._get_tiles(store, "ENIGMA", "1", sample_tiles.tile_range(WORLD, 0),
+                                   internal_match_id="m_foo", internal_selection_id="s_bar")
+    assert got == [_tile(0, 0, 3)]
+    assert store.reads == []
+    assert len(store.queries) == 1
+    aql, bind_vars = store.queries[0]
+    assert bind_vars["internal_match_id"] == "m_foo"
+    assert bind_vars["internal_selection_id"] == "s_bar"
+
+    # crossing the antimeridian
+    store = _FakeStorage({}, query_res=[])
+    tiles = sample_tiles.tile_range(BoundingBox(170, -10, -170, 10), 8)
+    assert await samples._get_tiles(store, "ENIGMA", "1", tiles) == []
+    aql, bind_vars = store.queries[0]
+    assert " OR d.longitude <= @east" in aql
+    assert "x >= @x_min OR x <= @x_max" in aql
+    assert bind_vars["west"] <= 170 and bind_vars["east"] >= -170
+
+
+def test_tiles_response():
+    res = samples._tiles_response(zoom=3, tiles=[_tile(1, 2)])
+    assert res.zoom == 3
+    assert res.tiles[0].x == 1
+    assert res.tiles[0].ids == ["s1"]
+    assert samples._tiles_response().tiles is None
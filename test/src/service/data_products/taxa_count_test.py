@@ -0,0 +1,124 @@
+import pytest
+
+from conftest import FakeStorage
+from src.common.storage import collection_and_field_names as names
+from src.common.storage.db_doc_conversions import taxa_count_top_key
+from src.service import models
+from src.service.data_products import taxa_count
+
+
+def _tc(name, count, **kwargs):
+    return {"name": name, "count": count} | kwargs
+
+
+class _FakeStorage(FakeStorage):
+
+    def __init__(self, top_docs, counts=None):
+        super().__init__(counts)
+        self.top_docs = top_docs
+        self.reads = []
+
+    async def get_doc_by_key(self, collection, key, op=None):
+        return (await self.get_docs_by_key(collection, [key])).get(key)
+
+    async def get_docs_by_key(self, collection, keys, op=None):
+        assert collection == names.COLL_TAXA_COUNT_TOP
+        self.reads.append(keys)
+        return {k: self.top_docs[k] for k in keys if k in self.top_docs}
+
+
+@pytest.mark.asyncio
+async def test_get_top_counts_keyed_read():
+    key = taxa_count_top_key("GTDB", "r207", "phylum")
+    store = _FakeStorage({key: {names.FLD_TAXA_COUNT_TOP: [_tc("a", 3), _tc("b", 2), _tc("c", 1)]}})
+    got = await taxa_count._get_top_counts(store, "GTDB", "r207", "phylum", 2)
+    assert got == [_tc("a", 3), _tc("b", 2)]
+    assert store.reads == [[key]]
+    assert store.queries == []
+
+
+@pytest.mark.asyncio
+async def test_get_top_counts_subset_keyed_read():
+    key = taxa_count_top_key("GTDB", "r207", "phylum", "m_imid")
+    store = _FakeStorage({key: {names.FLD_TAXA_COUNT_TOP: [_tc("a", 3)]}})
+    got = await taxa_count._get_top_counts(
+        store, "GTDB", "r207", "phylum", 20, internal_id="imid", type_=models.SubsetType.MATCH)
+    assert got == [_tc("a", 3)]
+
+
+@pytest.mark.asyncio
+async def test_get_top_counts_fallback_query():
+    store = _FakeStorage({}, counts=[{"name": "a", "count": 3, "rank": "phylum", "_key": "k"}])
+    got = await taxa_count._get_top_counts(store, "GTDB", "r207", "phylum", 20)
+    assert got == [_tc("a", 3)]
+    assert len(store.reads) == 1
+    assert len(store.queries) == 1
+    assert store.queries[0][1]["@colname"] == names.COLL_TAXA_COUNT
+
+
+class _Proc:
+
+    def __init__(self, type_, internal_id, complete=True):
+        self.type = type_
+        self.internal_id = internal_id
+        self._complete = complete
+
+    def is_complete(self):
+        return self._complete
+
+
+@pytest.mark.asyncio
+async def test_get_top_count_docs_single_read():
+    m, s = models.SubsetType.MATCH, models.SubsetType.SELECTION
+    key = taxa_count_top_key("GTDB", "r207", "phylum")
+    mkey = taxa_count_top_key("GTDB", "r207", "phylum", "m_mid")
+    skey = taxa_count_top_key("GTDB", "r207", "phylum", "s_sid")
+    store = _FakeStorage({
+        key: {names.FLD_TAXA_COUNT_TOP: [_tc("a", 3), _tc("b", 2)]},
+        mkey: {names.FLD_TAXA_COUNT_TOP: [_tc("b", 1)]},
+    })
+    docs = await taxa_count._get_top_count_docs(
+        store, "GTDB", "r207", "phylum",
+        [_Proc(m, "mid"), _Proc(s, "sid"), _Proc(s, "incomplete", complete=False), None])
+    assert store.reads == [[key, mkey, skey]]
+    assert set(docs) == {key, mkey}
+
+    got = await taxa_count._get_top_counts(store, "GTDB", "r207", "phylum", 20, top_docs=docs)
+    assert got == [_tc("a", 3), _tc("b", 2)]
+    got = await taxa_count._get_top_counts(
+        store, "GTDB", "r207", "phylum", 20, internal_id="mid", type_=m, top_docs=docs)
+    assert got == [_tc("b", 1)]
+    assert len(store.reads) == 1
+    assert store.queries == []
+
+
+class _DPProc:
+
+    def __init__(self, type_):
+        self.type = type_
+
+    def is_complete(self):
+        return True
+
+
+def test_sort_taxa_counts_standard():
+    recs = [_tc("c", 1), _tc("b", 2), _tc("a", 2), _tc("d", 5)]
+    taxa_count._sort_taxa_counts(recs, None, [None, None], limit=3)
+    assert recs == [_tc("d", 5), _tc("a", 2), _tc("b", 2)]
+
+
+def test_sort_taxa_counts_priority():
+    m, s = models.SubsetType.MATCH, models.SubsetType.SELECTION
+    recs = [
+        _tc("a", 5, match_count=1, sel_count=0),
+        _tc("b", 4, match_count=3, sel_count=1),
+        _tc("c", 3, match_count=3, sel_count=2),
+        _tc("d", 2, match_count=0, sel_count=2),
+    ]
+    # default priority: selected, matched, standard
+    got = list(recs)
+    taxa_count._sort_taxa_counts(got, None, [_DPProc(m), _DPProc(s)])
+    assert [r["name"] for r in got] == ["c", "d", "b", "a"]
+    got = list(recs)
+    taxa_count._sort_taxa_counts(got, "matched,standard", [_DPProc(m), _DPProc(s)], limit=3)
+    assert [r["name"] for r in got] == ["b", "c", "a"]
@@ -0,0 +1,216 @@
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.testclient import TestClient
+import pytest
+
+from conftest import assert_exception_correct
+from src.service import etags
+from src.service.etags import ETagMiddleware, ETagRegistry
+
+
+class _Timer:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class _Data:
+    """ Stands in for the database, tracking the number of route calls. """
+
+    def __init__(self):
+        self.load_ver = "r207"
+        self.subset_complete = True
+        self.calls = 0
+
+
+def _client(registry=None, version="1.0.0"):
+    data = _Data()
+    app = FastAPI()
+
+    @app.get("/collections/{collection_id}/data")
+    async def get_data(collection_id: str, match_id: str = None, load_ver_override: str = None):
+        data.calls += 1
+        etags.record_load_version(
+            collection_id, load_ver_override or data.load_ver, bool(load_ver_override))
+        if match_id:
+            etags.record_subset("match", f"internal_{match_id}", data.subset_complete)
+        return JSONResponse({"load_ver": data.load_ver, "match_id": match_id})
+
+    @app.get("/other")
+    async def other():
+        data.calls += 1
+        return PlainTextResponse("other")
+
+    @app.get("/error")
+    async def error():
+        etags.record_load_version("GTDB", data.load_ver)
+        return JSONResponse({"error": "oops"}, status_code=400)
+
+    app.add_middleware(ETagMiddleware, registry=registry, version=version)
+    return TestClient(app), data
+
+
+def test_registry_init_fail():
+    for kwargs, err in [
+        ({"max_entries": 0}, "max_entries must be > 0"),
+        ({"ttl_sec": 0}, "ttl_sec must be > 0"),
+    ]:
+        with pytest.raises(Exception) as got:
+            ETagRegistry(**kwargs)
+        assert_exception_correct(got.value, ValueError(err))
+
+
+def test_registry_get_put_invalidate():
+    timer = _Timer()
+    reg = ETagRegistry(max_entries=2, ttl_sec=10, timer=timer)
+    assert reg.get(("a",)) is None
+    reg.put(("a",), "GTDB", '"1"')
+    reg.put(("b",), "PMI", '"2"')
+    assert reg.get(("a",)) == '"1"'
+    # b is least recently used
+    reg.put(("c",), "GTDB", '"3"')
+    assert reg.get(("b",)) is None
+    assert reg.size == 2
+    reg.invalidate("GTDB")
+    assert reg.size == 0
+
+    reg.put(("a",), "GTDB", '"1"')
+    timer.now = 9.9
+    assert reg.get(("a",)) == '"1"'
+    timer.now = 10
+    assert reg.get(("a",)) is None
+    assert reg.size == 0
+
+
+def test_etag_and_304_from_registry():
+    reg = ETagRegistry()
+    cli, data = _client(reg)
+    res = cli.get("/collections/GTDB/data?b=2&a=1")
+    assert res.status_code == 200
+    etag = res.headers["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+    assert res.headers["cache-control"] == "no-cache"
+    assert data.calls == 1
+
+    # same query in a different order, answered without calling the route
+    for inm in [etag, f'"foo", W/{etag}', "*"]:
+        res = cli.get("/collections/GTDB/data?a=1&b=2", headers={"If-None-Match": inm})
+        assert res.status_code == 304
+        assert res.content == b""
+        assert res.headers["etag"] == etag
+        assert res.headers["cache-control"] == "no-cache"
+    assert data.calls == 1
+
+    # stale ETag
+    res = cli.get("/collections/GTDB/data?a=1&b=2", headers={"If-None-Match": '"foo"'})
+    assert res.status_code == 200
+    assert res.headers["etag"] == etag
+    assert data.calls == 2
+
+    # different query or encoding
+    res = cli.get("/collections/GTDB/data?a=1&b=3", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["etag"] != etag
+    res = cli.get("/collections/GTDB/data?a=1&b=2",
+                  headers={"If-None-Match": etag, "Accept-Encoding": "br"})
+    assert res.status_code == 200
+    assert res.headers["etag"] != etag
+    assert data.calls == 4
+
+
+def test_invalidation_on_activation():
+    reg = ETagRegistry()
+    cli, data = _client(reg)
+    etag = cli.get("/collections/GTDB/data").headers["etag"]
+    other_etag = cli.get("/collections/PMI/data").headers["etag"]
+    assert reg.size == 2
+
+    # a new load version is activated
+    data.load_ver = "r214"
+    reg.invalidate("GTDB")
+    res = cli.get("/collections/GTDB/data", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.json() == {"load_ver": "r214", "match_id": None}
+    new_etag = res.headers["etag"]
+    assert new_etag != etag
+    assert data.calls == 3
+    res = cli.get("/collections/GTDB/data", headers={"If-None-Match": new_etag})
+    assert res.status_code == 304
+    # other collections are unaffected
+    res = cli.get("/collections/PMI/data", headers={"If-None-Match": other_etag})
+    assert res.status_code == 304
+    assert data.calls == 3
+
+
+def test_304_from_route_without_registry():
+    cli, data = _client()
+    etag = cli.get("/collections/GTDB/data").headers["etag"]
+    res = cli.get("/collections/GTDB/data", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.headers["etag"] == etag
+    assert "content-type" not in res.headers
+    assert data.calls == 2
+    # the ETag changes with the load version
+    data.load_ver = "r214"
+    res = cli.get("/collections/GTDB/data", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["etag"] != etag
+
+
+def test_etag_includes_service_version():
+    etag1 = _client(version="1.0.0")[0].get("/collections/GTDB/data").headers["etag"]
+    etag2 = _client(version="1.0.1")[0].get("/collections/GTDB/data").headers["etag"]
+    assert etag1 != etag2
+
+
+def test_subset_and_override_not_registered():
+    reg = ETagRegistry()
+    cli, data = _client(reg)
+    for query in ["match_id=m1", "load_ver_override=r99"]:
+        res = cli.get(f"/collections/GTDB/data?{query}")
+        assert res.headers["cache-control"] == "private, no-cache"
+        etag = res.headers["etag"]
+        # the route is always called so that the user's permissions are checked
+        calls = data.calls
+        res = cli.get(f"/collections/GTDB/data?{query}", headers={"If-None-Match": etag})
+        assert res.status_code == 304
+        assert res.headers["cache-control"] == "private, no-cache"
+        assert data.calls == calls + 1
+    assert reg.size == 0
+
+
+def test_processing_subset():
+    cli, data = _client(ETagRegistry())
+    data.subset_complete = False
+    res = cli.get("/collections/GTDB/data?match_id=m1")
+    assert res.status_code == 200
+    assert res.headers["cache-control"] == "no-store"
+    assert "etag" not in res.headers
+
+    # once the subset is complete the response gets an ETag
+    data.subset_complete = True
+    res = cli.get("/collections/GTDB/data?match_id=m1", headers={"If-None-Match": "*"})
+    assert res.status_code == 304
+    assert res.headers["cache-control"] == "private, no-cache"
+
+
+def test_no_etag():
+    cli, data = _client(ETagRegistry())
+    # routes that don't record a load version
+    res = cli.get("/other", headers={"If-None-Match": "*"})
+    assert res.status_code == 200
+    assert "etag" not in res.headers
+    assert "cache-control" not in res.headers
+    # errors
+    res = cli.get("/error", headers={"If-None-Match": "*"})
+    assert res.status_code == 400
+    assert "etag" not in res.headers
+
+
+def test_record_outside_request():
+    # no-ops
+    etags.record_load_version("GTDB", "r207")
+    etags.record_subset("match", "m1", True)
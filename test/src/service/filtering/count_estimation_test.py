@@ -0,0 +1,377 @@
+import random
+
+import pytest
+
+from conftest import FakeCursor, assert_exception_correct
+from src.common.product_models.columnar_attribs_common_models import ColumnType, FilterStrategy
+from src.common.storage import collection_and_field_names as names
+from src.service.data_products.common_functions import count_documents
+from src.service.filtering.count_estimation import (
+    CountEstimate,
+    CountEstimator,
+    document_matches,
+    extrapolate,
+    filter_signature,
+)
+from src.service.filtering.filters import FilterSet
+from src.service.processing import SubsetSpecification
+
+
+_COLL = "GTDB"
+_LV = "r207"
+
+_S = ColumnType.STRING
+_F = ColumnType.FLOAT
+_I = ColumnType.INT
+_D = ColumnType.DATE
+_B = ColumnType.BOOL
+
+
+def _fs(*filters, conjunction=True, match_id=None, keep=None, keep_filter_nulls=False,
+        load_ver=_LV, **kwargs):
+    fs = FilterSet(
+        _COLL,
+        load_ver,
+        view="view",
+        collection="coll",
+        count=True,
+        conjunction=conjunction,
+        match_spec=SubsetSpecification(internal_subset_id=match_id, prefix="m_"),
+        keep=keep,
+        keep_filter_nulls=keep_filter_nulls,
+        **kwargs
+    )
+    for f in filters:
+        fs.append(*f)
+    return fs
+
+
+def _skewed_docs(count, seed=3):
+    # Zipf distributed phyla and log normal contig counts, so some filters select most of the
+    # data and others almost none
+    rand = random.Random(seed)
+    phyla = [f"p__Phylum{i}" for i in range(200)]
+    weights = [1 / (i + 1) ** 1.3 for i in range(len(phyla))]
+    docs = []
+    for i in range(count):
+        docs.append({
+            names.FLD_ARANGO_KEY: f"{_COLL}_{_LV}_{i}",
+            "kbase_id": f"GB_GCA_{i:07}.1",
+            "phylum": rand.choices(phyla, weights)[0],
+            "contigs": int(rand.lognormvariate(3, 1.2)),
+            "completeness": None if rand.random() < 0.1 else round(rand.uniform(50, 100), 2),
+            "rep": rand.random() < 0.05,
+            names.FLD_MATCHES_SELECTIONS: ["m_match1"] if rand.random() < 0.3 else [],
+        })
+    return docs
+
+
+class _FakeStorage:
+    """ Emulates the queries the estimator and count_documents make. """
+
+    def __init__(self, docs, seed=None):
+        self.docs = docs
+        self.rand = random.Random(seed)
+        self.queries = []
+
+    async def execute_aql(
+        self, aql, bind_vars=None, count=False, query_shape=None, op=None
+    ):
+        if "SORT RAND()" in aql:
+            self.queries.append("sample")
+            return FakeCursor([dict(d) for d in self.rand.sample(
+                self.docs, min(bind_vars["sample"], len(self.docs)))])
+        if "COLLECT WITH COUNT INTO total" in aql:
+            self.queries.append("total")
+            return FakeCursor([len(self.docs)])
+        if "IN @keys" in aql:
+            self.queries.append("marks")
+            keys = set(bind_vars["keys"])
+            return FakeCursor([
+                {k: d[k] for k in (names.FLD_ARANGO_KEY, names.FLD_MATCHES_SELECTIONS)}
+                for d in self.docs if d[names.FLD_ARANGO_KEY] in keys
+            ])
+        # an exact count from FilterSet.to_aql
+        self.queries.append("count")
+        assert "COUNT" in aql
+        return FakeCursor([self.exact])
+
+    def set_exact(self, filters):
+        self.exact = sum(1 for d in self.docs if document_matches(filters, d))
+
+
+def test_filter_signature():
+    fs1 = _fs(("phylum", _S, "p__Phylum1", None, FilterStrategy.IDENTITY),
+              ("contigs", _I, "[1, 10]"))
+    fs2 = _fs(("contigs", _I, "[1, 10]"),
+              ("phylum", _S, "p__Phylum1", None, FilterStrategy.IDENTITY),
+              skip=10, limit=5, sort_on="kbase_id", sort_descending=True)
+    assert filter_signature(fs1) == filter_signature(fs2)
+    # conjunction is irrelevant for a single filter
+    assert filter_signature(_fs(("contigs", _I, "[1, 10]"))) == filter_signature(
+        _fs(("contigs", _I, "[1, 10]"), conjunction=False))
+    assert filter_signature(_fs()) == filter_signature(_fs(conjunction=False))
+    for fs in [
+        _fs(("phylum", _S, "p__Phylum1", None, FilterStrategy.IDENTITY),
+            ("contigs", _I, "[1, 10]"), conjunction=False),
+        _fs(("phylum", _S, "p__Phylum1", None, FilterStrategy.IDENTITY),
+            ("contigs", _I, "[1, 10)")),
+        _fs(("phylum", _S, "p__Phylum1", None, FilterStrategy.PREFIX),
+            ("contigs", _I, "[1, 10]")),
+        _fs(("phylum", _S, "p__Phylum1", None, FilterStrategy.IDENTITY),
+            ("contigs", _I, "[1, 10]"), load_ver="r214"),
+        _fs(("phylum", _S, "p__Phylum1", None, FilterStrategy.IDENTITY),
+            ("contigs", _I, "[1, 10]"), match_id="match1"),
+        _fs(("phylum", _S, "p__Phylum1", None, FilterStrategy.IDENTITY),
+            ("contigs", _I, "[1, 10]"), keep=["contigs"], keep_filter_nulls=True),
+    ]:
+        assert filter_signature(fs) != filter_signature(fs1)
+
+
+def test_document_matches():
+    doc = {
+        "name": "Escherichia coli K-12 substr. MG1655",
+        "accent": "Bärbel",
+        "contigs": 42,
+        "gc": 0.51,
+        "date": "2021-05-01T00:00:00+0000",
+        "rep": True,
+        "null": None,
+        names.FLD_MATCHES_SELECTIONS: ["m_match1"],
+    }
+    _id, _ft, _pf, _ng = (FilterStrategy.IDENTITY, FilterStrategy.FULL_TEXT,
+                          FilterStrategy.PREFIX, FilterStrategy.NGRAM)
+    for filters, expected in [
+        ([], True),
+        ([("contigs", _I, "[42, 50]")], True),
+        ([("contigs", _I, "(42, 50]")], False),
+        ([("contigs", _I, ",42)")], False),
+        ([("gc", _F, "[0.5,]")], True),
+        ([("gc", _F, "(0.51,]")], False),
+        ([("date", _D, "[2021-01-01,2022-01-01)")], True),
+        ([("date", _D, "[2022-01-01,)")], False),
+        ([("name", _F, "[1,]")], False),
+        ([("rep", _B, "true")], True),
+        ([("rep", _B, "false")], False),
+        ([("null", _B, "false")], False),
+        ([("missing", _I, "[0,]")], False),
+        ([("name", _S, "Escherichia coli K-12 substr. MG1655", None, _id)], True),
+        ([("name", _S, "escherichia coli", None, _id)], False),
+        ([("name", _S, "COLI escherichia", None, _ft)], True),
+        ([("name", _S, "coli mg1656", None, _ft)], False),
+        ([("name", _S, "esch sub", None, _pf)], True),
+        ([("name", _S, "esch col", None, _pf)], True),
+        ([("name", _S, "sch", None, _pf)], False),
+        ([("name", _S, "HERICH", None, _ng)], True),
+        ([("name", _S, "hericx", None, _ng)], False),
+        ([("accent", _S, "barbel", None, _ft)], True),
+        ([("null", _S, "foo", None, _ft)], False),
+        ([("contigs", _I, "[42, 50]"), ("rep", _B, "true")], True),
+        ([("contigs", _I, "[43, 50]"), ("rep", _B, "true")], False),
+    ]:
+        assert document_matches(_fs(*filters), doc) is expected, filters
+    assert document_matches(
+        _fs(("contigs", _I, "[43, 50]"), ("rep", _B, "true"), conjunction=False), doc) is True
+    assert document_matches(
+        _fs(("contigs", _I, "[43, 50]"), ("rep", _B, "false"), conjunction=False), doc) is False
+    assert document_matches(_fs(match_id="match1"), doc) is True
+    assert document_matches(_fs(match_id="match2"), doc) is False
+    assert document_matches(_fs(match_id="match2"), {}) is False
+    assert document_matches(_fs(keep=["gc", "rep"], keep_filter_nulls=True), doc) is True
+    assert document_matches(_fs(keep=["gc", "null"], keep_filter_nulls=True), doc) is False
+    assert document_matches(_fs(keep=["gc", "null"]), doc) is True
+
+
+def test_extrapolate():
+    assert extrapolate(7, 100, 100) == CountEstimate(7, 0, False)
+    assert extrapolate(7, 100, 50) == CountEstimate(7, 0, False)
+    est = extrapolate(500, 1000, 100_000)
+    assert est.estimated
+    assert est.count == 50_000
+    # ~ 1.96 * sqrt(0.25 / 1000) * 100K
+    assert 3000 <= est.error <= 3150
+    # no matches in the sample still has an error bound
+    est = extrapolate(0, 1000, 100_000)
+    assert est.count == 0
+    assert 300 <= est.error <= 400
+    # a sample of most of the population has a small error
+    assert extrapolate(500, 990, 1000).error < extrapolate(500, 1000, 100_000).error / 20
+
+
+def test_extrapolate_fail():
+    with pytest.raises(Exception) as got:
+        extrapolate(0, 0, 10)
+    assert_exception_correct(got.value, ValueError("sample_size must be > 0"))
+
+
+def test_estimator_init_fail():
+    for kwargs, err in [
+        ({"sample_size": 0}, "sample_size must be > 0"),
+        ({"max_samples": 0}, "max_samples must be > 0"),
+        ({"max_counts": 0}, "max_counts must be > 0"),
+    ]:
+        with pytest.raises(Exception) as got:
+            CountEstimator(**kwargs)
+        assert_exception_correct(got.value, ValueError(err))
+
+
+_ACCURACY_FILTERS = [
+    # broad
+    [("contigs", _I, "[10,]")],
+    [("phylum", _S, "p__Phylum0", None, FilterStrategy.IDENTITY)],
+    [("completeness", _F, "[60, 95]"), ("rep", _B, "false")],
+    # narrow
+    [("phylum", _S, "p__Phylum15", None, FilterStrategy.IDENTITY)],
+    [("contigs", _I, "[300,]"), ("rep", _B, "true")],
+    # no matches
+    [("phylum", _S, "p__PhylumX", None, FilterStrategy.IDENTITY)],
+]
+
+
+@pytest.mark.asyncio
+async def test_estimate_accuracy_skewed_data():
+    docs = _skewed_docs(50_000)
+    trials = 40
+    for filters in _ACCURACY_FILTERS:
+        fs = _fs(*filters)
+        exact = sum(1 for d in docs if document_matches(fs, d))
+        covered = 0
+        for i in range(trials):
+            est = await CountEstimator(sample_size=2000).estimate(
+                _FakeStorage(docs, seed=i), fs)
+            assert est.estimated
+            assert est.error > 0
+            if abs(est.count - exact) <= est.error:
+                covered += 1
+            # the estimate is never wildly off, relative to the load version size
+            assert abs(est.count - exact) < 0.05 * len(docs), (filters, est, exact)
+        # the 95% bound should hold for almost all samples
+        assert covered >= trials * 0.85, (filters, covered, exact)
+
+
+@pytest.mark.asyncio
+async def test_estimate_relative_error_broad_filters():
+    docs = _skewed_docs(50_000)
+    fs = _fs(("contigs", _I, "[10,]"))
+    exact = sum(1 for d in docs if document_matches(fs, d))
+    errs = []
+    for i in range(20):
+        est = await CountEstimator(sample_size=2000).estimate(_FakeStorage(docs, seed=i), fs)
+        errs.append(abs(est.count - exact) / exact)
+    assert sum(errs) / len(errs) < 0.03
+
+
+@pytest.mark.asyncio
+async def test_estimate_cached_sample_and_counts():
+    docs = _skewed_docs(5000)
+    store = _FakeStorage(docs, seed=1)
+    est = CountEstimator(sample_size=500)
+    fs = _fs(("contigs", _I, "[10,]"))
+    first = await est.estimate(store, fs)
+    assert first.estimated
+    assert store.queries == ["total", "sample"]
+    # the sample is reused for other filters on the same load version
+    await est.estimate(store, _fs(("rep", _B, "true")))
+    assert store.queries == ["total", "sample"]
+    # exact counts are preferred
+    est.record_exact(fs, 1234)
+    assert est.get_exact(_fs(("contigs", _I, "[10,]"), limit=1)) == 1234
+    assert await est.estimate(store, fs) == CountEstimate(1234, 0, False)
+    # no column filters means a cheap exact count is possible
+    assert await est.estimate(store, _fs()) is None
+    assert store.queries == ["total", "sample"]
+
+
+@pytest.mark.asyncio
+async def test_estimate_complete_sample():
+    docs = _skewed_docs(300)
+    est = CountEstimator(sample_size=500)
+    fs = _fs(("contigs", _I, "[10,]"))
+    exact = sum(1 for d in docs if document_matches(fs, d))
+    assert await est.estimate(_FakeStorage(docs), fs) == CountEstimate(exact, 0, False)
+    # analyzer based filters are only approximated
+    fs = _fs(("phylum", _S, "phylum1", None, FilterStrategy.NGRAM))
+    exact = sum(1 for d in docs if document_matches(fs, d))
+    assert await est.estimate(_FakeStorage(docs), fs) == CountEstimate(exact, 0, True)
+
+
+@pytest.mark.asyncio
+async def test_estimate_refreshes_subset_marks():
+    docs = _skewed_docs(300)
+    store = _FakeStorage(docs)
+    est = CountEstimator(sample_size=500)
+    fs = _fs(("rep", _B, "false"), match_id="match2")
+    assert await est.estimate(store, fs) == CountEstimate(0, 0, False)
+    # a new match is created after the sample is taken
+    for d in docs[:100]:
+        d[names.FLD_MATCHES_SELECTIONS] = d[names.FLD_MATCHES_SELECTIONS] + ["m_match2"]
+    exact = sum(1 for d in docs if document_matches(fs, d))
+    assert exact > 0
+    assert await est.estimate(store, fs) == CountEstimate(exact, 0, False)
+    assert store.queries == ["total", "sample", "marks", "marks"]
+
+
+@pytest.mark.asyncio
+async def test_estimator_lru():
+    docs = _skewed_docs(100)
+    store = _FakeStorage(docs)
+    est = CountEstimator(sample_size=10, max_samples=1, max_counts=2)
+    fs1, fs2, fs3 = [_fs(("contigs", _I, f"[{i},]")) for i in range(3)]
+    est.record_exact(fs1, 1)
+    est.record_exact(fs2, 2)
+    assert est.get_exact(fs1) == 1
+    est.record_exact(fs3, 3)
+    assert est.get_exact(fs1) == 1
+    assert est.get_exact(fs2) is None
+    assert est.get_exact(fs3) == 3
+
+    await est.estimate(store, _fs(("rep", _B, "true")))
+    await est.estimate(store, _fs(("rep", _B, "true"), load_ver="r214"))
+    await est.estimate(store, _fs(("rep", _B, "true")))
+    assert store.queries == ["total", "sample"] * 3
+
+
+@pytest.mark.asyncio
+async def test_count_documents():
+    docs = _skewed_docs(5000)
+    store = _FakeStorage(docs)
+    fs = _fs(("contigs", _I, "[10,]"))
+    store.set_exact(fs)
+    exact = store.exact
+
+    # no estimator
+    assert await count_documents(store, fs) == CountEstimate(exact, 0, False)
+    assert await count_documents(store, fs, approximate=True) == CountEstimate(exact, 0, False)
+    assert store.queries == ["count", "count"]
+
+    # the exact count is cached for both exact and approximate counts
+    est = CountEstimator(sample_size=100)
+    store.queries.clear()
+    assert await count_documents(store, fs, est) == CountEstimate(exact, 0, False)
+    assert await count_documents(store, fs, est) == CountEstimate(exact, 0, False)
+    assert await count_documents(store, fs, est, True) == CountEstimate(exact, 0, False)
+    assert store.queries == ["count"]
+
+    # approximate count
+    fs = _fs(("rep", _B, "true"))
+    store.set_exact(fs)
+    got = await count_documents(store, fs, est, True)
+    assert got.estimated
+    assert store.queries == ["count", "total", "sample"]
+    # an exact count replaces the estimate
+    assert await count_documents(store, fs, est) == CountEstimate(store.exact, 0, False)
+    assert await count_documents(store, fs, est, True) == CountEstimate(store.exact, 0, False)
+
+    # no column filters
+    store.queries.clear()
+    fs = _fs(match_id="match1")
+    store.set_exact(fs)
+    assert await count_documents(store, fs, est, True) == CountEstimate(store.exact, 0, False)
+    assert store.queries == ["count"]
+
+
+@pytest.mark.asyncio
+async def test_count_documents_fail():
+    with pytest.raises(Exception) as got:
+        await count_documents(_FakeStorage([]), FilterSet(_COLL, _LV, collection="coll"))
+    assert_exception_correct(got.value, ValueError("The count flag must be set in the filters"))
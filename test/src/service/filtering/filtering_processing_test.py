@@ -0,0 +1,38 @@
+import pytest
+
+from conftest import assert_exception_correct
+from src.service.filtering import filtering_processing
+
+
+class _FakeStorage:
+
+    def __init__(self, views):
+        self.views = views
+
+    async def has_search_view(self, name):
+        return name in self.views
+
+
+@pytest.mark.asyncio
+async def test_get_existing_view():
+    gev = filtering_processing._get_existing_view
+    for views, fallback, expected in [
+        ({"hm_view_v2", "hm_view"}, "hm_view", "hm_view_v2"),
+        ({"hm_view_v2"}, None, "hm_view_v2"),
+        ({"hm_view"}, "hm_view", "hm_view"),
+    ]:
+        assert await gev(_FakeStorage(views), "hm", "hm_view_v2", fallback) == expected
+
+
+@pytest.mark.asyncio
+async def test_get_existing_view_fail():
+    gev = filtering_processing._get_existing_view
+    for views, fallback in [
+        (set(), "hm_view"),
+        ({"hm_view"}, None),
+        ({"other"}, "hm_view"),
+    ]:
+        with pytest.raises(Exception) as got:
+            await gev(_FakeStorage(views), "hm", "hm_view_v2", fallback)
+        assert_exception_correct(
+            got.value, ValueError("View hm_view_v2 does not exist for data product hm"))
@@ -453,7 +453,7 @@ FOR d IN @@view
         "internal_selection_id": "s_selly",
         "skip": 24,
         "limit": 2,
-        "keep": ["field1", "field2"],
+        "keep": ["field1", "field2", "_mtchsel"],
         'v1_low': -2.0,
         'v1_high': 6.0,
         'v2_input': 'thingy',
@@ -541,7 +541,7 @@ FOR dc IN @@collection
         "internal_match_id": "m_matchy",
         "internal_selection_id": "s_selly",
         'start_after': 'a_unique_field',
-        "keep": ["thing", "thang"],
+        "keep": ["thing", "thang", "_mtchsel"],
         "skip": 24,
         "limit": 2,
     }
@@ -890,3 +890,31 @@ def test_filterset_fail_to_aql_arangosearch_aql():
         FilterSet("c", "lv", collection="c"
             ).append("myfield", ColumnType.INT, "[1,"
             ).to_aql()
+
+
+def test_filterset_aql_w_keep_and_mark_only_match():
+    fs = FilterSet(
+        "mycollection",
+        "loadver6",
+        collection="my_arango_collection",
+        match_spec=SubsetSpecification(internal_subset_id="mtc", prefix="m_", mark_only=True),
+        keep=["thing", "_mtchsel"],
+    )
+    aql, bind_vars = fs.to_aql()
+
+    assert aql == """
+FOR doc IN @@collection
+    FILTER doc.coll == @collid
+    FILTER doc.load_ver == @load_ver
+    LIMIT @skip, @limit
+    RETURN KEEP(doc, @keep)
+""".strip() + "\n"
+    assert bind_vars == {
+        "@collection": "my_arango_collection",
+        "collid": "mycollection",
+        "load_ver": "loadver6",
+        "keep": ["thing", "_mtchsel"],
+        "skip": 0,
+        "limit": 1000,
+    }
+    assert fs.keep == ["thing", "_mtchsel"]
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+
+import pytest
+
+from conftest import FakeCursor, assert_exception_correct
+from src.common.product_models.columnar_attribs_common_models import ColumnType, FilterStrategy
+from src.common.storage import collection_and_field_names as names
+from src.service.data_products.common_functions import query_simple_collection_list
+from src.service.filtering.filters import FilterSet
+from src.service.filtering.query_shapes import (
+    QueryShape,
+    QueryShapeCount,
+    QueryShapeRecorder,
+    example_bind_vars,
+    get_query_shape_counts,
+    query_shape,
+    save_query_shape_counts,
+)
+from src.service.processing import SubsetSpecification
+
+
+class _FakeStorage:
+    """ Stores query shape count documents, interpreting queries by their keywords. """
+
+    def __init__(self, fail=False):
+        self.docs = {}
+        self.queries = []
+        self.shapes = []
+        self.fail = fail
+
+    async def execute_aql(
+        self, aql, bind_vars=None, count=False, query_shape=None, op=None
+    ):
+        if query_shape:
+            # a data query
+            self.shapes.append(query_shape)
+            return FakeCursor([])
+        self.queries.append(
+            "upsert" if "UPSERT" in aql else "remove" if "REMOVE" in aql else "read")
+        if self.fail:
+            raise ValueError("oh no")
+        assert bind_vars["@coll"] == names.COLL_SRV_QUERY_SHAPES
+        if "UPSERT" in aql:
+            for d in bind_vars["docs"]:
+                old = self.docs.get(d["_key"])
+                self.docs[d["_key"]] = d | {"count": d["count"] + (old["count"] if old else 0)}
+        elif "REMOVE" in aql:
+            self.docs = {k: d for k, d in self.docs.items() if d["bucket"] >= bind_vars["before"]}
+        else:
+            return FakeCursor(sorted((d for d in self.docs.values()
+                                       if d["bucket"] >= bind_vars["since"]),
+                                      key=lambda d: d["bucket"]))
+        return FakeCursor([])
+
+
+class _Clock:
+
+    def __init__(self, now=1_000_000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _fs(**kwargs):
+    args = {"collection_id": "GTDB", "load_ver": "r207", "view": "v", "collection": "c"}
+    return FilterSet(**(args | kwargs))
+
+
+def _shape(relation="c", **kwargs):
+    args = {"path": "collection", "relation": relation, "filters": [], "conjunction": True,
+            "sort_on": None, "sort_descending": None, "count": False, "keep": [],
+            "subset": False}
+    return QueryShape(**(args | kwargs))
+
+
+def test_query_shape_collection():
+    assert query_shape(_fs()) == _shape()
+    assert query_shape(_fs(sort_on="kbase_id", sort_descending=True, keep=["b", "a", "b"],
+                           match_spec=SubsetSpecification(internal_subset_id="m1"))
+    ) == _shape(sort_on="kbase_id", sort_descending=True, keep=["a", "b"], subset=True)
+    # counts ignore the sort and projection
+    assert query_shape(_fs(count=True, sort_on="kbase_id", keep=["a"])) == _shape(count=True)
+
+
+def test_query_shape_view():
+    fs = _fs(sort_on="kbase_id", conjunction=False,
+             selection_spec=SubsetSpecification(internal_subset_id="s1"))
+    fs.append("gc", ColumnType.FLOAT, "[0.5, 0.6]")
+    fs.append("classification", ColumnType.STRING, "bacteria", strategy=FilterStrategy.FULL_TEXT)
+    fs.append("is_complete", ColumnType.BOOL, "true")
+    assert query_shape(fs) == _shape(
+        path="view", relation="v", filters=[
+            ("classification", "fulltext"), ("gc", "range"), ("is_complete", "bool")],
+        conjunction=False, sort_on="kbase_id", sort_descending=False, subset=True)
+
+
+def test_query_shape_ignores_values():
+    fs1 = _fs(collection_id="GTDB", load_ver="r207", skip=10, limit=20)
+    fs1.append("gc", ColumnType.FLOAT, "[0.5, 0.6]")
+    fs2 = _fs(collection_id="PMI", load_ver="1", skip=0, limit=1000)
+    fs2.append("gc", ColumnType.FLOAT, "(,0.1)")
+    assert query_shape(fs1).signature() == query_shape(fs2).signature()
+    fs2.append("x", ColumnType.INT, "[1,]")
+    assert query_shape(fs1).signature() != query_shape(fs2).signature()
+
+
+@pytest.mark.asyncio
+async def test_query_simple_collection_list_passes_shape():
+    store = _FakeStorage()
+    fs = _fs(sort_on="kbase_id")
+    await query_simple_collection_list(store, fs, lambda d: None)
+    assert store.shapes == [query_shape(fs)]
+
+
+def test_recorder_init_fail():
+    for kwargs, err in [
+        ({"flush_interval_ms": 0}, "flush_interval_ms must be > 0"),
+        ({"bucket_ms": 0}, "bucket_ms must be > 0"),
+        ({"bucket_ms": 10, "retention_ms": 9}, "retention_ms must be >= bucket_ms"),
+        ({"max_pending": 0}, "max_pending must be > 0"),
+    ]:
+        with pytest.raises(Exception) as got:
+            QueryShapeRecorder(_FakeStorage(), **kwargs)
+        assert_exception_correct(got.value, ValueError(err))
+
+
+@pytest.mark.asyncio
+async def test_recorder_flushes_on_interval():
+    store = _FakeStorage()
+    clock = _Clock(1_000_000)
+    rec = QueryShapeRecorder(
+        store, clock, flush_interval_ms=100, bucket_ms=1000, retention_ms=3000)
+    s1, s2 = _shape("c1"), _shape("c2", sort_on="x", sort_descending=False)
+    assert rec.record(s1, "aql1", {"collid": "GTDB"}) is None
+    assert rec.record(s1, "aql1", {"collid": "PMI"}) is None
+    clock.now += 50
+    assert rec.record(s2, "aql2", None) is None
+    assert store.queries == []
+
+    clock.now += 50
+    await rec.record(s1, "aql1", {"@coll": "c1", "collid": "ENIGMA", "limit": 10})
+    assert store.queries == ["upsert", "remove"]
+    assert sorted(store.docs) == [f"1000000_{s1.signature()}", f"1000000_{s2.signature()}"]
+    # only the bind variable types are saved
+    assert store.docs[f"1000000_{s1.signature()}"] == {
+        "_key": f"1000000_{s1.signature()}",
+        "bucket": 1_000_000,
+        "sig": s1.signature(),
+        "shape": s1.model_dump(),
+        "count": 3,
+        "aql": "aql1",
+        "bind_vars": {"@coll": "c1", "collid": "str", "limit": "int"},
+    }
+
+    # counts accumulate across flushes in the same window
+    clock.now += 100
+    await rec.record(s1, "aql1", {"collid": "GTDB"})
+    assert store.docs[f"1000000_{s1.signature()}"]["count"] == 4
+
+    # the next window, and get_counts flushes the pending counts
+    clock.now = 1_001_500
+    await rec.record(s2, "aql2", {"a": 1})
+    assert await rec.get_counts() == [
+        QueryShapeCount(s1.signature(), s1, 4, "aql1", {"collid": "str"}),
+        QueryShapeCount(s2.signature(), s2, 2, "aql2", {"a": "int"}),
+    ]
+    assert store.docs[f"1001000_{s2.signature()}"]["count"] == 1
+
+    # the first and second windows expire
+    clock.now = 1_004_500
+    await rec.record(s2, "aql2", {"a": 2.0})
+    assert sorted(store.docs) == [f"1004000_{s2.signature()}"]
+    assert await rec.get_counts() == [
+        QueryShapeCount(s2.signature(), s2, 1, "aql2", {"a": "float"})]
+
+
+@pytest.mark.asyncio
+async def test_recorder_flushes_on_max_pending():
+    store = _FakeStorage()
+    rec = QueryShapeRecorder(store, _Clock(), max_pending=2)
+    rec.record(_shape("c1"), "aql", {})
+    rec.record(_shape("c1"), "aql", {})
+    assert store.docs == {}
+    await rec.record(_shape("c2"), "aql", {})
+    assert len(store.docs) == 2
+    # nothing to flush
+    await rec.flush()
+    assert store.queries == ["upsert", "remove"]
+
+
+class _BlockingStorage(_FakeStorage):
+    """ Blocks writes until released. """
+
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+
+    async def execute_aql(
+        self, aql, bind_vars=None, count=False, query_shape=None, op=None
+    ):
+        await self.release.wait()
+        return await super().execute_aql(aql, bind_vars, count, query_shape, op)
+
+
+@pytest.mark.asyncio
+async def test_recorder_flushes_in_background():
+    store = _BlockingStorage()
+    rec = QueryShapeRecorder(store, _Clock(), max_pending=1)
+    task = rec.record(_shape("c1"), "aql", {})
+    await asyncio.sleep(0)
+    assert not task.done()
+    # no new flush is started while the prior flush is in progress
+    assert rec.record(_shape("c2"), "aql", {}) is None
+    store.release.set()
+    await task
+    assert list(d["sig"] for d in store.docs.values()) == [_shape("c1").signature()]
+    # close waits for the prior flush and adds the pending counts
+    await rec.close()
+    assert sorted(d["sig"] for d in store.docs.values()) == sorted(
+        [_shape("c1").signature(), _shape("c2").signature()])
+
+
+@pytest.mark.asyncio
+async def test_recorder_logs_flush_failure(caplog):
+    store = _FakeStorage(fail=True)
+    rec = QueryShapeRecorder(store, _Clock(), max_pending=1)
+    with caplog.at_level(logging.ERROR):
+        await rec.record(_shape(), "aql", {})
+    assert "Failed to save 1 query shape counts" in caplog.text
+    # the counts are discarded
+    store.fail = False
+    await rec.flush()
+    assert store.docs == {}
+
+
+def test_example_bind_vars():
+    shape = _shape(sort_on="kbase_id", sort_descending=True, keep=["a", "b"])
+    assert example_bind_vars(shape, {
+        "@collection": "c",
+        "collid": "str",
+        "skip": "int",
+        "v1_low": "float",
+        "v2_bool_value": "bool",
+        "sort": "str",
+        "sortdir": "str",
+        "keep": "list",
+        "x": "NoneType",
+    }) == {
+        "@collection": "c",
+        "collid": "a",
+        "skip": 1,
+        "v1_low": 1.0,
+        "v2_bool_value": True,
+        "sort": "kbase_id",
+        "sortdir": "DESC",
+        "keep": ["a", "b"],
+        "x": None,
+    }
+    assert example_bind_vars(_shape(sort_on="x", sort_descending=False), {"sortdir": "str"}
+    ) == {"sortdir": "ASC"}
+
+
+@pytest.mark.asyncio
+async def test_get_query_shape_counts_sums_windows():
+    store = _FakeStorage()
+    s1, s2 = _shape("c1"), _shape("c2")
+    await save_query_shape_counts(store, 2000, [
+        QueryShapeCount(s1.signature(), s1, 2, "aql1", {"v": 2}),
+        QueryShapeCount(s2.signature(), s2, 4, "aql2", {"v": 2}),
+    ])
+    await save_query_shape_counts(store, 1000, [
+        QueryShapeCount(s1.signature(), s1, 3, "aql1", {"v": 1})])
+    await save_query_shape_counts(store, 0, [
+        QueryShapeCount(s1.signature(), s1, 100, "aql1", {"v": 0})])
+    # ordered by count, with the example query from the latest window
+    assert await get_query_shape_counts(store, 1000) == [
+        QueryShapeCount(s1.signature(), s1, 5, "aql1", {"v": 2}),
+        QueryShapeCount(s2.signature(), s2, 4, "aql2", {"v": 2}),
+    ]
@@ -0,0 +1,200 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from conftest import FakeStorage, assert_exception_correct
+from src.common.product_models.columnar_attribs_common_models import (
+    AttributesColumn,
+    ColumnType,
+    FilterStrategy,
+)
+from src.service.data_products.common_functions import query_table
+from src.service.filtering.filters import FilterSet
+from src.service.filtering.result_cache import ResultCache, result_key
+from src.service.processing import SubsetSpecification
+
+
+_S = ColumnType.STRING
+_I = ColumnType.INT
+
+
+def _fs(*filters, coll="GTDB", load_ver="r207", match_id=None, match_mark=False, **kwargs):
+    args = {"sort_on": "kbase_id", "limit": 10} | kwargs
+    fs = FilterSet(
+        coll,
+        load_ver,
+        collection="coll",
+        match_spec=SubsetSpecification(
+            internal_subset_id=match_id, mark_only=match_mark, prefix="m_"),
+        **args
+    )
+    for f in filters:
+        fs.append(*f)
+    return fs
+
+
+def _lookups(result):
+    return REGISTRY.get_sample_value(
+        "collections_result_cache_lookups_total", {"result": result}) or 0
+
+
+def test_result_key():
+    key = result_key(_fs(("phylum", _S, "p__Foo", None, FilterStrategy.IDENTITY),
+                         ("contigs", _I, "[1,10]")))
+    assert key == result_key(_fs(("contigs", _I, "[1, 10]"),
+                                 ("phylum", _S, "p__Foo", None, FilterStrategy.IDENTITY)))
+    assert result_key(_fs(), "a", True) == result_key(_fs(), "a", True)
+    assert result_key(_fs(), "a") != result_key(_fs(), "b")
+    # the sort direction is irrelevant without a sort field
+    assert result_key(_fs(sort_on=None, sort_descending=True)) == result_key(_fs(sort_on=None))
+    for fs in [
+        _fs(("contigs", _I, "[1,10)")),
+        _fs(coll="ENIGMA"),
+        _fs(load_ver="r214"),
+        _fs(sort_on="contigs"),
+        _fs(sort_descending=True),
+        _fs(skip=10),
+        _fs(limit=20),
+        _fs(start_after="foo"),
+        _fs(keep=["kbase_id"]),
+        _fs(count=True),
+        _fs(match_id="foo"),
+        _fs(match_id="foo", match_mark=True),
+    ]:
+        assert result_key(fs) != result_key(_fs())
+    assert result_key(_fs(match_id="foo", match_mark=True)) != result_key(
+        _fs(match_id="bar", match_mark=True))
+
+
+def test_init_fail():
+    for kwargs, err in [
+        ({"max_entries": 0}, "max_entries must be > 0"),
+        ({"max_rows": 0}, "max_rows must be > 0"),
+    ]:
+        with pytest.raises(Exception) as got:
+            ResultCache(**kwargs)
+        assert_exception_correct(got.value, ValueError(err))
+
+
+def test_get_put_hit_ratio():
+    hits, misses = _lookups("hit"), _lookups("miss")
+    rc = ResultCache()
+    assert rc.hit_ratio == 0
+    assert rc.get(_fs(), "a") is None
+    rc.put(_fs(), "res", 3, "a")
+    assert rc.get(_fs(), "a") == "res"
+    assert rc.get(_fs(), "b") is None
+    assert rc.get(_fs(skip=1), "a") is None
+    assert rc.hit_ratio == 0.25
+    assert rc.size == (1, 3)
+    assert _lookups("hit") == hits + 1
+    assert _lookups("miss") == misses + 3
+    # replacing an entry
+    rc.put(_fs(), "res2", 5, "a")
+    assert rc.get(_fs(), "a") == "res2"
+    assert rc.size == (1, 5)
+
+
+def test_lru_entries():
+    rc = ResultCache(max_entries=2)
+    rc.put(_fs(skip=1), 1, 1)
+    rc.put(_fs(skip=2), 2, 1)
+    assert rc.get(_fs(skip=1)) == 1
+    rc.put(_fs(skip=3), 3, 1)
+    assert rc.get(_fs(skip=2)) is None
+    assert rc.get(_fs(skip=1)) == 1
+    assert rc.get(_fs(skip=3)) == 3
+    assert rc.size == (2, 2)
+
+
+def test_lru_rows():
+    rc = ResultCache(max_rows=10)
+    rc.put(_fs(skip=1), 1, 4)
+    rc.put(_fs(skip=2), 2, 4)
+    rc.put(_fs(skip=3), 3, 4)
+    assert rc.size == (2, 8)
+    assert rc.get(_fs(skip=1)) is None
+    # too big to cache
+    rc.put(_fs(skip=4), 4, 11)
+    assert rc.get(_fs(skip=4)) is None
+    assert rc.size == (2, 8)
+    rc.put(_fs(skip=5), 5, 10)
+    assert rc.size == (1, 10)
+    assert rc.get(_fs(skip=5)) == 5
+
+
+def test_invalidate():
+    rc = ResultCache()
+    rc.put(_fs(skip=1), 1, 1)
+    rc.put(_fs(skip=2, load_ver="r214"), 2, 1)
+    rc.put(_fs(skip=1, coll="ENIGMA"), 3, 1)
+    rc.invalidate("GTDB")
+    assert rc.size == (1, 1)
+    assert rc.get(_fs(skip=1)) is None
+    assert rc.get(_fs(skip=2, load_ver="r214")) is None
+    assert rc.get(_fs(skip=1, coll="ENIGMA")) == 3
+    rc.invalidate("foo")
+    assert rc.size == (1, 1)
+
+
+def _mutator(doc):
+    doc.pop("_key", None)
+    return doc
+
+
+@pytest.mark.asyncio
+async def test_query_table_cached():
+    cols = [AttributesColumn(
+        key="kbase_id", type=_S, filter_strategy=FilterStrategy.IDENTITY), AttributesColumn(key="contigs", type=_I)]
+    store = FakeStorage([{"_key": "1", "kbase_id": "a", "contigs": 2},
+                          {"_key": "2", "kbase_id": "b"}])
+    rc = ResultCache()
+    res = await query_table(store, cols, _fs(), document_mutator=_mutator, result_cache=rc)
+    assert res.table == [["a", 2], ["b", None]]
+    assert res.fields == [{"name": "kbase_id"}, {"name": "contigs"}]
+    res2 = await query_table(store, cols, _fs(), document_mutator=_mutator, result_cache=rc)
+    assert res2 == res
+    assert len(store.queries) == 1
+    assert rc.size == (1, 2)
+
+    # different output format
+    res = await query_table(store, cols, _fs(), output_table=False, document_mutator=_mutator,
+                            result_cache=rc)
+    assert res.data == [{"kbase_id": "a", "contigs": 2}, {"kbase_id": "b", "contigs": None}]
+    assert len(store.queries) == 2
+    # different columns
+    await query_table(store, cols[:1], _fs(), document_mutator=_mutator, result_cache=rc)
+    assert len(store.queries) == 3
+    # different page
+    await query_table(store, cols, _fs(skip=2), document_mutator=_mutator, result_cache=rc)
+    assert len(store.queries) == 4
+    # no cache
+    await query_table(store, cols, _fs(), document_mutator=_mutator)
+    assert len(store.queries) == 5
+    # counts are not cached in the result cache
+    await query_table(store, cols, _fs(count=True), result_cache=rc)
+    assert len(store.queries) == 6
+    assert rc.size == (4, 8)
+
+
+@pytest.mark.asyncio
+async def test_query_table_cached_keep():
+    cols = [AttributesColumn(
+        key="kbase_id", type=_S, filter_strategy=FilterStrategy.IDENTITY),
+        AttributesColumn(key="contigs", type=_I), AttributesColumn(key="genes", type=_I)]
+    store = FakeStorage([{"_key": "1", "kbase_id": "a", "contigs": 2, "genes": 5,
+                           "_mtchsel": ["m_mid"]},
+                          {"_key": "2", "kbase_id": "b", "genes": 6}])
+    rc = ResultCache()
+    fs = _fs(keep=["genes", "kbase_id"], match_id="mid", match_mark=True)
+    res = await query_table(store, cols, fs, document_mutator=_mutator, result_cache=rc)
+    # fields are in column order
+    assert res.fields == [{"name": "__match__"}, {"name": "kbase_id"}, {"name": "genes"}]
+    assert res.table == [[True, "a", 5], [False, "b", 6]]
+    res2 = await query_table(store, cols, fs, document_mutator=_mutator, result_cache=rc)
+    assert res2 == res
+    assert len(store.queries) == 1
+    # different fields
+    res = await query_table(store, cols, _fs(keep=["contigs"]), document_mutator=_mutator,
+                            result_cache=rc)
+    assert res.table == [[2], [None]]
+    assert len(store.queries) == 2
@@ -0,0 +1,154 @@
+from aioarango.formatter import format_view
+
+from src.common.product_models.columnar_attribs_common_models import (
+    AttributesColumnSpec,
+    ColumnarAttributesSpec,
+)
+from src.service.filtering import analyzers, generic_view, view_definitions
+
+
+def _col(key, type_, **kwargs):
+    return AttributesColumnSpec(
+        key=key, type=type_, display_name=key, category="cat", **kwargs)
+
+
+_SPEC = ColumnarAttributesSpec(columns=[
+    _col("kbase_id", "string", filter_strategy="identity"),
+    _col("classification", "string", filter_strategy="fulltext"),
+    _col("checkm_completeness", "float"),
+    _col("contig_count", "int"),
+    _col("date", "date"),
+    _col("is_complete", "bool"),
+    _col("gc_content", "float"),
+])
+
+_CONSOLIDATION = {
+    "commitIntervalMsec": 5000,
+    "consolidationIntervalMsec": 60000,
+    "cleanupIntervalStep": 2,
+    "consolidationPolicy": {
+        "type": "tier",
+        "segmentsMin": 1,
+        "segmentsMax": 10,
+        "segmentsBytesMax": 8 * 1024 * 1024 * 1024,
+        "segmentsBytesFloor": 16 * 1024 * 1024,
+    },
+}
+
+
+def _server_view(props):
+    """ Returns a view as returned by the server and formatted by the client. """
+    body = {"name": "v", "type": "arangosearch", "id": "1", "globallyUniqueId": "h1/1"}
+    body |= props | {
+        "links": {c: {"analyzers": ["identity"], "storeValues": "none"} | {
+                      "fields": link["fields"], "includeAllFields": link["includeAllFields"]}
+                  for c, link in props["links"].items()},
+        "storedValues": [sv | {"cache": False} for sv in props["storedValues"]],
+        "writebufferIdle": 64,
+    }
+    body["consolidationPolicy"] = props["consolidationPolicy"] | {"minScore": 0}
+    return format_view(body)
+
+
+def test_view_properties():
+    props = view_definitions.get_view_properties(
+        "genome_attribs", _SPEC, analyzers.get_analyzer, primary_sort="kbase_id")
+    assert props == {
+        "links": {"genome_attribs": {
+            "fields": {
+                "kbase_id": {},
+                "classification": {"analyzers": ["text_en"]},
+                "checkm_completeness": {},
+                "contig_count": {},
+                "date": {},
+                "is_complete": {},
+                "gc_content": {},
+            },
+            "includeAllFields": False,
+        }},
+        "primarySort": [{"field": "kbase_id", "asc": True}],
+        "primarySortCompression": "lz4",
+        "storedValues": [
+            {"fields": ["kbase_id"], "compression": "lz4"},
+            {"fields": ["checkm_completeness", "contig_count", "gc_content"],
+             "compression": "lz4"},
+        ],
+    } | _CONSOLIDATION
+
+
+def test_view_properties_generic_no_sort():
+    spec = generic_view.create_generic_spec()
+    props = view_definitions.get_view_properties(
+        "heatmap", spec, analyzers.get_analyzer, include_all_fields=True)
+    assert props["links"] == {"heatmap": {
+        "fields": {"kbase_display_name": {"analyzers": ["kbcoll_en_ngram3"]}},
+        "includeAllFields": True,
+    }}
+    assert props["primarySort"] == []
+    assert props["storedValues"] == []
+
+
+def test_stored_values():
+    assert view_definitions.get_stored_values(_SPEC, None) == [
+        ["checkm_completeness", "contig_count", "gc_content"]]
+    # a numeric sort field is stored on its own
+    assert view_definitions.get_stored_values(_SPEC, "contig_count") == [
+        ["contig_count"], ["checkm_completeness", "gc_content"]]
+    spec = ColumnarAttributesSpec(columns=[_col("kbase_id", "string", filter_strategy="prefix")])
+    assert view_definitions.get_stored_values(spec, "kbase_id") == [["kbase_id"]]
+
+
+def test_generic_view_name_is_versioned():
+    assert generic_view.get_generic_view_name("heatmap") == (
+        f"heatmap_generic_view_v{view_definitions.VIEW_DEFINITION_VERSION}")
+    assert generic_view.get_legacy_generic_view_name("heatmap") == "heatmap_generic_view"
+
+
+def test_view_matches():
+    props = view_definitions.get_view_properties(
+        "genome_attribs", _SPEC, analyzers.get_analyzer, primary_sort="kbase_id")
+    view = _server_view(props)
+    assert view_definitions.view_matches(view, "genome_attribs", props)
+    assert not view_definitions.view_matches(view, "samples", view_definitions.get_view_properties(
+        "samples", _SPEC, analyzers.get_analyzer, primary_sort="kbase_id"))
+
+    # differing commit and consolidation settings still match
+    view["consolidation_interval_msec"] = 1000
+    assert view_definitions.view_matches(view, "genome_attribs", props)
+
+    for other in [
+        # a version 1 view with no primary sort or stored values
+        view_definitions.get_view_properties("genome_attribs", _SPEC, analyzers.get_analyzer),
+        view_definitions.get_view_properties(
+            "genome_attribs", _SPEC, analyzers.get_analyzer, primary_sort="gc_content"),
+        view_definitions.get_view_properties(
+            "genome_attribs", _SPEC, analyzers.get_analyzer, primary_sort="kbase_id",
+            include_all_fields=True),
+        view_definitions.get_view_properties(
+            "genome_attribs", ColumnarAttributesSpec(columns=_SPEC.columns[:-1]),
+            analyzers.get_analyzer, primary_sort="kbase_id"),
+    ]:
+        assert not view_definitions.view_matches(view, "genome_attribs", other)
+        assert not view_definitions.view_matches(_server_view(other), "genome_attribs", props)
+
+
+def test_view_needs_update():
+    props = view_definitions.get_view_properties(
+        "genome_attribs", _SPEC, analyzers.get_analyzer, primary_sort="kbase_id")
+    view = _server_view(props)
+    assert not view_definitions.view_needs_update(view)
+    for key, value in [
+        ("commit_interval_msec", 1000),
+        ("consolidation_interval_msec", 1000),
+        ("cleanup_interval_step", 10),
+        ("consolidation_policy", {"type": "tier", "segments_min": 1, "segments_max": 10,
+                                  "segments_bytes_max": 5 * 1024 ** 3,
+                                  "segments_bytes_floor": 2 * 1024 ** 2, "min_score": 0}),
+    ]:
+        assert view_definitions.view_needs_update(view | {key: value}), key
+
+
+def test_mutable_properties_are_copies():
+    props = view_definitions.get_mutable_properties()
+    props["consolidationPolicy"]["segmentsMax"] = 1
+    assert view_definitions.get_mutable_properties() == _CONSOLIDATION
@@ -0,0 +1,181 @@
+import pytest
+
+from conftest import assert_exception_correct
+from src.service.filtering.query_shapes import QueryShape, QueryShapeCount
+from src.service.index_advisor import (
+    ExplainedShape,
+    IndexAdvice,
+    IndexSuggestion,
+    advise,
+)
+
+
+def _shape(path="collection", relation="gattribs", **kwargs):
+    args = {"path": path, "relation": relation, "filters": [], "conjunction": True,
+            "sort_on": None, "sort_descending": None, "count": False, "keep": [],
+            "subset": False}
+    return QueryShape(**(args | kwargs))
+
+
+def _count(shape, count, aql):
+    return QueryShapeCount(shape.signature(), shape, count, aql, {"collid": "str"})
+
+
+_FULL_SCAN = {"type": "EnumerateCollectionNode", "collection": "gattribs"}
+_SORT = {"type": "SortNode"}
+
+
+def _index(*fields):
+    return {"type": "IndexNode", "collection": "gattribs", "indexes": [
+        {"type": "persistent", "fields": list(fields)}]}
+
+
+def _view(**kwargs):
+    return {"type": "EnumerateViewNode", "view": "gattribs_view"} | kwargs
+
+
+class _Explainer:
+    """ Returns a plan for each query keyed by the AQL string. """
+
+    def __init__(self, plans):
+        self.plans = plans
+        self.calls = []
+
+    async def __call__(self, aql, bind_vars):
+        self.calls.append((aql, bind_vars))
+        plan = self.plans[aql]
+        if isinstance(plan, Exception):
+            raise plan
+        return plan
+
+
+def _plan(cost, *nodes):
+    return {"nodes": [{"type": "SingletonNode"}] + list(nodes) + [{"type": "ReturnNode"}],
+            "estimatedCost": cost}
+
+
+@pytest.mark.asyncio
+async def test_advise_collection_path():
+    sorted_scan = _shape(sort_on="checkm", sort_descending=True)
+    unsorted_scan = _shape(relation="samples")
+    indexed = _shape(sort_on="kbase_id", sort_descending=False)
+    memsort = _shape(sort_on="gc", sort_descending=False, subset=True)
+    counts = [
+        _count(sorted_scan, 10, "q1"),
+        _count(unsorted_scan, 100, "q2"),
+        _count(indexed, 900, "q3"),
+        _count(memsort, 2, "q4"),
+    ]
+    explainer = _Explainer({
+        "q1": _plan(500.0, _FULL_SCAN, _SORT),
+        "q2": _plan(20.0, _FULL_SCAN),
+        # the index covers the filter and sort
+        "q3": _plan(5.0, _index("coll", "load_ver", "kbase_id", "other")),
+        # the index covers the filter only
+        "q4": _plan(300.0, _index("coll", "load_ver"), _SORT),
+    })
+    advice = await advise(counts, explainer)
+    assert advice == IndexAdvice(
+        suggestions=[
+            IndexSuggestion(kind="persistent_index", relation="gattribs",
+                            fields=["coll", "load_ver", "checkm"], cost=5000.0, executions=10,
+                            signatures=[sorted_scan.signature()]),
+            IndexSuggestion(kind="persistent_index", relation="samples",
+                            fields=["coll", "load_ver"], cost=2000.0, executions=100,
+                            signatures=[unsorted_scan.signature()]),
+            IndexSuggestion(kind="persistent_index", relation="gattribs",
+                            fields=["coll", "load_ver", "gc"], cost=600.0, executions=2,
+                            signatures=[memsort.signature()]),
+        ],
+        shapes=[
+            ExplainedShape(signature=sorted_scan.signature(), shape=sorted_scan, executions=10,
+                           plan_cost=500.0, cost=5000.0, explain_error=None),
+            ExplainedShape(signature=indexed.signature(), shape=indexed, executions=900,
+                           plan_cost=5.0, cost=4500.0, explain_error=None),
+            ExplainedShape(signature=unsorted_scan.signature(), shape=unsorted_scan,
+                           executions=100, plan_cost=20.0, cost=2000.0, explain_error=None),
+            ExplainedShape(signature=memsort.signature(), shape=memsort, executions=2,
+                           plan_cost=300.0, cost=600.0, explain_error=None),
+        ],
+    )
+    # the shapes are explained with example bind variable values
+    assert sorted(explainer.calls) == [(q, {"collid": "a"}) for q in ["q1", "q2", "q3", "q4"]]
+
+
+@pytest.mark.asyncio
+async def test_advise_view_path():
+    v = "gattribs_view"
+    filters = [("gc", "range")]
+    sort_gc = _shape("view", v, filters=filters, sort_on="gc", sort_descending=False)
+    sort_gc_or = _shape("view", v, filters=filters, conjunction=False, sort_on="gc",
+                        sort_descending=True)
+    keep = _shape("view", v, filters=filters, keep=["checkm", "gc", "kbase_id"])
+    stored = _shape("view", v, filters=[("checkm", "range")], keep=["checkm", "gc"],
+                    sort_on="kbase_id", sort_descending=False)
+    count = _shape("view", v, filters=filters, count=True)
+    counts = [
+        _count(sort_gc, 4, "q1"),
+        _count(sort_gc_or, 1, "q2"),
+        _count(keep, 10, "q3"),
+        _count(stored, 50, "q4"),
+        _count(count, 100, "q5"),
+    ]
+    explainer = _Explainer({
+        "q1": _plan(100.0, _view(), _SORT),
+        "q2": _plan(200.0, _view(), _SORT),
+        # kbase_id is stored but the other fields are read from the documents
+        "q3": _plan(10.0, _view(viewValuesVars=[{"columnNumber": 0, "viewStoredValuesVars": [
+            {"fieldNumber": 0, "field": "kbase_id"}]}])),
+        # the primary sort covers the sort and all fields are stored
+        "q4": _plan(1.0, _view(noMaterialization=True, viewValuesVars=[
+            {"field": "checkm"}, {"field": "gc"}])),
+        "q5": _plan(30.0, _view(noMaterialization=True)),
+    })
+    advice = await advise(counts, explainer)
+    assert advice.suggestions == [
+        IndexSuggestion(kind="stored_values", relation=v, fields=["gc"], cost=600.0,
+                        executions=5, signatures=[sort_gc.signature(), sort_gc_or.signature()]),
+        IndexSuggestion(kind="stored_values", relation=v, fields=["checkm", "gc"], cost=100.0,
+                        executions=10, signatures=[keep.signature()]),
+    ]
+    assert [s.signature for s in advice.shapes] == [
+        count.signature(), sort_gc.signature(), sort_gc_or.signature(), keep.signature(),
+        stored.signature()]
+
+
+@pytest.mark.asyncio
+async def test_advise_explain_error_and_max_shapes():
+    s1 = _shape(sort_on="a", sort_descending=False)
+    s2 = _shape(relation="other")
+    s3 = _shape(relation="ignored")
+    explainer = _Explainer({
+        "q1": ValueError("bad query"),
+        "q2": _plan(1.0, _FULL_SCAN),
+        "q3": _plan(1e9, _FULL_SCAN),
+    })
+    advice = await advise(
+        [_count(s3, 1, "q3"), _count(s1, 3, "q1"), _count(s2, 2, "q2")], explainer, max_shapes=2)
+    assert advice == IndexAdvice(
+        suggestions=[IndexSuggestion(kind="persistent_index", relation="other",
+                                     fields=["coll", "load_ver"], cost=2.0, executions=2,
+                                     signatures=[s2.signature()])],
+        shapes=[
+            ExplainedShape(signature=s2.signature(), shape=s2, executions=2, plan_cost=1.0,
+                           cost=2.0, explain_error=None),
+            ExplainedShape(signature=s1.signature(), shape=s1, executions=3, plan_cost=None,
+                           cost=None, explain_error="bad query"),
+        ],
+    )
+    assert [c[0] for c in explainer.calls] == ["q1", "q2"]
+
+
+@pytest.mark.asyncio
+async def test_advise_no_shapes():
+    assert await advise([], _Explainer({})) == IndexAdvice(suggestions=[], shapes=[])
+
+
+@pytest.mark.asyncio
+async def test_advise_fail():
+    with pytest.raises(Exception) as got:
+        await advise([], _Explainer({}), max_shapes=0)
+    assert_exception_correct(got.value, ValueError("max_shapes must be > 0"))
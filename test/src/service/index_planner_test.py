@@ -0,0 +1,129 @@
+from fastapi import APIRouter
+import pytest
+
+from conftest import assert_exception_correct
+from src.common.product_models.columnar_attribs_common_models import (
+    AttributesColumnSpec,
+    ColumnarAttributesSpec,
+)
+from src.service import data_product_specs
+from src.service.data_products.common_models import DataProductSpec, DBCollection
+from src.service.index_planner import ColumnIndexPlan, plan_column_indexes
+
+
+def _col(key, type_, non_visible=False):
+    kwargs = {"filter_strategy": "identity"} if type_ == "string" else {}
+    if not non_visible:
+        kwargs |= {"display_name": key, "category": "cat"}
+    return AttributesColumnSpec(key=key, type=type_, non_visible=non_visible, **kwargs)
+
+
+_SPECS = {
+    "attribs": {
+        "COL1": ColumnarAttributesSpec(columns=[
+            _col("kbase_id", "string"),
+            _col("completeness", "float"),
+            _col("contigs", "int"),
+            _col("genome_size", "int"),
+            _col("date", "date"),
+            _col("is_rep", "bool"),
+            _col("hidden_count", "int", non_visible=True),
+        ]),
+        "COL2": ColumnarAttributesSpec(columns=[
+            _col("kbase_id", "string"),
+            _col("completeness", "float"),
+            _col("genome_size", "int"),
+            _col("ani", "float"),
+        ]),
+        "COL3": ColumnarAttributesSpec(columns=[
+            _col("genome_size", "int"),
+            _col("contigs", "int"),
+        ]),
+    },
+    "samples": {
+        "COL1": ColumnarAttributesSpec(columns=[
+            _col("latitude", "float"),
+            _col("depth", "float"),
+        ]),
+    },
+}
+
+
+def _dp(name, dbcs):
+    return DataProductSpec(data_product=name, router=APIRouter(tags=[name]), db_collections=dbcs)
+
+
+_DPS = [
+    _dp("attribs", [
+        DBCollection(name="attribs_meta", indexes=[]),
+        DBCollection(name="attribs_data", view_required=True, indexes=[
+            ["coll", "load_ver", "kbase_id"],
+            ["coll", "load_ver", "contigs"],
+        ]),
+    ]),
+    _dp("samples", [DBCollection(name="samples_data", view_required=True, indexes=[])]),
+    # data products without specs are skipped
+    _dp("heatmap", [DBCollection(name="heatmap_data", generic_view_required=True, indexes=[])]),
+    _dp("taxa", [DBCollection(name="taxa_data", indexes=[["coll", "load_ver", "count"]])]),
+]
+
+
+def _specs(data_product):
+    return _SPECS[data_product]
+
+
+def test_plan():
+    plan = plan_column_indexes(_DPS, spec_provider=_specs)
+    assert plan == ColumnIndexPlan(
+        indexes={
+            # ordered by the number of KBase collections with the column, then name.
+            # contigs is already required by the data product
+            "attribs_data": [
+                ("coll", "load_ver", "genome_size"),
+                ("coll", "load_ver", "completeness"),
+                ("coll", "load_ver", "ani"),
+            ],
+            "samples_data": [
+                ("coll", "load_ver", "depth"),
+                ("coll", "load_ver", "latitude"),
+            ],
+        },
+        over_budget={"attribs_data": [], "samples_data": []},
+    )
+
+
+def test_plan_budget():
+    plan = plan_column_indexes(_DPS, budget=1, spec_provider=_specs)
+    assert plan == ColumnIndexPlan(
+        indexes={
+            "attribs_data": [("coll", "load_ver", "genome_size")],
+            "samples_data": [("coll", "load_ver", "depth")],
+        },
+        over_budget={"attribs_data": ["completeness", "ani"], "samples_data": ["latitude"]},
+    )
+    plan = plan_column_indexes(_DPS, budget=0, spec_provider=_specs)
+    assert plan.indexes == {"attribs_data": [], "samples_data": []}
+    assert plan.over_budget == {
+        "attribs_data": ["genome_size", "completeness", "ani"],
+        "samples_data": ["depth", "latitude"],
+    }
+
+
+def test_plan_installed_specs():
+    plan = plan_column_indexes(data_product_specs.get_data_products(), budget=5)
+    assert set(plan.indexes) == {"kbcoll_genome_attribs", "kbcoll_samples"}
+    for coll, idxs in plan.indexes.items():
+        assert 0 < len(idxs) <= 5
+        assert all(idx[:2] == ("coll", "load_ver") for idx in idxs)
+        assert not {idx[2] for idx in idxs} & set(plan.over_budget[coll])
+    assert plan.indexes["kbcoll_samples"] == [
+        ("coll", "load_ver", "genome_count"),
+        ("coll", "load_ver", "latitude"),
+        ("coll", "load_ver", "longitude"),
+    ]
+
+
+def test_plan_fail_budget():
+    with pytest.raises(Exception) as got:
+        plan_column_indexes(_DPS, budget=-1, spec_provider=_specs)
+    assert_exception_correct(got.value, ValueError("budget must be >= 0"))
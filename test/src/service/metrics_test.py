@@ -0,0 +1,90 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src.service import metrics
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def _app():
+    app = FastAPI()
+
+    @app.get("/things/{thing_id}")
+    async def get_thing(thing_id: str):
+        return {"id": thing_id}
+
+    @app.get("/boom")
+    async def boom():
+        raise ValueError("boom")
+
+    app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+
+def test_middleware_route_template():
+    name = "collections_http_request_duration_seconds_count"
+    labels = {"method": "GET", "route": "/things/{thing_id}", "status": "200"}
+    before = _sample(name, labels)
+    cli = TestClient(_app())
+    for i in range(3):
+        assert cli.get(f"/things/{i}").json() == {"id": str(i)}
+    assert _sample(name, labels) == before + 3
+
+
+def test_middleware_unmatched_and_error():
+    name = "collections_http_request_duration_seconds_count"
+    unmatched = {"method": "GET", "route": metrics.UNMATCHED_ROUTE, "status": "404"}
+    err = {"method": "GET", "route": "/boom", "status": "500"}
+    before_unmatched = _sample(name, unmatched)
+    before_err = _sample(name, err)
+    cli = TestClient(_app(), raise_server_exceptions=False)
+    assert cli.get("/nope/whatever").status_code == 404
+    assert cli.get("/boom").status_code == 500
+    assert _sample(name, unmatched) == before_unmatched + 1
+    assert _sample(name, err) == before_err + 1
+
+
+def test_get_collection_label():
+    assert metrics.get_collection_label(None) == metrics.NO_COLLECTION
+    assert metrics.get_collection_label({"a": "b"}) == metrics.NO_COLLECTION
+    assert metrics.get_collection_label({"a": "b", "@coll": "c", "@view": "v"}) == "c"
+
+
+class _FakeProcess:
+
+    def __init__(self, alive):
+        self.alive = alive
+
+    def is_alive(self):
+        return self.alive
+
+
+def test_track_process():
+    name = "collections_subset_processes_running"
+    p1 = _FakeProcess(True)
+    p2 = _FakeProcess(True)
+    p3 = _FakeProcess(True)
+    metrics.track_process(p1, "test.proc1")
+    metrics.track_process(p2, "test.proc1")
+    metrics.track_process(p3, "test.proc2")
+    assert _sample(name, {"process": "test.proc1"}) == 2
+    assert _sample(name, {"process": "test.proc2"}) == 1
+    p1.alive = False
+    p3.alive = False
+    assert _sample(name, {"process": "test.proc1"}) == 1
+    assert _sample(name, {"process": "test.proc2"}) == 0
+    p2.alive = False
+    assert _sample(name, {"process": "test.proc1"}) == 0
+    # dead processes are no longer reported after they've been reported as 0 once
+    assert REGISTRY.get_sample_value(name, {"process": "test.proc1"}) is None
+
+
+def test_observe_outbound_and_generate():
+    metrics.observe_outbound("Workspace", "Workspace.ver", 0)
+    content, ctype = metrics.generate_metrics()
+    assert ctype.startswith("text/plain")
+    assert (b'collections_outbound_request_duration_seconds_count{method="Workspace.ver",'
+            + b'service="Workspace"}') in content
@@ -1,4 +1,4 @@
-from src.service.models import DataProduct
+from src.service.models import DataProduct, DynamicConfig
 
 
 # TODO TEST add more tests
@@ -8,3 +8,13 @@ def test_noop():
     dp = DataProduct(product="foo", version="bar")
     assert dp.product == "foo"
     assert dp.version == "bar"
+
+
+def test_dynamic_config_is_empty():
+    assert DynamicConfig().is_empty() is True
+    assert DynamicConfig(**{}).is_empty() is True
+    # fields set to their default values are not empty
+    assert DynamicConfig(search_views={}).is_empty() is False
+    assert DynamicConfig(aql_profiling=False).is_empty() is False
+    assert DynamicConfig(aql_slow_query_ms=200).is_empty() is False
+    assert DynamicConfig(search_views={"genome_attribs": "v1"}).is_empty() is False
@@ -0,0 +1,328 @@
+import pytest
+
+from conftest import assert_exception_correct
+from src.service import errors, models
+from src.service import processing_selections
+from src.service.kb_auth import AdminPermission, KBaseUser
+from src.service.user import UserID
+
+
+_NOW = 100000
+
+_USER = KBaseUser(UserID("user"), AdminPermission.NONE, "token")
+
+
+def _coll(ver_num, load_ver="r207", default_select="genome_attribs"):
+    return models.SavedCollection(
+        name="GTDB",
+        ver_src="r207",
+        data_products=[
+            models.DataProduct(product="genome_attribs", version=load_ver),
+            models.DataProduct(product="taxa_count", version="r207"),
+        ],
+        matchers=[],
+        default_select=default_select,
+        id="GTDB",
+        ver_tag=f"tag{ver_num}",
+        ver_num=ver_num,
+        date_create="2022-10-07T17:58:53.188698+00:00",
+        user_create="some_user",
+    )
+
+
+def _sel(selection_id, ids, collection_id="GTDB", collection_ver=3,
+         state=models.ProcessState.COMPLETE, data_product="genome_attribs", unmatched_ids=None):
+    return models.InternalSelection(
+        selection_id=selection_id,
+        collection_id=collection_id,
+        collection_ver=collection_ver,
+        data_product=data_product,
+        state=state,
+        state_updated=_NOW,
+        heartbeat=_NOW,
+        selection_ids=ids,
+        selection_count=len(ids),
+        unmatched_ids=unmatched_ids,
+        internal_selection_id=f"int_{selection_id}",
+        created=60000,
+        last_access=90000,
+    )
+
+
+def _match(match_id, ids, matcher_id="gtdb_lineage", collection_ver=3):
+    return models.InternalMatch(
+        match_id=match_id,
+        matcher_id=matcher_id,
+        collection_id="GTDB",
+        collection_ver=collection_ver,
+        user_parameters={},
+        collection_parameters={},
+        state=models.ProcessState.COMPLETE,
+        state_updated=_NOW,
+        heartbeat=_NOW,
+        upas=[],
+        upa_count=0,
+        matches=ids,
+        internal_match_id=f"int_{match_id}",
+        wsids=[],
+        created=60000,
+        last_access=90000,
+        # avoid a workspace permission check
+        user_last_perm_check={"user": _NOW},
+    )
+
+
+class _FakeMatcher:
+
+    def __init__(self, required_data_products):
+        self.required_data_products = required_data_products
+
+
+class _FakeStorage:
+
+    def __init__(self, colls, subsets):
+        self.colls = {c.ver_num: c for c in colls}
+        self.subsets = {getattr(s, "match_id", None) or s.selection_id: s for s in subsets}
+        self.saved = []
+
+    async def get_collection_active(self, collection_id):
+        return self.colls[max(self.colls)]
+
+    async def get_collection_version_by_num(self, collection_id, ver_num):
+        return self.colls[ver_num]
+
+    async def get_selection_full(self, selection_id):
+        sel = self.subsets.get(selection_id)
+        if not isinstance(sel, models.InternalSelection):
+            raise errors.NoSuchSelectionError(selection_id)
+        return sel
+
+    async def get_match_full(self, match_id):
+        match = self.subsets.get(match_id)
+        if not isinstance(match, models.InternalMatch):
+            raise errors.NoSuchMatchError(match_id)
+        return match
+
+    async def update_selection_last_access(self, selection_id, last_access):
+        pass
+
+    async def update_match_last_access(self, match_id, last_access):
+        pass
+
+    async def save_selection(self, sel):
+        self.saved.append(sel)
+        # report the selection exists so no selection process is started
+        return sel, True
+
+
+class _FakeAppState:
+
+    def __init__(self, storage):
+        self.arangostorage = storage
+        self.sdk_client = None
+        self._matchers = {
+            "gtdb_lineage": _FakeMatcher(["genome_attribs"]),
+            "other": _FakeMatcher(["samples"]),
+        }
+
+    def get_epoch_ms(self):
+        return _NOW
+
+    def get_matcher(self, matcher_id):
+        return self._matchers.get(matcher_id)
+
+
+_U = models.SetOperation.UNION
+_I = models.SetOperation.INTERSECTION
+_D = models.SetOperation.DIFFERENCE
+_M = models.SubsetType.MATCH
+_S = models.SubsetType.SELECTION
+
+
+def test_combine_memberships():
+    a = ["g1", "g2", "g3", "g4"]
+    b = ["g3", "g4", "g5"]
+    c = ["g4", "g6", "g1"]
+    for op, members, expected in [
+        (_U, [a, b], ["g1", "g2", "g3", "g4", "g5"]),
+        (_U, [a, b, c], ["g1", "g2", "g3", "g4", "g5", "g6"]),
+        (_I, [a, b], ["g3", "g4"]),
+        (_I, [a, b, c], ["g4"]),
+        (_I, [b, ["g9"]], []),
+        (_D, [a, b], ["g1", "g2"]),
+        (_D, [b, a], ["g5"]),
+        (_D, [a, b, c], ["g2"]),
+        (_D, [a, a], []),
+        # a single subset is returned as is, sorted and without duplicates
+        (_U, [["g2", "g1", "g2"]], ["g1", "g2"]),
+        (_D, [["g2", "g1"]], ["g1", "g2"]),
+    ]:
+        assert processing_selections.combine_memberships(op, members) == expected, (op, members)
+
+
+def test_combine_memberships_laws():
+    a, b, c = {"1", "2", "3"}, {"2", "3", "4"}, {"3", "5"}
+    comb = processing_selections.combine_memberships
+    # the order of the subsets doesn't matter for union and intersection
+    assert comb(_U, [a, b, c]) == comb(_U, [c, a, b])
+    assert comb(_I, [a, b, c]) == comb(_I, [b, c, a])
+    # A - B - C == A - (B | C)
+    assert comb(_D, [a, b, c]) == comb(_D, [a, comb(_U, [b, c])])
+    # A == (A - B) | (A & B)
+    assert comb(_U, [comb(_D, [a, b]), comb(_I, [a, b])]) == sorted(a)
+
+
+def test_combine_memberships_fail():
+    with pytest.raises(Exception) as got:
+        processing_selections.combine_memberships(_U, [])
+    assert_exception_correct(got.value, ValueError("At least one subset is required"))
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets():
+    storage = _FakeStorage([_coll(3)], [
+        _sel("s1", ["g1", "g2", "g3"]),
+        _sel("s2", ["g2", "g3", "g4"]),
+        _match("m1", ["g3", "g5"]),
+    ])
+    appstate = _FakeAppState(storage)
+    sel = await processing_selections.combine_subsets(
+        appstate, "GTDB", _I, [(_S, "s1"), (_S, "s2")])
+    assert sel.selection_ids == ["g2", "g3"]
+    assert sel.selection_count == 2
+    assert sel.collection_id == "GTDB"
+    assert sel.collection_ver == 3
+    assert sel.data_product == "genome_attribs"
+    assert sel.state == models.ProcessState.PROCESSING
+    # the same selection as saving the IDs directly
+    direct = await processing_selections.save_selection(appstate, "GTDB", ["g3", "g2"])
+    assert sel.selection_id == direct.selection_id
+
+    sel = await processing_selections.combine_subsets(
+        appstate, "GTDB", _D, [(_S, "s1"), (_M, "m1"), (_S, "s2")], _USER)
+    assert sel.selection_ids == ["g1"]
+    sel = await processing_selections.combine_subsets(
+        appstate, "GTDB", _U, [(_M, "m1"), (_S, "s1")], _USER)
+    assert sel.selection_ids == ["g1", "g2", "g3", "g5"]
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_excludes_unmatched_ids():
+    storage = _FakeStorage([_coll(3)], [
+        _sel("s1", ["g1", "g2", "x1"], unmatched_ids=["x1"]),
+        _sel("s2", ["g2", "g3", "x1", "x2"], unmatched_ids=["x1", "x2"]),
+    ])
+    appstate = _FakeAppState(storage)
+    sel = await processing_selections.combine_subsets(
+        appstate, "GTDB", _U, [(_S, "s1"), (_S, "s2")])
+    assert sel.selection_ids == ["g1", "g2", "g3"]
+    sel = await processing_selections.combine_subsets(
+        appstate, "GTDB", _I, [(_S, "s1"), (_S, "s2")])
+    assert sel.selection_ids == ["g2"]
+    sel = await processing_selections.combine_subsets(
+        appstate, "GTDB", _D, [(_S, "s2"), (_S, "s1")])
+    assert sel.selection_ids == ["g3"]
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_prior_collection_version_same_load_version():
+    storage = _FakeStorage([_coll(2), _coll(3)], [
+        _sel("s1", ["g1", "g2"], collection_ver=2),
+        _sel("s2", ["g2"], collection_ver=3),
+    ])
+    sel = await processing_selections.combine_subsets(
+        _FakeAppState(storage), "GTDB", _D, [(_S, "s1"), (_S, "s2")])
+    assert sel.selection_ids == ["g1"]
+    assert sel.collection_ver == 3
+
+
+async def _combine_fail(storage, operands, expected, user=_USER, op=_U):
+    with pytest.raises(Exception) as got:
+        await processing_selections.combine_subsets(
+            _FakeAppState(storage), "GTDB", op, operands, user)
+    assert_exception_correct(got.value, expected)
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_fail_operands():
+    storage = _FakeStorage([_coll(3)], [_sel("s1", ["g1"])])
+    await _combine_fail(storage, [(_S, "s1")], errors.IllegalParameterError(
+        "At least 2 matches or selections are required"))
+    await _combine_fail(storage, [(_S, "s1")] * 11, errors.IllegalParameterError(
+        "At most 10 matches or selections can be combined"))
+    await _combine_fail(storage, [(_S, "s1"), (_S, "s2")], errors.NoSuchSelectionError("s2"))
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_fail_no_default_select():
+    storage = _FakeStorage([_coll(3, default_select=None)], [])
+    await _combine_fail(storage, [(_S, "s1"), (_S, "s2")], errors.IllegalParameterError(
+        "Collection GTDB version 3 is not configured to allow selections"))
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_fail_empty():
+    storage = _FakeStorage([_coll(3)], [_sel("s1", ["g1"]), _sel("s2", ["g2"])])
+    await _combine_fail(storage, [(_S, "s1"), (_S, "s2")], errors.IllegalParameterError(
+        "The intersection of the matches and selections contains no data"), op=_I)
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_fail_too_many_ids():
+    max_ = processing_selections.MAX_SELECTION_IDS
+    storage = _FakeStorage([_coll(3)], [
+        _sel("s1", [f"g{i}" for i in range(max_)]),
+        _sel("s2", [f"g{i}" for i in range(1, max_ + 1)]),
+    ])
+    # the union is one ID too many, but the intersection fits
+    await _combine_fail(storage, [(_S, "s1"), (_S, "s2")], errors.IllegalParameterError(
+        f"The union of the matches and selections contains {max_ + 1} data IDs, but a "
+        + f"selection may contain at most {max_}"))
+    sel = await processing_selections.combine_subsets(
+        _FakeAppState(storage), "GTDB", _I, [(_S, "s1"), (_S, "s2")])
+    assert sel.selection_count == max_ - 1
+    assert storage.saved == [sel]
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_fail_match():
+    storage = _FakeStorage([_coll(3)], [
+        _sel("s1", ["g1"]), _match("m1", ["g1"]), _match("m2", ["g1"], matcher_id="other")])
+    await _combine_fail(storage, [(_S, "s1"), (_M, "m1")], errors.UnauthorizedError(
+        "Authentication is required to combine matches"), user=None)
+    await _combine_fail(storage, [(_S, "s1"), (_M, "m2")], errors.IllegalParameterError(
+        "Match m2 from matcher other does not match data in the genome_attribs data product"))
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_fail_incomplete():
+    storage = _FakeStorage([_coll(3)], [
+        _sel("s1", ["g1"]), _sel("s2", ["g1"], state=models.ProcessState.FAILED)])
+    await _combine_fail(storage, [(_S, "s1"), (_S, "s2")], errors.InvalidSelectionStateError(
+        "Selection s2 processing is not complete"))
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_fail_data_product():
+    storage = _FakeStorage([_coll(3)], [
+        _sel("s1", ["g1"]), _sel("s2", ["g1"], data_product="taxa_count")])
+    await _combine_fail(storage, [(_S, "s1"), (_S, "s2")], errors.IllegalParameterError(
+        "Selection s2 applies to the taxa_count data product, not genome_attribs"))
+
+
+@pytest.mark.asyncio
+async def test_combine_subsets_fail_collection():
+    storage = _FakeStorage([_coll(2, load_ver="r202"), _coll(3)], [
+        _sel("s1", ["g1"]),
+        _sel("s2", ["g1"], collection_id="PMI"),
+        _sel("s3", ["g1"], collection_ver=2),
+        _match("m1", ["g1"], collection_ver=2),
+    ])
+    await _combine_fail(storage, [(_S, "s1"), (_S, "s2")], errors.InvalidSelectionStateError(
+        "Selection s2 is for collection PMI, not GTDB"))
+    await _combine_fail(storage, [(_S, "s1"), (_S, "s3")], errors.InvalidSelectionStateError(
+        "Selection s3 is for collection version 2, which has a different genome_attribs "
+        + "load version than the current version 3"))
+    await _combine_fail(storage, [(_S, "s1"), (_M, "m1")], errors.InvalidMatchStateError(
+        "Match m1 is for collection version 2, which has a different genome_attribs "
+        + "load version than the current version 3"))
@@ -0,0 +1,230 @@
+import json
+import math
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from pytest import raises
+
+from conftest import assert_exception_correct
+from src.common.product_models import columnar_attribs_common_models as col_models
+from src.common.product_models import heatmap_common_models as heatmap_models
+from src.service import models
+from src.service.data_products.common_models import DataProductMissingIDs
+from src.service.data_products.genome_attributes import Histogram, XYScatter
+from src.service.data_products.samples import (
+    SampleLocation,
+    SampleLocations,
+    Samples,
+    SamplesTable,
+)
+from src.service.data_products.table_models import TableAttributes
+from src.service.data_products.taxa_count import Ranks, TaxaCount, TaxaCounts
+from src.service.responses import FastJSONResponse, construct_all, to_json
+
+
+# These tests check that the JSON returned via the fast path is semantically equivalent to
+# the JSON FastAPI returns when validating the data against the response model.
+
+
+def _validated(model: type[BaseModel], data: dict) -> dict:
+    # this is how FastAPI serializes a response with a response model
+    return json.loads(json.dumps(model.model_validate(data).model_dump(mode="json")))
+
+
+def _fast(content) -> dict:
+    return json.loads(FastJSONResponse(content).body)
+
+
+def _assert_equivalent(model: type[BaseModel], data: dict, constructed: BaseModel = None):
+    constructed = constructed or model.model_construct(**data)
+    assert _fast(constructed) == _validated(model, data)
+
+
+_PROC = models.ProcessState.PROCESSING
+
+
+def test_table_attributes():
+    _assert_equivalent(TableAttributes, {
+        "skip": 10,
+        "limit": 2,
+        "fields": [{"name": "kbase_id"}, {"name": "gc"}],
+        "table": [["id1", 0.5], ["id2", None]],
+    })
+    _assert_equivalent(TableAttributes, {
+        "skip": 0,
+        "limit": 1000,
+        "data": [{"kbase_id": "id1", "gc": 0.5, "name": "ü ∑ 😀"}, {"kbase_id": "id2"}],
+    })
+    _assert_equivalent(TableAttributes, {"skip": 0, "limit": 0, "count": 42})
+
+
+def test_samples_table():
+    _assert_equivalent(SamplesTable, {
+        "skip": 0,
+        "limit": 0,
+        "match_state": _PROC,
+        "selection_state": None,
+    })
+    _assert_equivalent(SamplesTable, {
+        "skip": 0,
+        "limit": 1,
+        "match_state": models.ProcessState.COMPLETE,
+        "selection_state": models.ProcessState.FAILED,
+        "fields": [{"name": "sel"}, {"name": "kbase_sample_id"}],
+        "table": [[True, "s1"]],
+    })
+
+
+def test_sample_locations():
+    data = {
+        "match_state": None,
+        "selection_state": _PROC,
+        "locs": [
+            {"lat": 36.1, "lon": -28.2, "count": 3, "ids": ["s1", "s2"]},
+            {"lat": 1.0, "lon": 2.5, "count": 1},
+        ]
+    }
+    _assert_equivalent(SampleLocations, data, SampleLocations.model_construct(
+        match_state=None,
+        selection_state=_PROC,
+        locs=construct_all(SampleLocation, data["locs"]),
+    ))
+    _assert_equivalent(SampleLocations, {"match_state": None, "selection_state": None})
+
+
+def test_samples():
+    _assert_equivalent(Samples, {"samples": [{"kbase_sample_id": "s1", "depth": 4}]})
+    _assert_equivalent(Samples, {"samples": []})
+
+
+def test_taxa_counts():
+    data = [
+        {"name": "Bacillota", "count": 42, "match_count": 4},
+        {"name": "Pseudomonadota", "count": 24},
+    ]
+    _assert_equivalent(TaxaCounts, {
+        "match_state": models.ProcessState.COMPLETE,
+        "selection_state": None,
+        "data": data,
+    }, TaxaCounts.model_construct(
+        match_state=models.ProcessState.COMPLETE,
+        selection_state=None,
+        data=construct_all(TaxaCount, data),
+    ))
+    _assert_equivalent(TaxaCounts, {"match_state": None, "selection_state": _PROC})
+    _assert_equivalent(Ranks, {"data": ["domain", "phylum"]})
+
+
+def test_histogram_numpy():
+    hist, bins = np.histogram([1, 2, 2, 3.5, 7, 7, 7])
+    _assert_equivalent(
+        Histogram,
+        {"bins": bins.tolist(), "values": hist.tolist()},
+        Histogram.model_construct(bins=bins, values=hist),
+    )
+    _assert_equivalent(Histogram, {"bins": [0.0, 1.0], "values": [np.int64(3)]})
+
+
+def test_xy_scatter():
+    _assert_equivalent(XYScatter, {
+        "xcolumn": "Completeness",
+        "ycolumn": "Contamination",
+        "data": [{"x": 6.0, "y": 3.4}, {"x": 8, "y": 2.2}],
+    })
+
+
+def test_missing_ids():
+    _assert_equivalent(DataProductMissingIDs, {
+        "match_state": models.ProcessState.COMPLETE,
+        "selection_state": None,
+        "match_missing": ["id1", "id2"],
+        "selection_missing": None,
+    })
+
+
+def test_columnar_attributes_meta():
+    # the meta is validated when it's pulled from the DB, so check the validated model
+    meta = col_models.ColumnarAttributesMeta.model_validate({
+        "count": 2,
+        "columns": [
+            {"key": "gc", "type": "float", "filter_strategy": None, "min_value": 0.1,
+             "max_value": 0.9},
+            {"key": "level", "type": "enum", "enum_values": ["Contig", "Scaffold"]},
+        ]
+    })
+    assert _fast(meta) == json.loads(meta.model_dump_json())
+
+
+def test_heatmap():
+    row = {
+        "match": None,
+        "sel": True,
+        "kbase_id": "k1",
+        "kbase_display_name": "name_ü",
+        "cells": [
+            {"cell_id": "c1", "col_id": "1", "val": 1.5},
+            {"cell_id": "c2", "col_id": "2", "val": True},
+            {"cell_id": "c3", "col_id": "3", "val": 4},
+        ],
+        "meta": None,
+    }
+    data = {
+        "match_state": None,
+        "selection_state": models.ProcessState.COMPLETE,
+        "data": [row],
+        "min_value": 1,
+        "max_value": 4.0,
+        "count": None,
+        "count_estimated": None,
+        "count_error": None,
+    }
+    # the heatmap data endpoints serialize a plain dict
+    assert _fast(data) == _validated(heatmap_models.HeatMap, data)
+    _assert_equivalent(heatmap_models.HeatMapColumn, {
+        "col_id": "1",
+        "kbase_ids": ["k1", "k2"],
+        "cell_ids": ["c1", None],
+        "values": [1.5, None],
+    })
+
+
+def test_extra_fields_dropped():
+    _assert_equivalent(Ranks, {"data": ["domain"], "_key": "foo", "coll": "GTDB"})
+    _assert_equivalent(TaxaCounts, {
+        "match_state": None,
+        "selection_state": None,
+        "data": [{"name": "Bacillota", "count": 42, "rank": "phylum"}],
+    }, TaxaCounts.model_construct(
+        match_state=None,
+        selection_state=None,
+        data=construct_all(TaxaCount, [{"name": "Bacillota", "count": 42, "rank": "phylum"}]),
+    ))
+
+
+def test_to_json():
+    assert to_json({"a": np.float32(1.5), "b": np.arange(3), 1: "ü"}) == (
+        '{"a":1.5,"b":[0,1,2],"1":"ü"}'.encode())
+    assert json.loads(to_json({"a": math.nan, "b": math.inf})) == {"a": None, "b": None}
+
+
+def test_to_json_fail():
+    with raises(Exception) as got:
+        to_json({"a": object()})
+    assert_exception_correct(got.value, TypeError("Type is not JSON serializable: object"))
+
+
+def test_response_in_app():
+    app = FastAPI()
+
+    @app.get("/ranks", response_model=Ranks)
+    async def ranks():
+        return FastJSONResponse(Ranks.model_construct(data=["domain", "phylum"]))
+
+    res = TestClient(app).get("/ranks")
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/json"
+    assert res.json() == {"data": ["domain", "phylum"]}
+    schema = app.openapi()["paths"]["/ranks"]["get"]["responses"]["200"]
+    assert schema["content"]["application/json"]["schema"] == {"$ref": "#/components/schemas/Ranks"}
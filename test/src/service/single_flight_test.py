@@ -0,0 +1,192 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from conftest import FakeStorage, assert_exception_correct
+from src.common.product_models.columnar_attribs_common_models import (
+    AttributesColumn,
+    ColumnType,
+    FilterStrategy,
+)
+from src.service.data_products.common_functions import query_table
+from src.service.filtering.filters import FilterSet
+from src.service.processing import SubsetSpecification
+from src.service.single_flight import SingleFlight
+
+
+def _calls(result):
+    return REGISTRY.get_sample_value(
+        "collections_single_flight_calls_total", {"result": result}) or 0
+
+
+class _Work:
+    """ Counts executions and blocks until released. """
+
+    def __init__(self, result="result", err=None):
+        self.result = result
+        self.err = err
+        self.runs = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.err:
+            raise self.err
+        return self.result
+
+
+async def _yield():
+    # let the scheduled tasks run up to their next await
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_run_coalesces():
+    runs, coalesced = _calls("run"), _calls("coalesced")
+    sf = SingleFlight()
+    work = _Work()
+    tasks = [asyncio.create_task(sf.run("k", work)) for _ in range(10)]
+    await _yield()
+    assert sf.in_flight == 1
+    work.release.set()
+    assert await asyncio.gather(*tasks) == ["result"] * 10
+    assert work.runs == 1
+    assert sf.in_flight == 0
+    assert _calls("run") == runs + 1
+    assert _calls("coalesced") == coalesced + 9
+
+    # a call after completion runs again
+    assert await sf.run("k", work) == "result"
+    assert work.runs == 2
+
+
+@pytest.mark.asyncio
+async def test_run_different_keys():
+    sf = SingleFlight()
+    work1, work2 = _Work("r1"), _Work("r2")
+    t1 = asyncio.create_task(sf.run(("table", 1), work1))
+    t2 = asyncio.create_task(sf.run(("table", 2), work2))
+    await _yield()
+    assert sf.in_flight == 2
+    work1.release.set()
+    work2.release.set()
+    assert await asyncio.gather(t1, t2) == ["r1", "r2"]
+    assert (work1.runs, work2.runs) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_run_exception():
+    sf = SingleFlight()
+    work = _Work(err=ValueError("oh no"))
+    tasks = [asyncio.create_task(sf.run("k", work)) for _ in range(3)]
+    await _yield()
+    work.release.set()
+    res = await asyncio.gather(*tasks, return_exceptions=True)
+    assert work.runs == 1
+    for r in res:
+        assert_exception_correct(r, ValueError("oh no"))
+    assert sf.in_flight == 0
+
+    # errors are not cached
+    work.err = None
+    assert await sf.run("k", work) == "result"
+    assert work.runs == 2
+
+
+@pytest.mark.asyncio
+async def test_run_cancel_one_waiter():
+    sf = SingleFlight()
+    work = _Work()
+    leader = asyncio.create_task(sf.run("k", work))
+    follower = asyncio.create_task(sf.run("k", work))
+    await _yield()
+    # e.g. the client that started the call disconnects
+    leader.cancel()
+    await _yield()
+    assert leader.cancelled()
+    assert sf.in_flight == 1
+    work.release.set()
+    assert await follower == "result"
+    assert work.runs == 1
+    assert work.cancelled == 0
+
+
+@pytest.mark.asyncio
+async def test_run_cancel_all_waiters():
+    sf = SingleFlight()
+    work = _Work()
+    tasks = [asyncio.create_task(sf.run("k", work)) for _ in range(2)]
+    await _yield()
+    for t in tasks:
+        t.cancel()
+    await _yield()
+    assert all(t.cancelled() for t in tasks)
+    assert work.cancelled == 1
+    assert sf.in_flight == 0
+
+    # a new call runs the work again
+    work.release.set()
+    assert await sf.run("k", work) == "result"
+    assert work.runs == 2
+
+
+class _FakeStorage(FakeStorage):
+    """ Blocks each query execution until released. """
+
+    def __init__(self, docs):
+        super().__init__(docs)
+        self.release = asyncio.Event()
+
+    async def execute_aql(self, aql, bind_vars=None, **kwargs):
+        cur = await super().execute_aql(aql, bind_vars, **kwargs)
+        await self.release.wait()
+        return cur
+
+
+def _fs(match_id=None, **kwargs):
+    return FilterSet(
+        "GTDB",
+        "r207",
+        collection="coll",
+        match_spec=SubsetSpecification(internal_subset_id=match_id, prefix="m_"),
+        **({"sort_on": "kbase_id", "limit": 10} | kwargs)
+    )
+
+
+def _mutator(doc):
+    return doc
+
+
+@pytest.mark.asyncio
+async def test_query_table_coalesced():
+    cols = [AttributesColumn(
+        key="kbase_id", type=ColumnType.STRING, filter_strategy=FilterStrategy.IDENTITY)]
+    store = _FakeStorage([{"kbase_id": "a"}, {"kbase_id": "b"}])
+    sf = SingleFlight()
+
+    async def query(fs, **kwargs):
+        return await query_table(
+            store, cols, fs, document_mutator=_mutator, single_flight=sf, **kwargs)
+
+    tasks = [asyncio.create_task(query(_fs())) for _ in range(5)] + [
+        # different page, subset, and output format
+        asyncio.create_task(query(_fs(skip=10))),
+        asyncio.create_task(query(_fs(match_id="foo"))),
+        asyncio.create_task(query(_fs(), output_table=False)),
+    ]
+    await _yield()
+    assert len(store.queries) == 4
+    store.release.set()
+    res = await asyncio.gather(*tasks)
+    assert len(store.queries) == 4
+    assert res[0].table == [["a"], ["b"]]
+    assert all(r is res[0] for r in res[1:5])
+    assert res[7].data == [{"kbase_id": "a"}, {"kbase_id": "b"}]
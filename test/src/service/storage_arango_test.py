@@ -1,7 +1,691 @@
-from src.service.storage_arango import ArangoStorage
+import asyncio
+from contextlib import asynccontextmanager
+import json
+from urllib.parse import urlparse
+
+import pytest
+
+from aioarango.connection import BasicConnection
+from aioarango.database import StandardDatabase
+from aioarango.exceptions import CollectionCreateError, CursorNextError, DocumentGetError
+from aioarango.http import HTTPClient
+from aioarango.resolver import SingleHostResolver
+from aioarango.response import Response, StreamedResponse
+from aioarango.streaming import CursorBodyParser
+from fastapi import APIRouter
+from prometheus_client import REGISTRY
+from conftest import assert_exception_correct
+from src.common.product_models.columnar_attribs_common_models import (
+    AttributesColumnSpec,
+    ColumnarAttributesSpec,
+)
+from src.common.storage import collection_and_field_names as names
+from src.service import metrics
+from src.service.batch_sizer import BatchSizer
+from src.service.data_products.common_models import DataProductSpec, DBCollection
+from src.service.filtering import analyzers
+from src.service.storage_arango import (
+    ArangoStorage,
+    ARANGO_ERR_NAME_EXISTS,
+    SchemaChanges,
+    ViewExistsError,
+    get_schema_changes,
+)
 
 # TODO TEST these tests will need a running arango instance
 # Don't mock the arango client, bad practice to mock 3rd party interfaces
+# The schema setup tests below use a minimal fake of the database as the setup code is
+# otherwise untestable without a cluster.
+# The keyed read and cursor tests use the real client with a fake HTTP transport that serves
+# the document or cursor API and counts round trips.
 
 def test_noop():
     pass
+
+
+_SERVICE_COLLS = [
+    names.COLL_SRV_CONFIG,
+    names.COLL_SRV_ACTIVE,
+    names.COLL_SRV_COUNTERS,
+    names.COLL_SRV_VERSIONS,
+    names.COLL_SRV_MATCHES,
+    names.COLL_SRV_MATCHES_DELETED,
+    names.COLL_SRV_DATA_PRODUCT_PROCESSES,
+    names.COLL_SRV_SELECTIONS,
+    names.COLL_SRV_SELECTIONS_DELETED,
+    names.COLL_SRV_SUBSET_BITMAPS,
+    names.COLL_SRV_QUERY_SHAPES,
+    names.COLL_EXPORT_TYPES,
+]
+
+_SERVICE_INDEXES = [
+    (names.COLL_SRV_VERSIONS, ("id", "ver_num")),
+    (names.COLL_SRV_MATCHES, ("last_access",)),
+    (names.COLL_SRV_MATCHES, ("internal_match_id",)),
+    (names.COLL_SRV_MATCHES, ("collection_id", "collection_ver")),
+    (names.COLL_SRV_SELECTIONS, ("last_access",)),
+    (names.COLL_SRV_SELECTIONS, ("internal_selection_id",)),
+    (names.COLL_SRV_SELECTIONS, ("collection_id", "collection_ver")),
+    (names.COLL_SRV_QUERY_SHAPES, ("bucket",)),
+    (names.COLL_EXPORT_TYPES, ("coll", "data_product", "load_ver")),
+]
+
+
+class _FakeCollection:
+
+    def __init__(self, db, name):
+        self._db = db
+        self._name = name
+
+    async def indexes(self):
+        self._db.calls.append(("indexes", self._name))
+        return [{"id": "0", "type": "primary", "fields": ["_key"], "unique": True}
+               ] + self._db.indexes.get(self._name, [])
+
+    async def add_persistent_index(self, fields):
+        async with self._db.track():
+            self._db.calls.append(("add_index", self._name, tuple(fields)))
+            self._db.indexes.setdefault(self._name, []).append(
+                {"type": "persistent", "fields": fields, "unique": False, "sparse": False})
+
+
+class _FakeDB:
+
+    def __init__(self, collections, indexes=None, fail_create=None):
+        self.colls = set(collections)
+        self.indexes = indexes or {}
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._fail_create = fail_create
+
+    def track(self):
+        db = self
+
+        class Tracker:
+            async def __aenter__(self):
+                db.in_flight += 1
+                db.max_in_flight = max(db.max_in_flight, db.in_flight)
+                await asyncio.sleep(0)  # let the other tasks start
+
+            async def __aexit__(self, *args):
+                db.in_flight -= 1
+        return Tracker()
+
+    async def collections(self):
+        self.calls.append(("collections",))
+        return [{"name": c} for c in sorted(self.colls)]
+
+    def collection(self, name):
+        return _FakeCollection(self, name)
+
+    async def create_collection(self, name):
+        async with self.track():
+            self.calls.append(("create", name))
+            if self._fail_create:
+                raise self._fail_create
+            self.colls.add(name)
+
+
+def _dp(name, colls):
+    return DataProductSpec(
+        data_product=name,
+        router=APIRouter(tags=[name]),
+        db_collections=[DBCollection(name=c, indexes=idxs) for c, idxs in colls.items()],
+    )
+
+
+_DPS = [_dp("dp_one", {"dp1_coll": [["a", "b"], ["c"], ["a", "b"]]})]
+
+
+@pytest.mark.asyncio
+async def test_get_schema_changes_empty_db():
+    db = _FakeDB([])
+    changes = await get_schema_changes(db, _DPS)
+    assert changes == SchemaChanges(
+        collections=_SERVICE_COLLS + ["dp1_coll"],
+        indexes=_SERVICE_INDEXES + [("dp1_coll", ("a", "b")), ("dp1_coll", ("c",))]
+    )
+    # no index lists are fetched for non-existent collections and nothing is created
+    assert db.calls == [("collections",)]
+
+
+@pytest.mark.asyncio
+async def test_get_schema_changes_partial():
+    db = _FakeDB(_SERVICE_COLLS + ["dp1_coll"], indexes={
+        names.COLL_SRV_MATCHES: [
+            {"type": "persistent", "fields": ["last_access"], "unique": False, "sparse": False},
+            {"type": "persistent", "fields": ["internal_match_id"], "unique": True},
+        ],
+        "dp1_coll": [
+            {"type": "persistent", "fields": ["a", "b"], "unique": False, "sparse": False},
+            {"type": "persistent", "fields": ["c"], "unique": False, "sparse": True},
+        ],
+    })
+    changes = await get_schema_changes(db, _DPS)
+    expected = [i for i in _SERVICE_INDEXES if i != (names.COLL_SRV_MATCHES, ("last_access",))]
+    assert changes == SchemaChanges(collections=[], indexes=expected + [("dp1_coll", ("c",))])
+    assert db.calls[0] == ("collections",)
+    # index lists are fetched once per collection with indexes
+    assert sorted(db.calls[1:]) == sorted(
+        ("indexes", c) for c in [names.COLL_SRV_VERSIONS, names.COLL_SRV_MATCHES,
+                                 names.COLL_SRV_SELECTIONS, names.COLL_SRV_QUERY_SHAPES,
+                                 names.COLL_EXPORT_TYPES, "dp1_coll"])
+
+
+@pytest.mark.asyncio
+async def test_get_schema_changes_extra_indexes():
+    db = _FakeDB(_SERVICE_COLLS + ["dp1_coll"], indexes={
+        "dp1_coll": [
+            {"type": "persistent", "fields": ["a", "b"], "unique": False, "sparse": False},
+            {"type": "persistent", "fields": ["c"], "unique": False, "sparse": False},
+            {"type": "persistent", "fields": ["a", "d"], "unique": False, "sparse": False},
+        ],
+    })
+    changes = await get_schema_changes(
+        db, _DPS, extra_indexes={"dp1_coll": [("a", "d"), ("a", "e"), ("c",)]})
+    assert changes == SchemaChanges(
+        collections=[], indexes=_SERVICE_INDEXES + [("dp1_coll", ("a", "e"))])
+    # ArangoStorage.create doesn't check extra indexes
+    assert await get_schema_changes(db, _DPS) == SchemaChanges(
+        collections=[], indexes=_SERVICE_INDEXES)
+
+
+@pytest.mark.asyncio
+async def test_create_concurrent_and_idempotent():
+    db = _FakeDB([])
+    await ArangoStorage.create(db, _DPS, create_collections_on_startup=True, concurrency=3)
+    assert db.colls == set(_SERVICE_COLLS + ["dp1_coll"])
+    adds = [c[1:] for c in db.calls if c[0] == "add_index"]
+    assert sorted(adds) == sorted(
+        _SERVICE_INDEXES + [("dp1_coll", ("a", "b")), ("dp1_coll", ("c",))])
+    assert db.max_in_flight == 3
+
+    # second run changes nothing
+    db.calls = []
+    await ArangoStorage.create(db, _DPS, create_collections_on_startup=True)
+    assert [c[0] for c in db.calls if c[0] not in ("collections", "indexes")] == []
+    assert await get_schema_changes(db, _DPS) == SchemaChanges(collections=[], indexes=[])
+
+
+@pytest.mark.asyncio
+async def test_create_ignores_existing_collection_race():
+    err = CollectionCreateError.__new__(CollectionCreateError)
+    err.error_code = ARANGO_ERR_NAME_EXISTS
+    db = _FakeDB(_SERVICE_COLLS, fail_create=err)
+    await ArangoStorage.create(db, _DPS, create_collections_on_startup=True)
+    assert ("create", "dp1_coll") in db.calls
+    assert ("add_index", "dp1_coll", ("c",)) in db.calls
+
+
+@pytest.mark.asyncio
+async def test_create_fail_missing_collection():
+    db = _FakeDB(_SERVICE_COLLS)
+    with pytest.raises(Exception) as got:
+        await ArangoStorage.create(db, _DPS)
+    assert_exception_correct(got.value, ValueError("Collection dp1_coll does not exist"))
+    assert [c for c in db.calls if c[0] in ("create", "add_index")] == []
+
+
+@pytest.mark.asyncio
+async def test_fail_bad_concurrency():
+    for func in [lambda: ArangoStorage.create(_FakeDB([]), concurrency=0),
+                 lambda: get_schema_changes(_FakeDB([]), concurrency=0)]:
+        with pytest.raises(Exception) as got:
+            await func()
+        assert_exception_correct(got.value, ValueError("concurrency must be > 0"))
+
+
+_NOT_FOUND = {"error": True, "errorNum": 1202, "errorMessage": "document not found", "code": 404}
+
+
+class _FakeHTTPClient(HTTPClient):
+    """ Serves the ArangoDB document read API from memory and records each request. """
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.requests = []
+
+    def create_session(self, host):
+        return None
+
+    async def send_request(
+        self, session, method, url, headers=None, params=None, data=None, auth=None
+    ):
+        path = urlparse(url).path.split("/_api/document/")[1]
+        self.requests.append((method, path, params))
+        if method == "get":
+            coll, key = path.split("/")
+            doc = self.docs.get(coll, {}).get(key)
+            return self._response(method, url, 200 if doc else 404, doc or _NOT_FOUND)
+        assert method == "put" and params == {"onlyget": "true"}
+        coll = self.docs.get(path, {})
+        body = [coll.get(k, _NOT_FOUND) for k in json.loads(data)]
+        return self._response(method, url, 200, body)
+
+    def _response(self, method, url, status, body):
+        return Response(method, url, {}, status, "", json.dumps(body))
+
+
+def _keyed_read_storage(docs) -> tuple[ArangoStorage, _FakeHTTPClient]:
+    http = _FakeHTTPClient(docs)
+    conn = BasicConnection(
+        ["http://localhost:8529"], SingleHostResolver(), [None], "db", "user", "pwd",
+        http, json.dumps, json.loads,
+    )
+    return ArangoStorage(StandardDatabase(conn)), http
+
+
+def _doc(key, **kwargs):
+    return {"_key": key, "_id": f"coll/{key}", "_rev": "1"} | kwargs
+
+
+@pytest.mark.asyncio
+async def test_get_doc_by_key():
+    store, http = _keyed_read_storage({"coll": {"k1": _doc("k1", a=1)}})
+    assert await store.get_doc_by_key("coll", "k1") == _doc("k1", a=1)
+    assert await store.get_doc_by_key("coll", "k2") is None
+    assert http.requests == [("get", "coll/k1", {}), ("get", "coll/k2", {})]
+
+
+@pytest.mark.asyncio
+async def test_get_doc_by_key_metrics_op():
+    name = "collections_document_read_duration_seconds_count"
+    labeled = {"op": "read_thing", "collection": "coll"}
+    unlabeled = {"op": metrics.NO_OP, "collection": "coll"}
+    before = [REGISTRY.get_sample_value(name, lbl) or 0 for lbl in (labeled, unlabeled)]
+    store, _ = _keyed_read_storage({"coll": {"k1": _doc("k1")}})
+    await store.get_doc_by_key("coll", "k1", op="read_thing")
+    await store.get_docs_by_key("coll", ["k1"], op="read_thing")
+    await store.get_doc_by_key("coll", "k1")
+    assert REGISTRY.get_sample_value(name, labeled) == before[0] + 2
+    assert REGISTRY.get_sample_value(name, unlabeled) == before[1] + 1
+
+
+@pytest.mark.asyncio
+async def test_get_docs_by_key_single_round_trip():
+    store, http = _keyed_read_storage({"coll": {k: _doc(k, v=i) for i, k in enumerate("abcd")}})
+    got = await store.get_docs_by_key("coll", ["d", "x", "a", "b", "a"])
+    assert got == {"d": _doc("d", v=3), "a": _doc("a", v=0), "b": _doc("b", v=1)}
+    assert http.requests == [("put", "coll", {"onlyget": "true"})]
+
+    assert await store.get_docs_by_key("coll", []) == {}
+    assert len(http.requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_docs_by_key_batches():
+    keys = [f"k{i}" for i in range(2500)]
+    store, http = _keyed_read_storage({"coll": {k: _doc(k) for k in keys[::2]}})
+    got = await store.get_docs_by_key("coll", keys)
+    assert list(got) == keys[::2]
+    assert len(http.requests) == 3
+
+
+@pytest.mark.asyncio
+async def test_get_docs_by_key_fail():
+    store, http = _keyed_read_storage({})
+    err = {"error": True, "errorNum": 1203, "errorMessage": "collection not found", "code": 404}
+    http.docs = {"coll": {"k1": err}}
+    with pytest.raises(DocumentGetError) as got:
+        await store.get_docs_by_key("coll", ["k1"])
+    assert got.value.error_code == 1203
+
+
+class _FakeCursorHTTPClient(HTTPClient):
+    """
+    Serves the ArangoDB cursor API from memory, returning the documents for every query,
+    and records the batch size requested for each query.
+    If a chunk size is provided, streamed response bodies are split into chunks of that size.
+    """
+
+    def __init__(self, docs, chunk_size=None):
+        self.docs = docs
+        self.batch_sizes = []
+        self.fetches = 0
+        self.chunks_sent = 0
+        self.fail_fetch = False
+        self._chunk_size = chunk_size
+        self._cursors = {}
+
+    def create_session(self, host):
+        return None
+
+    async def send_request(
+        self, session, method, url, headers=None, params=None, data=None, auth=None
+    ):
+        path = urlparse(url).path.split("/_api/cursor")[1]
+        if method == "post":
+            batch_size = json.loads(data).get("batchSize")
+            self.batch_sizes.append(batch_size)
+            cid = str(len(self.batch_sizes))
+            self._cursors[cid] = (list(self.docs), batch_size or 1000)
+            return self._batch(method, url, cid)
+        cid = path.lstrip("/")
+        if method == "delete":
+            self._cursors.pop(cid, None)
+            return Response(method, url, {}, 202, "", json.dumps({"id": cid}))
+        self.fetches += 1
+        if self.fail_fetch:
+            err = {"error": True, "errorNum": 1600, "errorMessage": "cursor not found"}
+            return Response(method, url, {}, 404, "", json.dumps(err | {"code": 404}))
+        return self._batch(method, url, cid)
+
+    @asynccontextmanager
+    async def stream_request(
+        self, session, method, url, headers=None, params=None, data=None, auth=None
+    ):
+        if not self._chunk_size:
+            async with super().stream_request(
+                session, method, url, headers, params, data, auth
+            ) as resp:
+                yield resp
+            return
+        resp = await self.send_request(session, method, url, headers, params, data, auth)
+        body = resp.raw_body.encode("utf-8")
+
+        async def chunks():
+            for i in range(0, len(body), self._chunk_size):
+                self.chunks_sent += 1
+                yield body[i:i + self._chunk_size]
+
+        yield StreamedResponse(method, url, {}, resp.status_code, "", chunks())
+
+    def _batch(self, method, url, cid):
+        docs, batch_size = self._cursors[cid]
+        batch, rest = docs[:batch_size], docs[batch_size:]
+        self._cursors[cid] = (rest, batch_size)
+        body = {"result": batch, "hasMore": bool(rest)} | ({"id": cid} if rest else {})
+        return Response(method, url, {}, 201, "", json.dumps(body))
+
+
+def _cursor_storage(docs, chunk_size=None) -> tuple[ArangoStorage, _FakeCursorHTTPClient]:
+    http = _FakeCursorHTTPClient(docs, chunk_size)
+    conn = BasicConnection(
+        ["http://localhost:8529"], SingleHostResolver(), [None], "db", "user", "pwd",
+        http, json.dumps, json.loads,
+    )
+    return ArangoStorage(StandardDatabase(conn), BatchSizer(target_bytes=100_000)), http
+
+
+async def _read_all(store, bind_vars, batch_size=None):
+    cur = await store.execute_aql("FOR d IN @@c RETURN d", bind_vars, batch_size=batch_size)
+    try:
+        return [d async for d in cur]
+    finally:
+        await cur.close(ignore_missing=True)
+
+
+@pytest.mark.asyncio
+async def test_execute_aql_adaptive_batch_size_small_docs():
+    docs = [{"k": i} for i in range(5000)]  # ~10 bytes per doc
+    store, http = _cursor_storage(docs)
+    assert await _read_all(store, {"@c": "small"}, batch_size=500) == docs
+    assert http.batch_sizes == [500]
+    assert http.fetches == 9
+    # the batch grows toward 100KB per batch, so all the docs arrive in the first batch
+    assert await _read_all(store, {"@c": "small"}, batch_size=500) == docs
+    assert http.batch_sizes[1] > 5000
+    assert http.fetches == 9
+
+
+@pytest.mark.asyncio
+async def test_execute_aql_adaptive_batch_size_large_docs():
+    docs = [{"k": i, "row": "x" * 2000} for i in range(300)]  # ~2KB per doc
+    store, http = _cursor_storage(docs)
+    assert await _read_all(store, {"@c": "large"}) == docs
+    assert await _read_all(store, {"@c": "large"}) == docs
+    assert http.batch_sizes[0] is None
+    assert 45 <= http.batch_sizes[1] <= 50
+    # other collections are sized separately
+    await _read_all(store, {"@c": "other"}, batch_size=300)
+    assert http.batch_sizes[2] == 300
+
+
+@pytest.mark.asyncio
+async def test_execute_aql_batch_size_by_op():
+    docs = [{"k": i, "row": "x" * 2000} for i in range(300)]  # ~2KB per doc
+    store, http = _cursor_storage(docs)
+    name = "collections_aql_execute_duration_seconds_count"
+    labels = {"op": "read_large", "collection": "large"}
+    before = REGISTRY.get_sample_value(name, labels) or 0
+    for _ in range(2):
+        cur = await store.execute_aql("FOR d IN @@c RETURN d", {"@c": "large"}, op="read_large")
+        assert len([d async for d in cur]) == 300
+        await cur.close(ignore_missing=True)
+    assert REGISTRY.get_sample_value(name, labels) == before + 2
+    assert 45 <= http.batch_sizes[1] <= 50
+    # other operations on the same collection are sized separately
+    await _read_all(store, {"@c": "large"}, batch_size=300)
+    assert http.batch_sizes[2] == 300
+
+
+def _parse(body: bytes, chunk_size: int):
+    parser = CursorBodyParser()
+    docs = []
+    for i in range(0, len(body), chunk_size):
+        docs.extend(parser.feed(body[i:i + chunk_size]))
+    return docs, parser.close()
+
+
+def test_cursor_body_parser_chunk_boundaries():
+    docs = [
+        {"k": 1, "s": "caf\u00e9 \U0001f9ec \"quoted\" \\ end", "f": -1.5e-3, "n": None},
+        [1, [2, {"x": []}], True, False],
+        123456,
+        "str, with ] and } in it",
+        {},
+    ]
+    body = json.dumps(
+        {"id": "42", "result": docs, "hasMore": True, "extra": {"stats": {"a": 1}}},
+        indent=1,
+        ensure_ascii=False,
+    ).encode("utf-8")
+    # every split point, including inside multibyte characters, escapes and numbers
+    for chunk_size in range(1, len(body) + 1):
+        got, fields = _parse(body, chunk_size)
+        assert got == docs, chunk_size
+        assert fields == {"id": "42", "hasMore": True, "extra": {"stats": {"a": 1}}}
+
+
+def test_cursor_body_parser_docs_returned_incrementally():
+    docs = [{"k": i} for i in range(100)]
+    body = json.dumps({"result": docs, "hasMore": False}).encode("utf-8")
+    parser = CursorBodyParser()
+    got = []
+    for i in range(0, len(body), 50):
+        new = parser.feed(body[i:i + 50])
+        # documents are returned before the body is complete
+        assert i > len(body) / 2 or new
+        got.extend(new)
+    assert got == docs
+    assert parser.close() == {"hasMore": False}
+
+
+def test_cursor_body_parser_empty_and_missing_result():
+    assert _parse(b'{"result": [], "hasMore": false}', 3) == ([], {"hasMore": False})
+    assert _parse(b' { } ', 1) == ([], {})
+    assert _parse(b'{"hasMore": false, "count": 10}', 4) == ([], {"hasMore": False, "count": 10})
+    # only the result array is streamed
+    assert _parse(b'{"a": [1, 2], "result": [3]}', 2) == ([3], {"a": [1, 2]})
+
+
+def test_cursor_body_parser_fail():
+    for body in [
+        b'[1, 2]',
+        b'{"result": [1, 2}',
+        b'{"result" [1]}',
+        b'{"result": [1] "hasMore": false}',
+        b'{1: 2}',
+    ]:
+        parser = CursorBodyParser()
+        with pytest.raises(ValueError):
+            parser.feed(body)
+            parser.close()
+    for body in [b'', b'{"result": [1, 2', b'{"result": [1], "count": 12', b'{"result": [{"a": 1']:
+        parser = CursorBodyParser()
+        parser.feed(body)
+        with pytest.raises(Exception) as got:
+            parser.close()
+        assert_exception_correct(
+            got.value, ValueError("The cursor response body is truncated or invalid"))
+
+
+@pytest.mark.asyncio
+async def test_execute_aql_streams_batches():
+    docs = [{"k": i, "v": "é" * (i % 7)} for i in range(250)]
+    store, http = _cursor_storage(docs, chunk_size=97)
+    cur = await store.execute_aql("FOR d IN @@c RETURN d", {"@c": "c"}, batch_size=100)
+    got = [await cur.next() for _ in range(101)]
+    # the second batch is being streamed
+    assert http.fetches == 1
+    assert http.chunks_sent < 10
+    assert cur.has_more() is True
+    got.extend([d async for d in cur])
+    assert got == docs
+    assert cur.has_more() is False
+    assert cur.fetch_count() == 3
+    assert cur.received_count() == 250
+    await cur.close(ignore_missing=True)
+
+
+@pytest.mark.asyncio
+async def test_execute_aql_fetch_completes_streamed_batch():
+    docs = [{"k": i} for i in range(30)]
+    store, http = _cursor_storage(docs, chunk_size=5)
+    cur = await store.execute_aql("FOR d IN @@c RETURN d", {"@c": "c"}, batch_size=10)
+    cur.batch().clear()
+    assert await cur.next() == {"k": 10}
+    res = await cur.fetch()
+    assert res == {"id": "1", "has_more": True, "batch": docs[11:20]}
+    assert list(cur.batch()) == docs[11:20]
+    assert http.fetches == 1
+    await cur.close(ignore_missing=True)
+
+
+@pytest.mark.asyncio
+async def test_execute_aql_close_mid_stream():
+    docs = [{"k": i} for i in range(30)]
+    store, http = _cursor_storage(docs, chunk_size=5)
+    cur = await store.execute_aql("FOR d IN @@c RETURN d", {"@c": "c"}, batch_size=10)
+    cur.batch().clear()
+    assert await cur.next() == {"k": 10}
+    sent = http.chunks_sent
+    assert await cur.close() is True
+    # the rest of the batch is not received
+    assert http.chunks_sent == sent
+    assert cur.received_count() < 20
+
+
+@pytest.mark.asyncio
+async def test_execute_aql_stream_fail():
+    store, http = _cursor_storage([{"k": i} for i in range(30)], chunk_size=5)
+    cur = await store.execute_aql("FOR d IN @@c RETURN d", {"@c": "c"}, batch_size=10)
+    cur.batch().clear()
+    http.fail_fetch = True
+    with pytest.raises(CursorNextError) as got:
+        await cur.next()
+    assert got.value.error_code == 1600
+    assert got.value.http_code == 404
+    await cur.close(ignore_missing=True)
+
+
+class _FakeViewHTTPClient(HTTPClient):
+    """ Serves the ArangoDB view API from memory and records view creations and updates. """
+
+    def __init__(self, views=None):
+        self.views = views or {}
+        self.changes = []
+
+    def create_session(self, host):
+        return None
+
+    async def send_request(
+        self, session, method, url, headers=None, params=None, data=None, auth=None
+    ):
+        path = urlparse(url).path.split("/_api/view")[1].strip("/")
+        if method == "post":
+            body = json.loads(data)
+            if body["name"] in self.views:
+                err = {"error": True, "errorNum": 1207, "errorMessage": "duplicate name"}
+                return Response(method, url, {}, 409, "", json.dumps(err | {"code": 409}))
+            self.changes.append(("create", body["name"]))
+            self.views[body["name"]] = self._server_view(body)
+            return Response(method, url, {}, 201, "", json.dumps(self.views[body["name"]]))
+        if method == "get" and not path:
+            res = [{"name": n, "type": "arangosearch", "id": n} for n in self.views]
+            return Response(method, url, {}, 200, "", json.dumps({"result": res}))
+        name = path.split("/")[0]
+        if method == "patch":
+            self.changes.append(("update", name))
+            self.views[name] |= json.loads(data)
+        return Response(method, url, {}, 200, "", json.dumps(self.views[name]))
+
+    @staticmethod
+    def _server_view(body):
+        # add server side defaults
+        body = dict(body)
+        body["links"] = {c: link | {"analyzers": ["identity"]} for c, link in body["links"].items()}
+        body["storedValues"] = [sv | {"cache": False} for sv in body.get("storedValues", [])]
+        return body | {"id": body["name"], "writebufferIdle": 64}
+
+
+def _view_storage(views=None) -> tuple[ArangoStorage, _FakeViewHTTPClient]:
+    http = _FakeViewHTTPClient(views)
+    conn = BasicConnection(
+        ["http://localhost:8529"], SingleHostResolver(), [None], "db", "user", "pwd",
+        http, json.dumps, json.loads,
+    )
+    return ArangoStorage(StandardDatabase(conn)), http
+
+
+_VIEW_SPEC = ColumnarAttributesSpec(columns=[
+    AttributesColumnSpec(key="kbase_id", type="string", filter_strategy="identity",
+                         display_name="ID", category="c"),
+    AttributesColumnSpec(key="gc_content", type="float", display_name="GC", category="c"),
+])
+
+
+@pytest.mark.asyncio
+async def test_search_view_migration():
+    # a version 1 view with no primary sort or stored values and default settings
+    old_view = {
+        "name": "ga_v1", "type": "arangosearch",
+        "links": {"genome_attribs": {"fields": {"kbase_id": {}, "gc_content": {}},
+                                     "includeAllFields": False}},
+        "primarySort": [], "storedValues": [],
+        "commitIntervalMsec": 1000, "consolidationIntervalMsec": 1000,
+        "cleanupIntervalStep": 2,
+        "consolidationPolicy": {"type": "tier", "segmentsMin": 1, "segmentsMax": 10,
+                                "segmentsBytesMax": 5368709120,
+                                "segmentsBytesFloor": 2097152, "minScore": 0},
+    }
+    other_coll = old_view | {"name": "samples_v1", "links": {"samples": {
+        "fields": {}, "includeAllFields": False}}}
+    store, http = _view_storage({"ga_v1": old_view, "samples_v1": other_coll})
+
+    args = ("genome_attribs", _VIEW_SPEC, analyzers.get_analyzer)
+    assert await store.get_search_views_from_spec(*args) == []
+    assert await store.get_search_views_from_spec(*args, primary_sort="kbase_id") == []
+
+    assert await store.update_search_views("genome_attribs") == ["ga_v1"]
+    assert http.views["ga_v1"]["consolidationIntervalMsec"] == 60000
+    assert http.views["samples_v1"]["consolidationIntervalMsec"] == 1000
+    # the settings now match
+    assert await store.update_search_views("genome_attribs") == []
+
+    await store.create_search_view("ga_v2", *args, primary_sort="kbase_id")
+    assert http.views["ga_v2"]["primarySort"] == [{"field": "kbase_id", "asc": True}]
+    assert [sv["fields"] for sv in http.views["ga_v2"]["storedValues"]] == [
+        ["kbase_id"], ["gc_content"]]
+    assert await store.get_search_views_from_spec(*args, primary_sort="kbase_id") == ["ga_v2"]
+    assert await store.update_search_views("genome_attribs") == []
+    assert await store.get_search_views("genome_attribs") == {"ga_v1", "ga_v2"}
+
+    # creating a matching view with an existing name is a no-op
+    await store.create_search_view("ga_v2", *args, primary_sort="kbase_id")
+    with pytest.raises(Exception) as got:
+        await store.create_search_view("ga_v1", *args, primary_sort="kbase_id")
+    assert_exception_correct(got.value, ViewExistsError(
+        "The view 'ga_v1' already exists and differs from the requested specification."))
+    assert http.changes == [("update", "ga_v1"), ("create", "ga_v2")]
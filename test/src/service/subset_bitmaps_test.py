@@ -0,0 +1,73 @@
+import base64
+
+import pytest
+from pyroaring import BitMap
+
+from conftest import FakeStorage
+from src.common.storage import collection_and_field_names as names
+from src.service import subset_bitmaps
+
+
+class _FakeStorage(FakeStorage):
+    """ Stores bitmap documents by key, interpreting write queries by their keywords. """
+
+    def __init__(self):
+        super().__init__()
+        self.bitmaps = {}
+
+    def results(self, aql, bind_vars):
+        assert bind_vars["@coll"] == names.COLL_SRV_SUBSET_BITMAPS
+        aql = aql.strip()
+        if aql.startswith("UPSERT"):
+            self.bitmaps[bind_vars["key"]] = bind_vars["doc"]
+        elif "REMOVE" in aql:
+            self.bitmaps.pop(bind_vars["key"], None)
+        return []
+
+    async def get_doc_by_key(self, collection, key, op=None):
+        assert collection == names.COLL_SRV_SUBSET_BITMAPS
+        return self.bitmaps.get(key)
+
+
+@pytest.mark.asyncio
+async def test_save_get_remove():
+    store = _FakeStorage()
+    bitmap = BitMap([1, 5, 100_000])
+    await subset_bitmaps.save_subset_bitmap(store, "kbcoll_gen_att", "GTDB", "r207", "m_1", bitmap)
+    assert store.bitmaps == {"kbcoll_gen_att_m_1": {
+        "_key": "kbcoll_gen_att_m_1",
+        "data_coll": "kbcoll_gen_att",
+        "coll": "GTDB",
+        "load_ver": "r207",
+        "internal_id": "m_1",
+        "count": 3,
+        "bitmap": base64.b64encode(bitmap.serialize()).decode("ascii"),
+    }}
+    got = await subset_bitmaps.get_subset_bitmap(store, "kbcoll_gen_att", "GTDB", "r207", "m_1")
+    assert got == bitmap
+
+    # wrong collection, load version, or subset
+    for coll, load_ver, subset in [
+        ("PMI", "r207", "m_1"), ("GTDB", "r214", "m_1"), ("GTDB", "r207", "s_1")
+    ]:
+        assert await subset_bitmaps.get_subset_bitmap(
+            store, "kbcoll_gen_att", coll, load_ver, subset) is None
+
+    # overwrite
+    bitmap2 = BitMap([2])
+    await subset_bitmaps.save_subset_bitmap(store, "kbcoll_gen_att", "GTDB", "r207", "m_1", bitmap2)
+    got = await subset_bitmaps.get_subset_bitmap(store, "kbcoll_gen_att", "GTDB", "r207", "m_1")
+    assert got == bitmap2
+
+    await subset_bitmaps.remove_subset_bitmap(store, "kbcoll_gen_att", "m_1")
+    assert store.bitmaps == {}
+    assert await subset_bitmaps.get_subset_bitmap(
+        store, "kbcoll_gen_att", "GTDB", "r207", "m_1") is None
+    # removing a missing bitmap is a no-op
+    await subset_bitmaps.remove_subset_bitmap(store, "kbcoll_gen_att", "m_1")
+
+
+def test_serialization_is_portable():
+    # the stored bytes are the standard roaring format, readable by other implementations
+    data = BitMap([1, 2, 3]).serialize()
+    assert data[:4] == (12346).to_bytes(4, "little") or data[:2] == (12347).to_bytes(2, "little")